@@ -37,6 +37,15 @@
 # % key: local
 # % guisection: file input
 # %end
+# %option G_OPT_M_NPROCS
+# % description: Number of concurrent file and block transfers
+# %end
+# %option
+# % key: block_size
+# % type: integer
+# % answer: 64
+# % description: Size of transferred blocks in MB
+# %end
 
 
 import os
@@ -55,7 +64,12 @@ def main():
 
     if options["local"]:
         transf = GrassHdfs(options["driver"])
-        transf.upload(options["local"], options["hdfs"])
+        transf.upload(
+            options["local"],
+            options["hdfs"],
+            parallelism=int(options["nprocs"]),
+            block_size=int(options["block_size"]) * 1024 * 1024,
+        )
 
 
 if __name__ == "__main__":
@@ -51,6 +51,15 @@
 # % description: list of attributes with datatype
 # % guisection: data
 # %end
+# %option G_OPT_M_NPROCS
+# % description: Number of concurrent file and block transfers
+# %end
+# %option
+# % key: block_size
+# % type: integer
+# % answer: 64
+# % description: Size of transferred blocks in MB
+# %end
 
 import os
 import sys
@@ -91,7 +100,12 @@ def main():
         table_path = hive.find_table_location(options["table"])
         tmp_dir = os.path.join(tmp_dir, options["table"])
 
-    if not transf.download(hdfs=table_path, fs=tmp_dir):
+    if not transf.download(
+        hdfs=table_path,
+        fs=tmp_dir,
+        parallelism=int(options["nprocs"]),
+        block_size=int(options["block_size"]) * 1024 * 1024,
+    ):
         return
 
     files = os.listdir(tmp_dir)
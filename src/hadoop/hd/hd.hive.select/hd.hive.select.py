@@ -46,12 +46,144 @@
 # % required: no
 # % description: Name for output file (if omitted output to stdout)
 # %end
+# %option G_OPT_V_OUTPUT
+# % key: map
+# % required: no
+# % description: Name of vector map of points to import the result into
+# % guisection: Import
+# %end
+# %option G_OPT_DB_TABLE
+# % key: table
+# % required: no
+# % description: Name of attribute table to import the result into
+# % guisection: Import
+# %end
+# %option
+# % key: x
+# % type: string
+# % required: no
+# % description: Name of result column with x coordinates of points
+# % guisection: Import
+# %end
+# %option
+# % key: y
+# % type: string
+# % required: no
+# % description: Name of result column with y coordinates of points
+# % guisection: Import
+# %end
+# %option
+# % key: batch_size
+# % type: integer
+# % required: no
+# % answer: 10000
+# % description: Number of rows fetched and imported at once
+# % guisection: Import
+# %end
+# %rules
+# % exclusive: map,table
+# % requires_all: map,x,y
+# %end
+
+import sqlite3
+
+import numpy as np
 
 import grass.script as grass
+from grass.pygrass.vector import VectorTopo
+from grass.pygrass.vector.geometry import Point
+from grass.pygrass.vector.table import get_path
 
 from hdfsgrass.hdfs_grass_lib import ConnectionManager
 
 
+def sql_type(array):
+    """
+    Return SQL type of attribute column for numpy array
+    """
+    if array.dtype.kind in "biu":
+        return "INTEGER"
+    if array.dtype.kind == "f":
+        return "DOUBLE PRECISION"
+    return "TEXT"
+
+
+def column_name(name):
+    """
+    Strip table name from column name of Hive result (table.column)
+    """
+    return name.split(".")[-1]
+
+
+def import_vector(batches, name, x, y):
+    """
+    Import batches of query result to vector map of points
+    """
+    vect = None
+    cat = 1
+    for batch in batches:
+        columns = [column_name(c) for c in batch]
+        if vect is None:
+            if x not in columns or y not in columns:
+                grass.fatal("Columns <%s> and <%s> are not in the result" % (x, y))
+            cols = [("cat", "INTEGER PRIMARY KEY")]
+            cols += [(c, sql_type(a)) for c, a in zip(columns, batch.values())]
+            vect = VectorTopo(name)
+            vect.open("w", tab_cols=cols, overwrite=grass.overwrite())
+        arrays = dict(zip(columns, batch.values()))
+        valid = ~(np.ma.getmaskarray(arrays[x]) | np.ma.getmaskarray(arrays[y]))
+        rows = list(zip(*[a.tolist() for a in batch.values()]))
+        for xi, yi, row, ok in zip(arrays[x].tolist(), arrays[y].tolist(), rows, valid):
+            if ok:
+                vect.write(Point(xi, yi), cat=cat, attrs=row)
+                cat += 1
+        vect.table.conn.commit()
+
+    if vect is None:
+        grass.warning("Query returned no rows")
+        return
+    vect.close(build=True)
+    grass.message("%d points imported to <%s>" % (cat - 1, name))
+
+
+def import_table(batches, name):
+    """
+    Import batches of query result to attribute table
+    """
+    connection = grass.db_connection(force=True)
+    if connection["driver"] != "sqlite":
+        grass.fatal("Import to attribute table requires the sqlite driver")
+    if grass.db_table_exist(name) and not grass.overwrite():
+        grass.fatal("Table <%s> already exists" % name)
+
+    conn = sqlite3.connect(get_path(connection["database"]))
+    cur = conn.cursor()
+    created = False
+    nrows = 0
+    for batch in batches:
+        if not created:
+            cols = ", ".join(
+                "%s %s" % (column_name(c), sql_type(a)) for c, a in batch.items()
+            )
+            cur.execute("DROP TABLE IF EXISTS %s" % name)
+            cur.execute("CREATE TABLE %s (%s)" % (name, cols))
+            insert = "INSERT INTO %s VALUES (%s)" % (
+                name,
+                ",".join("?" * len(batch)),
+            )
+            created = True
+        rows = list(zip(*[a.tolist() for a in batch.values()]))
+        cur.executemany(insert, rows)
+        conn.commit()
+        nrows += len(rows)
+    conn.close()
+
+    if not created:
+        grass.warning("Query returned no rows")
+        return
+    grass.message("%d rows imported to table <%s>" % (nrows, name))
+
+
 def main():
     conn = ConnectionManager()
 
@@ -61,6 +193,18 @@ def main():
     if not options["schema"]:
         options["schema"] = "default"
 
+    if options["map"] or options["table"]:
+        if options["driver"] != "hiveserver2":
+            grass.fatal("Import to GRASS requires the hiveserver2 driver")
+        batches = hive.iter_batches(
+            hql=options["hql"], batch_size=int(options["batch_size"])
+        )
+        if options["map"]:
+            import_vector(batches, options["map"], options["x"], options["y"])
+        else:
+            import_table(batches, options["table"])
+        return
+
     out = hive.get_results(hql=options["hql"], schema=options["schema"])
 
     if options["out"]:
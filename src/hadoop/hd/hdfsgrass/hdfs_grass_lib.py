@@ -2,6 +2,8 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import inspect
+import itertools
+import json
 import logging
 import os
 import sys
@@ -23,8 +25,6 @@ from grass.script.core import PIPE
 import grass.script as grass
 from grass_map import VectorDBInfo as VectorDBInfoBase
 
-from dagpype import stream_lines, to_stream, filt, nth
-
 
 class ConnectionManager:
     r"""
@@ -369,61 +369,25 @@ class JSONBuilder:
             self.json = os.path.join(get_tmp_folder(), "%s.json" % filename)
         return self.json
 
-    def rm_last_lines(self, path, rm_last_line=3):
-        """
-        Removing last n lines for given text file
-        :param path:
-        :param rm_last_line:
-        :return:
-        """
-        file = open(
-            path,
-            "r+",
-        )
-
-        # Move the pointer (similar to a cursor in a text editor) to the end of the file.
-        file.seek(-rm_last_line, os.SEEK_END)
-
-        pos = file.tell() - 1
-
-        while pos > 0 and file.read(1) != "\n":
-            pos -= 1
-            file.seek(pos, os.SEEK_SET)
-
-        # So long as we're not at the start of the file, delete all the characters ahead of this position
-        if pos > 0:
-            file.seek(pos, os.SEEK_SET)
-            file.truncate()
-
-        file.close()
-
     @staticmethod
-    def remove_line(filename, lineNumber):
-        """
-        Remove n lines for given file
-        :param filename:
-        :param lineNumber:
-        :return:
+    def geojson_features(path):
         """
-        with open(filename, "r+") as outputFile:
-            with open(filename, "r") as inputFile:
-
-                currentLineNumber = 0
-                while currentLineNumber < lineNumber:
-                    inputFile.readline()
-                    currentLineNumber += 1
-
-                seekPosition = inputFile.tell()
-                outputFile.seek(seekPosition, 0)
-
-                inputFile.readline()
-
-                currentLine = inputFile.readline()
-                while currentLine:
-                    outputFile.writelines(currentLine)
-                    currentLine = inputFile.readline()
-
-            outputFile.truncate()
+        Iterate over the features of a GeoJSON file written by v.out.ogr
+        which writes one feature per line. The file is read line by line.
+        :param path:
+        :return: features without the separating commas
+        """
+        with open(path, "r") as f:
+            for line in f:
+                if line.lstrip().startswith('"features"'):
+                    break
+            for line in f:
+                line = line.strip()
+                if line == "]":
+                    break
+                line = line.rstrip(",")
+                if line:
+                    yield line
 
     def _get_grass_json(self):
         """
@@ -446,12 +410,13 @@ class JSONBuilder:
         out = os.path.join(get_tmp_folder(), out)
         if os.path.exists(out):
             os.remove(out)
+        collection = "%s.geojson" % out
         out1 = Module(
             "v.out.ogr",
             input=self.grass_map["map"],
             layer=self.grass_map["layer"],
             type=self.grass_map["type"],
-            output=out,
+            output=collection,
             format="GeoJSON",
             stderr_=PIPE,
             overwrite=True,
@@ -459,20 +424,21 @@ class JSONBuilder:
 
         grass.message(out1.outputs["stderr"].value.strip())
 
-        self.rm_last_lines(out, 3)
-        # remove first 5 lines and last 3 to enseure format for serializetion
-        for i in range(5):  # todo optimize
-            self.remove_line(out, 0)
+        # write one feature per line to ensure format for serialization
+        with open(out, "w") as f:
+            for feature in self.geojson_features(collection):
+                f.write("%s\n" % feature)
+        os.remove(collection)
 
         return out
 
 
 class GrassMapBuilder(object):
     """
-    Base class for creating GRASS map from GeoJSON
+    Base class for creating GRASS map from serialised Esri GeoJSON
     """
 
-    def __init__(self, json_file, map, attributes):
+    def __init__(self, json_file, map, attributes=None):
         self.file = json_file
         self.map = map
         self.attr = attributes
@@ -480,47 +446,54 @@ class GrassMapBuilder(object):
     def build(self):
         raise NotImplementedError
 
-    def remove_line(self, lineNumber):
-        with open(self.file, "r+") as outputFile:
-            with open(self.file, "r") as inputFile:
-
-                currentLineNumber = 0
-                while currentLineNumber < lineNumber:
-                    inputFile.readline()
-                    currentLineNumber += 1
-
-                seekPosition = inputFile.tell()
-                outputFile.seek(seekPosition, 0)
-
-                inputFile.readline()
-
-                currentLine = inputFile.readline()
-                while currentLine:
-                    outputFile.writelines(currentLine)
-                    currentLine = inputFile.readline()
+    def _records(self):
+        """
+        Iterate over the records of the serialised file, one per line.
+        Empty lines and null records are skipped.
+        :return:
+        """
+        with open(self.file, "r") as f:
+            for line in f:
+                line = line.strip().rstrip(",")
+                if line and line != "null":
+                    yield line
 
-            outputFile.truncate()
+    def _first_record(self):
+        """
+        Return the first record and an iterator over all records
+        :return:
+        """
+        records = self._records()
+        first = next(records, None)
+        if first is None:
+            raise ValueError("No features in file %s" % self.file)
+        return first, itertools.chain([first], records)
 
-    def _get_wkid(self):
+    def _write(self, header, records):
         """
-        Parse epsg from wkid (esri json)
+        Write enclosed JSON with the given header and records to a new file
+        which is used for creating the map
+        :param header:
+        :param records:
         :return:
-        :rtype:
         """
-        with open(self.file, "r") as f:
-            first_line = f.readline()
-            if first_line.find("wkid") != -1:
-                return self._find_between(first_line, 'wkid":', "}")
+        path = "%s.json" % self.file
+        with open(path, "w") as f:
+            f.write(header)
+            for i, record in enumerate(records):
+                f.write(",\n" if i else "\n")
+                f.write(record)
+            f.write("\n]}\n")
+        self.file = path
 
-    def _rm_null(self):
+    def _get_wkid(self, line):
         """
-        First line sometimes include null. Must be removed
+        Parse epsg from wkid (esri json)
         :return:
+        :rtype:
         """
-        with open(self.file, "r") as f:
-            first_line = f.readline()
-            if first_line.find("null") != -1:
-                self.remove_line(0)
+        if line.find("wkid") != -1:
+            return self._find_between(line, 'wkid":', "}")
 
     def _find_between(self, s, first, last):
         """
@@ -554,79 +527,53 @@ class GrassMapBuilder(object):
         # grass.message(out1.outputs["stderr"].value.strip())
         # logging.debug(out1.outputs["stderr"].value.strip())
 
-    def _prepend_line(self, line):
-        """
-        Prepend line to the text file
-        :param line:
-        :return:
-        """
-        with open(self.file, "r+") as f:
-            old = f.read()  # read everything in the file
-            f.seek(0)  # rewind
-            f.write("%s\n" % line + old)  # write the new line before
-
-    def _append_line(self, line):
-        """
-        Append line to the text file
-        :param line:
-        :return:
-        """
-        with open(self.file, "a") as file:
-            file.write(line)
-
-    def _get_type(self):
-        """
-        return type of esri simple feature
-        :return:
-        """
-        line = stream_lines(self.file) | nth(0)
-        if line.find("ring"):
-            return ["ring", '"type":"Polygon","coordinates":']
-        if line.find("multipoint"):
-            return ["multipoint", '"type":"MultiPoint","coordinates":']
-        if line.find("paths"):
-            return ["paths", '"type":"MultiLineString","coordinates":']
-
-        if line.find('"x"'):
-            grass.fatal("Point is not supported")
-        if line.find("envelope"):
-            grass.fatal("Envelope is not supported")
-
-    def replace_substring(self, foo, bar):
-        """
-        Replace substring by given string
-        :param foo:
-        :param bar:
-        :return:
-        """
-        path = "%s1" % self.file
-        io = open(path, "w")
-        stream_lines(self.file) | filt(lambda l: l.replace(foo, bar)) | to_stream(io)
-        self.file = path
-
 
 class GrassMapBuilderEsriToStandard(GrassMapBuilder):
     """
-    Class for conversion serialised GeoJson to GRASS MAP
+    Class for conversion serialised Esri GeoJson to standard GeoJSON and
+    GRASS MAP
     """
 
-    def __init__(self, json_file, map):
-        super(GrassMapBuilderEsriToStandard, self).__init__(json_file, map)
+    def __init__(self, json_file, map, attributes=None):
+        super(GrassMapBuilderEsriToStandard, self).__init__(json_file, map, attributes)
 
     def build(self):
-        geom_type = self._get_type()
-        self.replace_substring(geom_type[0], [1])
-        self.replace_substring("}}}", "}}},")
-
-        fst_line = (
+        header = (
             '{"type": "FeatureCollection","crs": '
             '{ "type": "name", "properties": { "name": "urn:ogc:def:crs:OGC:1.3:CRS84" } },"features": ['
         )
-        self._prepend_line(fst_line)
-        self._append_line("]}")
+        self._write(header, (self._feature(record) for record in self._records()))
 
         self._create_map()
 
+    @staticmethod
+    def _feature(record):
+        """
+        Convert Esri JSON feature to GeoJSON feature
+        :param record:
+        :return:
+        """
+        record = json.loads(record)
+        geom = record.get("geometry") or {}
+        if "rings" in geom:
+            geometry = {"type": "Polygon", "coordinates": geom["rings"]}
+        elif "paths" in geom:
+            geometry = {"type": "MultiLineString", "coordinates": geom["paths"]}
+        elif "points" in geom:
+            geometry = {"type": "MultiPoint", "coordinates": geom["points"]}
+        elif "x" in geom:
+            geometry = {"type": "Point", "coordinates": [geom["x"], geom["y"]]}
+        else:
+            geometry = None
+
+        return json.dumps(
+            {
+                "type": "Feature",
+                "properties": record.get("attributes") or {},
+                "geometry": geometry,
+            }
+        )
+
 
 class GrassMapBuilderEsriToEsri(GrassMapBuilder):
     """
@@ -639,14 +586,12 @@ class GrassMapBuilderEsriToEsri(GrassMapBuilder):
             return
 
     def build(self):
-        self._rm_null()
-        geom_type = self._get_type()
-        wkid = self._get_wkid()
-        self.replace_substring("}}", "}},")
+        first, records = self._first_record()
+        geom_type = self._get_type(first)
+        wkid = self._get_wkid(first)
 
         header = self._generate_header(geom_type[1], wkid)
-        self._prepend_line(header)
-        self._append_line("]}")
+        self._write(header, records)
 
         self._create_map()
 
@@ -683,18 +628,17 @@ class GrassMapBuilderEsriToEsri(GrassMapBuilder):
 
         return header
 
-    def _get_type(self):
+    def _get_type(self, line):
         logging.info("Get type for file: %s" % self.file)
-        line = stream_lines(self.file) | nth(0)
-        if line.find("ring"):
+        if '"rings"' in line:
             return ["ring", "esriGeometryPolygon"]
-        if line.find("multipoint"):
+        if '"points"' in line:
             return ["multipoint", "esriGeometryMultipoint"]
-        if line.find("paths"):
+        if '"paths"' in line:
             return ["paths", "esriGeometryPolyline"]
-        if line.find('"x"'):
+        if '"x"' in line:
             return ["point", "esriGeometryPoint"]
-        if line.find("envelope"):
+        if '"xmin"' in line:
             return ["envelope", "esriGeometryEnvelope"]
 
 
@@ -732,28 +676,39 @@ class GrassHdfs:
         self.mkdir(dest_path)
         return dest_path
 
-    def upload(self, fs, hdfs, overwrite=True, parallelism=1):
+    def _print_stats(self):
+        stats = getattr(self.hook, "stats", None)
+        if stats:
+            grass.message(" transferred: %s\n" % stats)
+
+    def upload(self, fs, hdfs, overwrite=True, parallelism=1, **kwargs):
         logging.info("Trying copy: fs: %s to  hdfs: %s   " % (fs, hdfs))
-        self.hook.upload_file(fs, hdfs, overwrite, parallelism)
-        self.grass.messageInfo(hdfs, "File has been copied to:")
+        self.hook.upload_file(fs, hdfs, overwrite, parallelism, **kwargs)
+        self.printInfo(hdfs, "File has been copied to:")
+        self._print_stats()
 
     def mkdir(self, hdfs):
         self.hook.mkdir(hdfs)
-        self.grass.messageInfo(hdfs)
+        self.printInfo(hdfs)
 
     def write(self, hdfs, data, **kwargs):
         # Write file to hdfs
         self.hook.write(hdfs, data, **kwargs)
-        self.grass.messageInfo(hdfs)
+        self.printInfo(hdfs)
 
-    def download(self, fs, hdfs, overwrite=True, parallelism=1):
+    def download(self, fs, hdfs, overwrite=True, parallelism=1, **kwargs):
         logging.info("Trying download : hdfs: %s to fs: %s   " % (hdfs, fs))
 
         out = self.hook.download_file(
-            hdfs_path=hdfs, local_path=fs, overwrite=overwrite, parallelism=parallelism
+            hdfs_path=hdfs,
+            local_path=fs,
+            overwrite=overwrite,
+            parallelism=parallelism,
+            **kwargs,
         )
         if out:
-            self.grass.messageInfo(out)
+            self.printInfo(out)
+            self._print_stats()
         else:
             grass.message("Copy error!")
         return out
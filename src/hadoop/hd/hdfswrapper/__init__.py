@@ -6,6 +6,7 @@ import hdfs_hook
 import hive_hook
 import security_utils
 import settings
+import transfer
 import webhdfs_hook
 
 for module in os.listdir(os.path.dirname(__file__)):
@@ -5,7 +5,9 @@ import csv
 import logging
 import re
 import subprocess
+from collections import OrderedDict
 
+import numpy as np
 import pyhs2
 from builtins import zip
 from past.builtins import basestring
@@ -19,6 +21,33 @@ from base_hook import BaseHook
 from hdfswrapper.hive_table import HiveSpatial
 
 
+# numpy dtypes of HiveServer2 column types, other types are kept as objects
+HIVE_DTYPES = {
+    "BOOLEAN_TYPE": np.bool_,
+    "TINYINT_TYPE": np.int8,
+    "SMALLINT_TYPE": np.int16,
+    "INT_TYPE": np.int32,
+    "BIGINT_TYPE": np.int64,
+    "FLOAT_TYPE": np.float32,
+    "DOUBLE_TYPE": np.float64,
+    "DECIMAL_TYPE": np.float64,
+}
+
+
+def to_array(values, dtype):
+    """
+    Convert a column of a batch of rows to a numpy array. Columns of
+    numeric types with NULL values are returned as masked arrays.
+    """
+    if dtype is object:
+        return np.array(values, dtype=object)
+    mask = [v is None for v in values]
+    if any(mask):
+        values = [0 if v is None else v for v in values]
+        return np.ma.masked_array(values, mask=mask, dtype=dtype)
+    return np.array(values, dtype=dtype)
+
+
 class HiveCliHook(BaseHook, HiveSpatial):
     """
     Simple wrapper around the hive CLI.
@@ -411,6 +440,45 @@ class HiveServer2Hook(BaseHook, HiveSpatial):
                         }
             return results
 
+    def iter_batches(self, hql, batch_size=10000):
+        """
+        Run a query and iterate over its result in batches of at most
+        `batch_size` rows. Only one batch is held in memory at a time.
+
+        Each batch is an OrderedDict of column names and numpy arrays with
+        dtypes derived from the schema of the result (see HIVE_DTYPES).
+        If `hql` is a list of statements, the result of the last one is
+        returned.
+
+        >>> hh = HiveServer2Hook()
+        >>> sql = "SELECT linkid, lon, lat FROM default.mwrecord"
+        >>> for batch in hh.iter_batches(sql, batch_size=1000):
+        ...     print(batch["lon"].mean())
+        """
+        if isinstance(hql, basestring):
+            hql = [hql]
+        with self.get_conn() as conn:
+            for statement in hql[:-1]:
+                with conn.cursor() as cur:
+                    cur.execute(statement)
+            with conn.cursor() as cur:
+                logging.info("Running query: " + hql[-1])
+                cur.execute(hql[-1])
+                schema = cur.getSchema() or []
+                names = [c["columnName"] for c in schema]
+                dtypes = [HIVE_DTYPES.get(c["type"], object) for c in schema]
+                i = 0
+                while cur.hasMoreRows:
+                    rows = [row for row in cur.fetchmany(batch_size) if row]
+                    if not rows:
+                        continue
+                    i += len(rows)
+                    logging.info("Fetched {0} rows so far.".format(i))
+                    yield OrderedDict(
+                        (name, to_array(column, dtype))
+                        for name, dtype, column in zip(names, dtypes, zip(*rows))
+                    )
+
     def to_csv(
         self,
         hql,
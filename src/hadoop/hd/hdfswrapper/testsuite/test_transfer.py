@@ -0,0 +1,179 @@
+"""
+Name:      test_transfer
+Purpose:   Tests chunked, parallel and resumable transfers of hdfswrapper
+           against the local WebHDFS stand-in
+
+Author:    GRASS Development Team
+Copyright: (C) 2024 by GRASS Development Team
+Licence:   This program is free software under the GNU General Public
+           License (>=v2). Read the file COPYING that comes with GRASS
+           for details.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transfer import LocalClient, Transfer, TransferException  # noqa: E402
+
+BLOCK_SIZE = 1000
+
+
+class FlakyClient(LocalClient):
+    """LocalClient failing the n-th append and the first read of offsets,
+    or all appends and reads"""
+
+    def __init__(self, root, fail_append=None, fail_offsets=(), always=False):
+        super(FlakyClient, self).__init__(root)
+        self.fail_append = fail_append
+        self.fail_offsets = set(fail_offsets)
+        self.always = always
+        self.appends = 0
+        self.reads = []
+        self._lock = threading.Lock()
+
+    def write(self, hdfs_path, data=None, overwrite=False, append=False):
+        if append:
+            with self._lock:
+                self.appends += 1
+                fail = self.always or self.appends == self.fail_append
+            if fail:
+                # only a part of the block reaches the server
+                super(FlakyClient, self).write(
+                    hdfs_path, data=data[: len(data) // 2], append=True
+                )
+                raise IOError("Injected write failure")
+        super(FlakyClient, self).write(
+            hdfs_path, data=data, overwrite=overwrite, append=append
+        )
+
+    def read(self, hdfs_path, offset=0, length=None):
+        with self._lock:
+            self.reads.append(offset)
+            fail = self.always or offset in self.fail_offsets
+            self.fail_offsets.discard(offset)
+        if fail:
+            raise IOError("Injected read failure")
+        return super(FlakyClient, self).read(hdfs_path, offset, length)
+
+
+class TestTransfer(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.hdfs = os.path.join(self.tmp, "hdfs")
+        os.makedirs(self.hdfs)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def create_file(self, path, size, seed=0):
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        data = bytes(bytearray((seed + i * 7) % 251 for i in range(size)))
+        with open(path, "wb") as f:
+            f.write(data)
+        return data
+
+    def read_file(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def transfer(self, client, **kwargs):
+        kwargs.setdefault("block_size", BLOCK_SIZE)
+        kwargs.setdefault("threads", 3)
+        kwargs.setdefault("retry_delay", 0)
+        return Transfer(client, **kwargs)
+
+    def test_folder_round_trip(self):
+        """Upload and download of a folder keep its structure and content"""
+        local = os.path.join(self.tmp, "tiles")
+        files = {
+            "a.bin": self.create_file(os.path.join(local, "a.bin"), 2500, 1),
+            "sub/b.bin": self.create_file(os.path.join(local, "sub", "b.bin"), 10, 2),
+            "sub/deep/c.bin": self.create_file(
+                os.path.join(local, "sub", "deep", "c.bin"), 4321, 3
+            ),
+        }
+        transfer = self.transfer(LocalClient(self.hdfs))
+        remote = transfer.upload(local, "/data")
+        self.assertEqual(remote, "/data")
+        self.assertEqual(transfer.stats.files, 3)
+        self.assertEqual(transfer.stats.bytes, 2500 + 10 + 4321)
+
+        target = os.path.join(self.tmp, "download")
+        transfer.download("/data", target)
+        self.assertEqual(transfer.stats.files, 3)
+        for name, data in files.items():
+            self.assertEqual(self.read_file(os.path.join(target, name)), data)
+
+    def test_block_size_boundary(self):
+        """Files of sizes around multiples of the block size are complete"""
+        client = LocalClient(self.hdfs)
+        transfer = self.transfer(client)
+        for size in (0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 1, 2 * BLOCK_SIZE):
+            local = os.path.join(self.tmp, "file_%d" % size)
+            data = self.create_file(local, size, size)
+            transfer.upload(local, "/boundary_%d" % size)
+            self.assertEqual(client.status("/boundary_%d" % size)["length"], size)
+
+            target = os.path.join(self.tmp, "back_%d" % size)
+            transfer.download("/boundary_%d" % size, target)
+            self.assertEqual(self.read_file(target), data)
+            self.assertEqual(transfer.stats.bytes, size)
+
+    def test_upload_resume(self):
+        """Failed append resumes from the length of the remote file"""
+        local = os.path.join(self.tmp, "file")
+        data = self.create_file(local, 3500)
+        client = FlakyClient(self.hdfs, fail_append=2)
+        transfer = self.transfer(client)
+        transfer.upload(local, "/file")
+
+        self.assertEqual(self.read_file(os.path.join(self.hdfs, "file")), data)
+        self.assertEqual(transfer.stats.retries, 1)
+        # half of the failed block reached the server, so the upload
+        # resumed at 1500 and needed two more blocks: 0, failed, 1500, 2500
+        self.assertEqual(client.appends, 4)
+
+    def test_download_block_retry(self):
+        """Only the failed block is read again"""
+        local = os.path.join(self.tmp, "file")
+        data = self.create_file(local, 3500)
+        self.transfer(LocalClient(self.hdfs)).upload(local, "/file")
+
+        client = FlakyClient(self.hdfs, fail_offsets=[BLOCK_SIZE])
+        transfer = self.transfer(client)
+        target = os.path.join(self.tmp, "back")
+        transfer.download("/file", target)
+
+        self.assertEqual(self.read_file(target), data)
+        self.assertEqual(transfer.stats.retries, 1)
+        self.assertEqual(sorted(client.reads), [0, 1000, 1000, 2000, 3000])
+
+    def test_retries_exhausted(self):
+        """TransferException is raised after the last retry"""
+        local = os.path.join(self.tmp, "file")
+        self.create_file(local, 2500)
+        transfer = self.transfer(FlakyClient(self.hdfs, always=True), retries=2)
+        self.assertRaises(TransferException, transfer.upload, local, "/file")
+
+        self.transfer(LocalClient(self.hdfs)).upload(local, "/other")
+        transfer = self.transfer(FlakyClient(self.hdfs, always=True), retries=1)
+        self.assertRaises(
+            TransferException,
+            transfer.download,
+            "/other",
+            os.path.join(self.tmp, "back"),
+        )
+
+
+if __name__ == "__main__":
+    test()
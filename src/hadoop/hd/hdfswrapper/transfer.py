@@ -0,0 +1,337 @@
+import logging
+import os
+import posixpath
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+class TransferException(Exception):
+    pass
+
+
+class TransferStats(object):
+    """
+    Thread safe counter of transferred files and bytes
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.retries = 0
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes=0, files=0, retries=0):
+        with self._lock:
+            self.bytes += nbytes
+            self.files += files
+            self.retries += retries
+
+    @property
+    def seconds(self):
+        return time.time() - self.start
+
+    @property
+    def throughput(self):
+        """
+        Return throughput in MB/s
+        """
+        return self.bytes / 1024.0 / 1024.0 / max(self.seconds, 1e-6)
+
+    def __str__(self):
+        return "%d files, %.1f MB in %.1f s (%.1f MB/s, %d retries)" % (
+            self.files,
+            self.bytes / 1024.0 / 1024.0,
+            self.seconds,
+            self.throughput,
+            self.retries,
+        )
+
+
+class Transfer(object):
+    """
+    Chunked, parallel and resumable transfer of files between the local
+    file system and HDFS.
+
+    The client is a hdfscli client (e.g. InsecureClient) or any object
+    with the same ``status``, ``list``, ``makedirs``, ``read`` and ``write``
+    methods such as :class:`LocalClient`.
+
+    Uploads run one thread per file and append the file block by block.
+    After a failed block, the upload resumes from the length of the remote
+    file. Downloads split every file into blocks which are read in
+    parallel at their offsets and each block is retried on its own.
+
+    >>> transfer = Transfer(client, block_size=32 * 1024 * 1024, threads=8)
+    >>> transfer.upload('/tmp/tiles', 'grass_data_hdfs/tiles')
+    >>> print(transfer.stats)
+    """
+
+    def __init__(
+        self,
+        client,
+        block_size=DEFAULT_BLOCK_SIZE,
+        threads=4,
+        retries=3,
+        retry_delay=1.0,
+        progress=None,
+    ):
+        """
+        :param client: hdfscli client
+        :param block_size: size of transferred blocks in bytes
+        :param threads: number of concurrent file or block transfers. A value
+          of `0` (or negative) uses as many threads as there are files or
+          blocks
+        :param retries: number of retries of a failed block
+        :param retry_delay: delay before the first retry in seconds, which
+          is doubled with every following retry
+        :param progress: callback called with the HDFS path and the number of
+          bytes after every transferred block
+        """
+        self.client = client
+        self.block_size = int(block_size)
+        self.threads = int(threads)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.progress = progress
+        self.stats = None
+
+    def _wait(self, attempt, path, error):
+        if attempt > self.retries:
+            raise TransferException(
+                "Transfer of %s failed after %d retries: %s"
+                % (path, self.retries, error)
+            )
+        logging.warning("Transfer of %s failed (%s), retrying" % (path, error))
+        time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def _workers(self, tasks):
+        return self.threads if self.threads > 0 else max(1, len(tasks))
+
+    def _report(self, stats, path, nbytes):
+        stats.add(nbytes)
+        if self.progress:
+            self.progress(path, nbytes)
+
+    def upload(self, local_path, hdfs_path, overwrite=True):
+        """
+        Upload a file or all files of a folder to HDFS
+        :param local_path: local file or folder
+        :param hdfs_path: target HDFS path. If it is an existing directory,
+          the file or folder is uploaded inside of it
+        :param overwrite: overwrite existing files
+        :return: HDFS path of the uploaded file or folder
+        """
+        status = self.client.status(hdfs_path, strict=False)
+        if status and status["type"] == "DIRECTORY":
+            hdfs_path = posixpath.join(hdfs_path, os.path.basename(local_path))
+
+        if os.path.isdir(local_path):
+            files = []
+            for root, dirs, names in os.walk(local_path):
+                rel = os.path.relpath(root, local_path)
+                for name in names:
+                    remote = posixpath.join(hdfs_path, *rel.split(os.sep) + [name])
+                    files.append((os.path.join(root, name), posixpath.normpath(remote)))
+        else:
+            files = [(local_path, hdfs_path)]
+
+        self.stats = stats = TransferStats()
+        with ThreadPoolExecutor(max_workers=self._workers(files)) as pool:
+            futures = [
+                pool.submit(self._upload_file, local, remote, overwrite, stats)
+                for local, remote in files
+            ]
+            for future in futures:
+                future.result()
+
+        logging.info("Uploaded %s to %s: %s" % (local_path, hdfs_path, stats))
+        return hdfs_path
+
+    def _upload_file(self, local, remote, overwrite, stats):
+        size = os.path.getsize(local)
+        self.client.makedirs(posixpath.dirname(remote) or "/")
+        self.client.write(remote, data=b"", overwrite=overwrite)
+
+        offset = 0
+        attempt = 0
+        with open(local, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                data = f.read(self.block_size)
+                try:
+                    self.client.write(remote, data=data, append=True)
+                except Exception as e:
+                    attempt += 1
+                    stats.add(retries=1)
+                    self._wait(attempt, remote, e)
+                    # resume after the data that reached the server
+                    offset = self.client.status(remote)["length"]
+                    continue
+                attempt = 0
+                offset += len(data)
+                self._report(stats, remote, len(data))
+        stats.add(files=1)
+
+    def download(self, hdfs_path, local_path, overwrite=True):
+        """
+        Download a file or all files of a folder from HDFS
+        :param hdfs_path: HDFS file or folder
+        :param local_path: local target path. If it is an existing directory,
+          the file or folder is downloaded inside of it
+        :param overwrite: overwrite existing files
+        :return: local path of the downloaded file or folder
+        """
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, posixpath.basename(hdfs_path))
+        if os.path.exists(local_path):
+            if not overwrite:
+                raise TransferException("Path %s already exists" % local_path)
+            if os.path.isdir(local_path):
+                shutil.rmtree(local_path)
+            else:
+                os.remove(local_path)
+
+        status = self.client.status(hdfs_path)
+        if status["type"] == "DIRECTORY":
+            files = []
+            for (root, _), dirs, names in self.client.walk(hdfs_path, status=True):
+                for name, file_status in names:
+                    remote = posixpath.join(root, name)
+                    rel = posixpath.relpath(remote, hdfs_path)
+                    local = os.path.join(local_path, *rel.split("/"))
+                    files.append((remote, local, file_status["length"]))
+        else:
+            files = [(hdfs_path, local_path, status["length"])]
+
+        self.stats = stats = TransferStats()
+        parts = []
+        for remote, local, size in files:
+            folder = os.path.dirname(local)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(local, "wb") as f:
+                f.truncate(size)
+            for offset in range(0, size, self.block_size):
+                parts.append(
+                    (remote, local, offset, min(self.block_size, size - offset))
+                )
+
+        with ThreadPoolExecutor(max_workers=self._workers(parts)) as pool:
+            futures = [pool.submit(self._download_part, stats, *p) for p in parts]
+            for future in futures:
+                future.result()
+        stats.add(files=len(files))
+
+        logging.info("Downloaded %s to %s: %s" % (hdfs_path, local_path, stats))
+        return local_path
+
+    def _download_part(self, stats, remote, local, offset, length):
+        done = 0
+        attempt = 0
+        with open(local, "r+b") as f:
+            while done < length:
+                try:
+                    with self.client.read(
+                        remote, offset=offset + done, length=length - done
+                    ) as reader:
+                        while done < length:
+                            data = reader.read(min(1024 * 1024, length - done))
+                            if not data:
+                                break
+                            f.seek(offset + done)
+                            f.write(data)
+                            done += len(data)
+                            self._report(stats, remote, len(data))
+                    if done < length:
+                        raise TransferException("Unexpected end of file")
+                except Exception as e:
+                    # resume after the data already written
+                    attempt += 1
+                    stats.add(retries=1)
+                    self._wait(attempt, remote, e)
+
+
+class LocalClient(object):
+    """
+    Stand-in for a WebHDFS client which stores files in a local folder.
+    It implements the subset of the hdfscli client used by
+    :class:`Transfer` and can be used for testing transfers without
+    a Hadoop cluster.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, hdfs_path):
+        return os.path.join(self.root, *hdfs_path.strip("/").split("/"))
+
+    def status(self, hdfs_path, strict=True):
+        path = self._path(hdfs_path)
+        if not os.path.exists(path):
+            if strict:
+                raise TransferException("File does not exist: %s" % hdfs_path)
+            return None
+        if os.path.isdir(path):
+            return {"type": "DIRECTORY", "length": 0}
+        return {"type": "FILE", "length": os.path.getsize(path)}
+
+    def list(self, hdfs_path, status=False):
+        names = sorted(os.listdir(self._path(hdfs_path)))
+        if status:
+            return [(n, self.status(posixpath.join(hdfs_path, n))) for n in names]
+        return names
+
+    def walk(self, hdfs_path, status=False):
+        for root, dirs, names in os.walk(self._path(hdfs_path)):
+            rel = os.path.relpath(root, self._path(hdfs_path)).replace(os.sep, "/")
+            path = posixpath.normpath(posixpath.join(hdfs_path, rel))
+            if status:
+                yield (
+                    (path, self.status(path)),
+                    [(n, self.status(posixpath.join(path, n))) for n in dirs],
+                    [(n, self.status(posixpath.join(path, n))) for n in names],
+                )
+            else:
+                yield path, dirs, names
+
+    def makedirs(self, hdfs_path):
+        path = self._path(hdfs_path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def write(self, hdfs_path, data=None, overwrite=False, append=False):
+        path = self._path(hdfs_path)
+        if not append and not overwrite and os.path.exists(path):
+            raise TransferException("File already exists: %s" % hdfs_path)
+        with open(path, "ab" if append else "wb") as f:
+            f.write(data or b"")
+
+    def read(self, hdfs_path, offset=0, length=None):
+        f = open(self._path(hdfs_path), "rb")
+        f.seek(offset)
+        return _LimitedReader(f, length)
+
+
+class _LimitedReader(object):
+    def __init__(self, f, length):
+        self.f = f
+        self.left = length
+
+    def read(self, size=-1):
+        if self.left is not None:
+            size = self.left if size < 0 else min(size, self.left)
+        data = self.f.read(size)
+        if self.left is not None:
+            self.left -= len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
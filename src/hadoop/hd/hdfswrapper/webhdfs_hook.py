@@ -4,6 +4,7 @@ import os
 from hdfs import InsecureClient, HdfsError
 
 from base_hook import BaseHook
+from transfer import DEFAULT_BLOCK_SIZE, Transfer
 
 _kerberos_security_mode = None  # TODO make confugration file for this
 if _kerberos_security_mode:
@@ -22,6 +23,7 @@ class WebHDFSHook(BaseHook):
     def __init__(self, webhdfs_conn_id="webhdfs_default", proxy_user=None):
         self.webhdfs_conn_id = webhdfs_conn_id
         self.proxy_user = proxy_user
+        self.stats = None
 
     def get_conn(self):
         """
@@ -80,10 +82,26 @@ class WebHDFSHook(BaseHook):
         return c.list(hdfs_path, status=recursive)
 
     def progress(self, a, b):
-        # print(a)
-        print("progress: chunk_size %s" % b)
+        logging.debug("progress: %s %s bytes" % (a, b))
+
+    def _transfer(self, parallelism, block_size, retries):
+        return Transfer(
+            self.get_conn(),
+            block_size=block_size,
+            threads=parallelism,
+            retries=retries,
+            progress=self.progress,
+        )
 
-    def upload_file(self, source, destination, overwrite=True, parallelism=1, **kwargs):
+    def upload_file(
+        self,
+        source,
+        destination,
+        overwrite=True,
+        parallelism=1,
+        block_size=DEFAULT_BLOCK_SIZE,
+        retries=3,
+    ):
         r"""
         Uploads a file to HDFS
         :param source: Local path to file or folder. If a folder, all the files
@@ -98,33 +116,37 @@ class WebHDFSHook(BaseHook):
         :param parallelism: Number of threads to use for parallelization. A value of
           `0` (or negative) uses as many threads as there are files.
         :type parallelism: int
-        :param \*\*kwargs: Keyword arguments forwarded to :meth:`upload`.
+        :param block_size: Size of the blocks appended to the remote files in bytes.
+          A failed block is retried from the length of the remote file.
+        :type block_size: int
+        :param retries: Number of retries of a failed block.
+        :type retries: int
         """
-        c = self.get_conn()
-        c.upload(
-            hdfs_path=destination,
-            local_path=source,
-            overwrite=overwrite,
-            n_threads=parallelism,
-            progress=self.progress,
-            **kwargs,
-        )
-        logging.debug("Uploaded file {} to {}".format(source, destination))
+        transfer = self._transfer(parallelism, block_size, retries)
+        out = transfer.upload(source, destination, overwrite=overwrite)
+        self.stats = transfer.stats
+        logging.debug("Uploaded file {} to {}".format(source, out))
+
+        return out
 
     def download_file(
-        self, hdfs_path, local_path, overwrite=True, parallelism=1, **kwargs
+        self,
+        hdfs_path,
+        local_path,
+        overwrite=True,
+        parallelism=1,
+        block_size=DEFAULT_BLOCK_SIZE,
+        retries=3,
     ):
-
-        c = self.get_conn()
-        out = c.download(
-            hdfs_path=hdfs_path,
-            local_path=local_path,
-            overwrite=overwrite,
-            n_threads=parallelism,
-            **kwargs,
-        )
-
-        logging.debug("Download file {} to {}".format(hdfs_path, local_path))
+        """
+        Downloads a file or folder from HDFS. Files are split into blocks of
+        `block_size` bytes which are downloaded by `parallelism` threads and
+        retried on their own.
+        """
+        transfer = self._transfer(parallelism, block_size, retries)
+        out = transfer.download(hdfs_path, local_path, overwrite=overwrite)
+        self.stats = transfer.stats
+        logging.debug("Download file {} to {}".format(hdfs_path, out))
 
         return out
 
@@ -134,16 +156,8 @@ class WebHDFSHook(BaseHook):
 
         logging.debug("Mkdir file {} ".format(path))
 
-    def write(self, fs, hdfs, **kwargs):
+    def write(self, hdfs, data, overwrite=True, **kwargs):
         client = self.get_conn()
+        client.write(hdfs, data=data, overwrite=overwrite, **kwargs)
 
-        client.delete(hdfs, recursive=True)
-        model = {
-            "(intercept)": 48.0,
-            "first_feature": 2.0,
-            "second_feature": 12.0,
-        }
-
-        with client.write(hdfs, encoding="utf-8") as writer:
-            for item in model.items():
-                writer.write("%s,%s\n" % item)
+        logging.debug("Write file {} ".format(hdfs))
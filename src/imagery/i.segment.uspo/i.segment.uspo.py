@@ -260,6 +260,16 @@
 # %end
 #
 # %option
+# % key: cache
+# % type: string
+# % label: Name of file caching evaluation metrics of segmentations across runs
+# % description: Created if missing, new metrics are appended to it
+# % gisprompt: any,file,file
+# % required: no
+# % guisection: Evaluation
+# %end
+#
+# %option
 # % key: processes
 # % type: integer
 # % description: Number of processes to run in parallel
@@ -300,10 +310,17 @@ import grass.script as gscript
 import sys
 import os
 import atexit
+import json
 from multiprocessing import Process, Queue, current_process
 
+import numpy as np
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
+
 # check requirements
 
+CELL_NULL = -2147483648
+
 # for python 3 compatibility
 try:
     xrange
@@ -319,20 +336,6 @@ def iteritems(dict):
     return dictitems
 
 
-def check_progs():
-    found_missing = False
-    for prog in ["r.neighborhoodmatrix"]:
-        if not gscript.find_program(prog, "--help"):
-
-            found_missing = True
-            gscript.warning(
-                _("'%s' required. Please install '%s' first using 'g.extension %s'")
-                % (prog, prog, prog)
-            )
-    if found_missing:
-        gscript.fatal(_("An ERROR occurred running i.segment.uspo"))
-
-
 def cleanup():
     """Delete temporary maps"""
 
@@ -359,32 +362,8 @@ def rg_hier_worker(parms, thresholds, minsize_queue, result_queue):
         for minsize in iter(minsize_queue.get, "STOP"):
             map_list = rg_hierarchical_seg(parms, thresholds, minsize)
             for mapname, threshold, minsize in map_list:
-                mapinfo = gscript.raster_info(mapname)
-                if mapinfo["max"] > mapinfo["min"]:
-                    variance_per_raster = []
-                    autocor_per_raster = []
-                    neighbordict = get_nb_matrix(mapname)
-                    for raster in parms["rasters"]:
-                        # there seems to be some trouble in ms windows with qualified
-                        # map names
-                        raster = raster.split("@")[0]
-                        var = get_variance(mapname, raster)
-                        variance_per_raster.append(var)
-                        autocor = get_autocorrelation(
-                            mapname, raster, neighbordict, parms["indicator"]
-                        )
-                        autocor_per_raster.append(autocor)
-
-                    mean_lv = sum(variance_per_raster) / len(variance_per_raster)
-                    mean_autocor = sum(autocor_per_raster) / len(autocor_per_raster)
-                    result_queue.put(
-                        [mapname, mean_lv, mean_autocor, threshold, minsize]
-                    )
-                else:
-                    # If resulting map contains only one segment, then give high
-                    # value of variance and 0 for spatial autocorrelation in order
-                    # to give this map a low priority
-                    result_queue.put([mapname, 999999, 0, threshold, minsize])
+                metrics = get_metrics(mapname, parms["rasters"])
+                result_queue.put([mapname, metrics, threshold, minsize])
 
     except:
         exc_info = sys.exc_info()
@@ -404,30 +383,8 @@ def rg_nonhier_worker(parms, parameter_queue, result_queue):
     try:
         for threshold, minsize in iter(parameter_queue.get, "STOP"):
             mapname = rg_non_hierarchical_seg(parms, threshold, minsize)
-            mapinfo = gscript.raster_info(mapname)
-            if mapinfo["max"] > mapinfo["min"]:
-                variance_per_raster = []
-                autocor_per_raster = []
-                neighbordict = get_nb_matrix(mapname)
-                for raster in parms["rasters"]:
-                    # there seems to be some trouble in ms windows with qualified
-                    # map names
-                    raster = raster.split("@")[0]
-                    var = get_variance(mapname, raster)
-                    variance_per_raster.append(var)
-                    autocor = get_autocorrelation(
-                        mapname, raster, neighbordict, parms["indicator"]
-                    )
-                    autocor_per_raster.append(autocor)
-
-                mean_lv = sum(variance_per_raster) / len(variance_per_raster)
-                mean_autocor = sum(autocor_per_raster) / len(autocor_per_raster)
-                result_queue.put([mapname, mean_lv, mean_autocor, threshold, minsize])
-            else:
-                # If resulting map contains only one segment, then give high
-                # value of variance and 0 for spatial autocorrelation in order
-                # to give this map a low priority
-                result_queue.put([mapname, 999999, 0, threshold, minsize])
+            metrics = get_metrics(mapname, parms["rasters"])
+            result_queue.put([mapname, metrics, threshold, minsize])
 
     except:
         exc_info = sys.exc_info()
@@ -526,28 +483,8 @@ def ms_worker(parms, parameter_queue, result_queue):
     try:
         for threshold, hr, radius, minsize in iter(parameter_queue.get, "STOP"):
             mapname = ms_seg(parms, threshold, hr, radius, minsize)
-            variance_per_raster = []
-            autocor_per_raster = []
-            neighbordict = get_nb_matrix(mapname)
-            for raster in parms["rasters"]:
-                var = get_variance(mapname, raster)
-                variance_per_raster.append(var)
-                autocor = get_autocorrelation(
-                    mapname, raster, neighbordict, parms["indicator"]
-                )
-                autocor_per_raster.append(autocor)
-
-            if len(variance_per_raster) > 0:
-                mean_lv = sum(variance_per_raster) / len(variance_per_raster)
-            else:
-                mean_lv = 999999
-            if len(autocor_per_raster) > 0:
-                mean_autocor = sum(autocor_per_raster) / len(autocor_per_raster)
-            else:
-                mean_autocor = 0
-            result_queue.put(
-                [mapname, mean_lv, mean_autocor, threshold, hr, radius, minsize]
-            )
+            metrics = get_metrics(mapname, parms["rasters"])
+            result_queue.put([mapname, metrics, threshold, hr, radius, minsize])
 
     except:
         result_queue.put(
@@ -608,107 +545,235 @@ def ms_seg(parms, threshold, hr, radius, minsize):
     return temp_segment_map_thresh
 
 
-def get_variance(mapname, raster):
-    """Calculate intra-segment variance of the values of the given raster"""
+def read_raster(mapname):
+    """Read a raster map in the current region into a float array with NaN for NULL"""
 
-    # current_process name contains '-' which can cause problems so we replace
-    # with '_'
-    temp_map = "isegmentuspo_temp_variance_map_%d_%s" % (
-        os.getpid(),
-        current_process().name.replace("-", "_"),
-    )
-    gscript.run_command(
-        "r.stats.zonal",
-        base=mapname,
-        cover=raster,
-        method="variance",
-        output=temp_map,
-        overwrite=True,
-        quiet=True,
+    region = Region()
+    # there seems to be some trouble in ms windows with qualified map names
+    name, mapset = (mapname.split("@") + [""])[:2]
+    array = np.empty((region.rows, region.cols))
+    with RasterRow(name, mapset=mapset) as raster:
+        for row in range(region.rows):
+            array[row] = raster[row]
+        if raster.mtype == "CELL":
+            array[array == CELL_NULL] = np.nan
+
+    return array
+
+
+def get_neighbors(labels):
+    """Return the pairs of neighboring segments as two arrays of labels
+
+    Segments are neighbors if they share an edge (4-neighborhood). Each pair
+    is listed in both directions, as r.neighborhoodmatrix does.
+    """
+
+    pairs = []
+    for first, second in (
+        (labels[:, :-1], labels[:, 1:]),
+        (labels[:-1, :], labels[1:, :]),
+    ):
+        different = (first != second) & (first >= 0) & (second >= 0)
+        pairs.append(np.column_stack((first[different], second[different])))
+    pairs = np.concatenate(pairs)
+    pairs = np.unique(np.concatenate((pairs, pairs[:, ::-1])), axis=0)
+
+    return pairs[:, 0], pairs[:, 1]
+
+
+def get_variance(labels, cells, values):
+    """Calculate the intra-segment variance of the values of a raster
+
+    Returns the per-segment means and the variance of each segment weighted by
+    its size (mean of r.stats.zonal method=variance over all cells).
+    """
+
+    valid = (labels >= 0) & ~np.isnan(values)
+    segments = labels[valid]
+    values = values[valid]
+    count = np.bincount(segments, minlength=len(cells))
+    has_values = count > 0
+    means = np.full(len(cells), np.nan)
+    means[has_values] = (
+        np.bincount(segments, weights=values, minlength=len(cells))[has_values]
+        / count[has_values]
     )
-    univar = gscript.parse_command("r.univar", map_=temp_map, flags="g", quiet=True)
-    var = float(univar["mean"])
-    gscript.run_command(
-        "g.remove", type_="raster", name=temp_map, flags="f", quiet=True
+    deviations = values - means[segments]
+    variances = (
+        np.bincount(segments, weights=deviations**2, minlength=len(cells))[has_values]
+        / count[has_values]
     )
-    return var
+    weights = cells[has_values]
+    variance = float(np.sum(weights * variances) / np.sum(weights))
+
+    return means, variance
 
 
-def get_nb_matrix(mapname):
-    """Create a dictionary with neighbors per segment"""
+def get_autocorrelation(means, global_mean, neighbors):
+    """Calculate Moran's I and Geary's C of the segment means of a raster"""
 
-    res = gscript.read_command(
-        "r.neighborhoodmatrix", input_=mapname, output="-", sep="comma", quiet=True
+    has_values = ~np.isnan(means)
+    first, second = neighbors
+    linked = has_values[first] & has_values[second]
+    first = first[linked]
+    second = second[linked]
+
+    N = np.count_nonzero(has_values)
+    total_nb_neighbors = len(first)
+    mean_diffs = means - global_mean
+    sum_sq_mean_diffs = np.sum(mean_diffs[has_values] ** 2)
+    if not total_nb_neighbors or not sum_sq_mean_diffs:
+        return {"morans": 0, "geary": 0}
+
+    sum_products = np.sum(mean_diffs[first] * mean_diffs[second])
+    sum_squared_differences = np.sum((means[first] - means[second]) ** 2)
+    morans = (float(N) / total_nb_neighbors) * (sum_products / sum_sq_mean_diffs)
+    geary = (float(N - 1) / (2 * total_nb_neighbors)) * (
+        sum_squared_differences / sum_sq_mean_diffs
     )
 
-    neighbordict = {}
-    for line in res.splitlines():
-        n1 = line.split(",")[0]
-        n2 = line.split(",")[1]
-        if n1 in neighbordict:
-            neighbordict[n1].append(n2)
-        else:
-            neighbordict[n1] = [n2]
+    return {"morans": float(morans), "geary": float(geary)}
+
 
-    return neighbordict
+def get_metrics(mapname, rasters):
+    """Calculate the evaluation metrics of a segmentation
 
+    Reads the segment map and each raster once and returns a dictionary with
+    the mean intra-segment variance and the mean Moran's I and Geary's C over
+    all rasters, or None if the segmentation contains only one segment.
+    """
 
-def get_autocorrelation(mapname, raster, neighbordict, indicator):
-    """Calculate either Moran's I or Geary's C for values of the given raster"""
+    segments = read_raster(mapname)
+    valid = ~np.isnan(segments)
+    ids, inverse = np.unique(segments[valid], return_inverse=True)
+    if len(ids) < 2:
+        return None
+    labels = np.full(segments.shape, -1, dtype=np.int64)
+    labels[valid] = inverse.ravel()
+    cells = np.bincount(labels[valid], minlength=len(ids))
+    neighbors = get_neighbors(labels)
 
-    raster_vars = gscript.parse_command("r.univar", map_=raster, flags="g", quiet=True)
-    global_mean = float(raster_vars["mean"])
+    variance_per_raster = []
+    morans_per_raster = []
+    geary_per_raster = []
+    for raster in rasters:
+        values = read_raster(raster)
+        means, variance = get_variance(labels, cells, values)
+        variance_per_raster.append(variance)
+        autocor = get_autocorrelation(means, np.nanmean(values), neighbors)
+        morans_per_raster.append(autocor["morans"])
+        geary_per_raster.append(autocor["geary"])
 
-    univar_res = gscript.read_command(
-        "r.univar",
-        flags="t",
-        map_=raster,
-        zones=mapname,
-        out="-",
-        sep="comma",
-        quiet=True,
+    return {
+        "variance": sum(variance_per_raster) / len(variance_per_raster),
+        "morans": sum(morans_per_raster) / len(morans_per_raster),
+        "geary": sum(geary_per_raster) / len(geary_per_raster),
+    }
+
+
+def get_criteria(metrics, indicator):
+    """Return the variance and autocorrelation criteria of a segmentation"""
+
+    if metrics is None:
+        # If resulting map contains only one segment, then give high
+        # value of variance and 0 for spatial autocorrelation in order
+        # to give this map a low priority
+        return 999999, 0
+
+    return metrics["variance"], metrics[indicator]
+
+
+def read_cache(filename):
+    """Read cached evaluation metrics into a dictionary keyed by candidate"""
+
+    cache = {}
+    if filename and os.path.exists(filename):
+        with open(filename) as cachefile:
+            for line in cachefile:
+                try:
+                    key, metrics = json.loads(line)
+                except ValueError:
+                    # incomplete line of an interrupted run
+                    continue
+                cache[key] = metrics
+
+    return cache
+
+
+def write_cache(filename, key, metrics):
+    """Append the evaluation metrics of a candidate to the cache file"""
+
+    with open(filename, "a") as cachefile:
+        cachefile.write(json.dumps([key, metrics]) + "\n")
+
+
+def raster_signature(mapname):
+    """Return the name and the modification times of the files of a raster"""
+
+    found = gscript.find_file(mapname, element="cell")
+    if not found["file"]:
+        return mapname
+    mapset_path = os.path.dirname(os.path.dirname(found["file"]))
+    paths = [
+        os.path.join(mapset_path, element, found["name"])
+        for element in ("cellhd", "cell", "fcell")
+    ]
+    paths.append(os.path.join(mapset_path, "cell_misc", found["name"], "null"))
+    mtimes = [
+        "%.6f" % os.path.getmtime(path) if os.path.exists(path) else "-"
+        for path in paths
+    ]
+
+    return "%s:%s" % (found["fullname"], ",".join(mtimes))
+
+
+def input_signature(parms):
+    """Identify the current state of the bands of the group and of the seeds,
+    so that cached metrics are not reused after any of them is changed"""
+
+    list_rasters = gscript.read_command(
+        "i.group", group=parms["group"], flags="gl", quiet=True
     )
+    rasters = set(list_rasters.split("\n")[:-1]) | set(parms["rasters"])
+    if parms["seeds"]:
+        rasters.add(parms["seeds"])
 
-    means = {}
-    mean_diffs = {}
-    firstline = True
-    for line in univar_res.splitlines():
-        l = line.split(",")
-        if firstline:
-            i = l.index("mean")
-            firstline = False
-        else:
-            means[l[0]] = float(l[i])
-            mean_diffs[l[0]] = float(l[i]) - global_mean
-
-    sum_sq_mean_diffs = sum(x**2 for x in mean_diffs.values())
-
-    total_nb_neighbors = 0
-    for region in neighbordict:
-        total_nb_neighbors += len(neighbordict[region])
-
-    N = len(means)
-    sum_products = 0
-    sum_squared_differences = 0
-    for region in neighbordict:
-        region_value = means[region] - global_mean
-        neighbors = neighbordict[region]
-        nb_neighbors = len(neighbors)
-        for neighbor in neighbors:
-            neighbor_value = means[neighbor] - global_mean
-            sum_products += region_value * neighbor_value
-            sum_squared_differences = (means[region] - means[neighbor]) ** 2
-
-    if indicator == "morans":
-        autocor = (float(N) / total_nb_neighbors) * (
-            float(sum_products) / sum_sq_mean_diffs
-        )
-    elif indicator == "geary":
-        autocor = (float(N - 1) / (2 * total_nb_neighbors)) * (
-            float(sum_squared_differences) / sum_sq_mean_diffs
-        )
+    return ",".join(raster_signature(mapname) for mapname in sorted(rasters))
+
+
+def candidate_key(parms, *values):
+    """Identify a candidate segmentation by its inputs and parameters"""
+
+    key = [
+        parms["method"],
+        parms["group"],
+        ",".join(parms["rasters"]),
+        str(parms["seeds"]),
+        str(parms["adaptive"]),
+        parms["region_settings"],
+        parms["input_signature"],
+    ]
+    key += ["%s" % value for value in values]
+
+    return "|".join(key)
+
+
+def segment_candidate(parms, hierarchical, thresholds, values):
+    """Segment a candidate again, e.g. if its metrics were cached
+
+    Returns the names of all maps created, the map of the candidate being
+    the last one. Hierarchical segmentation also creates the maps of the
+    lower thresholds, which are used as seeds.
+    """
 
-    return autocor
+    if parms["method"] == "mean_shift":
+        return [ms_seg(parms, *values)]
+    threshold, minsize = values
+    if hierarchical:
+        thresholds = thresholds[: thresholds.index(threshold) + 1]
+        map_list = rg_hierarchical_seg(parms, thresholds, minsize)
+        return [entry[0] for entry in map_list]
+    return [rg_non_hierarchical_seg(parms, threshold, minsize)]
 
 
 def normalize_criteria(crit_list, direction):
@@ -780,12 +845,11 @@ def main():
         message += "INFO: Note that this leads to less optimal parallization."
         gscript.info(message)
 
-    check_progs()
-
     parms = {}
     group = options["group"]
     parms["group"] = group
     method = options["segmentation_method"]
+    parms["method"] = method
     rg = False
     if method == "region_growing":
         rg = True
@@ -796,7 +860,6 @@ def main():
     if options["output"]:
         output = options["output"]
     indicator = options["autocorrelation_indicator"]
-    parms["indicator"] = indicator
     opt_function = options["optimization_function"]
     alpha = float(options["f_function_alpha"])
     parms["adaptive"] = False
@@ -867,6 +930,13 @@ def main():
     else:
         regions = False
 
+    cachefile = options["cache"]
+    cache = read_cache(cachefile)
+    if cachefile:
+        parms["input_signature"] = input_signature(parms)
+    else:
+        parms["input_signature"] = ""
+
     nb_best = int(options["number_best"])
     memory = int(options["memory"])
     processes = int(options["processes"])
@@ -887,15 +957,30 @@ def main():
         parms["region"] = region.replace("@", "_at_")
 
         gscript.run_command("g.region", region=region, quiet=True)
+        parms["region_settings"] = " ".join(
+            "%s=%s" % item for item in sorted(gscript.region().items())
+        )
 
         # Launch segmentation and optimization calculation in parallel processes
+        # for the candidates not found in the cache
         processes_list = []
         result_queue = Queue()
+        cached_results = []
         if rg:
             if hierarchical_segmentation:
                 minsize_queue = Queue()
                 for minsize in minsizes:
-                    minsize_queue.put(minsize)
+                    keys = [
+                        candidate_key(parms, threshold, minsize)
+                        for threshold in thresholds
+                    ]
+                    if all(key in cache for key in keys):
+                        for key, threshold in zip(keys, thresholds):
+                            cached_results.append(
+                                [None, cache[key], threshold, minsize]
+                            )
+                    else:
+                        minsize_queue.put(minsize)
                 for p in xrange(processes):
                     proc = Process(
                         target=rg_hier_worker,
@@ -911,7 +996,13 @@ def main():
                 parameter_queue = Queue()
                 for minsize in minsizes:
                     for threshold in thresholds:
-                        parameter_queue.put([threshold, minsize])
+                        key = candidate_key(parms, threshold, minsize)
+                        if key in cache:
+                            cached_results.append(
+                                [None, cache[key], threshold, minsize]
+                            )
+                        else:
+                            parameter_queue.put([threshold, minsize])
                 for p in xrange(processes):
                     proc = Process(
                         target=rg_nonhier_worker,
@@ -930,7 +1021,13 @@ def main():
                 for threshold in thresholds:
                     for hr in hrs:
                         for radius in radiuses:
-                            parameter_queue.put([threshold, hr, radius, minsize])
+                            key = candidate_key(parms, threshold, hr, radius, minsize)
+                            if key in cache:
+                                cached_results.append(
+                                    [None, cache[key], threshold, hr, radius, minsize]
+                                )
+                            else:
+                                parameter_queue.put([threshold, hr, radius, minsize])
             for p in xrange(processes):
                 proc = Process(
                     target=ms_worker, args=(parms, parameter_queue, result_queue)
@@ -949,34 +1046,49 @@ def main():
         variancelist = []
         autocorlist = []
 
+        results = []
+        for result in iter(result_queue.get, "STOP"):
+            if len(result) > 1:
+                if cachefile:
+                    write_cache(cachefile, candidate_key(parms, *result[2:]), result[1])
+                results.append(result)
+            else:
+                gscript.message("Error in worker function: %s" % result)
+        results += cached_results
+
         if rg:
-            for result in iter(result_queue.get, "STOP"):
-                if len(result) == 5:
-                    mapname, lv, autocor, threshold, minsize = result
-                    regional_maplist.append(mapname)
-                    variancelist.append(lv)
-                    autocorlist.append(autocor)
-                    threshlist.append(threshold)
-                    minsizelist.append(minsize)
-                else:
-                    gscript.message("Error in worker function: %s" % result)
+            for mapname, metrics, threshold, minsize in results:
+                lv, autocor = get_criteria(metrics, indicator)
+                regional_maplist.append(mapname)
+                variancelist.append(lv)
+                autocorlist.append(autocor)
+                threshlist.append(threshold)
+                minsizelist.append(minsize)
         else:
             hrlist = []
             radiuslist = []
-            for result in iter(result_queue.get, "STOP"):
-                if len(result) == 7:
-                    mapname, lv, autocor, threshold, hr, radius, minsize = result
-                    regional_maplist.append(mapname)
-                    variancelist.append(lv)
-                    autocorlist.append(autocor)
-                    threshlist.append(threshold)
-                    hrlist.append(hr)
-                    radiuslist.append(radius)
-                    minsizelist.append(minsize)
-                else:
-                    gscript.message("Error in worker function: %s" % result)
+            for mapname, metrics, threshold, hr, radius, minsize in results:
+                lv, autocor = get_criteria(metrics, indicator)
+                regional_maplist.append(mapname)
+                variancelist.append(lv)
+                autocorlist.append(autocor)
+                threshlist.append(threshold)
+                hrlist.append(hr)
+                radiuslist.append(radius)
+                minsizelist.append(minsize)
+
+        maplist += [mapname for mapname in regional_maplist if mapname]
+
+        def get_map(index):
+            """Return the map of a result, segmenting cached candidates again"""
+            if regional_maplist[index] or not segmented_map:
+                return regional_maplist[index]
+            mapnames = segment_candidate(
+                parms, hierarchical_segmentation, thresholds, results[index][2:]
+            )
+            maplist.extend(mapnames)
+            return mapnames[-1]
 
-        maplist += regional_maplist
         # Calculate optimization function values and get indices of best values
         if max(variancelist) > min(variancelist) and max(autocorlist) > min(
             autocorlist
@@ -1017,7 +1129,7 @@ def main():
                             optlist[optind],
                         ]
                     )
-                maps_to_keep.append([regional_maplist[optind], rank, parms["region"]])
+                maps_to_keep.append([get_map(optind), rank, parms["region"]])
                 rank += 1
         else:
             best_values[region] = []
@@ -1027,7 +1139,7 @@ def main():
                 best_values[region].append(
                     [threshlist[0], hrlist[0], radiuslist[0], minsizelist[0], -1]
                 )
-            maps_to_keep.append([regional_maplist[0], -1, parms["region"]])
+            maps_to_keep.append([get_map(0), -1, parms["region"]])
 
     # Create output
 
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+MODULE:    Test of i.segment.uspo
+
+PURPOSE:   Test of the cache of evaluation metrics of segmentations
+
+COPYRIGHT: (C) 2024 by the GRASS Development Team
+
+This program is free software under the GNU General Public
+License (>=v2). Read the file COPYING that comes with GRASS
+for details.
+"""
+import os
+import tempfile
+import time
+
+import grass.script as gs
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+
+
+class TestSegmentUspoCache(TestCase):
+    """Test that cached runs give the same results without leaving maps"""
+
+    band1 = "lsat7_2002_10@PERMANENT"
+    band2 = "lsat7_2002_20@PERMANENT"
+
+    # maps, group and region created during test
+    band = "uspo_band"
+    group = "uspo_group"
+    region = "uspo_region"
+    segment_map = "uspo_best"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.use_temp_region()
+        cls.runModule("g.region", raster=cls.band1)
+        cls.runModule(
+            "g.region",
+            n="n-10000",
+            s="s+10000",
+            e="e-10000",
+            w="w+10000",
+            save=cls.region,
+        )
+        cls.runModule("r.mapcalc", expression="{} = {}".format(cls.band, cls.band1))
+        cls.runModule("i.group", group=cls.group, input=[cls.band, cls.band2])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.del_temp_region()
+        cls.runModule("g.remove", flags="f", type="group", name=cls.group)
+        cls.runModule("g.remove", flags="f", type="region", name=cls.region)
+        cls.runModule("g.remove", flags="f", type="raster", name=cls.band)
+
+    def setUp(self):
+        fd, self.cache = tempfile.mkstemp(suffix=".cache")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.cache)
+        self.runModule(
+            "g.remove", flags="f", type="raster", pattern=self.segment_map + "_*"
+        )
+
+    def run_uspo(self, flags=""):
+        """Run the module with the cache and return the sorted output lines"""
+        fd, output = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        self.assertModule(
+            "i.segment.uspo",
+            flags=flags,
+            group=self.group,
+            regions=self.region,
+            segment_map=self.segment_map,
+            output=output,
+            thresholds=[0.02, 0.05, 0.1],
+            minsizes=[5, 10],
+            number_best=2,
+            cache=self.cache,
+            overwrite=True,
+        )
+        with open(output) as f:
+            lines = f.read().splitlines()
+        os.remove(output)
+        return lines[0], sorted(lines[1:])
+
+    def cache_size(self):
+        with open(self.cache) as f:
+            return len(f.read().splitlines())
+
+    def assertNoTempMaps(self):
+        temp_maps = gs.list_strings(
+            "raster", pattern="temp_segment_uspo_*", mapset=gs.gisenv()["MAPSET"]
+        )
+        self.assertEqual(temp_maps, [])
+
+    def assertSameRun(self, flags=""):
+        """Run twice and compare the second, cached run with the first"""
+        first = self.run_uspo(flags)
+        self.assertNoTempMaps()
+        size = self.cache_size()
+        self.assertEqual(size, len(first[1]))
+
+        second = self.run_uspo(flags)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache_size(), size)
+        self.assertNoTempMaps()
+        self.assertRasterExists(self.segment_map + "_" + self.region + "_rank1")
+        self.assertRasterExists(self.segment_map + "_" + self.region + "_rank2")
+
+    def test_cached_run(self):
+        """A cached run gives the same output and leaves no temporary maps"""
+        self.assertSameRun()
+
+    def test_cached_run_hierarchical(self):
+        """Cached hierarchical candidates which are segmented again for
+        segment_map leave no maps of their lower thresholds"""
+        self.assertSameRun(flags="h")
+
+    def test_band_changed(self):
+        """Metrics are not reused after a band of the group is changed"""
+        self.run_uspo()
+        size = self.cache_size()
+
+        # wait so that the modification time changes on file systems with a
+        # coarse time resolution
+        time.sleep(1)
+        self.runModule(
+            "r.mapcalc",
+            expression="{} = {} + 1".format(self.band, self.band1),
+            overwrite=True,
+        )
+        self.run_uspo()
+        self.assertEqual(self.cache_size(), 2 * size)
+        self.assertNoTempMaps()
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,353 @@
+"""
+MODULE:    r.boxplot
+
+PURPOSE:   Streaming boxplot statistics of raster maps, shared by r.boxplot
+           and t.rast.boxplot
+
+COPYRIGHT: (c) 2022 Paulo van Breugel, and the GRASS Development Team
+
+This program is free software under the GNU General Public License
+(>=v2). Read the file COPYING that comes with GRASS for details.
+
+The values of a raster map are read row by row into a histogram per zone,
+together with the exact minimum, maximum and number of values of each zone,
+so memory use depends on the number of distinct values, not on the number
+of cells. Values of integer (CELL) maps are counted exactly, so their
+quantiles are exact. Values of floating point (FCELL, DCELL) maps are
+counted in logarithmic bins, so their quantiles have a relative error of
+at most RELATIVE_ACCURACY (a DDSketch).
+"""
+
+import numpy as np
+
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
+
+CELL_NULL = np.iinfo(np.int32).min
+
+# maximum relative error of the quantiles of floating point maps
+RELATIVE_ACCURACY = 0.001
+
+# number of values collected before they are added to the histograms
+BUFFER_SIZE = 1 << 20
+
+# offset making the indexes of the logarithmic bins of all non-zero
+# double precision values positive
+BIN_OFFSET = 1 << 20
+
+
+def _starts(*keys):
+    """Return the indexes where runs of equal values in sorted keys start
+
+    >>> _starts(np.array([1, 1, 2, 2]), np.array([0, 1, 1, 1]))
+    array([0, 1, 2])
+    """
+    change = np.zeros(keys[0].size, dtype=bool)
+    change[:1] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+class BoxplotStats:
+    """Histograms of the values of a raster map per zone, built row by row
+
+    Rows are added with add(), and the statistics of a zone (or of all
+    values with zone None) are queried with count(), quantiles(), box()
+    and fliers().
+
+    :param bool integer: whether the values are integers, which are counted
+                         exactly
+    :param float accuracy: relative accuracy of the quantiles of floating
+                           point values
+    """
+
+    def __init__(self, integer, accuracy=RELATIVE_ACCURACY):
+        self.integer = integer
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = np.log(self.gamma)
+        # counts of the values per zone and bin, sorted by zone and bin
+        self._zones = np.empty(0, dtype=np.int64)
+        self._bins = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+        # exact minimum and maximum of the values per zone, sorted by zone
+        self._extent_zones = np.empty(0, dtype=np.int64)
+        self._minima = np.empty(0)
+        self._maxima = np.empty(0)
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, values, zones=None):
+        """Add a row of values, skipping null values
+
+        :param ndarray values: values of a row of the raster map
+        :param ndarray zones: zones of the values of the row, the null value
+                              of CELL maps for values without zone
+        """
+        values = np.asarray(values)
+        if values.dtype.kind == "f":
+            valid = ~np.isnan(values)
+        else:
+            valid = values != CELL_NULL
+        values = values[valid]
+        if zones is None:
+            zones = np.zeros(values.size, dtype=np.int64)
+        else:
+            zones = np.asarray(zones)[valid].astype(np.int64)
+        self._pending.append((zones, values))
+        self._pending_size += values.size
+        if self._pending_size >= BUFFER_SIZE:
+            self._flush()
+
+    def _to_bins(self, values):
+        """Return the bins of values, ordered like the values"""
+        if self.integer:
+            return values.astype(np.int64)
+        bins = np.zeros(values.size, dtype=np.int64)
+        nonzero = values != 0
+        magnitude = np.abs(values[nonzero].astype(np.float64))
+        index = np.ceil(np.log(magnitude) / self._log_gamma).astype(np.int64)
+        index += BIN_OFFSET
+        bins[nonzero] = np.where(values[nonzero] < 0, -index, index)
+        return bins
+
+    def _to_values(self, bins):
+        """Return the values representing bins"""
+        if self.integer:
+            return bins.astype(np.float64)
+        index = (np.abs(bins) - BIN_OFFSET).astype(np.float64)
+        with np.errstate(over="ignore"):
+            values = 2 * np.exp(index * self._log_gamma) / (self.gamma + 1)
+        values[bins == 0] = 0
+        return np.sign(bins) * values
+
+    def _flush(self):
+        """Add the collected values to the histograms and extents"""
+        if not self._pending_size:
+            self._pending = []
+            return
+        zones = np.concatenate([row[0] for row in self._pending])
+        values = np.concatenate([row[1] for row in self._pending])
+        self._pending = []
+        self._pending_size = 0
+
+        # exact minimum and maximum per zone
+        zones_extent = np.concatenate((self._extent_zones, zones))
+        minima = np.concatenate((self._minima, values))
+        maxima = np.concatenate((self._maxima, values))
+        order = np.argsort(zones_extent, kind="stable")
+        zones_extent = zones_extent[order]
+        starts = _starts(zones_extent)
+        self._extent_zones = zones_extent[starts]
+        self._minima = np.minimum.reduceat(minima[order], starts)
+        self._maxima = np.maximum.reduceat(maxima[order], starts)
+
+        # counts per zone and bin
+        new_counts = np.ones(values.size, dtype=np.int64)
+        zones = np.concatenate((self._zones, zones))
+        bins = np.concatenate((self._bins, self._to_bins(values)))
+        counts = np.concatenate((self._counts, new_counts))
+        order = np.lexsort((bins, zones))
+        zones = zones[order]
+        bins = bins[order]
+        starts = _starts(zones, bins)
+        self._zones = zones[starts]
+        self._bins = bins[starts]
+        self._counts = np.add.reduceat(counts[order], starts)
+
+    def zones(self):
+        """Return the sorted zones with values, without the null zone"""
+        self._flush()
+        return [zone for zone in self._extent_zones.tolist() if zone != CELL_NULL]
+
+    def count(self, zone=None):
+        """Return the number of values of a zone, or of all values"""
+        self._flush()
+        if zone is None:
+            return int(self._counts.sum())
+        return int(self._counts[self._zones == zone].sum())
+
+    def _histogram(self, zone):
+        """Return the sorted bins, their counts, the minimum and the maximum
+        of the values of a zone, or of all values"""
+        self._flush()
+        if zone is None:
+            order = np.argsort(self._bins, kind="stable")
+            bins = self._bins[order]
+            starts = _starts(bins)
+            counts = np.add.reduceat(self._counts[order], starts)
+            return bins[starts], counts, self._minima.min(), self._maxima.max()
+        select = self._zones == zone
+        index = np.searchsorted(self._extent_zones, zone)
+        return (
+            self._bins[select],
+            self._counts[select],
+            self._minima[index],
+            self._maxima[index],
+        )
+
+    def quantiles(self, probabilities, zone=None):
+        """Return quantiles of the values of a zone, or of all values
+
+        Quantiles are interpolated linearly between the values of the
+        adjoining ranks, like numpy.quantile and r.quantile.
+
+        :param list probabilities: probabilities of the quantiles (0 to 1)
+        :param int zone: zone, None for all values
+
+        :return list: quantiles
+        """
+        bins, counts, minimum, maximum = self._histogram(zone)
+        values = self._to_values(bins)
+        ends = np.cumsum(counts)
+        n_values = int(ends[-1])
+        quantiles = []
+        for probability in probabilities:
+            if probability <= 0:
+                quantiles.append(float(minimum))
+                continue
+            if probability >= 1:
+                quantiles.append(float(maximum))
+                continue
+            position = (n_values - 1) * probability
+            low = int(np.floor(position))
+            high = min(low + 1, n_values - 1)
+            low_value, high_value = values[
+                np.searchsorted(ends, [low, high], side="right")
+            ]
+            quantile = low_value + (position - low) * (high_value - low_value)
+            quantiles.append(float(min(max(quantile, minimum), maximum)))
+        return quantiles
+
+    def box(self, whisker_range, zone=None, notch_count=None):
+        """Return the boxplot statistics of a zone, or of all values
+
+        :param float whisker_range: number representing the whisker range
+        :param int zone: zone, None for all values
+        :param int notch_count: number of values used for the notches, None
+                                to skip the notches
+
+        :return dict: box with the whiskers, quantiles and notches, as used
+                      by matplotlib's bxp, without fliers
+        """
+        min_value, quant1, quant2, quant3, max_value = self.quantiles(
+            [0, 0.25, 0.5, 0.75, 1], zone
+        )
+
+        # Compute iqr and whisker limits
+        iqr = whisker_range * (quant3 - quant1)
+        lower_whisker = max(quant1 - iqr, min_value)
+        upper_whisker = min(quant3 + iqr, max_value)
+
+        # Compute notch limits
+        if notch_count:
+            lower_notch = quant2 - 1.57 * (iqr / notch_count**0.5)
+            upper_notch = quant2 + 1.57 * (iqr / notch_count**0.5)
+        else:
+            lower_notch = upper_notch = ""
+
+        return {
+            "whislo": lower_whisker,
+            "q1": quant1,
+            "med": quant2,
+            "q3": quant3,
+            "whishi": upper_whisker,
+            "fliers": [],
+            "cilo": lower_notch,
+            "cihi": upper_notch,
+        }
+
+    def fliers(self, box, zone=None):
+        """Return the values outside the whiskers of a box, one per cell
+
+        Only integer maps are counted exactly, the outliers of floating
+        point maps are read by read_outliers.
+
+        :param dict box: box of the zone (see box())
+        :param int zone: zone, None for all values
+
+        :return list: sorted outlier values
+        """
+        bins, counts, minimum, maximum = self._histogram(zone)
+        values = self._to_values(bins)
+        outside = (values < box["whislo"]) | (values > box["whishi"])
+        return np.repeat(values[outside], counts[outside]).tolist()
+
+
+def read_stats(rastername, zones=None, accuracy=RELATIVE_ACCURACY):
+    """Read the values of a raster in the current region in a single pass
+
+    :param str rastername: name of the value raster
+    :param str zones: name of the zonal raster
+
+    :return BoxplotStats: statistics of the values per zone, all values are
+                          in zone 0 without zonal raster
+    """
+    reg = Region()
+    with RasterRow(rastername) as src:
+        stats = BoxplotStats(src.mtype == "CELL", accuracy)
+        if zones:
+            with RasterRow(zones) as zsrc:
+                for row in range(reg.rows):
+                    stats.add(src[row], zsrc[row])
+        else:
+            for row in range(reg.rows):
+                stats.add(src[row])
+    return stats
+
+
+def read_outliers(rastername, whiskers, zones=None):
+    """Read the values outside the whiskers of their zone from a raster
+
+    :param str rastername: name of the value raster
+    :param dict whiskers: (lower whisker, upper whisker) per zone, with
+                          zone 0 without zonal raster
+    :param str zones: name of the zonal raster
+
+    :return ndarray values: outlier values in the order of the cells
+    :return ndarray zone_ids: zones of the outliers
+    :return ndarray cells: index of the cells (row * cols + col) of the
+                           outliers
+    """
+    reg = Region()
+    whisker_zones = np.array(sorted(whiskers), dtype=np.int64)
+    lower = np.array([whiskers[zone][0] for zone in whisker_zones.tolist()])
+    upper = np.array([whiskers[zone][1] for zone in whisker_zones.tolist()])
+    values = []
+    zone_ids = []
+    cells = []
+    src = RasterRow(rastername)
+    src.open()
+    zsrc = None
+    if zones:
+        zsrc = RasterRow(zones)
+        zsrc.open()
+    try:
+        for row in range(reg.rows):
+            row_values = np.asarray(src[row])
+            if zsrc is None:
+                row_zones = np.zeros(row_values.size, dtype=np.int64)
+            else:
+                row_zones = np.asarray(zsrc[row]).astype(np.int64)
+            if row_values.dtype.kind == "f":
+                valid = ~np.isnan(row_values)
+            else:
+                valid = row_values != CELL_NULL
+
+            # whiskers of the zones of the cells
+            position = np.searchsorted(whisker_zones, row_zones)
+            position = np.minimum(position, whisker_zones.size - 1)
+            valid &= whisker_zones[position] == row_zones
+            outside = valid & (
+                (row_values < lower[position]) | (row_values > upper[position])
+            )
+
+            index = np.flatnonzero(outside)
+            values.append(row_values[index])
+            zone_ids.append(row_zones[index])
+            cells.append(index + row * reg.cols)
+    finally:
+        src.close()
+        if zsrc is not None:
+            zsrc.close()
+    return np.concatenate(values), np.concatenate(zone_ids), np.concatenate(cells)
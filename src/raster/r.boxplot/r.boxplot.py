@@ -281,13 +281,21 @@
 
 
 import atexit
+import os
 import sys
 import uuid
 from subprocess import PIPE
 
+import numpy as np
+
 import grass.script as gs
+from grass.pygrass.gis.region import Region
 from grass.pygrass.modules import Module
 
+sys.path.insert(1, os.path.join(os.path.dirname(sys.path[0]), "etc", "r.boxplot"))
+
+from boxplot_stats import read_outliers, read_stats
+
 clean_maps = []
 
 
@@ -376,30 +384,6 @@ def check_integer(name):
         gs.fatal(_("The zonal raster must be of type CELL (integer)"))
 
 
-def raster_stats(name):
-    # Compute statistics
-    quantile_rules = Module(
-        "r.quantile",
-        flags="r",
-        input=name,
-        percentiles=[25, 50, 75],
-        stdout_=PIPE,
-    ).outputs.stdout
-    quantile_rules = quantile_rules.replace("\r", "").split("\n")
-    quantile_rules = [_f for _f in quantile_rules if _f]
-    quantiles = [x.split(":") for x in quantile_rules]
-
-    # Extract boxplot stats
-    min_value = float(quantiles[0][0])
-    quantile_1 = float(quantiles[0][1])
-    quantile_2 = float(quantiles[1][1])
-    quantile_3 = float(quantiles[2][1])
-    max_value = float(quantiles[3][1])
-
-    # Return values
-    return min_value, quantile_1, quantile_2, quantile_3, max_value
-
-
 def checkmask():
     """Check if there is a MASK set
 
@@ -538,234 +522,106 @@ def get_zonalcolors(zones, labelsids):
     return zones_rgb, txt_rgb
 
 
-def bx_zonal_stats(zones, name, bx_sort):
-    """Compute the zonal stats to construct the boxplot (and order boxplots)
+def compute_outliers(stats, boxes, rastername, zones=None, cells=False):
+    """Get the outlier values of the boxes
 
-    :param str zones: name of the zonal map
-    :param str name: name of the value map
+    The outliers of integer rasters are taken from the histograms of the
+    values, those of floating point rasters (or if the cells of the outliers
+    are needed) are read from the raster again. As before, every outlier
+    value is listed once per box.
 
-    :return list quantstats: matrix of zonal stats
-    :return list ordered_list: list with the order of the boxplots
+    :param BoxplotStats stats: statistics of the value raster
+    :param dict boxes: box of each zone, the fliers of the boxes are set
+    :param str rastername: name of the value raster
+    :param str zones: name of the zonal raster
+    :param bool cells: get the cells of the outliers
 
+    :return tuple: outlier values, their zones and the index of their cells
+                   (row * cols + col), None if the raster was not read
     """
-    # Compute quantiles and min and max values
-    quantstats_str = Module(
-        "r.stats.quantile",
-        flags=["p", "t"],
-        base=zones,
-        cover=name,
-        percentiles=[0, 25, 50, 75, 100],
-        stdout_=PIPE,
-    ).outputs.stdout
-    quantstats_str = quantstats_str.replace("\r", "").split("\n")
-    quantstats_str = [_f for _f in quantstats_str if _f]
+    if stats.integer and not cells:
+        for zone, box in boxes.items():
+            box["fliers"] = sorted(set(stats.fliers(box, zone)))
+        return None
 
-    # Ordering boxplots
-    quantstats = [list(map(float, _x.split(":"))) for _x in quantstats_str[1:]]
-    ids = []
-    medians = []
-    for zone_id, value in enumerate(quantstats):
-        ids.append(zone_id)
-        medians.append(float(value[3]))
-    if bx_sort == "descending":
-        ordered_list = [i for _, i in sorted(zip(medians, ids), reverse=True)]
-    elif bx_sort == "ascending":
-        ordered_list = [i for _, i in sorted(zip(medians, ids), reverse=False)]
-    else:
-        ordered_list = list(range(0, len(quantstats)))
-    return quantstats, ordered_list
+    whiskers = {zone: (box["whislo"], box["whishi"]) for zone, box in boxes.items()}
+    outliers = read_outliers(rastername, whiskers, zones)
+    values, zone_ids, _ = outliers
+    for zone, box in boxes.items():
+        box["fliers"] = np.unique(values[zone_ids == zone]).tolist()
+    return outliers
 
 
-def get_bx_stats(quantstats_i, whisker_range):
+def bx_zonal_stats(stats, whisker_range, notch, bx_sort):
     """Compute the zonal stats to construct the boxplot (and order boxplots)
 
-    :param list quantstats: nested list with boxplot stats
-    :param float whisker_range: wisker range
-
-    :return list: list with minimum value, 1st, 2nd and 3rd
-                  quantiles and maximum value of the input raster
-
-    """
-    # Extract the stats to construct boxplot ith zone
-    min_value = quantstats_i[1]
-    quant1 = quantstats_i[2]
-    quant2 = quantstats_i[3]
-    quant3 = quantstats_i[4]
-    max_value = quantstats_i[5]
-
-    # Compute the iqr and limits whiskers
-    iqr = whisker_range * (quant3 - quant1)
-    lower_bound = quant1 - iqr
-    if lower_bound > min_value:
-        lower_whisker = lower_bound
-    else:
-        lower_whisker = min_value
-    upper_bound = quant3 + iqr
-    if upper_bound < max_value:
-        upper_whisker = upper_bound
-    else:
-        upper_whisker = max_value
-    return [
-        min_value,
-        quant1,
-        quant2,
-        quant3,
-        max_value,
-        iqr,
-        lower_whisker,
-        upper_whisker,
-    ]
-
-
-def compute_notch(rastername, quant2, iqr):
-    """Compute notches of boxplots
-
-    :param str rastername: name of input raster
-    :param float quant2: 2nd quantile
-    :param float iqr: interquartile range
+    :param BoxplotStats stats: statistics of the value raster per zone
+    :param float whisker_range: number representing the whisker range
+    :param bool notch: compute the lower and upper notch
+    :param str bx_sort: sort boxplots on their median (ascending or descending)
 
-    :return list: list with lower and upper notch value of input raster
-    """
-    univar = Module(
-        "r.univar", flags=["g", "t"], map=rastername, stdout_=PIPE
-    ).outputs.stdout
-    n_values = int(univar.replace("\r", "").split("\n")[1].split("|")[0])
-    lower_notch = quant2 - 1.57 * (iqr / n_values**0.5)
-    upper_notch = quant2 + 1.57 * (iqr / n_values**0.5)
-    return [lower_notch, upper_notch]
-
-
-def compute_outliers(
-    rastername,
-    min_value,
-    max_value,
-    lower_whisker,
-    upper_whisker,
-    vectornames,
-    quantstats_i,
-    outliers,
-    zones,
-):
-    """Compute outliers
-
-    :param str raster: name value raster
-    :param float min_value: min value value raster
-    :param float max_value: min value value raster
-    :param float lower_whisker: lower whisker value raster
-    :param float upper_whisker: upper whisker value raster
-    :param list vectornames: list with vectorlayers of outliers
-    :param list quanstats_i: list with stats for zone i
-    :param bool outlier: create vector map of outliers (true or false)
-    :param bool zones: zonal map included or not
-
-    :return list: list with outlier values for input raster
-    :return list vectornames: list with vectorlayers of outliers
+    :return dict boxes: box of each zone
+    :return list zone_ids: zones of the boxplots
+    :return list ordered_list: list with the order of the boxplots
     """
+    # Notches are based on the number of all values of the raster
+    notch_count = stats.count() if notch else None
+    zone_ids = stats.zones()
+    boxes = {
+        zone: stats.box(whisker_range, zone, notch_count=notch_count)
+        for zone in zone_ids
+    }
 
-    # Construct recode rules to map outliers
-    lower_outlier_bnd = lower_whisker - 0.000000000001
-    lower_outliers = f"{min_value}:{lower_outlier_bnd}:1"
-    upper_outlier_bnd = upper_whisker + 0.000000000001
-    upper_outliers = f"{upper_outlier_bnd}:{max_value}:1"
-    if min_value < lower_whisker and max_value > upper_whisker:
-        recode_rules = "{}\n{}".format(lower_outliers, upper_outliers)
-    elif min_value < lower_whisker:
-        recode_rules = lower_outliers
-    elif max_value > upper_whisker:
-        recode_rules = upper_outliers
-    else:
-        recode_rules = False
-
-    # Extract outliers values of ith zone
-    if bool(outliers) and bool(recode_rules):
-        if bool(zones):
-            Module("r.mask", raster=zones, maskcats=int(quantstats_i[0]))
-        tmpname = create_temporary_name("tmp02")
-        tmpvect = create_temporary_name("tmpvec02")
-        Module(
-            "r.recode",
-            input=rastername,
-            output=tmpname,
-            rules="-",
-            stdin_=recode_rules,
-            quiet=True,
-        )
-        vectornames.append(tmpvect)
-        Module(
-            "r.to.vect",
-            input=tmpname,
-            output=tmpvect,
-            type="point",
-            quiet=True,
-        )
-        Module("g.remove", type="raster", name=tmpname, flags="f")
-        if zones:
-            Module("r.mask", flags="r")
-
-        # Get values input raster and write to outlier points
-        colname = strip_mapset(rastername)
-        Module("v.what.rast", map=tmpvect, raster=rastername, column=colname)
-        fliers = Module(
-            "db.select",
-            sql=f"select {colname} from {tmpvect}",
-            stdout_=PIPE,
-        ).outputs.stdout
-        fliers = list(set(fliers.split("\n")[1:-1]))
-        fliers = [float(x) for x in fliers]
+    # Ordering boxplots
+    medians = [boxes[zone]["med"] for zone in zone_ids]
+    ids = list(range(len(zone_ids)))
+    if bx_sort == "descending":
+        ordered_list = [i for _, i in sorted(zip(medians, ids), reverse=True)]
+    elif bx_sort == "ascending":
+        ordered_list = [i for _, i in sorted(zip(medians, ids), reverse=False)]
     else:
-        fliers = []
-    return fliers, vectornames
+        ordered_list = ids
+    return boxes, zone_ids, ordered_list
 
 
-def bxp_nozones_stats(rastername, whisker_range):
-    """Compute boxplot statistics
-
-    :param str rastername: name of input raster
-    :param float whisker_range: number representing the whisker range
+def write_outliers(name, value_name, values, cells, zones_name=None, zone_ids=None):
+    """Create a point vector map of outliers
 
-    :return list: list with minimum value, 1st, 2nd and 3rd
-                  quantiles and maximum value of the input raster
+    :param str name: name of the output vector map
+    :param str value_name: name of the value raster (used as column name)
+    :param ndarray values: outlier values
+    :param ndarray cells: index of the cells (row * cols + col) of the outliers
+    :param str zones_name: name of the zonal raster (used as column name)
+    :param ndarray zone_ids: zones of the outliers
     """
-    quantile_rules = Module(
-        "r.quantile",
-        flags="r",
-        input=rastername,
-        percentiles=[25, 50, 75],
-        stdout_=PIPE,
-    ).outputs.stdout
-    quantile_rules = quantile_rules.replace("\r", "").split("\n")
-    quantile_rules = [_f for _f in quantile_rules if _f]
-    quantiles = [x.split(":") for x in quantile_rules]
-    min_value = float(quantiles[0][0])
-    quant1 = float(quantiles[0][1])
-    quant2 = float(quantiles[1][1])
-    quant3 = float(quantiles[2][1])
-    max_value = float(quantiles[3][1])
-
-    # Compute iqr and whisker limits
-    iqr = whisker_range * (quant3 - quant1)
-    lower_bound = quant1 - iqr
-    if lower_bound > min_value:
-        lower_whisker = lower_bound
-    else:
-        lower_whisker = min_value
-    upper_bound = quant3 + iqr
-    if upper_bound < max_value:
-        upper_whisker = upper_bound
-    else:
-        upper_whisker = max_value
-
-    # Return values
-    return [
-        min_value,
-        quant1,
-        quant2,
-        quant3,
-        max_value,
-        iqr,
-        lower_whisker,
-        upper_whisker,
+    reg = Region()
+    rows, cols = np.divmod(cells, reg.cols)
+    records = [
+        (reg.west + (cols + 0.5) * reg.ewres).tolist(),
+        (reg.north - (rows + 0.5) * reg.nsres).tolist(),
+        values.tolist(),
     ]
+    columns = [
+        "x double precision",
+        "y double precision",
+        "{} double precision".format(strip_mapset(value_name)),
+    ]
+    if zone_ids is not None:
+        records.append(zone_ids.tolist())
+        columns.append("{} integer".format(strip_mapset(zones_name)))
+    Module(
+        "v.in.ascii",
+        input="-",
+        output=name,
+        separator="pipe",
+        columns=", ".join(columns),
+        x=1,
+        y=2,
+        stdin_="\n".join("|".join(map(str, rec)) for rec in zip(*records)),
+        quiet=True,
+    )
+    Module("v.db.dropcolumn", map=name, columns=["x", "y"], quiet=True)
+    gs.message("Point vector map '{}' created".format(name))
 
 
 def bxp_nozones(opt):
@@ -776,61 +632,28 @@ def bxp_nozones(opt):
     :param dict opt: dictionary with the input variables/objects
     """
 
-    # Compute boxplot stats
-    (
-        min_value,
-        quant1,
-        quant2,
-        quant3,
-        max_value,
-        iqr,
-        lower_whisker,
-        upper_whisker,
-    ) = bxp_nozones_stats(opt["value_raster"], opt["whisker_range"])
-
-    # Compute notch limits
-    if bool(opt["notch"]):
-        lower_notch, upper_notch = compute_notch(opt["value_raster"], quant2, iqr)
-    else:
-        lower_notch = upper_notch = ""
+    # Compute boxplot stats and notch limits in one pass
+    stats = read_stats(opt["value_raster"])
+    count = stats.count()
+    if not count:
+        gs.fatal(_("Raster map {} contains no data").format(opt["value_name"]))
+    box = stats.box(
+        opt["whisker_range"], 0, notch_count=count if opt["notch"] else None
+    )
 
     # Compute outliers
+    map_outliers = bool(opt["outliers"]) and bool(opt["name_outliers_map"])
     if bool(opt["outliers"]):
-        fliers, vect_name = compute_outliers(
-            opt["value_raster"],
-            min_value,
-            max_value,
-            lower_whisker,
-            upper_whisker,
-            [],
-            [],
-            opt["outliers"],
-            False,
+        outliers = compute_outliers(
+            stats, {0: box}, opt["value_raster"], cells=map_outliers
         )
-    else:
-        fliers = []
-
-    if opt["name_outliers_map"] and bool(fliers):
-        print(vect_name)
-        Module("v.db.dropcolumn", map=vect_name[0], columns=["value", "label"])
-        Module("g.rename", vector=[vect_name[0], opt["name_outliers_map"]])
-        gs.message("Point vector map '{}' created".format(opt["name_outliers_map"]))
+        if map_outliers and bool(box["fliers"]):
+            values, _, cells = outliers
+            write_outliers(opt["name_outliers_map"], opt["value_name"], values, cells)
 
     # Create plot
     _, ax = plt.subplots(figsize=opt["dimensions"])
-    boxes = [
-        {
-            "label": strip_mapset(opt["value_name"]),
-            "whislo": lower_whisker,
-            "q1": quant1,
-            "med": quant2,
-            "q3": quant3,
-            "whishi": upper_whisker,
-            "fliers": fliers,
-            "cilo": lower_notch,
-            "cihi": upper_notch,
-        }
-    ]
+    boxes = [{"label": strip_mapset(opt["value_name"]), **box}]
     boxprops = dict(linewidth=opt["bxp_linewidth"], facecolor=opt["bx_color"])
     whiskerprops = dict(linewidth=opt["whisker_linewidth"])
     medianprops = dict(linewidth=opt["median_lw"], color=opt["median_color"])
@@ -903,109 +726,59 @@ def bxp_zones(opt):
     if opt["bx_zonalcolors"]:
         zones_rgb, txt_rgb = get_zonalcolors(opt["zones_raster"], labelsids)
 
-    # Compute statistics
-    quantstats, ordered_list = bx_zonal_stats(
-        opt["zones_raster"], opt["value_raster"], opt["bx_sort"]
+    # Compute statistics and notch limits of all zones in one pass
+    stats = read_stats(opt["value_raster"], zones=opt["zones_raster"])
+    if not stats.count():
+        gs.fatal(_("Raster map {} contains no data").format(opt["value_name"]))
+    zone_boxes, zone_ids, ordered_list = bx_zonal_stats(
+        stats,
+        opt["whisker_range"],
+        bool(opt["notch"]),
+        opt["bx_sort"],
     )
 
+    # Compute outliers
+    map_outliers = bool(opt["outliers"]) and bool(opt["name_outliers_map"])
+    outliers = None
+    if bool(opt["outliers"]):
+        outliers = compute_outliers(
+            stats,
+            zone_boxes,
+            opt["value_raster"],
+            zones=opt["zones_raster"],
+            cells=map_outliers,
+        )
+
     # Change the order of the colors of the boxplots and median to match the
     # order in which the boxplots will be plottted
     if opt["bx_zonalcolors"]:
         zones_rgb[:] = [zones_rgb[i] for i in ordered_list]
         txt_rgb[:] = [txt_rgb[i] for i in ordered_list]
 
-    # Define the boxes
-    boxes = []
-    vectornames = []
-
     # Construct per zone the boxplot
+    boxes = []
     for i in ordered_list:
-
-        # Get stats for the ith boxplot
-        (
-            min_value,
-            quant1,
-            quant2,
-            quant3,
-            max_value,
-            iqr,
-            lower_whisker,
-            upper_whisker,
-        ) = get_bx_stats(quantstats[i], opt["whisker_range"])
-
-        # Compute notch limits
-        if opt["notch"]:
-            lower_notch, upper_notch = compute_notch(opt["value_raster"], quant2, iqr)
-        else:
-            lower_notch = upper_notch = ""
-
-        # Compute outliers
-        if opt["outliers"]:
-            fliers, vectornames = compute_outliers(
-                opt["value_raster"],
-                min_value,
-                max_value,
-                lower_whisker,
-                upper_whisker,
-                vectornames,
-                quantstats[i],
-                opt["outliers"],
-                opt["zones_raster"],
-            )
-        else:
-            fliers = []
-
-        # Construct box
         # Get boxplot label and stats
         if bool(opt["show_catnumbers"]):
             zone_name = "{}) {}".format(labelsids[i], labels[i])
         else:
             zone_name = labels[i]
-
-        dict_i = {
-            "label": zone_name,
-            "whislo": lower_whisker,
-            "q1": quant1,
-            "med": quant2,
-            "q3": quant3,
-            "whishi": upper_whisker,
-            "fliers": fliers,
-            "cilo": lower_notch,
-            "cihi": upper_notch,
-        }
-        boxes.append(dict_i)
+        boxes.append({"label": zone_name, **zone_boxes[zone_ids[i]]})
 
     # Save outlier vector layer
-    if bool(opt["name_outliers_map"]) and bool(vectornames):
-        if len(vectornames) == 1:
-            Module("g.rename", vector=[vectornames[0], opt["name_outliers_map"]])
-        else:
-            Module(
-                "v.patch",
-                flags="e",
-                input=vectornames,
-                output=opt["name_outliers_map"],
-            )
-        Module(
-            "v.db.dropcolumn",
-            map=opt["name_outliers_map"],
-            columns=["value", "label"],
+    if map_outliers and outliers[0].size:
+        values, outlier_zones, cells = outliers
+        write_outliers(
+            opt["name_outliers_map"],
+            opt["value_name"],
+            values,
+            cells,
+            zones_name=opt["zones_name"],
+            zone_ids=outlier_zones,
         )
-        colzones = strip_mapset(opt["zones_name"])
-        Module(
-            "v.what.rast",
-            map=opt["name_outliers_map"],
-            raster=opt["zones_raster"],
-            column=colzones,
-        )
-        gs.message("Point vector map '{}' created".format(opt["name_outliers_map"]))
     elif bool(opt["name_outliers_map"]):
         gs.message("\n--> There are no outliers B")
 
-    # Remove intermediate layers
-    if opt["outliers"] and vectornames:
-        Module("g.remove", type="vector", name=vectornames, flags="f")
-
     # Set plot dimensions and fontsize
     if bool(opt["fontsize"]):
         plt.rcParams["font.size"] = opt["fontsize"]
@@ -1016,7 +789,7 @@ def bxp_zones(opt):
     # Draw raster statistics
     rast_median_alpha = min(1, opt["raster_stat_alpha"] + 0.1)
     if bool(opt["plot_rast_stats"]) and bool(opt["vertical"]):
-        _, quant1_r, quant2_r, quant3_r, _ = raster_stats(name=opt["value_raster"])
+        quant1_r, quant2_r, quant3_r = stats.quantiles([0.25, 0.5, 0.75])
         plot_rast_stats_l = opt["plot_rast_stats"].split(",")
         if "IQR" in plot_rast_stats_l:
             ax.axhspan(
@@ -1037,7 +810,7 @@ def bxp_zones(opt):
                 linewidth=opt["median_lw"],
             )
     elif bool(opt["plot_rast_stats"]):
-        _, quant1_r, quant2_r, quant3_r, _ = raster_stats(name=opt["value_raster"])
+        quant1_r, quant2_r, quant3_r = stats.quantiles([0.25, 0.5, 0.75])
         plot_rast_stats_l = opt["plot_rast_stats"].split(",")
         if "IQR" in plot_rast_stats_l:
             ax.axvspan(
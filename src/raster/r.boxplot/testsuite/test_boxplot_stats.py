@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+MODULE:    Test of r.boxplot
+
+PURPOSE:   Test of the streaming boxplot statistics (boxplot_stats) against
+           the statistics of all values of a raster
+
+COPYRIGHT: (C) 2024 by the GRASS Development Team
+
+This program is free software under the GNU General Public
+License (>=v2). Read the file COPYING that comes with GRASS
+for details.
+"""
+import numpy as np
+
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+from grass.pygrass.raster import RasterRow
+from grass.script.utils import set_path
+
+set_path("r.boxplot")
+from boxplot_stats import RELATIVE_ACCURACY, read_outliers, read_stats
+
+
+class TestBoxplotStats(TestCase):
+    """Test quantiles, zones and outliers of integer and floating point maps"""
+
+    elevation = "elevation@PERMANENT"
+    zones_map = "landclass96@PERMANENT"
+
+    # rasters created during test
+    cell_map = "boxplot_cell"
+    dcell_map = "boxplot_dcell"
+
+    probabilities = [0, 0.25, 0.5, 0.75, 1]
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates an integer and a floating point raster with nulls"""
+        cls.use_temp_region()
+        cls.runModule("g.region", raster=cls.elevation, res=30)
+        cls.runModule(
+            "r.mapcalc",
+            expression="{} = if(row() % 7, int({}), null())".format(
+                cls.cell_map, cls.elevation
+            ),
+        )
+        cls.runModule(
+            "r.mapcalc",
+            expression="{} = if(row() % 7, double({}) - 100, null())".format(
+                cls.dcell_map, cls.elevation
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.del_temp_region()
+        cls.runModule(
+            "g.remove", flags="f", type="raster", name=[cls.cell_map, cls.dcell_map]
+        )
+
+    def read_raster(self, name):
+        with RasterRow(name) as src:
+            return np.array([np.asarray(row) for row in src])
+
+    def values(self, name, zone=None):
+        """Return the non-null values of a raster, optionally of one zone"""
+        values = self.read_raster(name).ravel()
+        if values.dtype.kind == "f":
+            valid = ~np.isnan(values)
+        else:
+            valid = values != np.iinfo(np.int32).min
+        values = values.astype(np.float64)
+        if zone is not None:
+            valid &= self.read_raster(self.zones_map).ravel() == zone
+        return values[valid]
+
+    def test_cell_quantiles(self):
+        """Quantiles of integer maps are exact"""
+        stats = read_stats(self.cell_map)
+        values = self.values(self.cell_map)
+        self.assertTrue(stats.integer)
+        self.assertEqual(stats.count(), values.size)
+        np.testing.assert_allclose(
+            stats.quantiles(self.probabilities),
+            np.quantile(values, self.probabilities),
+        )
+
+    def test_dcell_quantiles(self):
+        """Quantiles of floating point maps are within the relative accuracy,
+        the minimum and maximum are exact"""
+        stats = read_stats(self.dcell_map)
+        values = self.values(self.dcell_map)
+        self.assertFalse(stats.integer)
+        self.assertEqual(stats.count(), values.size)
+        quantiles = stats.quantiles(self.probabilities)
+        np.testing.assert_allclose(
+            quantiles, np.quantile(values, self.probabilities), rtol=RELATIVE_ACCURACY
+        )
+        self.assertEqual(quantiles[0], values.min())
+        self.assertEqual(quantiles[-1], values.max())
+
+    def test_zones(self):
+        """Statistics per zone equal the statistics of the values of the zone"""
+        stats = read_stats(self.cell_map, zones=self.zones_map)
+        zones = stats.zones()
+        self.assertTrue(zones)
+        for zone in zones:
+            values = self.values(self.cell_map, zone)
+            self.assertEqual(stats.count(zone), values.size)
+            np.testing.assert_allclose(
+                stats.quantiles(self.probabilities, zone),
+                np.quantile(values, self.probabilities),
+            )
+
+    def test_notch(self):
+        """Notches are based on the given number of values"""
+        stats = read_stats(self.cell_map)
+        box = stats.box(1.5, notch_count=100)
+        half_width = 1.57 * 1.5 * (box["q3"] - box["q1"]) / 10
+        self.assertAlmostEqual(box["cihi"] - box["med"], half_width)
+        self.assertAlmostEqual(box["med"] - box["cilo"], half_width)
+        self.assertEqual(stats.box(1.5)["cilo"], "")
+
+    def test_fliers(self):
+        """Outliers are listed once per cell, for histograms and rereads"""
+        stats = read_stats(self.cell_map)
+        box = stats.box(0.1)
+        values = self.values(self.cell_map)
+        expected = np.sort(
+            values[(values < box["whislo"]) | (values > box["whishi"])]
+        ).tolist()
+        self.assertTrue(expected)
+        self.assertEqual(stats.fliers(box), expected)
+
+        fliers, zone_ids, cells = read_outliers(
+            self.cell_map, {0: (box["whislo"], box["whishi"])}
+        )
+        self.assertEqual(sorted(fliers.tolist()), expected)
+        self.assertEqual(cells.size, len(expected))
+
+
+if __name__ == "__main__":
+    test()
@@ -184,6 +184,17 @@ Todo:
 # % guisection: Settings
 # %end
 
+# %flag
+# % key: c
+# % description: Reuse existing cost distance maps of patches instead of recomputing them
+# % guisection: Settings
+# %end
+
+# %option G_OPT_M_NPROCS
+# % description: Number of patches processed in parallel
+# % guisection: Settings
+# %end
+
 ##%flag
 ##% key: w
 ##% description: Use the use walking distance (r.walk) instead of cost distance (r.cost)
@@ -223,7 +234,9 @@ import sys
 import string
 import random
 import subprocess
+from functools import partial
 from io import BytesIO
+from multiprocessing import Pool
 import numpy as np
 import grass.script as grass
 from grass.pygrass.vector import VectorTopo
@@ -262,6 +275,279 @@ def cleanup():
         )
 
 
+def patch_distances(settings, cat):
+    """Compute cost distances from a patch to all patches within the
+    cutoff distance
+
+    Runs in a worker process with its own computational region (set with
+    GRASS_REGION) and temporary maps named after the patch, so that
+    patches can be processed in parallel in the current mapset.
+
+    Returns a dict with the category of the patch, a list of edges as
+    (to_patch, min_dist, dist, max_dist) tuples, the names of the vector
+    maps with shortest paths and whether an edge has zero distance.
+    """
+    tmp_prefix = settings["tmp_prefix"]
+    patches_pol = "{}_patches_pol".format(tmp_prefix)
+    patches_boundary = "{}_patches_boundary".format(tmp_prefix)
+    start_patch = "{}_patch_{}".format(tmp_prefix, cat)
+    start_buffer = "{}_patch_{}_buffer".format(tmp_prefix, cat)
+    neighbours = "{}_patch_{}_neighbours_contur".format(tmp_prefix, cat)
+    cost_distance_map = "{}_patch_{}_cost_dist".format(settings["prefix"], cat)
+    cutoff = settings["cutoff"]
+    result = {"cat": cat, "edges": [], "paths": [], "zero_dist": False}
+
+    # Get BoundingBox
+    from_bbox = grass.parse_command(
+        "v.db.select",
+        map=settings["patch_map"],
+        flags="r",
+        where="cat={}".format(cat),
+    )
+
+    # Set region to patch search radius within the start region
+    reg = grass.parse_command(
+        "g.region",
+        flags="ug",
+        quiet=True,
+        n=float(from_bbox["n"]) + cutoff,
+        s=float(from_bbox["s"]) - cutoff,
+        e=float(from_bbox["e"]) + cutoff,
+        w=float(from_bbox["w"]) - cutoff,
+        align=patches_pol,
+    )
+    env = os.environ.copy()
+    env["GRASS_REGION"] = grass.region_env(
+        n=min(float(reg["n"]), settings["n"]),
+        s=max(float(reg["s"]), settings["s"]),
+        e=min(float(reg["e"]), settings["e"]),
+        w=max(float(reg["w"]), settings["w"]),
+        align=patches_pol,
+    )
+
+    # Prepare start patch
+    recl = grass.feed_command(
+        "r.reclass",
+        quiet=True,
+        input=patches_boundary,
+        output=start_patch,
+        rules="-",
+        env=env,
+    )
+    recl.stdin.write(grass.encode("{} = 1\n* = NULL".format(cat)))
+    recl.stdin.close()
+    recl.wait()
+
+    # Restrict borders of neighbour patches to a buffer around the
+    # start-patch
+    grass.run_command(
+        "r.buffer",
+        quiet=True,
+        input=start_patch,
+        output=start_buffer,
+        distances=cutoff,
+        env=env,
+    )
+    grass.run_command(
+        "r.mapcalc",
+        quiet=True,
+        expression="{n}=if(isnull({b}), null(), \
+                          if({pb}=={p}, null(), {pb}))".format(
+            n=neighbours, b=start_buffer, pb=patches_boundary, p=cat
+        ),
+        env=env,
+    )
+
+    # Calculate cost distance, reuse an existing cost distance map if
+    # requested
+    if not (
+        settings["reuse"]
+        and grass.find_file(cost_distance_map, element="cell", mapset=".")["name"]
+    ):
+        grass.run_command(
+            "r.cost",
+            flags=settings["dist_flags"],
+            quiet=True,
+            overwrite=True,
+            input=settings["costs"],
+            output=cost_distance_map,
+            start_rast=start_patch,
+            memory=settings["memory"],
+            env=env,
+        )
+
+        cdhist = History(cost_distance_map)
+        cdhist.clear()
+        cdhist.creator = settings["user"]
+        cdhist.write()
+        # History object cannot modify description
+        grass.run_command(
+            "r.support",
+            map=cost_distance_map,
+            description="Generated by r.connectivity.distance",
+            history=settings["cmdline"],
+            env=env,
+        )
+
+    # Export distance at boundaries
+    connections = grass.encode(
+        grass.read_command(
+            "r.stats",
+            flags="1ng",
+            quiet=True,
+            input=[neighbours, cost_distance_map],
+            separator=";",
+            env=env,
+        ).rstrip("\n")
+    )
+
+    tmp_maps = [start_patch, start_buffer, neighbours]
+    if not connections:
+        grass.warning("No connections for patch {}".format(cat))
+        grass.run_command(
+            "g.remove", quiet=True, flags="f", type="raster", name=tmp_maps, env=env
+        )
+        return result
+
+    con_array = np.atleast_1d(
+        np.genfromtxt(
+            BytesIO(connections),
+            delimiter=";",
+            dtype=None,
+            names=["x", "y", "cat", "dist"],
+        )
+    )
+
+    # Find closest points on neigbour patches
+    con_array.sort(order=["cat", "dist"])
+    to_cats, starts = np.unique(con_array["cat"], return_index=True)
+    to_coords = []
+    for to_cat, connection in zip(to_cats, np.split(con_array, starts[1:])):
+        pixel = min(settings["border_dist"], len(connection) - 1)
+        edge = (
+            int(to_cat),
+            connection["dist"][0],
+            connection["dist"][pixel],
+            connection["dist"][-1],
+        )
+        result["edges"].append(edge)
+        to_coords.append(
+            "{},{},{},{},{},{}".format(connection["x"][0], connection["y"][0], *edge)
+        )
+
+        if edge[2] <= 0:
+            result["zero_dist"] = True
+
+    # Save closest points and shortest paths through cost raster as
+    # vector map (r.drain limited to 1024 points) if requested
+    if settings["p_flag"]:
+        grass.verbose("Extracting shortest paths for patch number {}...".format(cat))
+
+        for chunk in range(0, len(to_coords), 1024):
+            start_points = "{}_patch_{}_cp_{}".format(tmp_prefix, cat, chunk)
+            cost_paths = "{}_patch_{}_cost_paths_{}".format(tmp_prefix, cat, chunk)
+            # Import closest points for start-patch in chunks of 1024 points
+            sp = grass.feed_command(
+                "v.in.ascii",
+                flags="nr",
+                overwrite=True,
+                quiet=True,
+                input="-",
+                stderr=subprocess.PIPE,
+                output=start_points,
+                separator=",",
+                columns="x double precision,\
+                                       y double precision,\
+                                       to_p integer,\
+                                       dist_min double precision,\
+                                       dist double precision,\
+                                       dist_max double precision",
+                env=env,
+            )
+            sp.stdin.write(grass.encode("\n".join(to_coords[chunk : chunk + 1024])))
+            sp.stdin.close()
+            sp.wait()
+
+            # Extract shortest paths for start-patch
+            grass.run_command(
+                "r.drain",
+                overwrite=True,
+                quiet=True,
+                input=cost_distance_map,
+                output=cost_paths,
+                drain=cost_paths,
+                start_points=start_points,
+                env=env,
+            )
+
+            grass.run_command(
+                "v.db.addtable",
+                map=cost_paths,
+                quiet=True,
+                columns="cat integer,\
+                               from_p integer,\
+                               to_p integer,\
+                               dist_min double precision,\
+                               dist double precision,\
+                               dist_max double precision",
+                env=env,
+            )
+            grass.run_command(
+                "v.db.update",
+                map=cost_paths,
+                column="from_p",
+                value=cat,
+                quiet=True,
+                env=env,
+            )
+            grass.run_command(
+                "v.distance",
+                quiet=True,
+                from_=cost_paths,
+                to=start_points,
+                upload="to_attr",
+                column="to_p",
+                to_column="to_p",
+                env=env,
+            )
+            grass.run_command(
+                "v.db.join",
+                quiet=True,
+                map=cost_paths,
+                column="to_p",
+                other_column="to_p",
+                other_table=start_points,
+                subset_columns="dist_min,dist,dist_max",
+                env=env,
+            )
+            grass.run_command(
+                "g.remove",
+                quiet=True,
+                flags="f",
+                type="vector",
+                name=start_points,
+                env=env,
+            )
+            grass.run_command(
+                "g.remove",
+                quiet=True,
+                flags="f",
+                type="raster",
+                name=cost_paths,
+                env=env,
+            )
+            result["paths"].append(cost_paths)
+
+    # Remove temporary map data for patch
+    if settings["r_flag"]:
+        tmp_maps.append(cost_distance_map)
+    grass.run_command(
+        "g.remove", quiet=True, flags="f", type="raster", name=tmp_maps, env=env
+    )
+
+    return result
+
+
 def main():
     """Do the main processing"""
 
@@ -282,6 +568,7 @@ def main():
     border_dist = int(options["border_dist"])
     conefor_dir = options["conefor_dir"]
     memory = int(options["memory"])
+    nprocs = int(options["nprocs"])
 
     # Parse output options:
     prefix = options["prefix"]
@@ -303,9 +590,6 @@ def main():
     if not os.path.exists(folder):
         os.makedirs(folder)
 
-    # Setup counter for progress message
-    counter = 0
-
     # Check if location is lat/lon (only in lat/lon geodesic distance
     # measuring is supported)
     if grass.locn_is_latlong():
@@ -524,25 +808,6 @@ def main():
         map(int, set([x for x in rasterized_cats.split("\n") if x != ""]))
     )
 
-    # Init output vector maps if they are requested by user
-    network = VectorTopo(edge_map)
-    network_columns = [
-        ("cat", "INTEGER PRIMARY KEY"),
-        ("from_p", "INTEGER"),
-        ("to_p", "INTEGER"),
-        ("min_dist", "DOUBLE PRECISION"),
-        ("dist", "DOUBLE PRECISION"),
-        ("max_dist", "DOUBLE PRECISION"),
-    ]
-    network.open("w", tab_name=edge_map, tab_cols=network_columns)
-
-    vertex = VectorTopo(vertex_map)
-    vertex_columns = [
-        ("cat", "INTEGER PRIMARY KEY"),
-        (pop_proxy, "DOUBLE PRECISION"),
-    ]
-    vertex.open("w", tab_name=vertex_map, tab_cols=vertex_columns)
-
     if p_flag:
         # Init cost paths file for start-patch
         grass.run_command("v.edit", quiet=True, map=shortest_paths, tool="create")
@@ -578,7 +843,20 @@ def main():
                       visual representation of the patch."
         )
 
-    for cat in cats:
+    # Get centroid coordinates (average of the centroids of MultiPolygons)
+    # and population proxy of the patches
+    coords = {}
+    for vid, cat in zip(vpatch_ids["vid"], vpatch_ids["cat"]):
+        centroid = Centroid(v_id=int(vid), c_mapinfo=vpatches.c_mapinfo)
+        coords.setdefault(int(cat), []).append((centroid.x, centroid.y))
+    coords = {cat: np.average(xy, axis=0) for cat, xy in coords.items()}
+
+    vpatches.table.filters.select("cat", pop_proxy)
+    proxy_vals = dict(vpatches.table.execute().fetchall())
+    vpatches.close()
+
+    patch_cats = []
+    for cat in sorted(cats):
         if cat not in rasterized_cats:
             grass.warning(
                 "Patch {} has not been rasterized and will \
@@ -588,383 +866,104 @@ def main():
                     cat
                 )
             )
-
             continue
+        patch_cats.append(int(cat))
+
+    settings = {
+        "tmp_prefix": TMP_PREFIX,
+        "prefix": prefix,
+        "patch_map": patch_map,
+        "costs": costs,
+        "cutoff": cutoff,
+        "border_dist": border_dist,
+        "memory": memory,
+        "dist_flags": dist_flags,
+        "n": float(max_n),
+        "s": float(min_s),
+        "e": float(max_e),
+        "w": float(min_w),
+        "p_flag": p_flag,
+        "r_flag": r_flag,
+        "reuse": flags["c"],
+        "user": os.environ["USER"],
+        "cmdline": os.environ["CMDLINE"],
+    }
+
+    # Compute cost distances for all patches in parallel and collect
+    # the results in memory
+    worker = partial(patch_distances, settings)
+    if nprocs > 1:
+        pool = Pool(nprocs)
+        results = pool.imap_unordered(worker, patch_cats)
+    else:
+        results = map(worker, patch_cats)
+
+    patch_results = {}
+    for counter, result in enumerate(results):
         grass.verbose(
-            "Calculating connectivity-distances for patch \
+            "Calculated connectivity-distances for patch \
                       number {}".format(
-                cat
-            )
-        )
-
-        # Filter
-        from_vpatch = vpatch_ids[vpatch_ids["cat"] == cat]
-
-        # Get patch ID
-        if from_vpatch["vid"].size == 1:
-            from_centroid = Centroid(
-                v_id=int(from_vpatch["vid"]), c_mapinfo=vpatches.c_mapinfo
+                result["cat"]
             )
-            from_x = from_centroid.x
-            from_y = from_centroid.y
-
-            # Get centroid
-            if not from_centroid:
-                continue
-        else:
-            xcoords = []
-            ycoords = []
-            for f_p in from_vpatch["vid"]:
-                from_centroid = Centroid(v_id=int(f_p), c_mapinfo=vpatches.c_mapinfo)
-                xcoords.append(from_centroid.x)
-                ycoords.append(from_centroid.y)
-
-                # Get centroid
-                if not from_centroid:
-                    continue
-            from_x = np.average(xcoords)
-            from_y = np.average(ycoords)
-
-        # Get BoundingBox
-        from_bbox = grass.parse_command(
-            "v.db.select", map=patch_map, flags="r", where="cat={}".format(cat)
-        )
-
-        attr_filter = vpatches.table.filters.select(pop_proxy)
-        attr_filter = attr_filter.where("cat={}".format(cat))
-        proxy_val = vpatches.table.execute().fetchone()
-
-        # Prepare start patch
-        start_patch = "{}_patch_{}".format(TMP_PREFIX, cat)
-        reclass_rule = grass.encode("{} = 1\n* = NULL".format(cat))
-        recl = grass.feed_command(
-            "r.reclass",
-            quiet=True,
-            input="{}_patches_boundary".format(TMP_PREFIX),
-            output=start_patch,
-            rules="-",
-        )
-        recl.stdin.write(reclass_rule)
-        recl.stdin.close()
-        recl.wait()
-
-        # Check if patch was rasterised (patches smaller raster resolution and close to larger patches may not be rasterised)
-        # start_check = grass.parse_command('r.info', flags='r', map=start_patch)
-        # start_check = grass.parse_command('r.univar', flags='g', map=start_patch)
-        # print(start_check)
-        """if start_check['min'] != '1':
-            grass.warning('Patch {} has not been rasterized and will \
-                          therefore not be treated as part of the \
-                          network. Consider using t-flag or change \
-                          resolution.'.format(cat))
-
-            grass.run_command('g.remove', flags='f', vector=start_patch,
-                              raster=start_patch, quiet=True)
-            grass.del_temp_region()
-            continue"""
-
-        # Prepare stop patches
-        ############################################
-        reg = grass.parse_command(
-            "g.region",
-            flags="ug",
-            quiet=True,
-            raster=start_patch,
-            n=float(from_bbox["n"]) + float(cutoff),
-            s=float(from_bbox["s"]) - float(cutoff),
-            e=float(from_bbox["e"]) + float(cutoff),
-            w=float(from_bbox["w"]) - float(cutoff),
-            align="{}_patches_pol".format(TMP_PREFIX),
-        )
-
-        north = reg["n"] if max_n > reg["n"] else max_n
-        south = reg["s"] if min_s < reg["s"] else min_s
-        east = reg["e"] if max_e < reg["e"] else max_e
-        west = reg["w"] if min_w > reg["w"] else min_w
-
-        # Set region to patch search radius
-        grass.use_temp_region()
-        grass.run_command(
-            "g.region",
-            quiet=True,
-            n=north,
-            s=south,
-            e=east,
-            w=west,
-            align="{}_patches_pol".format(TMP_PREFIX),
-        )
-
-        # Create buffer around start-patch as a mask
-        # for cost distance analysis
-        grass.run_command(
-            "r.buffer", quiet=True, input=start_patch, output="MASK", distances=cutoff
-        )
-        grass.run_command(
-            "r.mapcalc",
-            quiet=True,
-            expression="{pf}_patch_{p}_neighbours_contur=\
-                                     if({pf}_patches_boundary=={p},\
-                                     null(),\
-                                     {pf}_patches_boundary)".format(
-                pf=TMP_PREFIX, p=cat
-            ),
-        )
-        grass.run_command("r.mask", flags="r", quiet=True)
-
-        # Calculate cost distance
-        cost_distance_map = "{}_patch_{}_cost_dist".format(prefix, cat)
-        grass.run_command(
-            "r.cost",
-            flags=dist_flags,
-            quiet=True,
-            overwrite=True,
-            input=costs,
-            output=cost_distance_map,
-            start_rast=start_patch,
-            memory=memory,
-        )
-
-        # grass.run_command('g.region', flags='up')
-        # grass.raster.raster_history(cost_distance_map)
-        cdhist = History(cost_distance_map)
-        cdhist.clear()
-        cdhist.creator = os.environ["USER"]
-        cdhist.write()
-        # History object cannot modify description
-        grass.run_command(
-            "r.support",
-            map=cost_distance_map,
-            description="Generated by r.connectivity.distance",
-            history=os.environ["CMDLINE"],
-        )
-
-        # Export distance at boundaries
-        maps = "{0}_patch_{1}_neighbours_contur,{2}_patch_{1}_cost_dist"
-        maps = (maps.format(TMP_PREFIX, cat, prefix),)
-
-        connections = grass.encode(
-            grass.read_command(
-                "r.stats", flags="1ng", quiet=True, input=maps, separator=";"
-            ).rstrip("\n")
         )
-        if connections:
-            con_array = np.genfromtxt(
-                BytesIO(connections),
-                delimiter=";",
-                dtype=None,
-                names=["x", "y", "cat", "dist"],
-            )
-        else:
-            grass.warning("No connections for patch {}".format(cat))
-
-            # Write centroid to vertex map
-            vertex.write(Point(from_x, from_y), cat=int(cat), attrs=proxy_val)
-            vertex.table.conn.commit()
+        patch_results[result["cat"]] = result
+        zero_dist = zero_dist or result["zero_dist"]
+        # Print progress message
+        grass.percent(i=counter + 1, n=len(patch_cats), s=3)
 
-            # Remove temporary map data
-            grass.run_command(
-                "g.remove",
-                quiet=True,
-                flags="f",
-                type=["raster", "vector"],
-                pattern="{}*{}*".format(TMP_PREFIX, cat),
-            )
-            grass.del_temp_region()
-            continue
+    if nprocs > 1:
+        pool.close()
+        pool.join()
 
-        # Find closest points on neigbour patches
-        to_cats = set(np.atleast_1d(con_array["cat"]))
-        to_coords = []
-        for to_cat in to_cats:
-            connection = con_array[con_array["cat"] == to_cat]
-            connection.sort(order=["dist"])
-            pixel = (
-                border_dist if len(connection) > border_dist else len(connection) - 1
-            )
-            # closest_points_x = connection['x'][pixel]
-            # closest_points_y = connection['y'][pixel]
-            closest_points_to_cat = to_cat
-            closest_points_min_dist = connection["dist"][0]
-            closest_points_dist = connection["dist"][pixel]
-            closest_points_max_dist = connection["dist"][-1]
-            to_patch_ids = vpatch_ids[vpatch_ids["cat"] == int(to_cat)]["vid"]
-
-            if len(to_patch_ids) == 1:
-                to_centroid = Centroid(v_id=to_patch_ids, c_mapinfo=vpatches.c_mapinfo)
-                to_x = to_centroid.x
-                to_y = to_centroid.y
-            elif len(to_patch_ids) >= 1:
-                xcoords = []
-                ycoords = []
-                for t_p in to_patch_ids:
-                    to_centroid = Centroid(v_id=int(t_p), c_mapinfo=vpatches.c_mapinfo)
-                    xcoords.append(to_centroid.x)
-                    ycoords.append(to_centroid.y)
-
-                    # Get centroid
-                    if not to_centroid:
-                        continue
-                to_x = np.average(xcoords)
-                to_y = np.average(ycoords)
-
-            to_coords.append(
-                "{},{},{},{},{},{}".format(
-                    connection["x"][0],
-                    connection["y"][0],
-                    to_cat,
-                    closest_points_min_dist,
-                    closest_points_dist,
-                    closest_points_max_dist,
-                )
-            )
+    # Init output vector maps if they are requested by user
+    network = VectorTopo(edge_map)
+    network_columns = [
+        ("cat", "INTEGER PRIMARY KEY"),
+        ("from_p", "INTEGER"),
+        ("to_p", "INTEGER"),
+        ("min_dist", "DOUBLE PRECISION"),
+        ("dist", "DOUBLE PRECISION"),
+        ("max_dist", "DOUBLE PRECISION"),
+    ]
+    network.open("w", tab_name=edge_map, tab_cols=network_columns)
 
-            # Save edges to network dataset
-            if closest_points_dist <= 0:
-                zero_dist = 1
+    vertex = VectorTopo(vertex_map)
+    vertex_columns = [
+        ("cat", "INTEGER PRIMARY KEY"),
+        (pop_proxy, "DOUBLE PRECISION"),
+    ]
+    vertex.open("w", tab_name=vertex_map, tab_cols=vertex_columns)
 
-            # Write data to network
+    # Write network and vertices in bulk transactions
+    for cat in patch_cats:
+        from_x, from_y = coords[cat]
+        for edge in patch_results[cat]["edges"]:
+            if edge[0] not in coords:
+                continue
+            to_x, to_y = coords[edge[0]]
             network.write(
                 Line([(from_x, from_y), (to_x, to_y)]),
                 cat=lin_cat,
-                attrs=(
-                    cat,
-                    int(closest_points_to_cat),
-                    closest_points_min_dist,
-                    closest_points_dist,
-                    closest_points_max_dist,
-                ),
+                attrs=(cat,) + edge,
             )
-            network.table.conn.commit()
-
             lin_cat = lin_cat + 1
 
-        # Save closest points and shortest paths through cost raster as
-        # vector map (r.drain limited to 1024 points) if requested
-        if p_flag:
-            grass.verbose(
-                "Extracting shortest paths for patch number \
-                          {}...".format(
-                    cat
-                )
-            )
-
-            points_n = len(to_cats)
-
-            tiles = int(points_n / 1024.0)
-            rest = points_n % 1024
-            if not rest == 0:
-                tiles = tiles + 1
-
-            tile_n = 0
-            while tile_n < tiles:
-                tile_n = tile_n + 1
-                # Import closest points for start-patch in 1000er blocks
-                sp = grass.feed_command(
-                    "v.in.ascii",
-                    flags="nr",
-                    overwrite=True,
-                    quiet=True,
-                    input="-",
-                    stderr=subprocess.PIPE,
-                    output="{}_{}_cp".format(TMP_PREFIX, cat),
-                    separator=",",
-                    columns="x double precision,\
-                                           y double precision,\
-                                           to_p integer,\
-                                           dist_min double precision,\
-                                           dist double precision,\
-                                           dist_max double precision",
-                )
-                sp.stdin.write(grass.encode("\n".join(to_coords)))
-                sp.stdin.close()
-                sp.wait()
-
-                # Extract shortest paths for start-patch in chunks of
-                # 1024 points
-                cost_paths = "{}_{}_cost_paths".format(TMP_PREFIX, cat)
-                start_points = "{}_{}_cp".format(TMP_PREFIX, cat)
-                grass.run_command(
-                    "r.drain",
-                    overwrite=True,
-                    quiet=True,
-                    input=cost_distance_map,
-                    output=cost_paths,
-                    drain=cost_paths,
-                    start_points=start_points,
-                )
-
-                grass.run_command(
-                    "v.db.addtable",
-                    map=cost_paths,
-                    quiet=True,
-                    columns="cat integer,\
-                                   from_p integer,\
-                                   to_p integer,\
-                                   dist_min double precision,\
-                                   dist double precision,\
-                                   dist_max double precision",
-                )
-                grass.run_command(
-                    "v.db.update",
-                    map=cost_paths,
-                    column="from_p",
-                    value=cat,
-                    quiet=True,
-                )
-                grass.run_command(
-                    "v.distance",
-                    quiet=True,
-                    from_=cost_paths,
-                    to=start_points,
-                    upload="to_attr",
-                    column="to_p",
-                    to_column="to_p",
-                )
-                grass.run_command(
-                    "v.db.join",
-                    quiet=True,
-                    map=cost_paths,
-                    column="to_p",
-                    other_column="to_p",
-                    other_table=start_points,
-                    subset_columns="dist_min,dist,dist_max",
-                )
-
-                # grass.run_command('v.info', flags='c',
-                #                  map=cost_paths)
-                grass.run_command(
-                    "v.patch",
-                    flags="ae",
-                    overwrite=True,
-                    quiet=True,
-                    input=cost_paths,
-                    output=shortest_paths,
-                )
-
-                # Remove temporary map data
-                grass.run_command(
-                    "g.remove",
-                    quiet=True,
-                    flags="f",
-                    type=["raster", "vector"],
-                    pattern="{}*{}*".format(TMP_PREFIX, cat),
-                )
-
-        # Remove temporary map data for patch
-        if r_flag:
-            grass.run_command(
-                "g.remove", flags="f", type="raster", name=cost_distance_map, quiet=True
-            )
-
-        vertex.write(Point(from_x, from_y), cat=int(cat), attrs=proxy_val)
-
-        vertex.table.conn.commit()
+        vertex.write(Point(from_x, from_y), cat=cat, attrs=(proxy_vals[cat],))
 
-        # Print progress message
-        grass.percent(i=int((float(counter) / n_cats) * 100), n=100, s=3)
+    network.table.conn.commit()
+    vertex.table.conn.commit()
 
-        # Update counter for progress message
-        counter = counter + 1
+    # Append shortest paths of all patches
+    paths = [p for cat in patch_cats for p in patch_results[cat]["paths"]]
+    for chunk in range(0, len(paths), 100):
+        grass.run_command(
+            "v.patch",
+            flags="ae",
+            overwrite=True,
+            quiet=True,
+            input=paths[chunk : chunk + 100],
+            output=shortest_paths,
+        )
 
     if zero_dist:
         grass.warning(
@@ -0,0 +1,99 @@
+"""Benchmarking of the backends of r.connectivity.network
+
+Compares the Python backend with the R/igraph backend on the networks of
+the example in the manual of r.connectivity.distance and
+r.connectivity.network (North Carolina dataset). Run the
+r.connectivity.distance example first, which creates the network
+hws_connectivity_edges. Additional networks can be added in main().
+
+The R backend is skipped if R or rpy2 are not available.
+"""
+
+from types import SimpleNamespace
+
+from grass.pygrass.modules import Module
+from grass.script import find_program
+
+import grass.benchmark as bm
+import grass.script as gs
+
+PREFIX = "benchmark_r_connectivity_network"
+
+
+def main():
+    results = []
+    backends = ["python"]
+    if find_program("R", "--version"):
+        try:
+            import rpy2  # noqa: F401
+
+            backends.append("R")
+        except ImportError:
+            pass
+
+    # Users can add more or modify existing networks
+    for backend in backends:
+        benchmark(
+            "hws_connectivity_edges",
+            backend,
+            "{} (hws_connectivity)".format(backend),
+            results,
+            max_cores=8,
+        )
+
+    compare(backends)
+    bm.nprocs_plot(results, filename="r_connectivity_network_benchmark.svg")
+
+
+def benchmark(network, backend, label, results, max_cores=8, repeat=3):
+    module = Module(
+        "r.connectivity.network",
+        input=network,
+        prefix="{}_{}".format(PREFIX, backend.lower()),
+        connectivity_cutoff=1500.0,
+        lnbh_cutoff=2.0,
+        exponent=-3,
+        backend=backend,
+        run_=False,
+        stdout_=None,
+        stderr_=None,
+        overwrite=True,
+    )
+
+    # r.connectivity.network uses the cores option instead of nprocs,
+    # which grass.benchmark.benchmark_nprocs sets
+    result = SimpleNamespace(all_times=[], times=[], nprocs=[], label=label)
+    for cores in range(1, max_cores + 1):
+        module.inputs["cores"].value = cores
+        single = bm.benchmark_single(
+            module, label="{} cores={}".format(label, cores), repeat=repeat
+        )
+        result.all_times.append(single.all_times)
+        result.times.append(single.time)
+        result.nprocs.append(cores)
+        print("{} cores={}: {:.2f} s".format(label, cores, single.time))
+    results.append(result)
+
+
+def compare(backends):
+    """Print the graph level measures of all backends side by side"""
+    tables = {}
+    for backend in backends:
+        table = "{}_{}_network_measures".format(PREFIX, backend.lower())
+        rows = gs.read_command(
+            "db.select", sql="SELECT measure, value FROM {}".format(table), flags="c"
+        )
+        tables[backend] = dict(
+            line.split("|", 1) for line in rows.splitlines() if "|" in line
+        )
+
+    measures = tables[backends[0]]
+    for measure in measures:
+        if measure == "Command":
+            continue
+        values = [tables[b].get(measure, "") for b in backends]
+        print("{}: {}".format(measure, " | ".join(values)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1217 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Graph analysis engine of r.connectivity.network
+
+The engine computes the connectivity measures of r.connectivity.network
+in-process instead of in R with igraph. Graphs are stored as arrays in
+compressed sparse row (CSR) layout (the layout of scipy.sparse.csr_matrix).
+Shortest path based measures (betweenness, local betweenness, closeness,
+diameter and directness of edges) are computed with Brandes' algorithm,
+distributed over source vertices to several processes.
+
+The module only depends on numpy, so that it can be used outside of GRASS
+GIS as well, e.g. for benchmarking.
+
+COPYRIGHT:    (C) 2011, 2018 by the Norwegian Institute for Nature
+                                    Research (NINA)
+
+              This program is free software under the GNU General Public
+              License (>=v2). Read the file COPYING that comes with
+              GRASS for details.
+"""
+
+import heapq
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import numpy as np
+
+INF = float("inf")
+
+# Relative tolerance for treating path lengths as equal
+EPSILON = 1e-10
+
+BiconnectedComponents = namedtuple(
+    "BiconnectedComponents",
+    [
+        "count",
+        "edge_component",
+        "tree_component",
+        "bridges",
+        "articulation_points",
+        "vertex_splits",
+    ],
+)
+
+Communities = namedtuple(
+    "Communities",
+    [
+        "removed",
+        "betweenness",
+        "components",
+        "bridges",
+        "memberships",
+        "membership",
+        "modularity",
+    ],
+)
+
+
+class DisjointSet(object):
+    """Union-find structure over vertex indices"""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, v):
+        parent = self.parent
+        root = v
+        while parent[root] != root:
+            root = parent[root]
+        while parent[v] != root:
+            parent[v], v = root, parent[v]
+        return root
+
+    def union(self, a, b):
+        """Join the sets of a and b, return False if they were joined already"""
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return False
+        if root_a < root_b:
+            self.parent[root_b] = root_a
+        else:
+            self.parent[root_a] = root_b
+        return True
+
+    def labels(self):
+        """Return the number of sets and 1-based set labels of all vertices
+        numbered in order of their first vertex (as igraph does)"""
+        labels = np.zeros(len(self.parent), dtype=np.int64)
+        roots = {}
+        for v in range(len(self.parent)):
+            root = self.find(v)
+            if root not in roots:
+                roots[root] = len(roots) + 1
+            labels[v] = roots[root]
+        return len(roots), labels
+
+
+class Graph(object):
+    """
+    Undirected multigraph in CSR layout
+
+    Edges are identified by their index in the source and target arrays.
+    Subgraphs share the vertices and edge indices of the graph they are
+    derived from, so that edge measures of all subgraphs can be stored in
+    arrays of the same length.
+
+    >>> graph = Graph(3, [0, 1], [1, 2])
+    >>> graph.components()
+    (1, array([1, 1, 1]))
+    >>> graph.subgraph(np.array([True, False])).components()[0]
+    2
+    """
+
+    def __init__(self, n_vertices, source, target, mask=None):
+        self.n_vertices = int(n_vertices)
+        self.source = np.asarray(source, dtype=np.int64)
+        self.target = np.asarray(target, dtype=np.int64)
+        if mask is None:
+            mask = np.ones(len(self.source), dtype=bool)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.edge_ids = np.flatnonzero(self.mask)
+
+        # Every edge is stored in both directions
+        tails = np.concatenate([self.source[self.edge_ids], self.target[self.edge_ids]])
+        heads = np.concatenate([self.target[self.edge_ids], self.source[self.edge_ids]])
+        edges = np.concatenate([self.edge_ids, self.edge_ids])
+        order = np.argsort(tails, kind="stable")
+
+        self.indptr = np.zeros(self.n_vertices + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=self.n_vertices), out=self.indptr[1:])
+        self.indices = heads[order]
+        self.edges = edges[order]
+
+    @property
+    def n_edges(self):
+        return len(self.edge_ids)
+
+    def subgraph(self, mask):
+        """Return the subgraph with the edges in mask (and all vertices)"""
+        return Graph(self.n_vertices, self.source, self.target, self.mask & mask)
+
+    def csr(self, weight):
+        """Return (data, indices, indptr) of the weighted adjacency matrix,
+        e.g. for scipy.sparse.csr_matrix"""
+        return np.asarray(weight)[self.edges], self.indices, self.indptr
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def density(self):
+        n = self.n_vertices
+        return self.n_edges / (n * (n - 1) / 2.0) if n > 1 else np.nan
+
+    def components(self):
+        """Return the number of connected components and the 1-based
+        component membership of the vertices"""
+        sets = DisjointSet(self.n_vertices)
+        for a, b in zip(
+            self.source[self.edge_ids].tolist(), self.target[self.edge_ids].tolist()
+        ):
+            sets.union(a, b)
+        return sets.labels()
+
+    def edge_array(self, values, dtype=np.float64):
+        """Return a masked array of edge values, masking edges which are not
+        part of the graph"""
+        values = np.ma.masked_array(
+            np.asarray(values, dtype=dtype), mask=~self.mask, copy=True
+        )
+        return values
+
+
+def rescale_inverse(values):
+    """
+    Invert values into the range of weights igraph accepts
+    (1e-12 to 1e16) by linear rescaling, as in the R implementation
+    """
+    values = np.asarray(values, dtype=np.float64)
+    negative = -values
+    lower = max(values.min(), 1e-12)
+    upper = min(values.max(), 1e16)
+    span = negative.max() - negative.min()
+    if span == 0:
+        return np.full_like(values, lower)
+    return (negative - negative.min()) * (upper - lower) / span + lower
+
+
+def minimum_spanning_tree(graph, weight):
+    """
+    Return a boolean array of the edges of the minimum spanning forest
+    (Kruskal's algorithm)
+    """
+    weight = np.asarray(weight)
+    ids = graph.edge_ids[np.argsort(weight[graph.edge_ids], kind="stable")]
+    sets = DisjointSet(graph.n_vertices)
+    tree = np.zeros(len(graph.mask), dtype=bool)
+    for e, a, b in zip(
+        ids.tolist(), graph.source[ids].tolist(), graph.target[ids].tolist()
+    ):
+        tree[e] = sets.union(a, b)
+    return tree
+
+
+def biconnected_components(graph):
+    """
+    Find biconnected components, bridges and articulation points
+    (iterative Hopcroft-Tarjan algorithm)
+
+    Returns a BiconnectedComponents tuple with the number of components,
+    the 1-based component of every edge, the component of every edge of the
+    depth first search tree (0 for other edges), boolean arrays of bridges
+    and articulation points and, for every vertex, the number of parts its
+    component falls apart into when the vertex is removed.
+    """
+    n = graph.n_vertices
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    edges = graph.edges.tolist()
+
+    m = len(graph.mask)
+    component = np.zeros(m, dtype=np.int64)
+    tree = np.zeros(m, dtype=bool)
+    bridges = np.zeros(m, dtype=bool)
+    splits = np.zeros(n, dtype=np.int64)
+
+    disc = [-1] * n
+    low = [0] * n
+    cuts = [0] * n
+    roots = set()
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if disc[root] != -1:
+            continue
+        roots.add(root)
+        disc[root] = low[root] = counter
+        counter += 1
+        edge_stack = []
+        stack = [(root, -1, indptr[root])]
+        while stack:
+            v, parent_edge, i = stack[-1]
+            if i < indptr[v + 1]:
+                stack[-1] = (v, parent_edge, i + 1)
+                u = indices[i]
+                e = edges[i]
+                if e == parent_edge or u == v:
+                    continue
+                if disc[u] == -1:
+                    tree[e] = True
+                    edge_stack.append(e)
+                    disc[u] = low[u] = counter
+                    counter += 1
+                    stack.append((u, e, indptr[u]))
+                elif disc[u] < disc[v]:
+                    # Back edge to an ancestor
+                    low[v] = min(low[v], disc[u])
+                    edge_stack.append(e)
+                continue
+
+            stack.pop()
+            if not stack:
+                break
+            p = stack[-1][0]
+            low[p] = min(low[p], low[v])
+            if low[v] >= disc[p]:
+                count += 1
+                cuts[p] += 1
+                while True:
+                    f = edge_stack.pop()
+                    component[f] = count
+                    if f == parent_edge:
+                        break
+                if low[v] > disc[p]:
+                    bridges[parent_edge] = True
+
+    # Removing a vertex separates the subtrees of its children that are
+    # not connected to its ancestors. Roots of the depth first search have
+    # no ancestors (and isolated vertices disappear).
+    for v in range(n):
+        splits[v] = cuts[v] if v in roots else cuts[v] + 1
+    articulation = splits > 1
+
+    return BiconnectedComponents(
+        count,
+        component,
+        np.where(tree, component, 0),
+        bridges,
+        articulation,
+        splits,
+    )
+
+
+def _dijkstra(source, indptr, indices, edges, weight):
+    """
+    Single source shortest paths in a weighted graph
+
+    Returns distances, numbers of shortest paths, predecessors (as
+    (vertex, edge) tuples) and the reached vertices in order of increasing
+    distance.
+    """
+    dist = {source: 0.0}
+    sigma = {source: 1.0}
+    preds = {source: []}
+    settled = set()
+    order = []
+    heap = [(0.0, source)]
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+
+    while heap:
+        d, v = heappop(heap)
+        if v in settled:
+            continue
+        settled.add(v)
+        order.append(v)
+        sigma_v = sigma[v]
+        for i in range(indptr[v], indptr[v + 1]):
+            e = edges[i]
+            w = weight[e]
+            if w == INF:
+                continue
+            u = indices[i]
+            if u in settled:
+                continue
+            nd = d + w
+            du = dist.get(u)
+            if du is None or nd < du - EPSILON * du:
+                dist[u] = nd
+                sigma[u] = sigma_v
+                preds[u] = [(v, e)]
+                heappush(heap, (nd, u))
+            elif nd <= du + EPSILON * du:
+                sigma[u] += sigma_v
+                preds[u].append((v, e))
+
+    return dist, sigma, preds, order
+
+
+_STATE = {}
+
+
+def _init_state(state):
+    _STATE.clear()
+    _STATE.update(state)
+
+
+def _source_measures(task):
+    """Accumulate the shortest path measures of a chunk of source vertices"""
+    sources, removed = task
+    n = _STATE["n"]
+    m = _STATE["m"]
+    indptr = _STATE["indptr"]
+    indices = _STATE["indices"]
+    edges = _STATE["edges"]
+    threshold = _STATE["threshold"]
+
+    weights = []
+    for name, weight in _STATE["weights"]:
+        if removed:
+            weight = list(weight)
+            for e in removed:
+                weight[e] = INF
+        weights.append((name, weight))
+
+    result = {}
+    for name, weight in weights:
+        result[name] = {
+            "edge_betweenness": [0.0] * m,
+            "vertex_betweenness": [0.0] * n,
+            "local_edge_betweenness": [0.0] * m,
+            "local_vertex_betweenness": [0.0] * n,
+            "shortest": [0] * m,
+            "farness": {},
+            "eccentricity": 0.0,
+        }
+
+    for s in sources:
+        local = None
+        for k, (name, weight) in enumerate(weights):
+            dist, sigma, preds, order = _dijkstra(s, indptr, indices, edges, weight)
+            res = result[name]
+
+            if len(order) > 1:
+                res["farness"][s] = sum(dist.values())
+            res["eccentricity"] = max(res["eccentricity"], dist[order[-1]])
+
+            # Edges that are (one of) the shortest paths between their ends
+            direct = {}
+            for i in range(indptr[s], indptr[s + 1]):
+                w = weight[edges[i]]
+                u = indices[i]
+                if w != INF and u != s and w < direct.get(u, INF):
+                    direct[u] = w
+            shortest = res["shortest"]
+            for i in range(indptr[s], indptr[s + 1]):
+                u = indices[i]
+                if u in direct and direct[u] <= dist[u] * (1.0 + EPSILON):
+                    shortest[edges[i]] += 1
+
+            # Brandes' dependency accumulation
+            edge_betweenness = res["edge_betweenness"]
+            vertex_betweenness = res["vertex_betweenness"]
+            delta = dict.fromkeys(order, 0.0)
+            for v in reversed(order):
+                coefficient = (1.0 + delta[v]) / sigma[v]
+                for p, e in preds[v]:
+                    c = sigma[p] * coefficient
+                    edge_betweenness[e] += c
+                    delta[p] += c
+                if v != s:
+                    vertex_betweenness[v] += delta[v]
+
+            if threshold is None:
+                continue
+
+            # Local betweenness counts one shortest path to every vertex
+            # within the neighbourhood, which is defined by distances
+            # with the first weight
+            if k == 0:
+                local = set(v for v, d in dist.items() if d < threshold)
+            local_edge = res["local_edge_betweenness"]
+            local_vertex = res["local_vertex_betweenness"]
+            below = dict.fromkeys(order, 0)
+            for v in reversed(order):
+                if v == s:
+                    continue
+                count = below[v] + (v in local)
+                p, e = preds[v][0]
+                local_edge[e] += count
+                local_vertex[v] += below[v]
+                below[p] += count
+
+    return result
+
+
+class ShortestPathAnalysis(object):
+    """
+    Shortest path based measures of a graph for one or more edge weights
+
+    Sources are split into chunks which are processed in parallel if
+    processes > 1. The pool of processes is kept open until the analysis
+    is closed, so that the same graph can be analysed repeatedly (e.g.
+    with edges removed).
+
+    >>> with ShortestPathAnalysis(graph, [("cd", cd_u)], processes=4) as spa:
+    ...     measures = spa.run()
+    >>> measures["cd"]["edge_betweenness"]
+    """
+
+    def __init__(self, graph, weights, local_threshold=None, processes=1):
+        """
+        :param graph: Graph
+        :param weights: list of (name, weight array) tuples with weights
+          for all edges of the graph
+        :param local_threshold: distance (with the first weight) defining
+          the local neighbourhood of a vertex for local betweenness
+        :param processes: number of processes
+        """
+        self.graph = graph
+        self.names = [name for name, weight in weights]
+        self.processes = max(int(processes), 1)
+        self.state = {
+            "n": graph.n_vertices,
+            "m": len(graph.mask),
+            "indptr": graph.indptr.tolist(),
+            "indices": graph.indices.tolist(),
+            "edges": graph.edges.tolist(),
+            "weights": [
+                (name, np.asarray(weight, dtype=np.float64).tolist())
+                for name, weight in weights
+            ],
+            "threshold": local_threshold,
+        }
+        self.pool = None
+        if self.processes > 1:
+            self.pool = Pool(
+                self.processes, initializer=_init_state, initargs=(self.state,)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def run(self, sources=None, removed=()):
+        """
+        Compute measures from the given source vertices
+
+        :param sources: source vertices, all vertices by default
+        :param removed: edges to ignore
+        :return: dict with a dict of measures per weight
+        """
+        n = self.graph.n_vertices
+        m = len(self.graph.mask)
+        if sources is None:
+            sources = range(n)
+        sources = list(sources)
+        removed = list(removed)
+
+        chunks = np.array_split(
+            np.asarray(sources, dtype=np.int64),
+            max(min(len(sources), self.processes * 4), 1),
+        )
+        tasks = [(chunk.tolist(), removed) for chunk in chunks if len(chunk)]
+        if self.pool:
+            parts = self.pool.imap_unordered(_source_measures, tasks)
+        else:
+            _init_state(self.state)
+            parts = map(_source_measures, tasks)
+
+        totals = {}
+        for name in self.names:
+            totals[name] = {
+                "edge_betweenness": np.zeros(m),
+                "vertex_betweenness": np.zeros(n),
+                "local_edge_betweenness": np.zeros(m),
+                "local_vertex_betweenness": np.zeros(n),
+                "shortest": np.zeros(m, dtype=np.int64),
+                "farness": np.full(n, np.nan),
+                "diameter": 0.0,
+            }
+        for part in parts:
+            for name, res in part.items():
+                total = totals[name]
+                for key in (
+                    "edge_betweenness",
+                    "vertex_betweenness",
+                    "local_edge_betweenness",
+                    "local_vertex_betweenness",
+                    "shortest",
+                ):
+                    total[key] += res[key]
+                for v, farness in res["farness"].items():
+                    total["farness"][v] = farness
+                total["diameter"] = max(total["diameter"], res["eccentricity"])
+
+        active = self.graph.mask.copy()
+        active[removed] = False
+        measures = {}
+        for name in self.names:
+            total = totals[name]
+            with np.errstate(divide="ignore"):
+                closeness = 1.0 / total["farness"]
+            measures[name] = {
+                # Every pair of vertices is counted twice in undirected graphs
+                "edge_betweenness": total["edge_betweenness"] / 2.0,
+                "vertex_betweenness": total["vertex_betweenness"] / 2.0,
+                "local_edge_betweenness": total["local_edge_betweenness"] / 2.0,
+                "local_vertex_betweenness": total["local_vertex_betweenness"] / 2.0,
+                "shortest": (total["shortest"] > 0) & active,
+                "closeness": closeness,
+                "diameter": total["diameter"],
+            }
+        return measures
+
+
+def modularity(graph, membership, weight):
+    """Return the weighted modularity of a vertex membership"""
+    ids = graph.edge_ids
+    weight = np.asarray(weight, dtype=np.float64)[ids]
+    total = weight.sum()
+    if total == 0:
+        return np.nan
+    a = membership[graph.source[ids]]
+    b = membership[graph.target[ids]]
+    k = membership.max() + 1
+    inner = np.bincount(a[a == b], weights=weight[a == b], minlength=k)
+    degree = np.bincount(a, weights=weight, minlength=k) + np.bincount(
+        b, weights=weight, minlength=k
+    )
+    return float(np.sum(inner / total - (degree / (2.0 * total)) ** 2))
+
+
+def edge_betweenness_communities(graph, weight, levels=0, processes=1):
+    """
+    Divisive community detection by successive removal of the edge with the
+    highest betweenness (Girvan & Newman 2002)
+
+    After every removal, betweenness is only recomputed for the component
+    the removed edge belonged to.
+
+    :param graph: Graph
+    :param weight: edge weights
+    :param levels: memberships are kept for all numbers of communities below
+      this value
+    :param processes: number of processes for betweenness
+    :return: Communities tuple with the removed edges, their betweenness at
+      removal, the number of components before every removal, a boolean
+      array of removals that split a component, a dict of kept memberships
+      by number of communities and the membership at maximum modularity and
+      its modularity
+    """
+    active = graph.mask.copy()
+    removed = []
+    betweenness_removed = []
+    components = []
+    bridges = []
+
+    n_components, membership = graph.components()
+    memberships = {}
+    if n_components < levels:
+        memberships[n_components] = membership
+    best_modularity = modularity(graph, membership, weight)
+    best_membership = membership
+
+    with ShortestPathAnalysis(graph, [("w", weight)], processes=processes) as spa:
+        betweenness = spa.run()["w"]["edge_betweenness"]
+        while active.any():
+            candidates = np.flatnonzero(active)
+            e = candidates[np.argmax(betweenness[candidates])]
+            removed.append(int(e))
+            betweenness_removed.append(betweenness[e])
+            components.append(n_components)
+
+            active[e] = False
+            current = graph.subgraph(active)
+            new_components, membership = current.components()
+            bridges.append(new_components > n_components)
+
+            if new_components > n_components:
+                n_components = new_components
+                if n_components < levels:
+                    memberships[n_components] = membership
+                q = modularity(graph, membership, weight)
+                if q > best_modularity:
+                    best_modularity = q
+                    best_membership = membership
+
+            affected = np.unique(membership[[graph.source[e], graph.target[e]]])
+            sources = np.flatnonzero(np.isin(membership, affected))
+            if len(sources) > 1:
+                update = spa.run(sources, removed)["w"]["edge_betweenness"]
+                inside = np.isin(membership[graph.source], affected) & active
+                betweenness[inside] = update[inside]
+
+    return Communities(
+        np.array(removed, dtype=np.int64),
+        np.array(betweenness_removed),
+        np.array(components, dtype=np.int64),
+        np.array(bridges, dtype=bool),
+        memberships,
+        best_membership,
+        best_modularity,
+    )
+
+
+def _masked(values, mask=None, dtype=None):
+    values = np.asarray(values) if dtype is None else np.asarray(values, dtype)
+    if mask is None:
+        mask = np.zeros(len(values), dtype=bool)
+    return np.ma.masked_array(values, mask=mask)
+
+
+class ConnectivityNetwork(object):
+    """
+    Network of habitat patches produced by r.connectivity.distance
+
+    The network consists of a directed graph with all connections between
+    patches and an undirected graph with one edge per pair of patches.
+    Edge attributes (potential flow and competing potential flow based on a
+    negative exponential decay kernel) and measures are computed as in the
+    R/igraph implementation of r.connectivity.network. Resulting tables are
+    OrderedDicts of (masked) numpy arrays, masked values represent NULL.
+    """
+
+    def __init__(self, patch_id, pop_proxy, con_id, from_p, to_p, dist, base, exponent):
+        """
+        :param patch_id: category of the patches (vertices)
+        :param pop_proxy: population proxy of the patches
+        :param con_id: category of the connections (directed edges)
+        :param from_p: category of the patch a connection starts from
+        :param to_p: category of the patch a connection leads to
+        :param dist: cost distance of a connection
+        :param base: base of the decay kernel
+        :param exponent: exponent of the decay kernel
+        """
+        self.patch_id = np.asarray(patch_id, dtype=np.int64)
+        self.pop_proxy = np.asarray(pop_proxy, dtype=np.float64)
+
+        order = np.argsort(con_id, kind="stable")
+        con_id = np.asarray(con_id, dtype=np.int64)[order]
+        from_p = np.asarray(from_p, dtype=np.int64)[order]
+        to_p = np.asarray(to_p, dtype=np.int64)[order]
+        cost_distance = np.asarray(dist, dtype=np.float64)[order]
+
+        vertex_index = dict((p, i) for i, p in enumerate(self.patch_id.tolist()))
+        try:
+            from_v = np.array([vertex_index[p] for p in from_p.tolist()], np.int64)
+            to_v = np.array([vertex_index[p] for p in to_p.tolist()], np.int64)
+        except KeyError as e:
+            raise ValueError("Connection to unknown patch {}".format(e))
+
+        # Unordered pairs of patches, numbered in order of appearance
+        pairs = [(min(a, b), max(a, b)) for a, b in zip(from_p.tolist(), to_p.tolist())]
+        pair_ids = {}
+        con_id_u = np.array(
+            [pair_ids.setdefault(pair, len(pair_ids) + 1) for pair in pairs],
+            dtype=np.int64,
+        )
+        group = con_id_u - 1
+        group_size = np.bincount(group)
+        cd_u = (np.bincount(group, weights=cost_distance) / group_size)[group]
+
+        from_pop = self.pop_proxy[from_v]
+        to_pop = self.pop_proxy[to_v]
+        decay = base * (10.0**exponent)
+        distance_weight_e = np.exp(decay * cost_distance)
+        distance_weight_e_ud = np.exp(decay * cd_u)
+
+        mf_o = from_pop * distance_weight_e
+        mf_i = to_pop * distance_weight_e
+        # As in the R implementation
+        mf_u = from_pop * distance_weight_e_ud + from_pop * distance_weight_e_ud
+        with np.errstate(divide="ignore"):
+            mf_o_inv = 1.0 / mf_o
+            mf_i_inv = 1.0 / mf_i
+        mf_inv_u = rescale_inverse(mf_u)
+
+        sum_mf_i = np.bincount(from_v, weights=mf_i, minlength=len(self.patch_id))
+        cf = mf_o * (mf_i / sum_mf_i[from_v])
+        cf_inv = rescale_inverse(cf)
+        cf_u_group = np.bincount(group, weights=cf)
+        cf_u = cf_u_group[group]
+        cf_inv_u = rescale_inverse(cf_u_group)[group]
+
+        self.from_v = from_v
+        self.to_v = to_v
+        self.directed = OrderedDict(
+            [
+                ("con_id", con_id),
+                ("con_id_u", con_id_u),
+                ("from_p", from_p),
+                ("from_pop", from_pop),
+                ("to_p", to_p),
+                ("to_pop", to_pop),
+                ("cd_u", cd_u),
+                ("mf_o", mf_o),
+                ("mf_o_inv", mf_o_inv),
+                ("mf_i", mf_i),
+                ("mf_i_inv", mf_i_inv),
+                ("mf_u", mf_u),
+                ("mf_inv_u", mf_inv_u),
+                ("cf", cf),
+                ("cf_inv", cf_inv),
+                ("cf_u", cf_u),
+                ("cf_inv_u", cf_inv_u),
+                ("cd", cost_distance),
+                ("distk", distance_weight_e),
+                ("distk_u", distance_weight_e_ud),
+            ]
+        )
+
+        # The undirected graph keeps the connections with a con_id below the
+        # average con_id of their pair (as in the R implementation)
+        mean_con_id = (np.bincount(group, weights=con_id) / group_size)[group]
+        self.ud_rows = np.flatnonzero(con_id < mean_con_id)
+        self.graph = Graph(len(self.patch_id), from_v[self.ud_rows], to_v[self.ud_rows])
+        self.weights = [
+            ("cd", cd_u[self.ud_rows]),
+            ("mf", mf_inv_u[self.ud_rows]),
+            ("cf", cf_inv_u[self.ud_rows]),
+        ]
+
+        self.network = None
+        self.vertices = None
+        self.edges = None
+
+    def _subgraph_measures(
+        self, graph, suffix, lnbh_cutoff, processes, edges, vertices
+    ):
+        """Edge and vertex measures of a subgraph with only direct edges"""
+        for name, weight in self.weights:
+            mst = minimum_spanning_tree(graph, weight)
+            edges["{}_mst_{}".format(name, suffix)] = graph.edge_array(mst, np.int64)
+
+        bcc = biconnected_components(graph)
+        edges["is_br_{}".format(suffix)] = graph.edge_array(bcc.bridges, np.int64)
+        edges["bc_e_{}".format(suffix)] = graph.edge_array(bcc.edge_component, np.int64)
+        edges["bc_te_{}".format(suffix)] = graph.edge_array(
+            bcc.tree_component, np.int64
+        )
+
+        n_components, membership = graph.components()
+        vertices["cl_{}".format(suffix)] = membership
+        vertices["deg_{}".format(suffix)] = graph.degree()
+
+        with ShortestPathAnalysis(
+            graph, self.weights, lnbh_cutoff, processes=processes
+        ) as spa:
+            measures = spa.run()
+
+        for name, weight in self.weights:
+            vertices["{}_cl_{}".format(name, suffix)] = measures[name]["closeness"]
+        vertices["art_{}".format(suffix)] = np.maximum(bcc.vertex_splits - 1, 0).astype(
+            np.int64
+        )
+        vertices["art_p_{}".format(suffix)] = bcc.articulation_points.astype(np.int64)
+        for name, weight in self.weights:
+            res = measures[name]
+            edges["{}_eb_{}".format(name, suffix)] = graph.edge_array(
+                res["edge_betweenness"]
+            )
+            edges["{}_leb_{}".format(name, suffix)] = graph.edge_array(
+                res["local_edge_betweenness"]
+            )
+            vertices["{}_vb_{}".format(name, suffix)] = res["vertex_betweenness"]
+            vertices["{}_lvb_{}".format(name, suffix)] = res["local_vertex_betweenness"]
+
+        return n_components, membership, measures["cd"]["diameter"]
+
+    def analyse(
+        self,
+        connectivity_cutoff,
+        lnbh_cutoff,
+        cl_thresh=0,
+        command="",
+        processes=1,
+    ):
+        """
+        Compute graph, edge and vertex measures
+
+        Results are stored in the network (list of (measure, value) tuples),
+        vertices and edges (tables of the vertex and directed edge measures)
+        attributes.
+        """
+        graph = self.graph
+        n = graph.n_vertices
+        rows = self.ud_rows
+        m = len(rows)
+        cd_u = self.weights[0][1]
+        pop_proxy = self.pop_proxy
+        local_threshold = lnbh_cutoff * connectivity_cutoff
+
+        # Edges of the undirected graph that are shortest paths
+        with ShortestPathAnalysis(graph, self.weights, processes=processes) as spa:
+            measures = spa.run()
+        ud_edges = OrderedDict()
+        for name, weight in self.weights:
+            ud_edges["isshort_{}".format(name)] = measures[name]["shortest"].astype(
+                np.int64
+            )
+        isshort = (
+            ud_edges["isshort_cd"] + ud_edges["isshort_mf"] + ud_edges["isshort_cf"]
+        ) > 0
+        ud_edges["isshort"] = isshort.astype(np.int64)
+        diam = measures["cd"]["diameter"]
+
+        graph_d = graph.subgraph(isshort)
+        graph_cd = graph.subgraph(cd_u < connectivity_cutoff)
+        graph_d_cd = graph_d.subgraph(cd_u < connectivity_cutoff)
+
+        # Edge and vertex measures
+        d_edges = OrderedDict()
+        d_vertices = OrderedDict()
+        cl_no_d, membership_d, diam_d = self._subgraph_measures(
+            graph_d, "ud", local_threshold, processes, d_edges, d_vertices
+        )
+        d_cd_edges = OrderedDict()
+        d_cd_vertices = OrderedDict()
+        cl_no_d_cd, membership_d_cd, diam_d_cd = self._subgraph_measures(
+            graph_d_cd, "udc", local_threshold, processes, d_cd_edges, d_cd_vertices
+        )
+
+        bcc = biconnected_components(graph)
+        ud_edges["is_br_u"] = (
+            graph.components()[0] + bcc.bridges.astype(np.int64) - cl_no_d
+        )
+        ud_edges["bc_e_u"] = bcc.edge_component
+        ud_edges["bc_te_u"] = bcc.tree_component
+
+        ud_vertices = OrderedDict([("deg_u", graph.degree())])
+
+        # Potential flow into the patches (evc)
+        directed = self.directed
+        in_cutoff = directed["cd_u"] < connectivity_cutoff
+        d_vertices_evc = OrderedDict(
+            [
+                ("mf_evc_d", np.bincount(self.to_v, directed["mf_o"], minlength=n)),
+                ("cf_evc_d", np.bincount(self.to_v, directed["cf"], minlength=n)),
+                (
+                    "mf_evc_cd",
+                    np.bincount(
+                        self.to_v[in_cutoff], directed["mf_o"][in_cutoff], minlength=n
+                    ),
+                ),
+                (
+                    "cf_evc_cd",
+                    np.bincount(
+                        self.to_v[in_cutoff], directed["cf"][in_cutoff], minlength=n
+                    ),
+                ),
+            ]
+        )
+
+        directed_extra = OrderedDict()
+        g_vertices = OrderedDict()
+        network_extra = []
+        if cl_thresh > 0:
+            self._communities(
+                cl_no_d,
+                cl_thresh,
+                processes,
+                ud_edges,
+                ud_vertices,
+                g_vertices,
+                directed_extra,
+                network_extra,
+            )
+
+        directed_extra["cl_pc"] = (
+            membership_d_cd[self.from_v] != membership_d_cd[self.to_v]
+        ).astype(np.int64)
+
+        # Graph level
+        cls_size_d = np.bincount(membership_d - 1, weights=pop_proxy)
+        cls_size_d_cd = np.bincount(membership_d_cd - 1, weights=pop_proxy)
+        n_directed = len(directed["con_id"])
+        self.network = [
+            ("Command", command),
+            ("Number of vertices", n),
+            ("Number of edges (undirected)", m),
+            ("Number of direct edges (undirected)", graph_d.n_edges),
+            (
+                "Number of edges shorter than cost distance threshold (undirected)",
+                graph_cd.n_edges,
+            ),
+            (
+                "Number of direct edges shorter than cost distance threshold (undirected)",
+                graph_d_cd.n_edges,
+            ),
+            ("Number of clusters of the entire graph", cl_no_d),
+            (
+                "Number of clusters of the graph with only edges shorter cost distance threshold",
+                cl_no_d_cd,
+            ),
+            ("Size of the largest cluster of the entire graph", cls_size_d.max()),
+            (
+                "Size of the largest cluster of the graph with only edges shorter cost distance threshold",
+                cls_size_d_cd.max(),
+            ),
+            ("Average size of the clusters of the entire graph", cls_size_d.mean()),
+            (
+                "Average size of the clusters of the graph with only edges shorter cost distance threshold",
+                cls_size_d_cd.mean(),
+            ),
+            ("Diameter of the entire graph (undirected)", diam),
+            ("Diameter of the graph with only direct edges (undirected)", diam_d),
+            (
+                "Diameter of the graph with only edges shorter cost distance threshold",
+                diam_d_cd,
+            ),
+            (
+                "Density of the entire graph (directed)",
+                n_directed / float(n * (n - 1)) if n > 1 else np.nan,
+            ),
+            ("Density of the entire graph (undirected)", graph.density()),
+            (
+                "Density of the graph with only direct edges (undirected)",
+                graph_d.density(),
+            ),
+        ]
+        if cl_thresh > 0:
+            self.network.append(
+                (
+                    "Density of the graph with only edges shorter cost distance threshold",
+                    graph_d_cd.density(),
+                )
+            )
+            self.network.extend(network_extra)
+
+        # Vertex table
+        self.vertices = OrderedDict(
+            [("patch_id", self.patch_id), ("pop_proxy", pop_proxy)]
+        )
+        for table in (
+            d_vertices_evc,
+            g_vertices,
+            ud_vertices,
+            d_vertices,
+            d_cd_vertices,
+        ):
+            self.vertices.update(table)
+        for name, values in self.vertices.items():
+            values = np.ma.masked_array(values)
+            if values.dtype.kind == "f":
+                values = np.ma.masked_invalid(values)
+            self.vertices[name] = values
+
+        # Edge table (directed edges with the measures of their undirected
+        # counterpart)
+        self.edges = OrderedDict([("id", np.arange(1, n_directed + 1))])
+        for name, values in directed.items():
+            if name in ("cd", "distk", "distk_u"):
+                continue
+            self.edges[name] = _masked(values)
+        self.edges.update((k, _masked(v)) for k, v in directed_extra.items())
+        for name in ("cd", "distk", "distk_u"):
+            self.edges[name] = _masked(directed[name])
+
+        ud_index = dict(
+            (u, i)
+            for i, u in reversed(list(enumerate(directed["con_id_u"][rows].tolist())))
+        )
+        lookup = np.array(
+            [ud_index.get(u, -1) for u in directed["con_id_u"].tolist()],
+            dtype=np.int64,
+        )
+        missing = lookup < 0
+        for table in (ud_edges, d_edges, d_cd_edges):
+            for name, values in table.items():
+                values = np.ma.masked_array(values)
+                joined = values[np.where(missing, 0, lookup)]
+                joined = np.ma.masked_array(
+                    joined.data, mask=np.ma.getmaskarray(joined) | missing
+                )
+                if joined.dtype.kind == "f":
+                    joined = np.ma.masked_invalid(joined)
+                self.edges[name] = joined
+
+    def _communities(
+        self,
+        cl_no_d,
+        cl_thresh,
+        processes,
+        ud_edges,
+        ud_vertices,
+        g_vertices,
+        directed_extra,
+        network_extra,
+    ):
+        """Edge betweenness communities weighted by competing potential flow"""
+        graph = self.graph
+        n = graph.n_vertices
+        m = graph.n_edges
+        weight = self.weights[2][1]
+        con_id_u = self.directed["con_id_u"][self.ud_rows]
+        levels = 2 * cl_no_d + cl_thresh
+        communities = edge_betweenness_communities(
+            graph, weight, levels=levels, processes=processes
+        )
+
+        rank = np.zeros(m, dtype=np.int64)
+        rank[communities.removed] = np.arange(1, m + 1)
+        value = np.zeros(m)
+        value[communities.removed] = communities.betweenness
+        clusters = np.zeros(m, dtype=np.int64)
+        clusters[communities.removed] = communities.components
+        is_bridge = np.zeros(m, dtype=np.int64)
+        is_bridge[communities.removed] = communities.bridges
+
+        best = communities.membership
+        ud_edges["cf_iebc_v"] = value
+        ud_edges["cf_iebc_r"] = rank
+        ud_edges["cf_iebc_b"] = is_bridge
+        ud_edges["cf_iebc_c"] = (best[graph.source] != best[graph.target]).astype(
+            np.int64
+        )
+
+        def cut_at(k):
+            membership = communities.memberships.get(k)
+            if membership is None:
+                return [None] * n
+            return membership.tolist()
+
+        g_vertices["cf_iebc_me"] = best
+        levels_cs = [cut_at(k) for k in range(cl_no_d, cl_no_d + cl_thresh + 1)]
+        g_vertices["cf_iebc_cs"] = np.array(
+            [
+                ";".join(
+                    "NA" if level[v] is None else str(level[v]) for level in levels_cs
+                )
+                for v in range(n)
+            ],
+            dtype=object,
+        )
+        last = cut_at(cl_no_d + cl_thresh)
+        g_vertices["cf_iebc_cl"] = np.ma.masked_array(
+            [0 if c is None else c for c in last],
+            mask=[c is None for c in last],
+            dtype=np.int64,
+        )
+
+        sizes = np.bincount(best)[1:]
+        network_extra.extend(
+            [
+                (
+                    "Modularity (from iebc) of the entire graph (undirected) weighted by cf",
+                    communities.modularity,
+                ),
+                (
+                    "Number of communities (at maximum modularity score (from iebc)) of the entire (undirected) graph weighted by cf",
+                    len(sizes),
+                ),
+                ("com_sizes_u", ", ".join(str(s) for s in sizes)),
+                (
+                    "com_sizes_u_names",
+                    ", ".join(
+                        "Size of comumity {} (at maximum modularity score (from iebc))".format(
+                            c
+                        )
+                        for c in range(1, len(sizes) + 1)
+                    ),
+                ),
+            ]
+        )
+
+        # Community structure traced while removing edges
+        structure = [[str(c)] for c in graph.components()[1].tolist()]
+        previous = None
+        for step, clust in enumerate(communities.components.tolist()):
+            if (
+                previous is not None
+                and clust - cl_no_d < cl_no_d + cl_thresh
+                and clust > previous
+                and clust in communities.memberships
+            ):
+                for v, c in enumerate(communities.memberships[clust].tolist()):
+                    structure[v].append(str(c))
+            previous = clust
+        ud_vertices["cf_ebc_cs"] = np.array(
+            [";".join(s) for s in structure], dtype=object
+        )
+        level = cl_no_d + cl_thresh - 1
+        ud_vertices["cf_ebc_cl"] = np.ma.masked_array(
+            [int(s[level]) if len(s) > level else 0 for s in structure],
+            mask=[len(s) <= level for s in structure],
+            dtype=np.int64,
+        )
+
+        ud_edges["cf_ebc_v"] = value
+        ud_edges["cf_ebc_r"] = rank
+        ud_edges["cf_ebc_c"] = clusters
+        now = datetime.now().replace(microsecond=0)
+        ud_edges["cf_ebc_vi"] = np.array(
+            [str(now + timedelta(seconds=int(r))) for r in rank], dtype=object
+        )
+
+        community = ud_vertices["cf_ebc_cl"]
+        directed_extra["cf_ebc_cc"] = (
+            community[self.from_v] != community[self.to_v]
+        ).astype(np.int64)
+
+    def edge_removal(self, convergence_threshold, connectivity_cutoff, processes=1):
+        """
+        Cluster characteristics of the undirected graph after successive
+        removal of the edges with the longest cost distance
+
+        Steps are kept as long as the number of clusters relative to the
+        number of vertices reaches the convergence threshold or the cost
+        distance of the removed edge is within 125 % of the connectivity
+        cutoff.
+
+        :return: dict of arrays with the cost distance of the last removed
+          edge, the number of clusters, the size of the largest cluster and
+          the diameter, ordered by increasing distance
+        """
+        graph = self.graph
+        n = graph.n_vertices
+        cd_u = self.weights[0][1]
+        order = graph.edge_ids[
+            np.argsort(-cd_u[graph.edge_ids], kind="stable")
+        ].tolist()
+        m = len(order)
+
+        # Add edges in order of increasing cost distance, which gives the
+        # graph after removing the x longest edges in reverse
+        sets = DisjointSet(n)
+        size = self.pop_proxy.tolist()
+        n_clusters = n
+        max_size = max(size) if size else 0
+        counts = [0] * (m + 1)
+        max_sizes = [0.0] * (m + 1)
+        for x in range(m, 0, -1):
+            if x < m:
+                e = order[x]
+                a = sets.find(int(graph.source[e]))
+                b = sets.find(int(graph.target[e]))
+                if sets.union(a, b):
+                    n_clusters -= 1
+                    root = sets.find(a)
+                    size[root] = size[a] + size[b]
+                    max_size = max(max_size, size[root])
+            counts[x] = n_clusters
+            max_sizes[x] = max_size
+
+        keep = [
+            x
+            for x in range(1, m + 1)
+            if float(counts[x]) / n >= convergence_threshold
+            or cd_u[order[x - 1]] <= connectivity_cutoff * 1.25
+        ]
+
+        diameters = []
+        with ShortestPathAnalysis(graph, self.weights[:1], processes=processes) as spa:
+            for x in keep:
+                diameters.append(spa.run(removed=order[:x])["cd"]["diameter"])
+
+        keep = keep[::-1]
+        return {
+            "distance": np.array([cd_u[order[x - 1]] for x in keep]),
+            "clusters": np.array([counts[x] for x in keep]),
+            "max_size": np.array([max_sizes[x] for x in keep]),
+            "diameter": np.array(diameters[::-1]),
+        }
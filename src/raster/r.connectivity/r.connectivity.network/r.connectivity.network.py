@@ -5,7 +5,8 @@
 MODULE:       r.connectivity.network
 AUTHOR(S):    Stefan Blumentrath <stefan dot blumentrath at nina dot no>
 PURPOSE:      Compute connectivity measures for a set of habitat patches
-              based on graph-theory (using the igraph-package in R).
+              based on graph-theory (in Python or using the
+              igraph-package in R).
 
               Recently, graph-theory has been characterised as an
               efficient and useful tool for conservation planning
@@ -17,7 +18,7 @@ PURPOSE:      Compute connectivity measures for a set of habitat patches
 
               r.connectivity.network is the 2nd tool of the
               r.connectivity.* toolchain and performs the (core) network
-              analysis (using the igraph-package in R) on the network
+              analysis (in Python or using the igraph-package in R) on the network
               data prepared with r.connectivity.distance. This network
               data is analysed on graph, edge and vertex level.
 
@@ -65,12 +66,12 @@ COPYRIGHT:    (C) 2011, 2018 by the Norwegian Institute for Nature
 
 ########################################################################
 REQUIREMENTS:
-R with packages igraph (version 1.0) and nlme (for parallel processing
+numpy and matplotlib,
+for the R backend: R with packages igraph (version 1.0) and nlme (for parallel processing
 doMC, multicore, iterators, codetools and foreach are required as well),
 ghostscript is required for postscript-output
 
 ToDo:
-- replace R with Python
 - add RGB columns instead of QML
 - Fix history assignment
 - - grass.parse_command('v.support', map=edges, flags='g')[comments]
@@ -196,9 +197,20 @@ ToDo:
 # % answer: 1
 # %end
 
+# %option
+# % key: backend
+# % type: string
+# % description: Implementation used for the network analysis
+# % options: python,R
+# % descriptions: python;Graph analysis in Python (numpy);R;Graph analysis with the igraph package in R
+# % guisection: Settings
+# % required: no
+# % answer: python
+# %end
+
 # %flag
 # % key: i
-# % description: Install required R packages in an interactive session if they are missing
+# % description: Install required R packages in an interactive session if they are missing (R backend)
 # %end
 
 # %flag
@@ -211,11 +223,17 @@ import os
 import sys
 import platform
 import warnings
+from collections import OrderedDict
+from io import StringIO
 import numpy as np
 import grass.script as grass
 import grass.script.task as task
 import grass.script.db as grass_db
 
+sys.path.insert(
+    1, os.path.join(os.path.dirname(sys.path[0]), "etc", "r.connectivity.network")
+)
+
 
 # check if GRASS is running or not
 if "GISBASE" not in os.environ:
@@ -247,34 +265,287 @@ def is_number(string):
     return True
 
 
+def read_columns(vector, columns):
+    """Read numeric attribute columns of a vector map into numpy arrays"""
+    data = np.genfromtxt(
+        StringIO(
+            grass.read_command(
+                "v.db.select",
+                flags="c",
+                map=vector,
+                columns=",".join(columns),
+                separator="pipe",
+            )
+        ),
+        delimiter="|",
+        dtype=np.float64,
+        ndmin=2,
+    )
+    return [data[:, i] for i in range(len(columns))]
+
+
+def sql_value(value):
+    """Format a value for an SQL statement (masked or non-finite values are
+    written as NULL)"""
+    if value is None or value is np.ma.masked:
+        return "NULL"
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value)) if np.isfinite(value) else "NULL"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def write_table(table, columns, overwrite):
+    """Write a table of (masked) numpy arrays to the current database
+    with a single call of db.execute"""
+    types = []
+    for name, values in columns.items():
+        kind = np.asarray(values).dtype.kind
+        if kind in "iub":
+            types.append("{} integer".format(name))
+        elif kind == "f":
+            types.append("{} double precision".format(name))
+        else:
+            types.append("{} text".format(name))
+
+    sql = []
+    if overwrite:
+        sql.append("DROP TABLE IF EXISTS {};".format(table))
+    sql.append("CREATE TABLE {} ({});".format(table, ", ".join(types)))
+    values = [
+        v.tolist() if not np.ma.isMaskedArray(v) else v.tolist(None)
+        for v in columns.values()
+    ]
+    for row in zip(*values):
+        sql.append(
+            "INSERT INTO {} VALUES ({});".format(
+                table, ", ".join(sql_value(v) for v in row)
+            )
+        )
+
+    grass.write_command("db.execute", input="-", stdin="\n".join(sql) + "\n")
+
+
+def write_qml(qml_style_dir, edges):
+    """Write QML files for the visualisation of edge measures in QGIS"""
+    colors = [
+        "215,25,28,255",
+        "253,174,97,255",
+        "255,255,191,255",
+        "166,217,106,255",
+        "26,150,65,255",
+    ]
+    line_symbol = """      <symbol outputUnit="MM" alpha="1" type="line" name="{name}">
+        <layer pass="{name}" class="SimpleLine" locked="0">
+          <prop k="capstyle" v="square"/>
+          <prop k="color" v="{color}"/>
+          <prop k="customdash" v="5;2"/>
+          <prop k="joinstyle" v="bevel"/>
+          <prop k="offset" v="0"/>
+          <prop k="penstyle" v="solid"/>
+          <prop k="use_custom_dash" v="0"/>
+          <prop k="width" v="0.26"/>
+        </layer>
+      </symbol>"""
+
+    for attribute, values in edges.items():
+        if attribute in ("id", "con_id", "con_id_u", "from_p", "to_p", "cf_ebc_vi"):
+            continue
+        values = np.ma.masked_invalid(np.ma.masked_array(values, dtype=np.float64))
+        values = values.compressed()
+        if not len(values):
+            continue
+
+        qml = [
+            "<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>",
+            '<qgis version="1.8" minimumScale="0" maximumScale="1e+08" hasScaleBasedVisibilityFlag="0">',
+            "  <transparencyLevelInt>255</transparencyLevelInt>",
+        ]
+        if values.max() - values.min() == 1:
+            qml.extend(
+                [
+                    '  <renderer-v2 attr="{}" symbollevels="0" type="categorizedSymbol">'.format(
+                        attribute
+                    ),
+                    "    <categories>",
+                    '      <category symbol="0" value="1" label=""/>',
+                    "    </categories>",
+                    "    <symbols>",
+                    line_symbol.format(name=0, color="0,0,0,255"),
+                ]
+            )
+        else:
+            # Type 8 quantiles as in R
+            quantiles = np.quantile(
+                values, np.linspace(0, 1, 6), method="median_unbiased"
+            )
+            qml.append(
+                '  <renderer-v2 attr="{}" symbollevels="1" type="graduatedSymbol">'.format(
+                    attribute
+                )
+            )
+            qml.append("    <ranges>")
+            for quant in range(5):
+                qml.append(
+                    '      <range symbol="{0}" lower="{1}" upper="{2}" label="{3} - {4}"/>'.format(
+                        quant,
+                        quantiles[quant],
+                        quantiles[quant + 1],
+                        round(quantiles[quant], 4),
+                        round(quantiles[quant + 1], 4),
+                    )
+                )
+            qml.append("    </ranges>")
+            qml.append("    <symbols>")
+            for quant in range(5):
+                qml.append(line_symbol.format(name=quant, color=colors[quant]))
+
+        qml.extend(
+            [
+                "    </symbols>",
+                "    <source-symbol>",
+                line_symbol.format(name=0, color="161,238,135,255"),
+                "    </source-symbol>",
+                '    <mode name="quantile"/>',
+                '    <rotation field=""/>',
+                '    <sizescale field=""/>',
+                "  </renderer-v2>",
+                "  <customproperties/>",
+                '  <displayfield>"{}"</displayfield>'.format(attribute),
+                "  <attributeactions/>",
+                "</qgis>",
+            ]
+        )
+
+        qml_output = os.path.join(
+            qml_style_dir, "edge_measures_{}.qml".format(attribute)
+        )
+        with open(qml_output, "w") as qml_file:
+            qml_file.write("\n".join(qml) + "\n")
+
+
+def plot_overview(plt, network, overview_plot, convergence_threshold, cutoff, cores):
+    """Plot number of clusters, size of the largest cluster, number of edges
+    and diameter of the network over increasing cost distance"""
+    removal = network.edge_removal(convergence_threshold, cutoff, processes=cores)
+    vertices_n = network.graph.n_vertices
+    edges_n = network.graph.n_edges
+    diam_d = max(removal["diameter"].max(), 1e-12)
+    scale = 10.0 ** (len(str(int(removal["distance"].max()))) - 2)
+    x_values = removal["distance"] / scale
+
+    fig = plt.figure()
+    plt.plot(
+        x_values,
+        removal["clusters"] * 100.0 / vertices_n,
+        "k-",
+        label="Clusters (in % of maximum possible clusters)",
+    )
+    plt.plot(
+        x_values,
+        removal["max_size"] * 100.0 / network.pop_proxy.sum(),
+        "k--",
+        label="Size of the largest cluster (in % of total population size)",
+    )
+    plt.plot(
+        x_values,
+        np.arange(1, len(x_values) + 1) * 100.0 / edges_n,
+        "k:",
+        label="Number of edges (in % of maximum possible number of edges)",
+    )
+    plt.plot(
+        x_values,
+        removal["diameter"] * 100.0 / diam_d,
+        "k-.",
+        label="Diameter (in % of diameter of the entire graph)",
+    )
+    if cutoff > 0:
+        plt.axvline(
+            cutoff / scale,
+            color="red",
+            linestyle=":",
+            label="Connectivity threshold used in analysis",
+        )
+    plt.ylim(0, 100)
+    plt.yticks([0, 25, 50, 75, 100], ["0 %", "25 %", "50 %", "75 %", "100 %"])
+    plt.xlabel(
+        "Connectivity threshold\n(Cost distance between patches in {})".format(
+            int(scale)
+        )
+    )
+    plt.legend(loc="upper left", fontsize="x-small")
+    fig.savefig(overview_plot)
+    plt.close(fig)
+
+
+def analyse_network(
+    network_map,
+    in_vertices,
+    pop_proxy,
+    base,
+    exponent,
+    connectivity_cutoff,
+    lnbh_cutoff,
+    cl_thresh,
+    cores,
+    command,
+):
+    """Analyse the network with the Python backend"""
+    from network_lib import ConnectivityNetwork
+
+    patch_id, pop = read_columns(in_vertices, ["cat", pop_proxy])
+    con_id, from_p, to_p, dist = read_columns(
+        network_map, ["cat", "from_p", "to_p", "dist"]
+    )
+
+    grass.message(_("Building the graph..."))
+    network = ConnectivityNetwork(
+        patch_id, pop, con_id, from_p, to_p, dist, base, exponent
+    )
+
+    grass.message(_("Computing graph, edge and vertex measures..."))
+    network.analyse(
+        connectivity_cutoff,
+        lnbh_cutoff,
+        cl_thresh=cl_thresh,
+        command=command,
+        processes=cores,
+    )
+    return network
+
+
 def main():
     """Do the main work"""
 
-    try:
-        import rpy2
-        import rpy2.rinterface
+    backend = options["backend"]
 
-        rpy2.rinterface.set_initoptions(
-            (b"rpy2", b"--no-save", b"--no-restore", b"--quiet")
-        )
-        import rpy2.robjects as robjects
-
-        # rpy2 throws lots of warnings (that cannot be suppressed)
-        # when packages are loaded
-        warnings.filterwarnings("ignore")
-        import rpy2.robjects.packages as rpackages
-        from rpy2.robjects.vectors import StrVector
-        import rpy2.robjects.numpy2ri
-    except ImportError:
-        grass.fatal(
-            _(
-                "Cannot import rpy2 (https://rpy2.bitbucket.io)"
-                " library."
-                " Please install it (pip install rpy2)"
-                " or ensure that it is on path"
-                " (use PYTHONPATH variable)."
+    if backend == "R":
+        try:
+            import rpy2
+            import rpy2.rinterface
+
+            rpy2.rinterface.set_initoptions(
+                (b"rpy2", b"--no-save", b"--no-restore", b"--quiet")
+            )
+            import rpy2.robjects as robjects
+
+            # rpy2 throws lots of warnings (that cannot be suppressed)
+            # when packages are loaded
+            warnings.filterwarnings("ignore")
+            import rpy2.robjects.packages as rpackages
+            from rpy2.robjects.vectors import StrVector
+            import rpy2.robjects.numpy2ri
+        except ImportError:
+            grass.fatal(
+                _(
+                    "Cannot import rpy2 (https://rpy2.bitbucket.io)"
+                    " library."
+                    " Please install it (pip install rpy2)"
+                    " or ensure that it is on path"
+                    " (use PYTHONPATH variable)."
+                )
             )
-        )
 
     import matplotlib
 
@@ -287,8 +558,8 @@ def main():
     # network = network_map.split('@')[1] if len(network_map.split('@'))
     # > 1 else None
     prefix = options["prefix"]
-    cores = options["cores"]
-    convergence_treshold = options["convergence_threshold"]
+    cores = int(options["cores"])
+    convergence_treshold = float(options["convergence_threshold"])
     euler = np.exp(1)
     base = float(options["base"])
     exponent = float(options["exponent"])
@@ -300,8 +571,8 @@ def main():
             grass.fatal('"connectivity_cutoff" has to be > 0.')
     else:
         grass.fatal('Option "connectivity_cutoff" is not given as a number.')
-    lnbh_cutoff = options["lnbh_cutoff"]
-    cl_thresh = options["cl_thresh"]
+    lnbh_cutoff = float(options["lnbh_cutoff"])
+    cl_thresh = int(options["cl_thresh"])
 
     cd_cutoff = connectivity_cutoff
 
@@ -400,8 +671,7 @@ def main():
     # OS adjustment
     os_type = platform.system()
 
-    robjects.numpy2ri.activate()
-
+    grass.verbose("backend is {}".format(backend))
     grass.verbose("prefix is {}".format(prefix))
     grass.verbose("cores is {}".format(cores))
     grass.verbose("convergence_treshold is {}".format(convergence_treshold))
@@ -419,7 +689,7 @@ def main():
     grass.verbose("cl_thresh is {}".format(cl_thresh))
 
     # Check if R is installed
-    if not grass.find_program("R"):
+    if backend == "R" and not grass.find_program("R"):
         grass.fatal(
             "R is required, but cannot be found on the system.\n \
                     Please make sure that R is installed and the path \
@@ -463,6 +733,59 @@ def main():
         elif kernel_plot:
             fig.savefig(kernel_plot)
 
+    if backend == "python":
+        network = analyse_network(
+            network_map,
+            in_vertices,
+            pop_proxy,
+            base,
+            exponent,
+            connectivity_cutoff,
+            lnbh_cutoff,
+            cl_thresh,
+            cores,
+            command,
+        )
+
+        if overview_plot:
+            grass.message(_("Plotting an overview over network characteristics..."))
+            plot_overview(
+                plt,
+                network,
+                overview_plot,
+                convergence_treshold,
+                connectivity_cutoff,
+                cores,
+            )
+
+        grass.message(_("Writing connectivity measures..."))
+        write_table(
+            network_output,
+            OrderedDict(
+                [
+                    ("measure", np.array([m for m, v in network.network], object)),
+                    ("value", np.array([str(v) for m, v in network.network], object)),
+                ]
+            ),
+            overwrite,
+        )
+        write_table(vertex_output_tmp, network.vertices, overwrite)
+        write_table(edge_output_tmp, network.edges, overwrite)
+
+        if qml_style_dir:
+            write_qml(qml_style_dir, network.edges)
+
+        join_measures(
+            network_map,
+            in_vertices,
+            edge_output,
+            edge_output_tmp,
+            vertex_output,
+            vertex_output_tmp,
+            net_hist_str,
+        )
+        return 0
+
     if cores > 1 and os_type == "Windows":
         grass.warning(
             "Parallel processing not yet supported on MS Windows. \
@@ -495,6 +818,8 @@ def main():
                             output, please install ghostscript first"
                 )
 
+    robjects.numpy2ri.activate()
+
     req_packages = ["igraph", "nlme", "rgrass7", "DBI"]
     if cores > 1 and os_type != "Windows":
         req_packages = req_packages + ["doMC", "foreach", "iterators", "codetools"]
@@ -1660,6 +1985,27 @@ close(con_qml)
 
     robjects.r(rscript)
 
+    join_measures(
+        network_map,
+        in_vertices,
+        edge_output,
+        edge_output_tmp,
+        vertex_output,
+        vertex_output_tmp,
+        net_hist_str,
+    )
+
+
+def join_measures(
+    network_map,
+    in_vertices,
+    edge_output,
+    edge_output_tmp,
+    vertex_output,
+    vertex_output_tmp,
+    net_hist_str,
+):
+    """Copy the input maps and join the tables with edge and vertex measures"""
     grass.run_command(
         "g.copy", quiet=True, vector="{},{}".format(network_map, edge_output)
     )
@@ -7,33 +7,27 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import math
+import numpy as np
 import grass.script as grass
 from grass.pygrass.modules.shortcuts import general as g
 from grass.pygrass.modules.shortcuts import raster as r
 from grass.pygrass.modules.shortcuts import vector as v
-from .colors import MOBILITY_COLORS
 from .constants import (
     EQUATION,
     HIGHEST_RECREATION_CATEGORY,
     SUITABILITY_SCORES_LABELS,
-    COMMA,
-    CSV_EXTENSION,
     METHODS,
 )
 from .grassy_utilities import (
-    temporary_filename,
     remove_map_at_exit,
-    remove_files_at_exit,
-    string_to_file,
-    get_raster_statistics,
     update_vector,
     raster_to_vector,
 )
 from .utilities import (
-    merge_two_dictionaries,
     nested_dictionary_to_csv,
     dictionary_to_csv,
 )
+from .zonal import read_blocks, group_by, accumulate
 
 
 def compile_use_table(supply):
@@ -71,6 +65,208 @@ def compile_use_table(supply):
     return uses
 
 
+def zonal_label(value):
+    """Round a value as written in category labels by `r.stats.zonal -r`"""
+    return float("{:f}".format(value))
+
+
+def reclassification_labels(rules):
+    """Parse the labels of `r.reclass` rules as numbers
+
+    Parameters
+    ----------
+    rules :
+        Reclassification rules in the form 'low thru high = category label'
+
+    Returns
+    -------
+    A dictionary of the labels of each input category
+
+    Examples
+    --------
+    >>> reclassification_labels("1 thru 1 = 1 0\n3 thru 4 = 4 0.5")
+    {1: 0.0, 3: 0.5, 4: 0.5}
+    """
+    labels = {}
+    for rule in rules.strip().splitlines():
+        categories, output = rule.split("=")
+        low, _thru, high = categories.split()
+        label = float(output.split()[1])
+        for category in range(int(low), int(high) + 1):
+            labels[category] = label
+    return labels
+
+
+def cell_area():
+    """Area of a cell of the current region in square meters"""
+    region = grass.region()
+    meters = float(grass.parse_command("g.proj", flags="g")["meters"])
+    return region["nsres"] * region["ewres"] * meters * meters
+
+
+def sum_flow_in_base(base, flow, highest_spectrum):
+    """Sum the flow within each category of the base map inside the areas of
+    highest recreation spectrum
+
+    Parameters
+    ----------
+    base :
+        Base land types map
+
+    flow :
+        Map of visits
+
+    highest_spectrum :
+        Map of areas with highest recreational value
+
+    Returns
+    -------
+    A dictionary of the sum of flow for each base category
+    """
+    totals = {}
+    for base_block, flow_block, highest_block in read_blocks(
+        (base, flow, highest_spectrum)
+    ):
+        valid = ~(np.isnan(base_block) | np.isnan(flow_block) | np.isnan(highest_block))
+        accumulate(totals, group_by([base_block[valid]], flow_block[valid]))
+    return {key[0]: zonal_label(value) for key, value in totals.items()}
+
+
+def count_cells_per_category(
+    aggregation, recreation_spectrum, highest_spectrum, base, reclassified_base
+):
+    """Count the cells of high quality recreation in each category of the
+    aggregation map
+
+    Parameters
+    ----------
+    aggregation :
+        Map of aggregation zones
+
+    recreation_spectrum :
+        Map scoring access to and quality of recreation
+
+    highest_spectrum :
+        Map of areas with highest recreational value
+
+    base :
+        Base land types map
+
+    reclassified_base :
+        Base map reclassified to ecosystem types
+
+    Returns
+    -------
+    cells :
+        A nested dictionary of the number of cells of each base category
+        in each aggregation category
+
+    base_in_types :
+        A nested dictionary of the number of cells of each pair of base
+        category and ecosystem type in each aggregation category
+    """
+    cells = {}
+    base_in_types = {}
+    for (
+        aggregation_block,
+        spectrum_block,
+        highest_block,
+        base_block,
+        type_block,
+    ) in read_blocks(
+        (aggregation, recreation_spectrum, highest_spectrum, base, reclassified_base)
+    ):
+        valid = (spectrum_block == HIGHEST_RECREATION_CATEGORY) & ~(
+            np.isnan(aggregation_block) | np.isnan(highest_block) | np.isnan(base_block)
+        )
+        accumulate(cells, group_by([aggregation_block[valid], base_block[valid]]))
+        valid &= ~np.isnan(type_block)
+        accumulate(
+            base_in_types,
+            group_by([aggregation_block[valid], base_block[valid], type_block[valid]]),
+        )
+
+    cells_per_category = {}
+    for (category, base_category), count in cells.items():
+        cells_per_category.setdefault(category, {})[base_category] = int(count)
+    base_in_types_per_category = {}
+    for (category, base_category, ecosystem_type), count in base_in_types.items():
+        base_in_types_per_category.setdefault(category, {})[
+            (base_category, ecosystem_type)
+        ] = int(count)
+    return cells_per_category, base_in_types_per_category
+
+
+def supply_statistics(cells, base_in_types, flow_in_base, scores, area):
+    """Distribute the flow of an aggregation category to ecosystem types
+
+    The flow of each base category is weighted by the extent of the base
+    category multiplied by its suitability score and summed for each
+    ecosystem type.
+
+    Parameters
+    ----------
+    cells :
+        Number of cells of each base category
+
+    base_in_types :
+        Number of cells of each pair of base category and ecosystem type
+
+    flow_in_base :
+        Flow in each base category
+
+    scores :
+        Suitability score of each base category
+
+    area :
+        Area of a cell in square meters
+
+    Returns
+    -------
+    A dictionary with the ecosystem types as keys and the list of flow,
+    area, number of cells and percentage of cells (as strings, as reported
+    by `r.stats -nacpl`) as values
+    """
+    weighted_extents = {}
+    for base_category, count in cells.items():
+        extent = zonal_label(count * area)
+        score = scores.get(base_category, float("nan"))
+        weighted_extents[base_category] = zonal_label(extent * score)
+    weighted_sum = sum(
+        [value for value in weighted_extents.values() if not math.isnan(value)]
+    )
+    if not weighted_sum:
+        return {}
+
+    # Compute weighted fractions of land types
+    fractions = {key: value / weighted_sum for (key, value) in weighted_extents.items()}
+    fractions_sum = sum([x for x in fractions.values() if not math.isnan(x)])
+    assert abs(fractions_sum - 1) < 1.0e-6, "Sum of fractions is != 1"
+
+    # Compute flow
+    flows = {}
+    counts = {}
+    for (base_category, ecosystem_type), count in sorted(base_in_types.items()):
+        counts[ecosystem_type] = counts.get(ecosystem_type, 0) + count
+        flow = fractions.get(base_category, float("nan")) * flow_in_base.get(
+            base_category, float("nan")
+        )
+        if math.isnan(flow):
+            flow = 0
+        flows[ecosystem_type] = flows.get(ecosystem_type, 0) + count * flow
+
+    total = sum(counts.values())
+    return {
+        str(ecosystem_type): [
+            "{:f}".format(flows[ecosystem_type]),
+            "{:f}".format(count * area),
+            str(count),
+            "{:.2f}%".format(100.0 * count / total),
+        ]
+        for ecosystem_type, count in sorted(counts.items())
+    }
+
+
 def compute_supply(
     base,
     recreation_spectrum,
@@ -153,18 +349,6 @@ def compute_supply(
     Examples
     --------
     """
-    # Inputs
-    flow_in_base = flow + "_" + base
-    base_scores = base + ".scores"
-
-    # Define lists and dictionaries to hold intermediate data
-    statistics_dictionary = {}
-    weighted_extents = {}
-    flows = []
-
-    # MASK areas of high quality recreation
-    r.mask(raster=highest_spectrum, overwrite=True, quiet=True)
-
     # Reclassify land cover map to MAES ecosystem types
     r.reclass(
         input=base,
@@ -174,349 +358,62 @@ def compute_supply(
     )
     # add 'reclassified_base' to "remove_at_exit" after the reclassified maps!
 
-    # Discard areas out of MASK
-    temporary_reclassified_base = reclassified_base + "_temporary"
-    copy_equation = EQUATION.format(
-        result=temporary_reclassified_base, expression=reclassified_base
-    )
-    r.mapcalc(copy_equation, overwrite=True)
-    g.rename(
-        raster=(temporary_reclassified_base, reclassified_base),
-        overwrite=True,
-        quiet=True,
-    )
-
     # Count flow within each land cover category
-    r.stats_zonal(
-        base=base,
-        flags="r",
-        cover=flow,
-        method="sum",
-        output=flow_in_base,
-        overwrite=True,
-        quiet=True,
+    flow_in_base = sum_flow_in_base(
+        base=base, flow=flow, highest_spectrum=highest_spectrum
     )
-    remove_map_at_exit(flow_in_base)
-
-    # Set colors for "flow" map
-    r.colors(map=flow_in_base, color=MOBILITY_COLORS, quiet=True)
+    scores = reclassification_labels(SUITABILITY_SCORES_LABELS)
 
     # Parse aggregation raster categories and labels
     categories = grass.parse_command("r.category", map=aggregation, delimiter="\t")
 
-    for category in categories:
-
-        msg = "\n>>> Processing category '{c}' of aggregation map '{a}'"
-        grass.verbose(_(msg.format(c=category, a=aggregation)))
-
-        # Intermediate names
-
-        cells = highest_spectrum + ".cells" + "." + category
-        remove_map_at_exit(cells)
-
-        extent = highest_spectrum + ".extent" + "." + category
-        remove_map_at_exit(extent)
-
-        weighted = highest_spectrum + ".weighted" + "." + category
-        remove_map_at_exit(weighted)
-
-        fractions = base + ".fractions" + "." + category
-        remove_map_at_exit(fractions)
-
-        flow_category = "_flow_" + category
-        flow = base + flow_category
-        remove_map_at_exit(flow)
-
-        flow_in_reclassified_base = reclassified_base + "_flow"
-        flow_in_category = reclassified_base + flow_category
-        flows.append(flow_in_category)  # add to list for patching
-        remove_map_at_exit(flow_in_category)
-
-        # Output names
-
-        msg = "*** Processing aggregation raster category: {r}"
-        msg = msg.format(r=category)
-        grass.debug(_(msg))
-        # g.message(_(msg))
+    # Set region to extent of the aggregation map
+    # and resolution to the one of the population map
+    g.region(
+        raster=aggregation,
+        nsres=ns_resolution,
+        ewres=ew_resolution,
+        flags="a",
+        quiet=True,
+    )
+    area = cell_area()
+
+    # Read all maps once, count cells of all categories at the same time
+    grass.verbose(_("Counting cells of all categories of '{a}'".format(a=aggregation)))
+    cells, base_in_types = count_cells_per_category(
+        aggregation=aggregation,
+        recreation_spectrum=recreation_spectrum,
+        highest_spectrum=highest_spectrum,
+        base=base,
+        reclassified_base=reclassified_base,
+    )
 
-        # First, set region to extent of the aggregation map
-        # and resolution to the one of the population map
-        # Note the `-a` flag to g.region: ?
-        # To safely modify the region: grass.use_temp_region()  # FIXME
-        g.region(
-            raster=aggregation,
-            nsres=ns_resolution,
-            ewres=ew_resolution,
-            flags="a",
-            quiet=True,
-        )
+    statistics_dictionary = {}
+    flows = []
+    flow_in_reclassified_base = reclassified_base + "_flow"
 
-        msg = "!!! Computational resolution matched to {raster}"
-        msg = msg.format(raster=aggregation)
-        grass.debug(_(msg))
+    for category, label in categories.items():
 
-        # Build MASK for current category & high quality recreation areas
-        msg = " * Setting category '{c}' as a MASK"
+        msg = "\n>>> Processing category '{c}' of aggregation map '{a}'"
         grass.verbose(_(msg.format(c=category, a=aggregation)))
 
-        masking = "if( {spectrum} == {highest_quality_category} && "
-        masking += "{aggregation} == {category}, "
-        masking += "1, null() )"
-        masking = masking.format(
-            spectrum=recreation_spectrum,
-            highest_quality_category=HIGHEST_RECREATION_CATEGORY,
-            aggregation=aggregation,
-            category=category,
-        )
-        masking_equation = EQUATION.format(result="MASK", expression=masking)
-        grass.mapcalc(masking_equation, overwrite=True)
-
-        # zoom to MASK
-        g.region(zoom="MASK", nsres=ns_resolution, ewres=ew_resolution, quiet=True)
-
-        # Count number of cells within each land category
-        r.stats_zonal(
-            flags="r",
-            base=base,
-            cover=highest_spectrum,
-            method="count",
-            output=cells,
-            overwrite=True,
-            quiet=True,
-        )
-        cells_categories = grass.parse_command("r.category", map=cells, delimiter="\t")
-        grass.debug(_("*** Cells: {c}".format(c=cells_categories)))
-
-        # Build cell category and label rules for `r.category`
-        cells_rules = "\n".join(
-            ["{0}:{1}".format(key, value) for key, value in cells_categories.items()]
-        )
-
-        # Discard areas out of MASK
-        temporary_cells = cells + "_temporary"
-        copy_equation = EQUATION.format(result=temporary_cells, expression=cells)
-        r.mapcalc(copy_equation, overwrite=True)
-        g.rename(
-            raster=(temporary_cells, cells),
-            overwrite=True,
-            quiet=True,
-        )
-
-        # Reassign cell category labels
-        r.category(
-            map=cells,
-            rules="-",
-            stdin=cells_rules,
-            separator=":",
-        )
-
-        # Compute extent of each land category
-        extent_expression = "@{cells} * area()"
-        extent_expression = extent_expression.format(cells=cells)
-        extent_equation = EQUATION.format(result=extent, expression=extent_expression)
-        r.mapcalc(extent_equation, overwrite=True)
-
-        # Write extent figures as labels
-        extent_figures_as_labels = extent + "_labeled"
-        r.stats_zonal(
-            flags="r",
-            base=base,
-            cover=extent,
-            method="average",
-            output=extent_figures_as_labels,
-            overwrite=True,
-            verbose=False,
-            quiet=True,
-        )
-        g.rename(
-            raster=(extent_figures_as_labels, extent),
-            overwrite=True,
-            quiet=True,
-        )
-
-        # Write land suitability scores as an ASCII file
-        temporary_reclassified_base_map = temporary_filename(filename=reclassified_base)
-        suitability_scores_as_labels = string_to_file(
-            SUITABILITY_SCORES_LABELS, filename=temporary_reclassified_base_map
-        )
-        remove_files_at_exit(suitability_scores_as_labels)
-
-        # Write scores as raster category labels
-        r.reclass(
-            input=base,
-            output=base_scores,
-            rules=suitability_scores_as_labels,
-            overwrite=True,
-            quiet=True,
-            verbose=False,
-        )
-        remove_map_at_exit(base_scores)
-
-        # Compute weighted extents
-        weighted_expression = "@{extent} * float(@{scores})"
-        weighted_expression = weighted_expression.format(
-            extent=extent, scores=base_scores
-        )
-        weighted_equation = EQUATION.format(
-            result=weighted, expression=weighted_expression
-        )
-        r.mapcalc(weighted_equation, overwrite=True)
-
-        # Write weighted extent figures as labels
-        weighted_figures_as_labels = weighted + "_figures_as_labels"
-        r.stats_zonal(
-            flags="r",
-            base=base,
-            cover=weighted,
-            method="average",
-            output=weighted_figures_as_labels,
-            overwrite=True,
-            verbose=False,
-            quiet=True,
-        )
-        g.rename(
-            raster=(weighted_figures_as_labels, weighted), overwrite=True, quiet=True
+        statistics = supply_statistics(
+            cells=cells.get(int(category), {}),
+            base_in_types=base_in_types.get(int(category), {}),
+            flow_in_base=flow_in_base,
+            scores=scores,
+            area=area,
         )
-
-        # Get weighted extents in a dictionary
-        weighted_extents = grass.parse_command(
-            "r.category", map=weighted, delimiter="\t"
-        )
-
-        # Compute the sum of all weighted extents and add to dictionary
-        category_sum = sum(
-            [
-                float(x) if not math.isnan(float(x)) else 0
-                for x in weighted_extents.values()
-            ]
-        )
-        weighted_extents["sum"] = category_sum
-
-        # Create a map to hold fractions of each weighted extent to the sum
-        # See also:
-        # https://grasswiki.osgeo.org/wiki/LANDSAT#Hint:_Minimal_disk_space_copies
-        r.reclass(
-            input=base,
-            output=fractions,
-            rules="-",
-            stdin="*=*",
-            verbose=False,
-            quiet=True,
-        )
-
-        # Compute weighted fractions of land types
-        fraction_category_label = {
-            key: float(value) / weighted_extents["sum"]
-            for (key, value) in weighted_extents.items()
-            if key is not "sum"
-        }
-
-        # Build fraction category and label rules for `r.category`
-        fraction_rules = "\n".join(
-            [
-                "{0}:{1}".format(key, value)
-                for key, value in fraction_category_label.items()
-            ]
-        )
-
-        # Set rules
-        r.category(map=fractions, rules="-", stdin=fraction_rules, separator=":")
-
-        # Assert that sum of fractions is ~1
-        fraction_categories = grass.parse_command(
-            "r.category", map=fractions, delimiter="\t"
-        )
-
-        fractions_sum = sum(
-            [
-                float(x) if not math.isnan(float(x)) else 0
-                for x in fraction_categories.values()
-            ]
-        )
-        msg = "*** Fractions: {f}".format(f=fraction_categories)
-        grass.debug(_(msg))
-
-        # g.message(_("Sum: {:.17g}".format(fractions_sum)))
-        assert abs(fractions_sum - 1) < 1.0e-6, "Sum of fractions is != 1"
-
-        # Compute flow
-        flow_expression = "@{fractions} * @{flow}"
-        flow_expression = flow_expression.format(fractions=fractions, flow=flow_in_base)
-        flow_equation = EQUATION.format(result=flow, expression=flow_expression)
-        r.mapcalc(flow_equation, overwrite=True)
-
-        # Write flow figures as raster category labels
-        r.stats_zonal(
-            base=reclassified_base,
-            flags="r",
-            cover=flow,
-            method="sum",
-            output=flow_in_category,
-            overwrite=True,
-            verbose=False,
-            quiet=True,
-        )
-
-        # Parse flow categories and labels
-        flow_categories = grass.parse_command(
-            "r.category",
-            map=flow_in_category,
-            delimiter="\t",
-            quiet=True,
-        )
-        grass.debug(_("*** Flow: {c}".format(c=flow_categories)))
-
-        # Build flow category and label rules for `r.category`
-        flow_rules = "\n".join(
-            ["{0}:{1}".format(key, value) for key, value in flow_categories.items()]
-        )
-
-        # Discard areas out of MASK
-
-        # Check here again!
-        # Output patch of all flow maps?
-
-        temporary_flow_in_category = flow_in_category + "_temporary"
-        copy_equation = EQUATION.format(
-            result=temporary_flow_in_category, expression=flow_in_category
-        )
-        r.mapcalc(copy_equation, overwrite=True)
-        g.rename(
-            raster=(temporary_flow_in_category, flow_in_category),
-            overwrite=True,
-            quiet=True,
-        )
-
-        # Reassign cell category labels
-        r.category(
-            map=flow_in_category,
-            rules="-",
-            stdin=flow_rules,
-            separator=":",
-            quiet=True,
-        )
-
-        # Update title
-        reclassified_base_title += " " + category
-        r.support(flow_in_category, title=reclassified_base_title)
-
-        # debugging
-        # r.report(
-        #     flags='hn',
-        #     map=(flow_in_category),
-        #     units=('k','c','p'),
-        # )
+        if not statistics:
+            msg = " * No areas of highest recreation spectrum in category '{c}'"
+            grass.verbose(_(msg.format(c=category)))
+            continue
 
         if print_only:
 
             grass.verbose(" * Flow in category {c}:".format(c=category))
-            r.stats(
-                input=(flow_in_category),
-                output="-",
-                flags="nacpl",
-                separator=COMMA,
-                quiet=True,
-            )
+            for ecosystem_type, values in statistics.items():
+                print(",".join([ecosystem_type] + values))
 
         if not print_only:
 
@@ -529,6 +426,47 @@ def compute_supply(
             # Produce vector map(s)
             if vector:
 
+                flow_in_category = reclassified_base + "_flow_" + category
+                flows.append(flow_in_category)  # add to list for patching
+                remove_map_at_exit(flow_in_category)
+
+                # Ecosystem types in high quality recreation areas of category
+                masking = "if( {spectrum} == {highest_quality_category} && "
+                masking += "{aggregation} == {category} && "
+                masking += "!isnull({highest_spectrum}), "
+                masking += "{reclassified_base}, null() )"
+                masking = masking.format(
+                    spectrum=recreation_spectrum,
+                    highest_quality_category=HIGHEST_RECREATION_CATEGORY,
+                    aggregation=aggregation,
+                    category=category,
+                    highest_spectrum=highest_spectrum,
+                    reclassified_base=reclassified_base,
+                )
+                masking_equation = EQUATION.format(
+                    result=flow_in_category, expression=masking
+                )
+                r.mapcalc(masking_equation, overwrite=True)
+
+                # Write flow figures as raster category labels
+                flow_rules = "\n".join(
+                    [
+                        "{0}:{1}".format(key, value[0])
+                        for key, value in statistics.items()
+                    ]
+                )
+                r.category(
+                    map=flow_in_category,
+                    rules="-",
+                    stdin=flow_rules,
+                    separator=":",
+                    quiet=True,
+                )
+
+                # Update title
+                reclassified_base_title += " " + category
+                r.support(flow_in_category, title=reclassified_base_title)
+
                 update_vector(
                     vector=vector,
                     raster=flow_in_category,
@@ -546,43 +484,15 @@ def compute_supply(
                     type="area",
                 )
 
-            # get statistics
-            dictionary = get_raster_statistics(
-                map_one=aggregation,  # reclassified_base
-                map_two=flow_in_category,
-                separator="|",
-                flags="nlcap",
-            )
-
-            # merge 'dictionary' with global 'statistics_dictionary'
-            statistics_dictionary = merge_two_dictionaries(
-                statistics_dictionary, dictionary
-            )
-
-        # It is important to remove the MASK!
-        r.mask(flags="r", quiet=True)
+            statistics_dictionary[(category, label)] = statistics
 
     # Add the "reclassified_base" map to "remove_at_exit" here,
     # so as to be after all reclassified maps that derive from it
     remove_map_at_exit(reclassified_base)
 
     if not print_only:
-        g.region(
-            raster=aggregation,
-            nsres=ns_resolution,
-            ewres=ew_resolution,
-            flags="a",
-            quiet=True,
-        )
-        r.patch(
-            flags="",
-            input=flows,
-            output=flow_in_reclassified_base,
-            quiet=True,
-        )
-        remove_map_at_exit(flow_in_reclassified_base)
 
-        if vector:
+        if vector and flows:
             # Patch all flow vector maps in one
             v.patch(
                 flags="e",
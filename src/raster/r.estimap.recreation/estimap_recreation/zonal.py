@@ -0,0 +1,88 @@
+"""
+Zonal statistics of several raster maps computed in a single pass with NumPy
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+
+import numpy as np
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
+
+CELL_NULL = -2147483648
+BLOCK_ROWS = 256
+
+
+def read_blocks(rasters, block_rows=BLOCK_ROWS):
+    """Read raster maps block by block in the current region
+
+    Parameters
+    ----------
+    rasters :
+        Names of raster maps to read
+
+    block_rows :
+        Number of rows of each block
+
+    Returns
+    -------
+    A generator of lists of blocks, one block for each raster map. Blocks
+    are float arrays in which NULL cells are NaN.
+    """
+    region = Region()
+    maps = [RasterRow(name) for name in rasters]
+    for raster in maps:
+        raster.open("r")
+    try:
+        for start in range(0, region.rows, block_rows):
+            end = min(start + block_rows, region.rows)
+            blocks = []
+            for raster in maps:
+                block = np.empty((end - start, region.cols))
+                for row in range(start, end):
+                    block[row - start] = raster[row]
+                if raster.mtype == "CELL":
+                    block[block == CELL_NULL] = np.nan
+                blocks.append(block)
+            yield blocks
+    finally:
+        for raster in maps:
+            raster.close()
+
+
+def group_by(keys, values=None):
+    """Count or sum values grouped by combinations of integer keys
+
+    Parameters
+    ----------
+    keys :
+        List of equally sized arrays of (integer) keys
+
+    values :
+        Array of values to sum. If None, the number of cells is counted.
+
+    Returns
+    -------
+    A dictionary of sums (or counts) whose keys are tuples of keys
+
+    Examples
+    --------
+    >>> group_by([np.array([1, 1, 2]), np.array([3, 3, 3])])
+    {(1, 3): 2.0, (2, 3): 1.0}
+    """
+    if not len(keys[0]):
+        return {}
+    stacked = np.column_stack([np.asarray(key, dtype=np.int64) for key in keys])
+    unique, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=values, minlength=len(unique))
+    return {
+        tuple(int(key) for key in row): float(total) for row, total in zip(unique, sums)
+    }
+
+
+def accumulate(totals, sums):
+    """Add the group sums of a block to the totals"""
+    for key, value in sums.items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
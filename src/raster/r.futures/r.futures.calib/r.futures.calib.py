@@ -240,6 +240,12 @@
 # % description: Only create patch size distribution file
 # % guisection: Calibration
 # %end
+# %flag
+# % key: r
+# % label: Resume interrupted calibration
+# % description: Simulations recorded in the checkpoint file of calibration results are not repeated
+# % guisection: Calibration
+# %end
 # %rules
 # % collective: demand,scaling_factor,gamma,development_pressure_approach,seed_search,num_neighbors,devpot_params,n_dev_neighbourhood,predictors,development_pressure,calibration_results,discount_factor,compactness_range,compactness_mean,repeat
 # % exclusive: -l,demand
@@ -261,6 +267,7 @@
 # % exclusive: -l,compactness_mean
 # % exclusive: -l,repeat
 # % exclusive: -l,memory
+# % exclusive: -l,-r
 # % required: -l,demand
 # % required: -l,scaling_factor
 # % required: -l,gamma
@@ -281,55 +288,22 @@
 import sys
 import os
 import atexit
+import hashlib
+import json
 import numpy as np
-from io import StringIO
-from multiprocessing import Process, Queue, Pool
+from multiprocessing import Pool
 
 import grass.script.core as gcore
-import grass.script.raster as grast
 import grass.script.utils as gutils
 from grass.exceptions import CalledModuleError
-
-
-try:
-    from grass.script.utils import append_random
-except ImportError:
-    import random
-    import string
-
-    def append_random(name, suffix_length=None, total_length=None):
-        """Add a random part to of a specified length to a name (string)
-        >>> append_random("tmp", 8)
-        >>> append_random("tmp", total_length=16)
-        ..note::
-            This function is copied from grass79.
-        """
-        if suffix_length and total_length:
-            raise ValueError(
-                "Either suffix_length or total_length can be provided, not both"
-            )
-        if not suffix_length and not total_length:
-            raise ValueError("suffix_length or total_length has to be provided")
-        if total_length:
-            # remove len of name and one underscore
-            name_length = len(name)
-            suffix_length = total_length - name_length - 1
-            if suffix_length <= 0:
-                raise ValueError(
-                    "No characters left for the suffix:"
-                    " total_length <{total_length}> is too small"
-                    " or name <{name}> ({name_length}) is too long".format(**locals())
-                )
-        # We don't do lower and upper case because that could cause conflicts in
-        # contexts which are case-insensitive.
-        # We use lowercase because that's what is in UUID4 hex string.
-        allowed_chars = string.ascii_lowercase + string.digits
-        # The following can be shorter with random.choices from Python 3.6.
-        suffix = "".join(random.choice(allowed_chars) for _ in range(suffix_length))
-        return "{name}_{suffix}".format(**locals())
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
 
 
 TMP = []
+CELL_NULL = -2147483648
+# inputs of simulation tasks, set once in each worker process
+SETTINGS = {}
 
 
 def cleanup(tmp=None):
@@ -337,117 +311,155 @@ def cleanup(tmp=None):
         maps = tmp
     else:
         maps = TMP
-    gcore.run_command(
-        "g.remove", flags="f", type=["raster", "vector"], name=maps, quiet=True
-    )
+    if maps:
+        gcore.run_command(
+            "g.remove", flags="f", type=["raster", "vector"], name=maps, quiet=True
+        )
 
 
-def check_addon_installed(addon, fatal=True):
-    if not gcore.find_program(addon, "--help"):
-        call = gcore.fatal if fatal else gcore.warning
-        call(
-            _(
-                "Addon {a} is not installed." " Please install it using g.extension."
-            ).format(a=addon)
-        )
+def init_worker(settings):
+    global SETTINGS
+    SETTINGS = settings
 
 
-def run_one_combination(
-    comb_count,
-    comb_all,
-    repeat,
-    seed,
-    development_start,
-    compactness_mean,
-    compactness_range,
-    discount_factor,
-    patches_file,
-    fut_options,
-    threshold,
-    hist_bins_area_orig,
-    hist_range_area_orig,
-    hist_bins_compactness_orig,
-    hist_range_compactness_orig,
-    cell_size,
-    histogram_area_orig,
-    histogram_compactness_orig,
-    tmp_name,
-    queue,
-):
-    TMP_PROCESS = []
-    # unique name, must be sql compliant
-    suffix = (
-        str(discount_factor) + str(compactness_mean) + str(compactness_range)
-    ).replace(".", "")
-    simulation_dev_end = tmp_name + "simulation_dev_end_" + suffix
-    simulation_dev_diff = tmp_name + "simulation_dev_diff" + suffix
-    tmp_clump = tmp_name + "tmp_clump" + suffix
-    TMP_PROCESS.append(simulation_dev_diff)
-    TMP_PROCESS.append(simulation_dev_end)
-    TMP_PROCESS.append(tmp_clump)
+def run_task(task):
+    """Run one simulation of a combination and compare it with the original
 
-    sum_dist_area = 0
-    sum_dist_compactness = 0
-    # offset seed
-    seed *= 10000
-    for i in range(repeat):
-        f_seed = seed + i
-        gcore.message(
-            _(
-                "Running calibration combination {comb_count}/{comb_all}"
-                " of simulation attempt {i}/{repeat} with random seed {s}...".format(
-                    comb_count=comb_count,
-                    comb_all=comb_all,
-                    i=i + 1,
-                    repeat=repeat,
-                    s=f_seed,
-                )
+    Returns the task and distances of area and compactness histograms,
+    which are None if the simulation failed.
+    """
+    comb_count, i, seed, compactness_mean, compactness_range, discount_factor = task
+    s = SETTINGS
+    simulation_dev_end = s["tmp_name"] + "simulation_dev_end_" + str(os.getpid())
+    gcore.message(
+        _(
+            "Running calibration combination {comb_count}/{comb_all}"
+            " of simulation attempt {i}/{repeat} with random seed {s}...".format(
+                comb_count=comb_count + 1,
+                comb_all=s["comb_all"],
+                i=i + 1,
+                repeat=s["repeat"],
+                s=seed,
             )
         )
-        try:
-            run_simulation(
-                development_start=development_start,
-                development_end=simulation_dev_end,
-                compactness_mean=compactness_mean,
-                compactness_range=compactness_range,
-                discount_factor=discount_factor,
-                patches_file=patches_file,
-                seed=f_seed,
-                fut_options=fut_options,
-            )
-        except CalledModuleError as e:
-            queue.put(None)
-            cleanup(tmp=TMP_PROCESS)
-            gcore.error(_("Running r.futures.pga failed. Details: {e}").format(e=e))
-            return
-        new_development(simulation_dev_end, simulation_dev_diff)
-
-        data = patch_analysis(simulation_dev_diff, threshold, tmp_clump)
-        sim_hist_area, sim_hist_compactness = create_histograms(
-            data,
-            hist_bins_area_orig,
-            hist_range_area_orig,
-            hist_bins_compactness_orig,
-            hist_range_compactness_orig,
-            cell_size,
+    )
+    try:
+        run_simulation(
+            development_start=s["development_start"],
+            development_end=simulation_dev_end,
+            compactness_mean=compactness_mean,
+            compactness_range=compactness_range,
+            discount_factor=discount_factor,
+            patches_file=s["patches_file"],
+            seed=seed,
+            fut_options=s["fut_options"],
         )
+    except CalledModuleError as e:
+        cleanup(tmp=[simulation_dev_end])
+        gcore.error(_("Running r.futures.pga failed. Details: {e}").format(e=e))
+        return task, None
+    data = patch_analysis(new_development(simulation_dev_end), s["threshold"], s["res"])
+    cleanup(tmp=[simulation_dev_end])
+    sim_hist_area, sim_hist_compactness = create_histograms(
+        data,
+        s["hist_bins_area_orig"],
+        s["hist_range_area_orig"],
+        s["hist_bins_compactness_orig"],
+        s["hist_range_compactness_orig"],
+        s["cell_size"],
+    )
+    return task, (
+        compare_histograms(s["histogram_area_orig"], sim_hist_area),
+        compare_histograms(s["histogram_compactness_orig"], sim_hist_compactness),
+    )
 
-        sum_dist_area += compare_histograms(histogram_area_orig, sim_hist_area)
-        sum_dist_compactness += compare_histograms(
-            histogram_compactness_orig, sim_hist_compactness
-        )
 
-    mean_dist_area = sum_dist_area / repeat
-    mean_dist_compactness = sum_dist_compactness / repeat
+def sweep_tasks(combinations, repeat, seed):
+    """Return simulation tasks of all combinations and repeats
+
+    Each combination has its own seed which is offset for each repeat.
+    """
+    tasks = []
+    for count, (com_mean, com_range, discount_factor) in enumerate(combinations):
+        for i in range(repeat):
+            f_seed = (seed + count) * 10000 + i
+            tasks.append((count, i, f_seed, com_mean, com_range, discount_factor))
+    return tasks
+
+
+def task_key(task):
+    count, i, seed, com_mean, com_range, discount_factor = task
+    return ",".join(str(each) for each in (discount_factor, com_mean, com_range, seed))
+
+
+def checkpoint_header(options, flags, region):
+    """Return first line of checkpoint file identifying the inputs
+
+    The line contains a hash of the options and flags, except those which
+    are part of the keys of simulations or do not change their results,
+    and of the computational region.
+    """
+    ignored = (
+        "compactness_mean",
+        "compactness_range",
+        "discount_factor",
+        "calibration_results",
+        "patch_sizes",
+        "separator",
+        "nprocs",
+    )
+    inputs = dict(
+        options={k: v for k, v in options.items() if k not in ignored},
+        flags={k: v for k, v in flags.items() if k != "r"},
+        region=region,
+    )
+    digest = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+    return "# r.futures.calib checkpoint {}".format(digest)
+
 
-    data = {}
-    data["input_discount_factor"] = discount_factor
-    data["input_compactness_mean"] = compactness_mean
-    data["input_compactness_range"] = compactness_range
-    data["area_distance"] = mean_dist_area
-    data["compactness_distance"] = mean_dist_compactness
-    queue.put(data)
-    cleanup(tmp=TMP_PROCESS)
+def read_checkpoint(checkpoint, header):
+    """Read distances of finished simulations from checkpoint file
+
+    Fails if the checkpoint file was created with different inputs.
+    """
+    done = {}
+    if not os.path.exists(checkpoint) or not os.path.getsize(checkpoint):
+        return done
+    with open(checkpoint) as f:
+        if f.readline().strip() != header:
+            gcore.fatal(
+                _(
+                    "Checkpoint file <{}> was created with different options or "
+                    "computational region, remove it to start a new calibration"
+                ).format(checkpoint)
+            )
+        for line in f:
+            values = line.strip().split(",")
+            # skip incomplete last line of an interrupted run
+            if len(values) != 6:
+                continue
+            done[",".join(values[:4])] = (float(values[4]), float(values[5]))
+    return done
+
+
+def calibration_row(combination, distances):
+    """Format result of a combination as a line of calibration results"""
+    com_mean, com_range, discount_factor = combination
+    # sum in the order of repeats to keep results reproducible
+    sum_dist_area = 0
+    sum_dist_compactness = 0
+    for dist_area, dist_compactness in distances:
+        sum_dist_area += dist_area
+        sum_dist_compactness += dist_compactness
+    return ",".join(
+        [
+            str(discount_factor),
+            str(sum_dist_area / len(distances)),
+            str(com_mean),
+            str(com_range),
+            str(sum_dist_compactness / len(distances)),
+        ]
+    )
 
 
 def run_simulation(
@@ -497,105 +509,101 @@ def run_simulation(
     gcore.run_command("r.futures.pga", overwrite=True, **parameters)
 
 
-def diff_development(development_start, development_end, subregions, development_diff):
-    grast.mapcalc(
-        exp="{res} = if({subregions} && {dev_end} && (isnull({dev_start}) ||| !{dev_start}), 1, null())".format(
-            res=development_diff,
-            subregions=subregions,
-            dev_end=development_end,
-            dev_start=development_start,
-        ),
-        overwrite=True,
-        quiet=True,
+def read_raster(name):
+    """Read raster map in the current region, NULLs are NaNs"""
+    region = Region()
+    array = np.empty((region.rows, region.cols))
+    with RasterRow(name) as raster:
+        for row in range(region.rows):
+            array[row] = raster[row]
+        if raster.mtype == "CELL":
+            array[array == CELL_NULL] = np.nan
+    return array
+
+
+def diff_development(development_start, development_end, subregions):
+    """Return mask of cells developed between start and end within subregions"""
+    start = read_raster(development_start)
+    end = read_raster(development_end)
+    return (
+        ~np.isnan(subregions)
+        & (subregions != 0)
+        & ~np.isnan(end)
+        & (end != 0)
+        & (np.isnan(start) | (start == 0))
     )
 
 
-def new_development(development_end, development_diff):
-    grast.mapcalc(
-        exp="{res} = if({dev_end} > 0, 1, null())".format(
-            res=development_diff, dev_end=development_end
-        ),
-        overwrite=True,
-        quiet=True,
-    )
+def new_development(development_end):
+    """Return mask of cells developed in simulation"""
+    return read_raster(development_end) > 0
 
 
-def analyse_subregion(params):
-    tmp_clump_cat, subregions, cat, clump, threshold = params
-    grast.mapcalc(
-        "{new} = if ({reg} == {cat}, {clump}, null())".format(
-            new=tmp_clump_cat, reg=subregions, cat=cat, clump=clump
-        ),
-        overwrite=True,
-    )
-    env = os.environ.copy()
-    env["GRASS_REGION"] = gcore.region_env(zoom=tmp_clump_cat)
-    try:
-        data = gcore.read_command(
-            "r.object.geometry",
-            input=tmp_clump_cat,
-            flags="m",
-            separator="comma",
-            env=env,
-            quiet=True,
-        ).strip()
-        data = np.loadtxt(StringIO(data), delimiter=",", usecols=(1, 2), skiprows=1)
-        # in case there is just one record
-        data = data.reshape((-1, 2))
-        return data[data[:, 0] > threshold]
-    except CalledModuleError:
-        gcore.warning(
-            "Subregion {cat} has no changes in development, no patches found.".format(
-                cat=cat
-            )
-        )
-        return np.empty([0, 2])
+def patch_geometry(development_diff, res, zones=None):
+    """Compute area and perimeter of patches of new development
 
+    Patches are clumps of 4-connected cells as created by r.clump.
+    If zones are given, patches are split by zones.
+    Area and perimeter are in meters as computed by r.object.geometry -m,
+    i.e., perimeter includes the edges shared with other patches.
 
-def patch_analysis_per_subregion_parallel(
-    development_diff, subregions, threshold, tmp_clump, tmp_name, nprocs
-):
-    gcore.run_command(
-        "r.clump", input=development_diff, output=tmp_clump, overwrite=True, quiet=True
-    )
-    cats = (
-        gcore.read_command("r.describe", flags="1n", map=subregions, quiet=True)
-        .strip()
-        .splitlines()
-    )
-    params = []
-    toremove = []
-    for cat in cats:
-        tmp_clump_cat = append_random(tmp_name, suffix_length=8)
-        toremove.append(tmp_clump_cat)
-        params.append((tmp_clump_cat, subregions, cat, tmp_clump, threshold))
-    with Pool(processes=nprocs) as pool:
-        results = pool.map_async(analyse_subregion, params).get()
-    subregions_data = dict(zip(cats, results))
-    gcore.run_command("g.remove", type="raster", flags="f", name=toremove, quiet=True)
+    :param development_diff: boolean array of new development
+    :param res: east-west and north-south resolution in meters
+    :param zones: array of zone categories
+    :return: array of area and perimeter of each patch and, if zones are
+             given, array of zone of each patch
+    """
+    from scipy import ndimage
+
+    labels, count = ndimage.label(development_diff)
+    if zones is not None:
+        cats, cat_index = np.unique(zones[development_diff], return_inverse=True)
+        keys = labels[development_diff].astype(np.int64) * len(cats) + cat_index
+        keys, patch_index = np.unique(keys, return_inverse=True)
+        labels = np.zeros(development_diff.shape, dtype=np.int64)
+        labels[development_diff] = patch_index + 1
+        count = len(keys)
+        patch_zones = cats[keys % len(cats)]
+
+    ewres, nsres = res
+    area = np.bincount(labels.ravel(), minlength=count + 1) * ewres * nsres
+    perimeter = np.zeros(count + 1)
+    padded = np.pad(labels, 1)
+    # edges between vertical and horizontal neighbors
+    for first, second, length in (
+        (padded[:-1, :], padded[1:, :], ewres),
+        (padded[:, :-1], padded[:, 1:], nsres),
+    ):
+        edges = first != second
+        perimeter += np.bincount(first[edges], minlength=count + 1) * length
+        perimeter += np.bincount(second[edges], minlength=count + 1) * length
+
+    data = np.column_stack((area[1:], perimeter[1:]))
+    if zones is not None:
+        return data, patch_zones
+    return data
+
+
+def patch_analysis_per_subregion(development_diff, subregions, threshold, res):
+    data, patch_zones = patch_geometry(development_diff, res, zones=subregions)
+    subregions_data = {}
+    for cat in np.unique(subregions[~np.isnan(subregions)]):
+        cat_data = data[patch_zones == cat]
+        if not len(cat_data):
+            gcore.warning(
+                "Subregion {cat} has no changes in development, no patches found.".format(
+                    cat=int(cat)
+                )
+            )
+        subregions_data[str(int(cat))] = cat_data[cat_data[:, 0] > threshold]
     return subregions_data
 
 
-def patch_analysis(development_diff, threshold, tmp_clump):
-    gcore.run_command(
-        "r.clump", input=development_diff, output=tmp_clump, overwrite=True, quiet=True
-    )
-    try:
-        data = gcore.read_command(
-            "r.object.geometry",
-            input=tmp_clump,
-            flags="m",
-            separator="comma",
-            quiet=True,
-        ).strip()
-        data = np.loadtxt(StringIO(data), delimiter=",", usecols=(1, 2), skiprows=1)
-        # in case there is just one record
-        data = data.reshape((-1, 2))
-        data = data[data[:, 0] > threshold]
-    except CalledModuleError:
+def patch_analysis(development_diff, threshold, res):
+    data = patch_geometry(development_diff, res)
+    if not len(data):
         gcore.warning("No changes in development, no patches found.")
-        data = np.empty([0, 2])
-    return data
+    return data[data[:, 0] > threshold]
 
 
 def create_histograms(
@@ -715,7 +723,10 @@ def process_calibration(calib_file):
 
 
 def main():
-    check_addon_installed("r.object.geometry", fatal=True)
+    try:
+        from scipy import ndimage  # noqa: F401
+    except ImportError:
+        gcore.fatal(_("Importing scipy failed. Please install scipy."))
 
     dev_start = options["development_start"]
     dev_end = options["development_end"]
@@ -744,29 +755,17 @@ def main():
     res = (region["nsres"] + region["ewres"]) / 2.0
     coeff = float(gcore.parse_command("g.proj", flags="g")["meters"])
     cell_size = res * res * coeff * coeff
+    res_meters = (region["ewres"] * coeff, region["nsres"] * coeff)
 
     tmp_name = "tmp_futures_calib_" + str(os.getpid()) + "_"
-    global TMP
-
-    orig_patch_diff = tmp_name + "orig_patch_diff"
-    TMP.append(orig_patch_diff)
-    tmp_clump = tmp_name + "tmp_clump"
-    TMP.append(tmp_clump)
-    if patches_per_subregion:
-        tmp_cat_clump = tmp_name + "tmp_cat_clump"
-        TMP.append(tmp_cat_clump)
 
     gcore.message(_("Analyzing original patches..."))
-    diff_development(dev_start, dev_end, options["subregions"], orig_patch_diff)
-    data = write_data = patch_analysis(orig_patch_diff, threshold, tmp_clump)
+    subregions = read_raster(options["subregions"])
+    orig_patch_diff = diff_development(dev_start, dev_end, subregions)
+    data = write_data = patch_analysis(orig_patch_diff, threshold, res_meters)
     if patches_per_subregion:
-        subregions_data = patch_analysis_per_subregion_parallel(
-            orig_patch_diff,
-            options["subregions"],
-            threshold,
-            tmp_clump,
-            tmp_name,
-            nprocs,
+        subregions_data = patch_analysis_per_subregion(
+            orig_patch_diff, subregions, threshold, res_meters
         )
         # if there is just one column, write the previous analysis result
         if len(subregions_data.keys()) > 1:
@@ -805,70 +804,87 @@ def main():
         histogram_compactness_orig * 100
     )  # to get percentage for readability
 
-    seed = int(options["random_seed"])
-    count = 0
-    proc_count = 0
-    queue_list = []
-    proc_list = []
-    num_all = len(compactness_means) * len(compactness_ranges) * len(discount_factors)
-    with open(options["calibration_results"], "w") as f:
-        for com_mean in compactness_means:
-            for com_range in compactness_ranges:
-                for discount_factor in discount_factors:
-                    count += 1
-                    q = Queue()
-                    p = Process(
-                        target=run_one_combination,
-                        args=(
-                            count,
-                            num_all,
-                            repeat,
-                            seed,
-                            dev_start,
-                            com_mean,
-                            com_range,
-                            discount_factor,
-                            patches_file,
-                            options,
-                            threshold,
-                            hist_bins_area_orig,
-                            hist_range_area_orig,
-                            hist_bins_compactness_orig,
-                            hist_range_compactness_orig,
-                            cell_size,
-                            histogram_area_orig,
-                            histogram_compactness_orig,
-                            tmp_name,
-                            q,
-                        ),
+    combinations = [
+        (com_mean, com_range, discount_factor)
+        for com_mean in compactness_means
+        for com_range in compactness_ranges
+        for discount_factor in discount_factors
+    ]
+    tasks = sweep_tasks(combinations, repeat, int(options["random_seed"]))
+    results_file = options["calibration_results"]
+    checkpoint = results_file + ".checkpoint"
+    header = checkpoint_header(options, flags, region)
+    done = read_checkpoint(checkpoint, header) if flags["r"] else {}
+    distances = [[None] * repeat for each in combinations]
+    for task in tasks:
+        if task_key(task) in done:
+            distances[task[0]][task[1]] = done[task_key(task)]
+    remaining = [task for task in tasks if task_key(task) not in done]
+    if done:
+        gcore.message(
+            _("Resuming calibration, {n} of {m} simulations are finished").format(
+                n=len(tasks) - len(remaining), m=len(tasks)
+            )
+        )
+
+    settings = dict(
+        comb_all=len(combinations),
+        repeat=repeat,
+        development_start=dev_start,
+        patches_file=patches_file,
+        fut_options=options,
+        threshold=threshold,
+        hist_bins_area_orig=hist_bins_area_orig,
+        hist_range_area_orig=hist_range_area_orig,
+        hist_bins_compactness_orig=hist_bins_compactness_orig,
+        hist_range_compactness_orig=hist_range_compactness_orig,
+        cell_size=cell_size,
+        res=res_meters,
+        histogram_area_orig=histogram_area_orig,
+        histogram_compactness_orig=histogram_compactness_orig,
+        tmp_name=tmp_name,
+    )
+    # results are written as soon as all repeats of a combination finish,
+    # checkpoint records each finished simulation
+    resume = flags["r"] and os.path.exists(checkpoint) and os.path.getsize(checkpoint)
+    with open(results_file, "w") as f, open(
+        checkpoint, "a" if resume else "w"
+    ) as checkpoint_file:
+        if not resume:
+            checkpoint_file.write(header + "\n")
+        for count, combination in enumerate(combinations):
+            if None not in distances[count]:
+                f.write(calibration_row(combination, distances[count]) + "\n")
+        f.flush()
+        # tasks are scheduled one by one to balance the load
+        with Pool(
+            processes=nprocs, initializer=init_worker, initargs=(settings,)
+        ) as pool:
+            for task, result in pool.imap_unordered(run_task, remaining, chunksize=1):
+                count, i = task[0], task[1]
+                if result is None:
+                    continue
+                checkpoint_file.write(
+                    "{key},{area},{compactness}\n".format(
+                        key=task_key(task), area=result[0], compactness=result[1]
+                    )
+                )
+                checkpoint_file.flush()
+                distances[count][i] = result
+                if None not in distances[count]:
+                    f.write(
+                        calibration_row(combinations[count], distances[count]) + "\n"
                     )
-                    p.start()
-                    queue_list.append(q)
-                    proc_list.append(p)
-                    proc_count += 1
-                    seed += 1
-                    if proc_count == nprocs or count == num_all:
-                        for i in range(proc_count):
-                            proc_list[i].join()
-                            data = queue_list[i].get()
-                            if not data:
-                                continue
-                            f.write(
-                                ",".join(
-                                    [
-                                        str(data["input_discount_factor"]),
-                                        str(data["area_distance"]),
-                                        str(data["input_compactness_mean"]),
-                                        str(data["input_compactness_range"]),
-                                        str(data["compactness_distance"]),
-                                    ]
-                                )
-                            )
-                            f.write("\n")
-                        f.flush()
-                        proc_count = 0
-                        proc_list = []
-                        queue_list = []
+                    f.flush()
+
+    # rewrite in the order of combinations,
+    # combinations with a failed simulation are skipped
+    with open(results_file, "w") as f:
+        for count, combination in enumerate(combinations):
+            if None not in distances[count]:
+                f.write(calibration_row(combination, distances[count]) + "\n")
+    if all(None not in each for each in distances):
+        gutils.try_remove(checkpoint)
     # compute combined normalized error
     process_calibration(options["calibration_results"])
 
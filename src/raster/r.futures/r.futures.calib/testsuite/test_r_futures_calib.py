@@ -84,6 +84,9 @@ class TestPGACalib(TestCase):
             "data/out_library_subregion.csv",
             "data/out_calib.csv",
             "data/out_calib_subregion.csv",
+            "data/out_library_resume.txt",
+            "data/out_calib_resume.csv",
+            "data/out_calib_resume.csv.checkpoint",
         ):
             try:
                 os.remove(each)
@@ -184,6 +187,29 @@ class TestPGACalib(TestCase):
             "Calibration results differ",
         )
 
+    def test_pga_calib_resume_changed_inputs(self):
+        """Test that resuming from checkpoint of different inputs fails"""
+        checkpoint = "data/out_calib_resume.csv.checkpoint"
+        with open(checkpoint, "w") as f:
+            f.write("# r.futures.calib checkpoint 0123456789abcdef\n")
+            f.write("0.1,0.1,0.1,10000,0.5,0.5\n")
+        self.assertModuleFail(
+            "r.futures.calib",
+            flags="r",
+            development_start="urban_1987",
+            development_end="urban_2002",
+            patch_threshold=0,
+            patch_sizes="data/out_library_resume.txt",
+            compactness_mean=[0.1],
+            compactness_range=[0.1],
+            discount_factor=[0.1],
+            calibration_results="data/out_calib_resume.csv",
+            nprocs=1,
+            repeat=1,
+            random_seed=1,
+            **self.pga_params,
+        )
+
 
 if __name__ == "__main__":
     test()
@@ -0,0 +1,77 @@
+"""Benchmarking of the backends of r.futures.devpressure
+
+Compares r.mfilter with the FFT backend for increasing neighborhood sizes
+to find the size from which FFT is faster (FFT_MIN_SIZE used by backend
+auto). Uses the current region, which should be large enough to make
+the overhead of reading and writing negligible, e.g.:
+
+g.region raster=elevation res=3
+"""
+
+import matplotlib.pyplot as plt
+
+from grass.pygrass.modules import Module
+
+import grass.benchmark as bm
+import grass.script as gs
+
+INPUT = "benchmark_devpressure_developed"
+OUTPUT = "benchmark_devpressure"
+
+
+def main():
+    gs.mapcalc(
+        "{} = if(rand(0., 1.) < 0.2, 1, 0)".format(INPUT), seed=1, overwrite=True
+    )
+    sizes = [1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30]
+    times = {}
+    for backend in ("mfilter", "fft"):
+        times[backend] = [benchmark(size, backend) for size in sizes]
+
+    print("size  mfilter [s]  fft [s]")
+    for i, size in enumerate(sizes):
+        print(
+            "{:4d}  {:11.2f}  {:7.2f}".format(
+                size, times["mfilter"][i], times["fft"][i]
+            )
+        )
+    crossover = [
+        size for i, size in enumerate(sizes) if times["fft"][i] < times["mfilter"][i]
+    ]
+    if crossover:
+        print("FFT is faster from size {}".format(crossover[0]))
+
+    fig, ax = plt.subplots()
+    for backend in times:
+        ax.plot(sizes, times[backend], "-o", label=backend)
+    ax.set_xlabel("Half of neighborhood size [cells]")
+    ax.set_ylabel("Time [s]")
+    ax.legend()
+    fig.savefig("r_futures_devpressure_benchmark.svg")
+
+    gs.run_command("g.remove", type="raster", name=[INPUT, OUTPUT], flags="f")
+
+
+def benchmark(size, backend, nprocs=4, repeat=3):
+    module = Module(
+        "r.futures.devpressure",
+        input=INPUT,
+        output=OUTPUT,
+        method="gravity",
+        size=size,
+        backend=backend,
+        nprocs=nprocs,
+        flags="n",
+        run_=False,
+        stdout_=None,
+        stderr_=None,
+        overwrite=True,
+    )
+    result = bm.benchmark_single(
+        module, label="{} size={}".format(backend, size), repeat=repeat
+    )
+    return result.time
+
+
+if __name__ == "__main__":
+    main()
@@ -59,6 +59,15 @@
 # % required: no
 # % answer: 1
 # %end
+# %option
+# % key: backend
+# % type: string
+# % description: Backend for filtering the development raster
+# % required: no
+# % answer: auto
+# % options: auto,mfilter,fft
+# % descriptions: auto;fft for larger neighborhoods, mfilter otherwise;mfilter;direct convolution with r.mfilter;fft;FFT convolution of overlapping blocks in Python
+# %end
 # %option G_OPT_M_NPROCS
 # %end
 # %flag
@@ -71,17 +80,23 @@ import os
 import sys
 import atexit
 import numpy as np
-from math import sqrt
+from concurrent.futures import ThreadPoolExecutor
 
 # from grass.exceptions import CalledModuleError
 import grass.script.core as gcore
 import grass.script.utils as gutils
 import grass.script.raster as grast
 from grass.script import task as gtask
+from grass.pygrass.raster import RasterRow
+from grass.pygrass.raster.buffer import Buffer
 
 
 TMPFILE = None
 TMP = []
+# smallest size for which backend auto uses FFT,
+# see benchmark/benchmark_r_futures_devpressure.py
+FFT_MIN_SIZE = 5
+CELL_NULL = -2147483648
 
 
 def cleanup():
@@ -105,6 +120,9 @@ def main():
     input_dev = options["input"]
     output = options["output"]
     method = options["method"]
+    backend = options["backend"]
+    if backend == "auto":
+        backend = "fft" if size >= FFT_MIN_SIZE else "mfilter"
 
     if method in ("gravity", "kernel") and (gamma is None or scale is None):
         gcore.fatal(
@@ -156,19 +174,21 @@ def main():
         matrix_ = scale * np.exp(-2 * matrix / gamma)
         matrix = np.where(matrix > 0, matrix_, 0)
 
-    path = gcore.tempfile()
-    global TMPFILE
-    TMPFILE = path
-
-    with open(path, "w") as f:
-        f.write(write_filter(matrix))
     gcore.message(_("Running development pressure filter..."))
-    params = {}
-    if module_has_parameter("r.mfilter", "nprocs"):
-        params["nprocs"] = options["nprocs"]
-    gcore.run_command(
-        "r.mfilter", input=rmfilter_inp, output=rmfilter_out, filter=path, **params
-    )
+    if backend == "fft":
+        fft_filter(rmfilter_inp, rmfilter_out, matrix, int(options["nprocs"]))
+    else:
+        path = gcore.tempfile()
+        TMPFILE = path
+
+        with open(path, "w") as f:
+            f.write(write_filter(matrix))
+        params = {}
+        if module_has_parameter("r.mfilter", "nprocs"):
+            params["nprocs"] = options["nprocs"]
+        gcore.run_command(
+            "r.mfilter", input=rmfilter_inp, output=rmfilter_out, filter=path, **params
+        )
 
     if flags["n"]:
         gcore.run_command(
@@ -189,32 +209,149 @@ def main():
 
 
 def distance_matrix(size):
-    matrix_size = 2 * size + 1
-    matrix = np.zeros((matrix_size, matrix_size))
-    center = size
-    for i in range(matrix_size):
-        for j in range(matrix_size):
-            dist = sqrt((i - center) * (i - center) + (j - center) * (j - center))
-            if dist <= size:
-                matrix[i, j] = dist
+    offsets = np.arange(-size, size + 1)
+    matrix = np.sqrt(offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2)
+    matrix[matrix > size] = 0
     return matrix
 
 
 def write_filter(matrix):
     filter_text = ["TITLE development pressure"]
     filter_text.append("MATRIX %s" % matrix.shape[0])
-    for i in range(matrix.shape[0]):
-        line = ""
-        for j in range(matrix.shape[0]):
-            line += str(matrix[i, j])
-            line += " "
-        filter_text.append(line)
+    for row in matrix:
+        filter_text.append(" ".join(str(value) for value in row))
     filter_text.append("DIVISOR 1")
     filter_text.append("TYPE P")
 
     return "\n".join(filter_text)
 
 
+def fft_size(minimum):
+    """Smallest 5-smooth number (fast FFT length) not smaller than minimum"""
+    size = minimum
+    while True:
+        rest = size
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return size
+        size += 1
+
+
+def fft_block_size(kernel_size, rows, cols):
+    """Size of the square blocks transformed by FFT
+
+    Blocks overlap by kernel_size - 1 cells, so they need to be several times
+    larger than the kernel to keep the overhead low, but not larger than the
+    region.
+    """
+    block = max(512, 4 * kernel_size)
+    block = min(block, max(rows, cols) + kernel_size - 1)
+    return fft_size(block)
+
+
+def box_count(mask, size):
+    """Number of True cells in each window of mask (valid windows only)"""
+    window = 2 * size + 1
+    counts = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    counts[1:, 1:] = mask.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
+    return (
+        counts[window:, window:]
+        - counts[:-window, window:]
+        - counts[window:, :-window]
+        + counts[:-window, :-window]
+    )
+
+
+def filter_block(values, kernel_fft, block, size):
+    """Filter a block of values padded by size cells on each side"""
+    result = np.fft.irfft2(
+        np.fft.rfft2(values, s=(block, block)) * kernel_fft, s=(block, block)
+    )
+    return result[2 * size : values.shape[0], 2 * size : values.shape[1]]
+
+
+def filter_strip(values, nulls, kernel_fft, block, size, pool):
+    """Filter a strip of rows padded by size cells on each side
+
+    The strip is split into overlapping blocks which are filtered in parallel.
+    A cell is NULL if there is any NULL in its window.
+    """
+    step = block - 2 * size
+    cols = values.shape[1] - 2 * size
+    starts = range(0, cols, step)
+    blocks = pool.map(
+        lambda start: filter_block(
+            values[:, start : start + step + 2 * size], kernel_fft, block, size
+        ),
+        starts,
+    )
+    result = np.concatenate(list(blocks), axis=1)
+    result[box_count(nulls, size) > 0] = np.nan
+    return result
+
+
+def read_rows(raster, start, end, rows, cols, size):
+    """Read rows start to end of raster padded by size cells
+
+    Returns values with NULLs replaced by zeros and the mask of NULLs.
+    Cells outside of the region are NULL.
+    """
+    values = np.zeros((end - start, cols + 2 * size))
+    nulls = np.ones(values.shape, dtype=bool)
+    for row in range(max(start, 0), min(end, rows)):
+        data = raster[row]
+        if raster.mtype == "CELL":
+            null = data == CELL_NULL
+        else:
+            null = np.isnan(data)
+        values[row - start, size : size + cols] = np.where(null, 0, data)
+        nulls[row - start, size : size + cols] = null
+    return values, nulls
+
+
+def fft_filter(input, output, matrix, nprocs):
+    """Filter input with matrix using FFT like r.mfilter with DIVISOR 1
+
+    Output cells with a NULL in their window are NULL, cells closer
+    to the edges of the region than the half of the window keep
+    the input values.
+    """
+    size = matrix.shape[0] // 2
+    region = gcore.region()
+    rows, cols = region["rows"], region["cols"]
+    with RasterRow(input) as raster:
+        block = fft_block_size(matrix.shape[0], rows, cols)
+        step = block - 2 * size
+        # r.mfilter correlates, FFT convolves
+        kernel_fft = np.fft.rfft2(matrix[::-1, ::-1], s=(block, block))
+
+        out = RasterRow(output)
+        out.open("w", mtype="DCELL", overwrite=gcore.overwrite())
+        buff = Buffer((cols,), "DCELL")
+        with ThreadPoolExecutor(max_workers=max(1, nprocs)) as pool:
+            for start in range(0, rows, step):
+                end = min(start + step, rows)
+                values, nulls = read_rows(
+                    raster, start - size, end + size, rows, cols, size
+                )
+                result = filter_strip(values, nulls, kernel_fft, block, size, pool)
+                # edges are copied from input
+                inner = (slice(size, size + end - start), slice(size, size + cols))
+                edge = np.where(nulls[inner], np.nan, values[inner])
+                result[:, :size] = edge[:, :size]
+                result[:, cols - size :] = edge[:, cols - size :]
+                for row in range(start, end):
+                    if row < size or row >= rows - size:
+                        buff[:] = edge[row - start]
+                    else:
+                        buff[:] = result[row - start]
+                    out.put_row(buff)
+                gcore.percent(end, rows, 1)
+        out.close()
+
+
 if __name__ == "__main__":
     options, flags = gcore.parser()
     atexit.register(cleanup)
@@ -7,6 +7,7 @@ from grass.gunittest.main import test
 class TestDevpressure(TestCase):
 
     output = "devpressure_output"
+    output_mfilter = "devpressure_output_mfilter"
     result = "result"
 
     @classmethod
@@ -34,7 +35,12 @@ class TestDevpressure(TestCase):
         cls.del_temp_region()
 
     def tearDown(self):
-        self.runModule("g.remove", flags="f", type="raster", name=self.output)
+        self.runModule(
+            "g.remove",
+            flags="f",
+            type="raster",
+            name=[self.output, self.output_mfilter],
+        )
 
     def test_devpressure_run(self):
         """Test if results is in expected limits"""
@@ -46,11 +52,43 @@ class TestDevpressure(TestCase):
             size=15,
             flags="n",
             nprocs=2,
+            backend="mfilter",
+        )
+        self.assertRastersNoDifference(
+            actual=self.output, reference=self.result, precision=1e-6
+        )
+
+    def test_devpressure_fft(self):
+        """Test if FFT backend gives the same results as r.mfilter"""
+        self.assertModule(
+            "r.futures.devpressure",
+            input="urban_2002",
+            output=self.output,
+            method="gravity",
+            size=15,
+            flags="n",
+            nprocs=2,
+            backend="fft",
         )
         self.assertRastersNoDifference(
             actual=self.output, reference=self.result, precision=1e-6
         )
 
+    def test_devpressure_fft_nulls(self):
+        """Test if FFT backend propagates nulls like r.mfilter"""
+        for backend, output in (("fft", self.output), ("mfilter", self.output_mfilter)):
+            self.assertModule(
+                "r.futures.devpressure",
+                input="urban_2002",
+                output=output,
+                method="kernel",
+                size=4,
+                backend=backend,
+            )
+        self.assertRastersNoDifference(
+            actual=self.output, reference=self.output_mfilter, precision=1e-6
+        )
+
 
 if __name__ == "__main__":
     test()
@@ -68,6 +68,34 @@
 # % guisection: Optional
 # %end
 
+# %option
+# % key: n_jobs
+# % type: integer
+# % label: Number of cores for multiprocessing
+# % description: Number of processes used to predict blocks of rows in parallel, -2 is n_cores-1
+# % answer: 1
+# % guisection: Optional
+# %end
+
+# %option
+# % key: max_windows
+# % type: integer
+# % label: Maximum number of blocks of rows held in memory
+# % description: Maximum number of blocks of rows that are read ahead or waiting to be written during parallel prediction. Zero uses twice the number of processes
+# % answer: 0
+# % guisection: Optional
+# %end
+
+# %option
+# % key: cache_dir
+# % type: string
+# % gisprompt: new,dir,dir
+# % label: Directory used to cache the predictor rasters
+# % description: The rasters of the imagery group are stored in this directory as memory-mapped arrays and reused by later runs with the same rasters and computational region
+# % required: no
+# % guisection: Optional
+# %end
+
 
 import grass.script as gs
 import numpy as np
@@ -97,7 +125,8 @@ def main():
         gs.fatal("Package python3-scikit-learn 0.20 or newer is not installed")
 
     gs.utils.set_path(modulename="r.learn.ml2", dirname="rlearnlib", path="..")
-    from rlearnlib.raster import RasterStack
+    from rlearnlib.raster import RasterStack, n_jobs_to_workers
+    from rlearnlib.cache import RasterCache
 
     # parser options
     group = options["group"]
@@ -106,6 +135,13 @@ def main():
     probability = flags["p"]
     prob_only = flags["z"]
     chunksize = int(options["chunksize"])
+    n_jobs = n_jobs_to_workers(int(options["n_jobs"]))
+    max_windows = int(options["max_windows"])
+
+    cache = RasterCache(options["cache_dir"]) if options["cache_dir"] else None
+
+    if max_windows < 0:
+        gs.fatal("max_windows must be zero or a positive number")
 
     # remove @ from output in case overwriting result
     if "@" in output:
@@ -126,8 +162,11 @@ def main():
     region = Region()
     row_incr = math.ceil(chunksize / region.cols)
 
-    # do not read by increments if increment > n_rows
-    if row_incr >= region.rows:
+    # do not read by increments if increment > n_rows, unless the rows are
+    # shared between several processes or read from the cache
+    if n_jobs > 1:
+        row_incr = min(row_incr, math.ceil(region.rows / n_jobs))
+    elif row_incr >= region.rows and cache is None:
         row_incr = None
 
     # prediction
@@ -138,6 +177,9 @@ def main():
             output=output,
             height=row_incr,
             overwrite=gs.overwrite(),
+            n_jobs=n_jobs,
+            max_windows=max_windows,
+            cache=cache,
         )
 
     if probability is True:
@@ -148,6 +190,9 @@ def main():
             class_labels=np.unique(y),
             overwrite=gs.overwrite(),
             height=row_incr,
+            n_jobs=n_jobs,
+            max_windows=max_windows,
+            cache=cache,
         )
 
     # assign categories for classification map
@@ -321,6 +321,35 @@
 # % guisection: Optional
 # %end
 
+# %option
+# % key: max_samples
+# % type: integer
+# % label: Maximum number of training pixels per class
+# % description: Randomly subsample the labelled pixels of training_map so that no class has more than this number of pixels. Zero uses all pixels
+# % answer: 0
+# % guisection: Optional
+# %end
+
+# %option
+# % key: sample_fraction
+# % type: double
+# % label: Fraction of training pixels to use per class
+# % description: Stratified random subsample of the labelled pixels of training_map
+# % answer: 1.0
+# % options: 0.0-1.0
+# % guisection: Optional
+# %end
+
+# %option
+# % key: cache_dir
+# % type: string
+# % gisprompt: new,dir,dir
+# % label: Directory used to cache extracted training data
+# % description: Extracted training data are stored in this directory and reused by later runs with the same predictors, training data and computational region
+# % required: no
+# % guisection: Optional
+# %end
+
 # %option G_OPT_F_INPUT
 # % key: load_training
 # % label: Load training data from csv
@@ -439,8 +468,10 @@ def main():
         option_to_list,
         scoring_metrics,
         check_class_weights,
+        get_fullname,
     )
     from rlearnlib.raster import RasterStack
+    from rlearnlib.cache import RasterCache
 
     try:
         import sklearn
@@ -493,6 +524,9 @@ def main():
     save_training = options["save_training"]
     n_jobs = int(options["n_jobs"])
     balance = flags["b"]
+    max_samples = int(options["max_samples"])
+    sample_fraction = float(options["sample_fraction"])
+    cache_dir = options["cache_dir"]
     category_maps = option_to_list(options["category_maps"])
 
     # define estimator --------------------------------------------------------
@@ -580,8 +614,25 @@ def main():
         if group_raster != "":
             stack.append(group_raster)
 
+        cache = RasterCache(cache_dir) if cache_dir != "" else None
+
         if training_map != "":
-            X, y, cat = stack.extract_pixels(training_map)
+            extract_params = {
+                "max_per_class": max_samples if max_samples > 0 else None,
+                "sample_fraction": sample_fraction if sample_fraction < 1 else None,
+                "random_state": random_state,
+            }
+
+            def extract():
+                return stack.extract_pixels(training_map, **extract_params)
+
+            if cache is not None:
+                X, y, cat = cache.cached_training_data(
+                    stack, get_fullname(training_map), extract, extract_params
+                )
+            else:
+                X, y, cat = extract()
+
             y = y.flatten()
 
             with RasterRow(training_map) as src:
@@ -593,7 +644,21 @@ def main():
                     class_labels = None
 
         elif training_points != "":
-            X, y, cat = stack.extract_points(training_points, field)
+
+            def extract():
+                return stack.extract_points(training_points, field)
+
+            if cache is not None:
+                X, y, cat = cache.cached_training_data(
+                    stack,
+                    gs.find_file(training_points, element="vector")["fullname"],
+                    extract,
+                    {"field": field},
+                    vector=True,
+                )
+            else:
+                X, y, cat = extract()
+
             y = y.flatten()
 
             if y.dtype in (np.object_, object):
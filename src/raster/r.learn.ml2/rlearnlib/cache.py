@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+
+"""The cache module contains a persistent on-disk cache of extracted training
+data and of the predictor rasters of a RasterStack.
+
+Cache entries are keyed by the names and modification times of the GRASS maps
+involved and by the current computational region (including any raster
+MASK), so that entries are never reused after any of the inputs change.
+Predictor rasters are stored as one .npy file per band that is memory-mapped
+when reading."""
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import re
+import zipfile
+
+import grass.script as gs
+import numpy as np
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
+
+# files within a mapset that are modified when a raster map changes
+RASTER_ELEMENTS = ("cellhd", "cell", "fcell", "cats", "colr")
+
+# files within a vector map directory that are modified when it changes
+VECTOR_ELEMENTS = ("head", "coor", "topo", "dbln")
+
+# errors of numpy when loading a truncated or otherwise corrupt cache file
+LOAD_ERRORS = (
+    OSError,
+    ValueError,
+    EOFError,
+    KeyError,
+    zipfile.BadZipFile,
+    pickle.UnpicklingError,
+)
+
+
+def _mtime(path):
+    """Return the modification time of a file or None if it does not exist"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _mapset_path(mapset):
+    env = gs.gisenv()
+    return os.path.join(env["GISDBASE"], env["LOCATION_NAME"], mapset)
+
+
+def raster_signature(fullname):
+    """
+    Return the modification times of the files of a GRASS raster map
+
+    Parameters
+    ----------
+    fullname : str
+        Name of a GRASS raster map in the format name@mapset.
+
+    Returns
+    -------
+    list
+        List of [element, mtime] pairs.
+    """
+    name, mapset = fullname.split("@")
+    path = _mapset_path(mapset)
+    signature = [[e, _mtime(os.path.join(path, e, name))] for e in RASTER_ELEMENTS]
+    signature.append(["null", _mtime(os.path.join(path, "cell_misc", name, "null"))])
+
+    return signature
+
+
+def vector_signature(fullname):
+    """
+    Return the modification times of the files of a GRASS vector map and of
+    its attribute database, if the database is stored as a file
+
+    Parameters
+    ----------
+    fullname : str
+        Name of a GRASS vector map in the format name@mapset.
+
+    Returns
+    -------
+    list
+        List of [element, mtime] pairs.
+    """
+    name, mapset = fullname.split("@")
+    path = os.path.join(_mapset_path(mapset), "vector", name)
+    signature = [[e, _mtime(os.path.join(path, e))] for e in VECTOR_ELEMENTS]
+
+    try:
+        database = gs.vector_db(fullname)[1]["database"]
+        signature.append(["database", _mtime(database)])
+    except (KeyError, gs.CalledModuleError):
+        pass
+
+    return signature
+
+
+def region_signature():
+    """
+    Return a description of the current computational region including the
+    state of any raster MASK
+
+    Returns
+    -------
+    dict
+    """
+    reg = Region()
+    signature = {
+        "north": reg.north,
+        "south": reg.south,
+        "east": reg.east,
+        "west": reg.west,
+        "rows": reg.rows,
+        "cols": reg.cols,
+    }
+
+    mask = gs.find_file("MASK", element="cell", mapset=gs.gisenv()["MAPSET"])
+
+    if mask["fullname"]:
+        signature["mask"] = raster_signature(mask["fullname"])
+
+    return signature
+
+
+class RasterCache:
+    def __init__(self, path):
+        """A persistent cache of extracted training data and predictor
+        rasters
+
+        Parameters
+        ----------
+        path : str
+            Directory used to store the cache. It is created if it does not
+            exist.
+        """
+        self.path = path
+        self._bands = os.path.join(path, "bands")
+        self._training = os.path.join(path, "training")
+
+        for d in (self._bands, self._training):
+            os.makedirs(d, exist_ok=True)
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha1(
+            json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _prefix(name):
+        """Return a file name prefix that is safe to use for a map name"""
+        return re.sub(r"[^A-Za-z0-9_.]", "_", name)
+
+    def _entry(self, directory, name, key, ext):
+        """Return the path of a cache entry and remove any stale entries that
+        were stored under the same name with a different key"""
+        prefix = self._prefix(name)
+        entry = os.path.join(directory, "{}-{}{}".format(prefix, self._hash(key), ext))
+
+        for stale in glob.glob(os.path.join(directory, prefix + "-*" + ext)):
+            if stale != entry:
+                os.remove(stale)
+
+        return entry
+
+    @staticmethod
+    def _discard(entry):
+        """Remove a corrupt cache entry, e.g. left by an interrupted run"""
+        gs.warning("Removing unreadable cache entry {}".format(entry))
+
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def training_data(self, stack, source, params=None, vector=False):
+        """
+        Load extracted training data from the cache
+
+        Parameters
+        ----------
+        stack : rlearnlib.raster.RasterStack
+            RasterStack of the predictor variables.
+
+        source : str
+            Fully-qualified name of the raster map of labelled pixels, or of
+            the vector map of training points.
+
+        params : dict (opt)
+            Any other parameters that affect the extraction, e.g. the response
+            field or subsampling settings.
+
+        vector : bool (opt). Default is False
+            Whether `source` is a vector map of training points.
+
+        Returns
+        -------
+        tuple
+            Tuple of (X, y, cat) or None if there is no valid cache entry.
+            Entries that cannot be read are removed.
+        """
+        entry = self._training_entry(stack, source, params, vector)
+
+        if not os.path.exists(entry):
+            return None
+
+        try:
+            with np.load(entry, allow_pickle=True) as data:
+                return data["X"], data["y"], data["cat"]
+        except LOAD_ERRORS:
+            self._discard(entry)
+            return None
+
+    def save_training_data(self, stack, source, X, y, cat, params=None, vector=False):
+        """
+        Store extracted training data in the cache
+
+        Parameters
+        ----------
+        stack : rlearnlib.raster.RasterStack
+            RasterStack of the predictor variables.
+
+        source : str
+            Fully-qualified name of the raster map of labelled pixels, or of
+            the vector map of training points.
+
+        X : ndarray
+            2d numpy array containing predictor values.
+
+        y : ndarray
+            1d numpy array containing labels.
+
+        cat : ndarray
+            1d numpy array of sample indexes or GRASS key column.
+
+        params : dict (opt)
+            Any other parameters that affect the extraction.
+
+        vector : bool (opt). Default is False
+            Whether `source` is a vector map of training points.
+        """
+        entry = self._training_entry(stack, source, params, vector)
+        tmp = entry + ".tmp.npz"
+        np.savez(tmp, X=X, y=y, cat=cat)
+        os.replace(tmp, entry)
+
+    def cached_training_data(self, stack, source, extract, params=None, vector=False):
+        """
+        Load extracted training data from the cache, or extract and store it
+        if there is no valid cache entry
+
+        Parameters
+        ----------
+        stack : rlearnlib.raster.RasterStack
+            RasterStack of the predictor variables.
+
+        source : str
+            Fully-qualified name of the raster map of labelled pixels, or of
+            the vector map of training points.
+
+        extract : callable
+            Function without arguments that returns a tuple of (X, y, cat).
+
+        params : dict (opt)
+            Any other parameters that affect the extraction.
+
+        vector : bool (opt). Default is False
+            Whether `source` is a vector map of training points.
+
+        Returns
+        -------
+        tuple
+            Tuple of (X, y, cat).
+        """
+        data = self.training_data(stack, source, params, vector)
+
+        if data is not None:
+            gs.message("Using cached training data for {}".format(source))
+            return data
+
+        X, y, cat = extract()
+        self.save_training_data(stack, source, X, y, cat, params, vector)
+
+        return X, y, cat
+
+    def _training_entry(self, stack, source, params, vector):
+        if vector:
+            source_signature = vector_signature(source)
+        else:
+            source_signature = raster_signature(source)
+
+        key = {
+            "source": [source, source_signature],
+            "predictors": [[n, raster_signature(n)] for n in stack.names],
+            "region": region_signature(),
+            "params": params,
+        }
+
+        return self._entry(self._training, source, key, ".npz")
+
+    def band(self, fullname):
+        """
+        Return a memory-mapped array of a raster in the current region,
+        reading it from GRASS into the cache first if required
+
+        Rasters are stored using their native dtype. Integer (CELL) rasters
+        use the GRASS nodata value, floating point rasters use NaN as the
+        nodata value. Entries that cannot be read are read again from GRASS.
+
+        Parameters
+        ----------
+        fullname : str
+            Name of a GRASS raster map in the format name@mapset.
+
+        Returns
+        -------
+        numpy.memmap
+            Read-only 2d array of the raster with dimensions (row, column).
+        """
+        key = {
+            "raster": [fullname, raster_signature(fullname)],
+            "region": region_signature(),
+        }
+        entry = self._entry(self._bands, fullname, key, ".npy")
+
+        if os.path.exists(entry):
+            try:
+                return np.load(entry, mmap_mode="r")
+            except LOAD_ERRORS:
+                self._discard(entry)
+
+        reg = Region()
+        tmp = entry + ".tmp"
+
+        with RasterRow(fullname) as src:
+            dtype = {"CELL": "int32", "FCELL": "float32"}.get(src.mtype, "float64")
+            arr = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype=dtype, shape=(reg.rows, reg.cols)
+            )
+
+            for row in range(reg.rows):
+                arr[row, :] = src[row]
+
+            arr.flush()
+            del arr
+
+        os.replace(tmp, entry)
+
+        return np.load(entry, mmap_mode="r")
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        for d in (self._bands, self._training):
+            for entry in glob.glob(os.path.join(d, "*")):
+                os.remove(entry)
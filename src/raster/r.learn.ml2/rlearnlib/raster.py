@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 import itertools
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from subprocess import PIPE
 
 import grass.script as gs
@@ -8,7 +10,6 @@ import numpy as np
 from grass.pygrass.gis.region import Region
 from grass.pygrass.modules.shortcuts import general as g
 from grass.pygrass.modules.shortcuts import imagery as im
-from grass.pygrass.modules.shortcuts import raster as r
 from grass.pygrass.modules.shortcuts import vector as v
 from grass.pygrass.raster import RasterRow, numpy2raster
 from grass.pygrass.raster.buffer import Buffer
@@ -32,6 +33,55 @@ def import_pandas():
     return module
 
 
+# estimator held by each prediction worker process
+_worker_estimator = None
+
+
+def _init_predict_worker(estimator):
+    """Initializer for the prediction worker processes
+
+    The estimator is sent once to each worker instead of being pickled
+    together with every window of data. Estimators that are multithreaded
+    themselves are restricted to a single thread to avoid oversubscribing
+    the cores that are already used by the process pool.
+    """
+    global _worker_estimator
+
+    if hasattr(estimator, "get_params"):
+        params = {k: 1 for k in estimator.get_params() if k.endswith("n_jobs")}
+
+        if params:
+            estimator.set_params(**params)
+
+    _worker_estimator = estimator
+
+
+def _predict_window(func, img, nodata):
+    """Apply a prediction function to a window of data in a worker process"""
+    result = func(img, _worker_estimator)
+    return np.ma.filled(result, nodata)
+
+
+def n_jobs_to_workers(n_jobs):
+    """Convert a joblib-style n_jobs value into a number of worker processes
+
+    Parameters
+    ----------
+    n_jobs : int
+        Number of processes. Negative values are counted from the number of
+        available cores, i.e. -1 uses all cores and -2 uses all cores but one.
+
+    Returns
+    -------
+    int
+        Number of worker processes, at least 1.
+    """
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+
+    return max(1, n_jobs)
+
+
 class RasterStack(StatisticsMixin):
     def __init__(self, rasters=None, group=None):
         """A RasterStack enables a collection of raster layers to be bundled
@@ -337,7 +387,7 @@ class RasterStack(StatisticsMixin):
 
             return new_raster
 
-    def read(self, row=None, rows=None):
+    def read(self, row=None, rows=None, dtype=None, out=None):
         """Read data from RasterStack as a masked 3D numpy array
 
         Notes
@@ -350,6 +400,13 @@ class RasterStack(StatisticsMixin):
         arguments are supplied, then all of the maps within the RasterStack are
         read into a 3d numpy array (obeying the GRASS region settings)
 
+        By default the data are returned as a float64 masked array. If either
+        `dtype` or `out` are supplied, the data are instead read directly into
+        a plain ndarray without any per-band masks. For floating point dtypes
+        nodata cells are set to NaN, for integer dtypes nodata cells retain
+        the GRASS integer nodata value. A single shared mask of the nodata
+        cells can be obtained using `RasterStack.nodata_mask`.
+
         Parameters
         ----------
         row : int (opt)
@@ -359,10 +416,22 @@ class RasterStack(StatisticsMixin):
             Tuple of integers representing the start and end numbers of rows to
             read as a single block of rows.
 
+        dtype : str or numpy.dtype (opt)
+            Data type of the returned array. Use "native" to select the
+            smallest data type that represents all rasters in the stack
+            without loss (int32 if all rasters are CELL, float32 if all
+            rasters are FCELL, otherwise float64).
+
+        out : ndarray (opt)
+            Preallocated 3d array with the dimensions (band, row, column) that
+            is filled with the data, e.g. to reuse the same buffer for
+            successive windows. Its dtype takes precedence over `dtype`.
+
         Returns
         -------
         data : ndarray
-            3d masked numpy array containing data from RasterStack rasters.
+            3d masked numpy array containing data from RasterStack rasters, or
+            a 3d ndarray if `dtype` or `out` are supplied.
         """
 
         reg = Region()
@@ -370,31 +439,42 @@ class RasterStack(StatisticsMixin):
         # create numpy array to receive data
         if rows:
             row_start, row_stop = rows
-            width = reg.cols
-            height = abs(row_stop - row_start)
-            shape = (self.count, height, width)
-            rowincrs = [i for i in range(row_start, row_stop)]
         elif row:
             row_start = row
             row_stop = row + 1
-            height = 1
-            shape = (self.count, height, reg.cols)
-            rowincrs = [i for i in range(row_start, row_stop)]
         else:
-            shape = (self.count, reg.rows, reg.cols)
+            row_start, row_stop = 0, reg.rows
+
+        if dtype is not None or out is not None:
+            srcs = self._open()
+
+            try:
+                data = self._read_window(
+                    srcs, (row_start, row_stop), reg.cols, dtype=dtype, out=out
+                )
+            finally:
+                for f in srcs:
+                    f.close()
+
+            return data
 
+        shape = (self.count, abs(row_stop - row_start), reg.cols)
         data = np.zeros(shape)
 
         # read from each RasterRow object
         for band, (name, src) in enumerate(self.layers.items()):
             with RasterRow(src.fullname()) as f:
                 if row or rows:
-                    for i, row in enumerate(rowincrs):
+                    for i, row in enumerate(range(row_start, row_stop)):
                         data[band, i, :] = f[row]
                 else:
                     data[band, :, :] = np.asarray(f)
 
-        # mask array
+        return self._mask_nodata(data)
+
+    def _mask_nodata(self, data):
+        """Convert an array of raster data into a masked array where the
+        GRASS integer nodata value and NaNs are masked"""
         data = np.ma.masked_equal(data, self._cell_nodata)
         data = np.ma.masked_invalid(data)
 
@@ -405,6 +485,276 @@ class RasterStack(StatisticsMixin):
 
         return data
 
+    def native_dtype(self):
+        """Return the smallest numpy dtype that represents the data of all
+        rasters in the RasterStack
+
+        Returns
+        -------
+        numpy.dtype
+            int32 if all rasters are CELL, float32 if all rasters are FCELL,
+            otherwise float64, because float32 cannot represent all CELL
+            values (integers above 2^24) without loss.
+        """
+        mtypes = set(self.mtypes.values())
+
+        if mtypes == {"CELL"}:
+            return np.dtype("int32")
+        if mtypes == {"FCELL"}:
+            return np.dtype("float32")
+
+        return np.dtype("float64")
+
+    def nodata_mask(self, data):
+        """Return a single 2d mask of the cells that are nodata in any band
+
+        Parameters
+        ----------
+        data : ndarray
+            3d array with the dimensions (band, row, column), as returned by
+            `RasterStack.read` using the `dtype` or `out` parameters.
+
+        Returns
+        -------
+        ndarray
+            2d boolean array with the dimensions (row, column).
+        """
+        if np.ma.isMaskedArray(data):
+            return np.ma.getmaskarray(data).any(axis=0)
+
+        mask = np.zeros(data.shape[1:], dtype="bool")
+
+        for band in data:
+            if np.issubdtype(band.dtype, np.floating):
+                mask |= np.isnan(band)
+            else:
+                mask |= band == self._cell_nodata
+
+        return mask
+
+    def _open(self):
+        """Open all rasters in the RasterStack for reading
+
+        Returns
+        -------
+        list
+            List of opened grass.pygrass.raster.RasterRow objects. The caller
+            is responsible for closing them.
+        """
+        srcs = []
+
+        try:
+            for src in self.loc.values():
+                f = RasterRow(src.fullname())
+                f.open("r")
+                srcs.append(f)
+        except Exception:
+            for f in srcs:
+                f.close()
+            raise
+
+        return srcs
+
+    def _copy_values(self, dst, values, masked):
+        """Copy raster values into an array while converting nodata between
+        the GRASS integer nodata value and NaN as required by the data types
+        of the source and destination"""
+        if masked:
+            dst[...] = values
+        elif np.issubdtype(dst.dtype, np.floating) and values.dtype.kind in "iu":
+            dst[...] = values
+            dst[values == self._cell_nodata] = np.nan
+        elif np.issubdtype(values.dtype, np.floating) and dst.dtype.kind in "iu":
+            dst[...] = np.where(np.isnan(values), self._cell_nodata, values)
+        else:
+            dst[...] = values
+
+    def _read_window(self, srcs, rows, cols, dtype=None, out=None):
+        """Read a window of rows from already opened rasters
+
+        Parameters
+        ----------
+        srcs : list
+            List of opened grass.pygrass.raster.RasterRow objects, or of 2d
+            arrays such as the memory-mapped bands of a RasterCache.
+
+        rows : tuple
+            Tuple of (start_row, end_row) of the window.
+
+        cols : int
+            Number of columns in the current region.
+
+        dtype : str or numpy.dtype (opt)
+            Data type of the returned array, or "native". If neither `dtype`
+            nor `out` are supplied, a float64 masked array is returned.
+
+        out : ndarray (opt)
+            Preallocated 3d array that is filled with the data.
+
+        Returns
+        -------
+        data : ndarray
+            3d numpy array with the dimensions (band, row, column).
+        """
+        row_start, row_stop = rows
+        shape = (len(srcs), row_stop - row_start, cols)
+        masked = dtype is None and out is None
+
+        if out is not None:
+            if out.shape != shape:
+                raise ValueError(
+                    "Output array has shape {} but {} is required".format(
+                        out.shape, shape
+                    )
+                )
+            data = out
+        else:
+            if dtype == "native":
+                dtype = self.native_dtype()
+            data = np.empty(shape, dtype="float64" if masked else dtype)
+
+        for band, f in enumerate(srcs):
+            if isinstance(f, np.ndarray):
+                self._copy_values(data[band, :, :], f[row_start:row_stop, :], masked)
+            else:
+                for i, row in enumerate(range(row_start, row_stop)):
+                    self._copy_values(data[band, i, :], np.asarray(f[row]), masked)
+
+        if masked:
+            return self._mask_nodata(data)
+
+        return data
+
+    def _predict_windows(
+        self, estimator, func, height, nodata, n_jobs=1, max_windows=None, cache=None
+    ):
+        """Generator applying a prediction function to successive row windows
+        of the RasterStack
+
+        The input rasters are kept open for the whole run. If `n_jobs` is
+        larger than one, windows are read ahead and predicted by a pool of
+        worker processes while the results are returned in row order. The
+        reading and writing of rasters always remains in the calling process
+        because the GRASS raster library is not thread-safe.
+
+        Parameters
+        ----------
+        estimator : estimator object implementing 'fit'
+            The object to use to fit the data.
+
+        func : function
+            Prediction function, e.g. RasterStack._pred_fun.
+
+        height : int
+            Number of raster rows in each window.
+
+        nodata : any number
+            Value used to fill masked cells of the result.
+
+        n_jobs : int (opt). Default is 1
+            Number of processes used for prediction. Negative values are
+            counted from the number of available cores.
+
+        max_windows : int (opt)
+            Maximum number of windows that are held in memory at one time
+            (read or predicted but not yet written). Defaults to twice the
+            number of processes.
+
+        cache : rlearnlib.cache.RasterCache (opt)
+            Read the predictors from the memory-mapped bands of a RasterCache
+            instead of from the GRASS rasters.
+
+        Yields
+        ------
+        ndarray
+            3d numpy array of the prediction result for each window with
+            masked cells filled with `nodata`.
+        """
+        reg = Region()
+        n_jobs = n_jobs_to_workers(n_jobs)
+        windows = self.row_windows(region=reg, height=height)
+
+        if cache is not None:
+            srcs = [cache.band(name) for name in self.names]
+        else:
+            srcs = self._open()
+
+        # read predictors as float32 with NaN as nodata, like the training
+        # data, unless any raster requires double precision
+        dtype = np.float64 if "DCELL" in self.mtypes.values() else np.float32
+
+        try:
+            if n_jobs == 1:
+                buffer = np.empty((self.count, height, reg.cols), dtype=dtype)
+
+                for rows in windows:
+                    img = self._read_window(
+                        srcs, rows, reg.cols, out=buffer[:, : rows[1] - rows[0], :]
+                    )
+                    yield np.ma.filled(func(img, estimator), nodata)
+            else:
+                if not max_windows:
+                    max_windows = 2 * n_jobs
+
+                with ProcessPoolExecutor(
+                    max_workers=n_jobs,
+                    initializer=_init_predict_worker,
+                    initargs=(estimator,),
+                ) as pool:
+                    pending = deque()
+
+                    for rows in windows:
+                        img = self._read_window(srcs, rows, reg.cols, dtype=dtype)
+                        pending.append(pool.submit(_predict_window, func, img, nodata))
+
+                        if len(pending) >= max_windows:
+                            yield pending.popleft().result()
+
+                    while pending:
+                        yield pending.popleft().result()
+        finally:
+            if cache is None:
+                for f in srcs:
+                    f.close()
+
+    @staticmethod
+    def _flatten(img):
+        """Reshape a 3d array of raster data into a 2d array of samples
+
+        Parameters
+        ----------
+        img : numpy.ndarray
+            3d masked array, or ndarray with NaN as nodata, with the
+            dimensions in order of (band, rows, columns).
+
+        Returns
+        -------
+        flat_pixels : numpy.ndarray
+            2d array with the dimensions (n_samples, n_features) in which
+            nodata values are replaced by -99999.
+
+        mask : numpy.ndarray
+            1d boolean array of the samples that contain nodata values.
+        """
+        n_features, rows, cols = img.shape[0], img.shape[1], img.shape[2]
+
+        # reshape each image block matrix into a 2D matrix
+        # first reorder into rows,cols,bands(transpose)
+        # then resample into 2D array (rows=sample_n, cols=band_values)
+        n_samples = rows * cols
+        flat_pixels = img.transpose(1, 2, 0).reshape((n_samples, n_features))
+
+        # create mask for NaN values and replace with number
+        if np.ma.isMaskedArray(flat_pixels):
+            mask = np.ma.getmaskarray(flat_pixels).any(axis=1)
+            flat_pixels = np.ma.filled(flat_pixels, -99999)
+        else:
+            nan_mask = np.isnan(flat_pixels)
+            mask = nan_mask.any(axis=1)
+            flat_pixels = np.where(nan_mask, -99999, flat_pixels)
+
+        return flat_pixels, mask
+
     @staticmethod
     def _pred_fun(img, estimator):
         """Prediction function for classification or regression response
@@ -424,23 +774,14 @@ class RasterStack(StatisticsMixin):
             2d numpy array representing a single band raster containing the
             classification or regression result.
         """
-        n_features, rows, cols = img.shape[0], img.shape[1], img.shape[2]
-
-        # reshape each image block matrix into a 2D matrix
-        # first reorder into rows,cols,bands(transpose)
-        # then resample into 2D array (rows=sample_n, cols=band_values)
-        n_samples = rows * cols
-        flat_pixels = img.transpose(1, 2, 0).reshape((n_samples, n_features))
-
-        # create mask for NaN values and replace with number
-        flat_pixels_mask = flat_pixels.mask.copy()
-        flat_pixels = np.ma.filled(flat_pixels, -99999)
+        rows, cols = img.shape[1], img.shape[2]
+        flat_pixels, mask = RasterStack._flatten(img)
 
         # prediction
         result = estimator.predict(flat_pixels)
 
         # replace mask and fill masked values with nodata value
-        result = np.ma.masked_array(result, mask=flat_pixels_mask.any(axis=1))
+        result = np.ma.masked_array(result, mask=mask)
 
         # reshape the prediction from a 1D matrix/list
         # back into the original format [band, row, col]
@@ -468,28 +809,17 @@ class RasterStack(StatisticsMixin):
             associated with each class. ndarray dimensions are in the order of
             (class, row, column).
         """
-        n_features, rows, cols = img.shape[0], img.shape[1], img.shape[2]
-
-        # reshape each image block matrix into a 2D matrix
-        # first reorder into rows,cols,bands(transpose)
-        # then resample into 2D array (rows=sample_n, cols=band_values)
-        n_samples = rows * cols
-        flat_pixels = img.transpose(1, 2, 0).reshape((n_samples, n_features))
-
-        # create mask for NaN values and replace with number
-        flat_pixels_mask = flat_pixels.mask.copy()
-        flat_pixels = np.ma.filled(flat_pixels, -99999)
+        rows, cols = img.shape[1], img.shape[2]
+        flat_pixels, mask = RasterStack._flatten(img)
 
         # predict probabilities
         result = estimator.predict_proba(flat_pixels)
 
         # reshape class probabilities back to 3D [iclass, rows, cols]
         result = result.reshape((rows, cols, result.shape[1]))
-        flat_pixels_mask = flat_pixels_mask.reshape((rows, cols, n_features))
 
-        # flatten mask into 2d
-        mask2d = flat_pixels_mask.any(axis=2)
-        mask2d = np.where(mask2d != mask2d.min(), True, False)
+        # reshape mask into 2d
+        mask2d = mask.reshape((rows, cols))
         mask2d = np.repeat(mask2d[:, :, np.newaxis], result.shape[2], axis=2)
 
         # convert proba to masked array using mask2d
@@ -519,15 +849,9 @@ class RasterStack(StatisticsMixin):
             3d numpy array representing the multi-target prediction result with
             the dimensions in the order of (target, row, column).
         """
-        n_features, rows, cols = img.shape[0], img.shape[1], img.shape[2]
-
-        mask2d = img.mask.any(axis=0)
-
-        # reshape each image block matrix into a 2D matrix
-        # first reorder into rows,cols,bands(transpose)
-        # then resample into 2D array (rows=sample_n, cols=band_values)
-        n_samples = rows * cols
-        flat_pixels = img.transpose(1, 2, 0).reshape((n_samples, n_features))
+        rows, cols = img.shape[1], img.shape[2]
+        flat_pixels, mask = RasterStack._flatten(img)
+        mask2d = mask.reshape((rows, cols))
 
         # predict probabilities
         result = estimator.predict(flat_pixels)
@@ -546,7 +870,16 @@ class RasterStack(StatisticsMixin):
 
         return result
 
-    def predict(self, estimator, output, height=None, overwrite=False):
+    def predict(
+        self,
+        estimator,
+        output,
+        height=None,
+        overwrite=False,
+        n_jobs=1,
+        max_windows=None,
+        cache=None,
+    ):
         """Prediction method for RasterStack class
 
         Parameters
@@ -564,6 +897,20 @@ class RasterStack(StatisticsMixin):
         overwrite : bool (opt). Default is False
             Option to overwrite an existing raster.
 
+        n_jobs : int (opt). Default is 1
+            Number of processes used to predict the row windows in parallel.
+            Only used if `height` is specified. Negative values are counted
+            from the number of available cores (-1 uses all cores).
+
+        max_windows : int (opt)
+            Maximum number of row windows held in memory at one time during
+            parallel prediction. Defaults to twice the number of processes.
+
+        cache : rlearnlib.cache.RasterCache (opt)
+            Read the predictors from a persistent cache of memory-mapped
+            arrays instead of from the GRASS rasters. Only used if `height`
+            is specified.
+
         Returns
         -------
         RasterStack
@@ -601,7 +948,17 @@ class RasterStack(StatisticsMixin):
 
         if len(indexes) > 1:
             result_stack = self._predict_multi(
-                estimator, reg, indexes, indexes, height, func, output, overwrite
+                estimator,
+                reg,
+                indexes,
+                indexes,
+                height,
+                func,
+                output,
+                overwrite,
+                n_jobs,
+                max_windows,
+                cache,
             )
         else:
             if height is not None:
@@ -610,20 +967,17 @@ class RasterStack(StatisticsMixin):
                     output, mode="w", mtype=mtype, overwrite=overwrite
                 ) as dst:
                     n_windows = len([i for i in self.row_windows(height=height)])
+                    newrow = Buffer((reg.cols,), mtype=mtype)
 
-                    data_gen = (
-                        (wi, self.read(rows=rows))
-                        for wi, rows in enumerate(self.row_windows(height=height))
+                    results = self._predict_windows(
+                        estimator, func, height, nodata, n_jobs, max_windows, cache
                     )
 
-                    for wi, arr in data_gen:
+                    for wi, result in enumerate(results):
                         gs.percent(wi, n_windows, 1)
-                        result = func(arr, estimator)
-                        result = np.ma.filled(result, nodata)
 
                         # writing data to GRASS raster row-by-row
                         for i in range(result.shape[1]):
-                            newrow = Buffer((reg.cols,), mtype=mtype)
                             newrow[:] = result[0, i, :]
                             dst.put_row(newrow)
 
@@ -640,7 +994,15 @@ class RasterStack(StatisticsMixin):
         return result_stack
 
     def predict_proba(
-        self, estimator, output, class_labels=None, height=None, overwrite=False
+        self,
+        estimator,
+        output,
+        class_labels=None,
+        height=None,
+        overwrite=False,
+        n_jobs=1,
+        max_windows=None,
+        cache=None,
     ):
         """Prediction method for RasterStack class
 
@@ -664,6 +1026,20 @@ class RasterStack(StatisticsMixin):
         overwrite : bool (opt). Default is False
             Option to overwrite an existing raster(s)
 
+        n_jobs : int (opt). Default is 1
+            Number of processes used to predict the row windows in parallel.
+            Only used if `height` is specified. Negative values are counted
+            from the number of available cores (-1 uses all cores).
+
+        max_windows : int (opt)
+            Maximum number of row windows held in memory at one time during
+            parallel prediction. Defaults to twice the number of processes.
+
+        cache : rlearnlib.cache.RasterCache (opt)
+            Read the predictors from a persistent cache of memory-mapped
+            arrays instead of from the GRASS rasters. Only used if `height`
+            is specified.
+
         Returns
         -------
         RasterStack
@@ -686,13 +1062,33 @@ class RasterStack(StatisticsMixin):
 
         # create and open rasters for writing
         result_stack = self._predict_multi(
-            estimator, reg, indexes, class_labels, height, func, output, overwrite
+            estimator,
+            reg,
+            indexes,
+            class_labels,
+            height,
+            func,
+            output,
+            overwrite,
+            n_jobs,
+            max_windows,
         )
 
         return result_stack
 
     def _predict_multi(
-        self, estimator, region, indexes, class_labels, height, func, output, overwrite
+        self,
+        estimator,
+        region,
+        indexes,
+        class_labels,
+        height,
+        func,
+        output,
+        overwrite,
+        n_jobs=1,
+        max_windows=None,
+        cache=None,
     ):
         # create and open rasters for writing if incremental reading
         if height is not None:
@@ -703,26 +1099,24 @@ class RasterStack(StatisticsMixin):
                 dst.append(RasterRow(rastername))
                 dst[i].open("w", mtype="FCELL", overwrite=overwrite)
 
-            # create data reader generator
+            # create prediction generator
             n_windows = len([i for i in self.row_windows(height=height)])
 
-            data_gen = (
-                (wi, self.read(rows=rows))
-                for wi, rows in enumerate(self.row_windows(height=height))
+            results = self._predict_windows(
+                estimator, func, height, np.nan, n_jobs, max_windows, cache
             )
 
         # perform prediction
         try:
             if height is not None:
-                for wi, arr in data_gen:
+                newrow = Buffer((region.cols,), mtype="FCELL")
+
+                for wi, result in enumerate(results):
                     gs.percent(wi, n_windows, 1)
-                    result = func(arr, estimator)
-                    result = np.ma.filled(result, np.nan)
 
                     # write multiple features to GRASS GIS rasters
                     for i, arr_index in enumerate(indexes):
                         for row in range(result.shape[1]):
-                            newrow = Buffer((region.cols,), mtype="FCELL")
                             newrow[:] = result[arr_index, row, :]
                             dst[i].put_row(newrow)
             else:
@@ -769,10 +1163,109 @@ class RasterStack(StatisticsMixin):
 
         return windows
 
-    def extract_pixels(self, rast_name, use_cats=False, as_df=False):
+    def _null_cells(self, values, mtype):
+        """Return a boolean array of the null cells in a row of raster data"""
+        if mtype == "CELL":
+            return values == self._cell_nodata
+
+        return np.isnan(values)
+
+    def _labelled_cells(self, src, srcs, row):
+        """Read a row of labelled pixels and the predictors at its labelled
+        cells
+
+        Parameters
+        ----------
+        src : grass.pygrass.raster.RasterRow
+            Opened raster of labelled pixels.
+
+        srcs : list
+            Opened rasters of the RasterStack.
+
+        row : int
+            Index of the row to read.
+
+        Returns
+        -------
+        values : ndarray
+            1d array of the label values of the row.
+
+        idx : ndarray
+            Indexes of the cells that are labelled and not null in any of the
+            predictors.
+
+        bands : list
+            1d arrays of the predictor values of the row, empty if the row
+            has no labelled cells.
+        """
+        values = np.asarray(src[row])
+        valid = ~self._null_cells(values, src.mtype)
+        bands = []
+
+        if valid.any():
+            for f in srcs:
+                band_values = np.asarray(f[row])
+                valid &= ~self._null_cells(band_values, f.mtype)
+                bands.append(band_values)
+
+        return values, np.flatnonzero(valid), bands
+
+    def _count_labels(self, src, srcs, rows, strata):
+        """Count the labelled cells in an opened raster where none of the
+        given predictors is null
+
+        Parameters
+        ----------
+        src : grass.pygrass.raster.RasterRow
+            Opened raster of labelled pixels.
+
+        srcs : list
+            Opened rasters of the RasterStack.
+
+        rows : int
+            Number of rows in the current region.
+
+        strata : bool
+            Whether to count the cells of each label value separately.
+
+        Returns
+        -------
+        counts : dict
+            Number of labelled cells per label value, or the total number of
+            labelled cells using the None key if `strata` is False.
+        """
+        counts = {}
+
+        for row in range(rows):
+            values, idx, bands = self._labelled_cells(src, srcs, row)
+            values = values[idx]
+
+            if strata:
+                for value, n in zip(*np.unique(values, return_counts=True)):
+                    counts[value] = counts.get(value, 0) + int(n)
+            else:
+                counts[None] = counts.get(None, 0) + values.shape[0]
+
+        return counts
+
+    def extract_pixels(
+        self,
+        rast_name,
+        use_cats=False,
+        as_df=False,
+        max_per_class=None,
+        sample_fraction=None,
+        random_state=None,
+    ):
         """Extract pixel values from a RasterStack using another RasterRow
         object of labelled pixels
 
+        The labelled raster is streamed row by row and the predictor values
+        at the labelled cells are gathered directly into preallocated arrays,
+        so memory use scales with the number of extracted samples. Cells
+        where any of the predictors is null are skipped before the cells to
+        extract per class are sampled.
+
         Parameters
         ----------
         rast_name : str
@@ -787,6 +1280,35 @@ class RasterStack(StatisticsMixin):
         as_df : bool (opt). Default is False
             Whether to return the extracted RasterStack pixels as a Pandas
             DataFrame.
+
+        max_per_class : int (opt)
+            Maximum number of labelled cells to extract per class. Classes
+            with more labelled cells that are not null in any predictor are
+            randomly subsampled. For rasters of labelled pixels that are not
+            of CELL type, the maximum applies to the total number of labelled
+            cells.
+
+        sample_fraction : float (opt)
+            Fraction of the labelled cells of each class to extract, i.e. a
+            stratified random subsample. Can be combined with `max_per_class`.
+
+        random_state : int (opt)
+            Seed used for the random subsampling.
+
+        Returns
+        -------
+        X : ndarray
+            2d array containing the extracted raster values with the dimensions
+            ordered by (n_samples, n_features).
+
+        y : ndarray
+            1d array of labels.
+
+        cat : ndarray
+            1d array of sample indexes.
+
+        df : pandas.DataFrame
+            Extracted raster values as Pandas DataFrame if as_df = True.
         """
         # some checks
         pd = import_pandas()
@@ -794,6 +1316,9 @@ class RasterStack(StatisticsMixin):
         if RasterRow(rast_name).exist() is False:
             gs.fatal("The supplied raster does not exist")
 
+        if sample_fraction is not None and not 0 < sample_fraction <= 1:
+            gs.fatal("The sample fraction must be in the range (0, 1]")
+
         # check for categories in labelled pixel map
         with RasterRow(rast_name) as src:
             labels = src.cats
@@ -801,30 +1326,91 @@ class RasterStack(StatisticsMixin):
         if "" in labels.labels() or use_cats is False:
             labels = None
 
-        # extract predictor values at pixel locations
-        data = r.stats(
-            input=[rast_name] + self.names,
-            separator="pipe",
-            flags=["n", "g"],
-            stdout_=PIPE,
-        ).outputs.stdout
+        reg = Region()
+        subsample = max_per_class is not None or sample_fraction is not None
+        srcs = self._open()
+
+        try:
+            with RasterRow(rast_name) as lab:
+                strata = subsample and lab.mtype == "CELL"
+                # predictors are only read in the first pass if the counts of
+                # the cells to sample from are needed, otherwise the arrays
+                # are trimmed after the second pass
+                counts = self._count_labels(
+                    lab, srcs if subsample else [], reg.rows, strata
+                )
+                n_labelled = sum(counts.values())
+
+                # select the ordinal positions of the cells to keep per class
+                keep = None
+
+                if subsample:
+                    rng = np.random.RandomState(random_state)
+                    keep = {}
+
+                    for value, n in counts.items():
+                        k = n
+                        if sample_fraction is not None:
+                            k = int(round(n * sample_fraction))
+                        if max_per_class is not None:
+                            k = min(k, max_per_class)
+
+                        selected = np.zeros(n, dtype="bool")
+                        selected[rng.choice(n, k, replace=False)] = True
+                        keep[value] = selected
+
+                    n_labelled = sum(int(i.sum()) for i in keep.values())
+
+                seen = dict.fromkeys(counts.keys(), 0)
+                y = np.empty(n_labelled, dtype="float32")
+                X = np.empty((n_labelled, self.count), dtype="float32")
+                n = 0
+
+                for row in range(reg.rows):
+                    values, idx, bands = self._labelled_cells(lab, srcs, row)
+
+                    if keep is not None and idx.shape[0] > 0:
+                        if strata:
+                            row_keep = np.zeros(idx.shape[0], dtype="bool")
+
+                            for value in np.unique(values[idx]):
+                                in_class = values[idx] == value
+                                n_class = int(in_class.sum())
+                                start = seen[value]
+                                row_keep[in_class] = keep[value][
+                                    start : start + n_class
+                                ]
+                                seen[value] += n_class
+                        else:
+                            start = seen[None]
+                            row_keep = keep[None][start : start + idx.shape[0]]
+                            seen[None] += idx.shape[0]
 
-        if data == "":
+                        idx = idx[row_keep]
+
+                    if idx.shape[0] == 0:
+                        continue
+
+                    stop = n + idx.shape[0]
+                    y[n:stop] = values[idx]
+
+                    for band, band_values in enumerate(bands):
+                        X[n:stop, band] = band_values[idx]
+
+                    n = stop
+        finally:
+            for f in srcs:
+                f.close()
+
+        X = X[:n]
+        y = y[:n]
+
+        if y.shape[0] == 0:
             gs.fatal(
                 "The training pixel locations do not spatially "
                 "intersect any raster datasets"
             )
 
-        data = data.strip().split(os.linesep)
-        data = [i.split("|") for i in data]
-        data = np.asarray(data).astype("float32")
-
-        # remove x,y columns from array indexes 1 and 2
-        data = data[:, 2:]
-
-        y = data[:, 0]
-        X = data[:, 1:]
-
         if (y % 1).all() == 0:
             y = y.astype("int")
 
@@ -997,28 +1583,23 @@ class RasterStack(StatisticsMixin):
         pd = import_pandas()
 
         reg = Region()
-        arr = self.read()
+
+        # read as floating point with NaN as nodata
+        dtype = np.result_type(self.native_dtype(), np.float32)
+        arr = self.read(dtype=dtype)
 
         # generate x and y grid coordinate arrays
         x_range = np.linspace(start=reg.west, stop=reg.east, num=reg.cols)
         y_range = np.linspace(start=reg.south, stop=reg.north, num=reg.rows)
         xs, ys = np.meshgrid(x_range, y_range)
 
-        # flatten 3d data into 2d array (layer, sample)
-        arr = arr.reshape((arr.shape[0], arr.shape[1] * arr.shape[2]))
-        arr = arr.transpose()
+        # convert to dataframe using a flattened view of each band
+        columns = {"x": xs.ravel(), "y": ys.ravel()}
 
-        # convert to dataframe
-        df = pd.DataFrame(
-            np.column_stack((xs.flatten(), ys.flatten(), arr)),
-            columns=["x", "y"] + self.names,
-        )
-
-        # set nodata values to nan
         for i, col_name in enumerate(self.names):
-            df.loc[df[col_name] == self._cell_nodata, col_name] = np.nan
+            columns[col_name] = arr[i].ravel()
 
-        return df
+        return pd.DataFrame(columns)
 
     def head(self, n=10):
         """Show the head (first rows, first columns) or tail (last rows, last
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+MODULE:    Test of r.learn.ml
+
+PURPOSE:   Test of the persistent cache of training data and predictor
+           rasters (rlearnlib.cache.RasterCache)
+
+COPYRIGHT: (C) 2024 by the GRASS Development Team
+
+This program is free software under the GNU General Public
+License (>=v2). Read the file COPYING that comes with GRASS
+for details.
+"""
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import grass.script as gs
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+from grass.pygrass.raster import RasterRow
+from grass.script.utils import set_path
+
+set_path("r.learn.ml2", "rlearnlib")
+from rlearnlib.cache import RasterCache
+from rlearnlib.raster import RasterStack
+
+
+class TestRasterCache(TestCase):
+    """Test hits, misses and invalidation of cache entries"""
+
+    band1 = "lsat7_2002_10@PERMANENT"
+    band2 = "lsat7_2002_20@PERMANENT"
+    classif_map = "landclass96@PERMANENT"
+
+    # rasters created during test, rewritten to invalidate cache entries
+    band = "cache_band"
+    labelled_pixels = "cache_training_pixels"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.use_temp_region()
+        cls.runModule("g.region", raster=cls.band1)
+        cls.runModule(
+            "r.random",
+            input=cls.classif_map,
+            npoints=500,
+            raster=cls.labelled_pixels,
+            seed=1234,
+        )
+        cls.runModule("r.mapcalc", expression="{} = {}".format(cls.band, cls.band1))
+
+        mapset = gs.gisenv()["MAPSET"]
+        cls.band_fullname = "{}@{}".format(cls.band, mapset)
+        cls.labels_fullname = "{}@{}".format(cls.labelled_pixels, mapset)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.del_temp_region()
+        cls.runModule(
+            "g.remove",
+            flags="f",
+            type="raster",
+            name=[cls.band, cls.labelled_pixels],
+        )
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = RasterCache(self.path)
+        self.stack = RasterStack([self.band_fullname, self.band2])
+        self.extractions = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        self.runModule("g.region", raster=self.band1)
+
+    def extract(self):
+        """Extract training data, counting the cache misses"""
+        self.extractions += 1
+        return self.stack.extract_pixels(self.labels_fullname)
+
+    def training_data(self, params=None):
+        return self.cache.cached_training_data(
+            self.stack, self.labels_fullname, self.extract, params
+        )
+
+    def entries(self, kind):
+        return glob.glob(os.path.join(self.path, kind, "*"))
+
+    def rewrite(self, name, expression):
+        """Rewrite a raster, waiting so that its modification time changes
+        on file systems with a coarse time resolution"""
+        time.sleep(1)
+        self.runModule(
+            "r.mapcalc",
+            expression="{} = {}".format(name, expression),
+            overwrite=True,
+        )
+
+    def read_raster(self, name):
+        with RasterRow(name) as src:
+            return np.array([np.asarray(row) for row in src])
+
+    def test_training_hit(self):
+        """Training data are extracted once and then read from the cache"""
+        X, y, cat = self.training_data()
+        X_cached, y_cached, cat_cached = self.training_data()
+        self.assertEqual(self.extractions, 1)
+        np.testing.assert_array_equal(X, X_cached)
+        np.testing.assert_array_equal(y, y_cached)
+        np.testing.assert_array_equal(cat, cat_cached)
+        self.assertEqual(len(self.entries("training")), 1)
+
+    def test_training_params(self):
+        """Different extraction parameters do not reuse an entry"""
+        self.training_data({"max_samples": 0})
+        self.training_data({"max_samples": 10})
+        self.assertEqual(self.extractions, 2)
+
+    def test_training_input_changed(self):
+        """Rewriting a predictor invalidates the entry and removes it"""
+        X, y, cat = self.training_data()
+        self.rewrite(self.band, "{} + 1".format(self.band1))
+        X_new, y_new, cat_new = self.training_data()
+        self.assertEqual(self.extractions, 2)
+        np.testing.assert_array_equal(X_new[:, 0], X[:, 0] + 1)
+        self.assertEqual(len(self.entries("training")), 1)
+        self.rewrite(self.band, self.band1)
+
+    def test_training_region_changed(self):
+        """Changing the computational region invalidates the entry"""
+        self.training_data()
+        self.runModule("g.region", raster=self.band1, res=60)
+        self.training_data()
+        self.assertEqual(self.extractions, 2)
+
+    def test_training_corrupt(self):
+        """An unreadable entry is treated as a miss and replaced"""
+        X, y, cat = self.training_data()
+        (entry,) = self.entries("training")
+        with open(entry, "wb") as f:
+            f.write(b"not a numpy file")
+
+        X_new, y_new, cat_new = self.training_data()
+        self.assertEqual(self.extractions, 2)
+        np.testing.assert_array_equal(X, X_new)
+        np.testing.assert_array_equal(y, y_new)
+
+        self.training_data()
+        self.assertEqual(self.extractions, 2)
+
+    def test_band_hit(self):
+        """A band is read from GRASS once and then memory-mapped"""
+        arr = self.cache.band(self.band_fullname)
+        np.testing.assert_array_equal(arr, self.read_raster(self.band_fullname))
+        (entry,) = self.entries("bands")
+        inode = os.stat(entry).st_ino
+
+        arr = self.cache.band(self.band_fullname)
+        self.assertIsInstance(arr, np.memmap)
+        self.assertEqual(os.stat(entry).st_ino, inode)
+
+    def test_band_input_changed(self):
+        """Rewriting a raster invalidates its band entry"""
+        self.cache.band(self.band_fullname)
+        self.rewrite(self.band, "{} * 2".format(self.band1))
+        arr = self.cache.band(self.band_fullname)
+        np.testing.assert_array_equal(arr, self.read_raster(self.band_fullname))
+        self.assertEqual(len(self.entries("bands")), 1)
+        self.rewrite(self.band, self.band1)
+
+    def test_band_corrupt(self):
+        """A truncated band entry is read again from GRASS"""
+        self.cache.band(self.band_fullname)
+        (entry,) = self.entries("bands")
+        with open(entry, "r+b") as f:
+            f.truncate(200)
+
+        arr = self.cache.band(self.band_fullname)
+        np.testing.assert_array_equal(arr, self.read_raster(self.band_fullname))
+
+
+if __name__ == "__main__":
+    test()
@@ -43,6 +43,7 @@ class TestClassification(TestCase):
 
     # raster map created as output during test
     output = "classification_result"
+    output_parallel = "classification_result_parallel"
 
     # files created during test
     model_file = tempfile.NamedTemporaryFile(suffix=".gz").name
@@ -87,7 +88,12 @@ class TestClassification(TestCase):
     def tearDown(self):
         """Remove the output created from the tests
         (reuse the same name for all the test functions)"""
-        self.runModule("g.remove", flags="f", type="raster", name=[self.output])
+        self.runModule(
+            "g.remove",
+            flags="f",
+            type="raster",
+            name=[self.output, self.output_parallel],
+        )
 
         try:
             os.remove(self.model_file)
@@ -190,6 +196,40 @@ class TestClassification(TestCase):
         )
         self.assertRasterExists(self.output, msg="Output was not created")
 
+    def test_parallel_prediction(self):
+        """Checks that prediction using several processes matches the
+        prediction using a single process"""
+        self.assertModule(
+            "r.learn.train",
+            group=self.group,
+            training_map=self.labelled_pixels,
+            model_name="RandomForestClassifier",
+            n_estimators=100,
+            save_model=self.model_file,
+        )
+        self.assertFileExists(filename=self.model_file)
+
+        self.assertModule(
+            "r.learn.predict",
+            group=self.group,
+            load_model=self.model_file,
+            output=self.output,
+            chunksize=10000,
+        )
+        self.assertModule(
+            "r.learn.predict",
+            group=self.group,
+            load_model=self.model_file,
+            output=self.output_parallel,
+            chunksize=10000,
+            n_jobs=2,
+            max_windows=3,
+        )
+        self.assertRasterExists(self.output_parallel, msg="Output was not created")
+        self.assertRastersNoDifference(
+            actual=self.output_parallel, reference=self.output, precision=0
+        )
+
 
 if __name__ == "__main__":
     test()
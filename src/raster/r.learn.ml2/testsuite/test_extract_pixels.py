@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""
+MODULE:    Test of r.learn.ml
+
+PURPOSE:   Test of RasterStack.extract_pixels with per-class caps and
+           stratified subsampling of labelled pixels
+
+COPYRIGHT: (C) 2024 by the GRASS Development Team
+
+This program is free software under the GNU General Public
+License (>=v2). Read the file COPYING that comes with GRASS
+for details.
+"""
+import numpy as np
+
+import grass.script as gs
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+from grass.script.utils import set_path
+
+set_path("r.learn.ml2", "rlearnlib")
+from rlearnlib.raster import RasterStack
+
+
+class TestExtractPixels(TestCase):
+    """Test sampling of labelled pixels where predictors contain nulls"""
+
+    band1 = "lsat7_2002_10@PERMANENT"
+    classif_map = "landclass96@PERMANENT"
+
+    # rasters created during test
+    labelled_pixels = "extract_training_pixels"
+    band_nulls = "extract_band_nulls"
+    valid_pixels = "extract_valid_pixels"
+
+    @classmethod
+    def setUpClass(cls):
+        """Creates labelled pixels and a predictor which is null in every
+        other row, so that about half of the labelled pixels are unusable"""
+        cls.use_temp_region()
+        cls.runModule("g.region", raster=cls.classif_map)
+        cls.runModule(
+            "r.random",
+            input=cls.classif_map,
+            npoints=2000,
+            raster=cls.labelled_pixels,
+            seed=1234,
+        )
+        cls.runModule(
+            "r.mapcalc",
+            expression="{} = if(row() % 2, null(), {})".format(
+                cls.band_nulls, cls.band1
+            ),
+        )
+        cls.runModule(
+            "r.mapcalc",
+            expression="{} = if(isnull({}), null(), {})".format(
+                cls.valid_pixels, cls.band_nulls, cls.labelled_pixels
+            ),
+        )
+
+        # number of labelled pixels per class that are not null in any predictor
+        stats = gs.read_command(
+            "r.stats", flags="cn", input=cls.valid_pixels, separator=" "
+        )
+        cls.counts = {}
+        for line in stats.splitlines():
+            value, count = line.split()
+            cls.counts[int(value)] = int(count)
+
+        cls.stack = RasterStack([cls.band1, cls.band_nulls])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.del_temp_region()
+        cls.runModule(
+            "g.remove",
+            flags="f",
+            type="raster",
+            name=[cls.labelled_pixels, cls.band_nulls, cls.valid_pixels],
+        )
+
+    def class_counts(self, y):
+        values, counts = np.unique(y, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def test_all_pixels(self):
+        """Without subsampling all labelled pixels with valid predictors are
+        extracted"""
+        X, y, cat = self.stack.extract_pixels(self.labelled_pixels)
+        self.assertEqual(self.class_counts(y), self.counts)
+        self.assertFalse(np.isnan(X).any())
+        self.assertEqual(cat.shape[0], y.shape[0])
+
+    def test_max_per_class(self):
+        """Classes are capped after pixels with null predictors are dropped"""
+        max_per_class = 50
+        X, y, cat = self.stack.extract_pixels(
+            self.labelled_pixels, max_per_class=max_per_class, random_state=1
+        )
+        expected = {
+            value: min(count, max_per_class) for value, count in self.counts.items()
+        }
+        self.assertEqual(self.class_counts(y), expected)
+        self.assertFalse(np.isnan(X).any())
+
+    def test_sample_fraction(self):
+        """A stratified subsample keeps the fraction of each class"""
+        X, y, cat = self.stack.extract_pixels(
+            self.labelled_pixels, sample_fraction=0.5, random_state=1
+        )
+        expected = {
+            value: int(round(count * 0.5)) for value, count in self.counts.items()
+        }
+        self.assertEqual(
+            self.class_counts(y),
+            {value: count for value, count in expected.items() if count > 0},
+        )
+
+    def test_random_state(self):
+        """The same seed selects the same pixels"""
+        X1, y1, cat1 = self.stack.extract_pixels(
+            self.labelled_pixels, max_per_class=20, random_state=42
+        )
+        X2, y2, cat2 = self.stack.extract_pixels(
+            self.labelled_pixels, max_per_class=20, random_state=42
+        )
+        np.testing.assert_array_equal(X1, X2)
+        np.testing.assert_array_equal(y1, y2)
+
+
+if __name__ == "__main__":
+    test()
@@ -85,22 +85,36 @@
 # % type: string
 # % label: Backend for patching computed tiles
 # % description: If backend is not specified, original serial implementation with RasterRow is used
-# % options: RasterRow,r.patch
-# % descriptions: RasterRow; serial patching with PyGRASS RasterRow; r.patch; parallelized r.patch (with zero overlap only)
+# % options: RasterRow,r.patch,streaming
+# % descriptions: RasterRow; serial patching with PyGRASS RasterRow; r.patch; parallelized r.patch (with zero overlap only); streaming; patching of each row of tiles as soon as it is computed
 # % required: no
 # %end
 #
+# %option G_OPT_MEMORYMB
+# % description: Maximum memory to be used for patching rows of tiles with the streaming backend (in MB)
+# %end
+#
 # %rules
 # % exclusive: processes,nprocs
 # %end
 
+import math
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
 import grass.script as gscript
+from grass.pygrass.gis.region import Region
 from grass.pygrass.modules.grid.grid import (
     GridModule,
     Location,
+    cmd_exe,
     split_region_tiles,
     rpatch_map,
 )
+from grass.pygrass.raster import RasterRow
+from grass.pygrass.raster.buffer import Buffer
 
 try:
     parallel_rpatch_available = True
@@ -109,11 +123,123 @@ except ImportError:
     parallel_rpatch_available = False
 
 
+DTYPES = {"CELL": np.int32, "FCELL": np.float32, "DCELL": np.float64}
+
+
+def auto_tile_size(processes, memory):
+    """Return the width and height of the tiles for the current region
+
+    Tiles are horizontal slices of the region, which are faster to patch
+    than square tiles. There are at least four tiles per process, so that
+    rows of tiles are finished steadily and can be patched while the others
+    are computed, and the height is limited so that a row of tiles of
+    double precision values fits into the given memory (in MB).
+    """
+    region = Region()
+    height = int(math.ceil(region.rows / (4.0 * processes)))
+    max_height = int(memory * 1024 * 1024 / (region.cols * 8))
+    return region.cols, max(1, min(height, max_height))
+
+
+def run_tile(args):
+    """Run the module for a tile and return the index of the tile"""
+    index, work = args
+    cmd_exe(work)
+    return index
+
+
+def read_tile_row(raster, mset_str, bboxes, row, start_row=0, start_col=0):
+    """Read a row of tiles into an array covering the full width of the
+    current region, cropping the overlap of the tiles with the bounding
+    boxes of the tiles without overlap
+
+    Return the array and the type of the raster map.
+    """
+    region = Region()
+    r_start = int(round((region.north - bboxes[0].north) / region.nsres))
+    r_end = int(round((region.north - bboxes[0].south) / region.nsres))
+    band = None
+    for col, bbox in enumerate(bboxes):
+        c_start = int(round((bbox.west - region.west) / region.ewres))
+        c_end = int(round((bbox.east - region.west) / region.ewres))
+        mapset = mset_str % (start_row + row, start_col + col)
+        with RasterRow(raster, mapset=mapset) as tile:
+            if band is None:
+                mtype = tile.mtype
+                band = np.empty((r_end - r_start, region.cols), dtype=DTYPES[mtype])
+            for i, tile_row in enumerate(range(r_start, r_end)):
+                band[i, c_start:c_end] = tile[tile_row][c_start:c_end]
+    return band, mtype
+
+
 class MyGridModule(GridModule):
     """inherit GridModule, but handle the fact that the output name is in the expression"""
 
+    def __init__(self, *args, **kwargs):
+        self.streaming = kwargs.pop("streaming", False)
+        super().__init__(*args, **kwargs)
+        self.patch_time = 0.0
+        self.patch_tail = 0.0
+
+    def run(self, patch=True, clean=True):
+        """Run r.mapcalc over the tiles. With the streaming backend, each
+        row of tiles is patched into the output as soon as its tiles and
+        those of the rows above are computed."""
+        if not self.streaming:
+            return super().run(patch=patch, clean=clean)
+        self.module.flags.overwrite = True
+        self.define_mapset_inputs()
+        works = self.get_works()
+        tiles = [
+            (row, col)
+            for row, box_row in enumerate(self.bboxes)
+            for col in range(len(box_row))
+        ]
+        bboxes = split_region_tiles(width=self.width, height=self.height)
+        output_map = self.out_prefix[:]
+        self.out_prefix = ""
+        pending = [len(box_row) for box_row in bboxes]
+        next_row = 0
+        output = None
+        pool = Pool(processes=self.processes)
+        try:
+            for index in pool.imap_unordered(run_tile, enumerate(works)):
+                pending[tiles[index][0]] -= 1
+                start = time.time()
+                while patch and next_row < len(pending) and not pending[next_row]:
+                    band, mtype = read_tile_row(
+                        output_map,
+                        self.msetstr,
+                        bboxes[next_row],
+                        next_row,
+                        start_row=self.start_row,
+                        start_col=self.start_col,
+                    )
+                    if output is None:
+                        output = RasterRow(output_map)
+                        output.open("w", mtype=mtype, overwrite=gscript.overwrite())
+                        buff = Buffer((band.shape[1],), mtype)
+                    for values in band:
+                        buff[:] = values
+                        output.put_row(buff)
+                    next_row += 1
+                self.patch_tail = time.time() - start
+                self.patch_time += self.patch_tail
+        except Exception:
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+            if output is not None:
+                output.close()
+        if clean:
+            self.clean_location()
+            self.rm_tiles()
+
     def patch(self):
         """Patch the final results."""
+        start = time.time()
         bboxes = split_region_tiles(width=self.width, height=self.height)
         output_map = self.out_prefix[:]
         self.out_prefix = ""
@@ -139,6 +265,7 @@ class MyGridModule(GridModule):
                 prefix=self.out_prefix,
                 processes=self.processes,
             )
+        self.patch_time = self.patch_tail = time.time() - start
 
 
 def main():
@@ -153,24 +280,10 @@ def main():
         width = int(width)
     if height:
         height = int(height)
-    if not parallel_rpatch_available:
-        warning = False
-        if not width:
-            width = 1000
-            warning = True
-        if not height:
-            height = 1000
-            warning = True
-        if warning:
-            # square tiles tend to be slower than horizontal slices
-            gscript.warning(
-                _(
-                    "No tile width or height provided, default tile size set: {h} rows x {w} cols."
-                ).format(h=height, w=width)
-            )
     overlap = int(options["overlap"])
     processes = options["nprocs"]
     patch_backend = options["patch_backend"]
+    memory = int(options["memory"])
     if not processes:
         processes = options["processes"]
         if processes:
@@ -179,6 +292,14 @@ def main():
         processes = int(processes)
     except ValueError:
         processes = 1
+    streaming = patch_backend == "streaming"
+    if (streaming or not parallel_rpatch_available) and not (width and height):
+        auto_width, auto_height = auto_tile_size(processes, memory)
+        width = width or auto_width
+        height = height or auto_height
+        gscript.verbose(
+            _("Tile size set: {h} rows x {w} cols.").format(h=height, w=width)
+        )
 
     output = None
     if options["output"]:
@@ -190,15 +311,15 @@ def main():
     kwargs = {"expression": expression, "quiet": True}
 
     if not parallel_rpatch_available and patch_backend == "r.patch":
-        gs.warning(
+        gscript.warning(
             _(
                 "r.patch backend is not available in this version of GRASS GIS, using RasterRow"
             )
         )
     if patch_backend == "r.patch" and overlap > 0:
-        gs.fatal(_("Patching backend 'r.patch' doesn't work for overlap > 0"))
+        gscript.fatal(_("Patching backend 'r.patch' doesn't work for overlap > 0"))
     if parallel_rpatch_available:
-        kwargs["patch_backend"] = patch_backend
+        kwargs["patch_backend"] = "RasterRow" if streaming else patch_backend
 
     if output:
         output_mapname = output
@@ -214,9 +335,17 @@ def main():
         split=False,
         mapset_prefix=mapset_prefix,
         out_prefix=output_mapname,
+        streaming=streaming,
         **kwargs,
     )
+    start = time.time()
     grd.run()
+    gscript.message(
+        _(
+            "Wall time: {total:.2f} s, patching: {patch:.2f} s "
+            "({tail:.2f} s after the last tile was computed)"
+        ).format(total=time.time() - start, patch=grd.patch_time, tail=grd.patch_tail)
+    )
 
 
 if __name__ == "__main__":
@@ -176,6 +176,12 @@ for details.
 # %option G_OPT_MEMORYMB
 # %end
 
+# %flag
+# % key: t
+# % label: Report processing speed and timings of processing stages
+# % description: Prints the number of processed points per second and the time spent in viewshed computation, reading, parametrisation and cumulation
+# %end
+
 # %option G_OPT_M_NPROCS
 # %end
 
@@ -184,10 +190,11 @@ import math
 import atexit
 import sys
 import subprocess
-from multiprocessing import Pool
+import time
+from multiprocessing import Lock, Pool
 from copy import deepcopy
+from functools import partial
 import numpy as np
-import itertools
 
 from grass.pygrass.gis import Mapset
 from grass.pygrass.raster import RasterRow
@@ -205,6 +212,18 @@ from grass.script import utils as grassutils
 # random name of binary viewshed
 TEMPNAME = grass.tempname(12)
 
+# file of the cumulative viewshed shared by all worker processes
+ACCUMULATOR_FILE = None
+
+# shared cumulative viewshed and its lock as seen by a worker process
+WORKER_STATE = {}
+
+# number of batches of target points per core
+BATCHES_PER_CORE = 8
+
+# processing stages reported by the benchmark flag
+STAGES = ("read DSM", "viewshed", "read-back", "parametrise", "accumulate")
+
 
 def cleanup():
     """Remove raster and vector maps stored in a list"""
@@ -225,6 +244,9 @@ def cleanup():
         grass.run_command("r.mask", flags="r", quiet=True)
     reset_mask()
 
+    if ACCUMULATOR_FILE and os.path.exists(ACCUMULATOR_FILE):
+        os.remove(ACCUMULATOR_FILE)
+
 
 def unset_mask():
     """Deactivate user mask"""
@@ -285,16 +307,138 @@ def clean_temp(pid):
             rmtree(path)
 
 
-def do_it_all(global_vars, target_pts_np):
-    """Conduct weighted and parametrised partial viewshed and cummulate it with
-    the previous partial viewsheds
+def init_worker(lock, accumulator_file):
+    """Open the shared cumulative viewshed in a worker process
+    :param lock: Lock guarding updates of the cumulative viewshed
+    :type lock: multiprocessing.Lock
+    :param accumulator_file: Path to the memory-mapped cumulative viewshed
+    :type accumulator_file: string
+    """
+    WORKER_STATE["lock"] = lock
+    WORKER_STATE["np_cum"] = np.load(accumulator_file, mmap_mode="r+")
+
+
+def accumulate(np_cum, np_viewshed, offset):
+    """Add a local parametrised viewshed to the cumulative viewshed in place
+    Cells that are NULL in the local viewshed are left untouched, cells that
+    are NULL in the cumulative viewshed only are set to the local value
+    :param np_cum: 2D array of cumulative viewshed
+    :type np_cum: ndarray
+    :param np_viewshed: 2D array of local parametrised viewshed
+    :type np_viewshed: ndarray
+    :param offset: Row and column of the local viewshed in np_cum
+    :type offset: list
+    """
+    np_window = np_cum[
+        offset[0] : offset[0] + np_viewshed.shape[0],
+        offset[1] : offset[1] + np_viewshed.shape[1],
+    ]
+    valid = ~np.isnan(np_viewshed)
+    np_window[valid & np.isnan(np_window)] = 0
+    np.add(np_window, np_viewshed, out=np_window, where=valid)
+
+
+def spatial_order(target_pts_np, reg, tile_size):
+    """Order target points along a Z-order (Morton) curve over a grid of
+    square tiles, so that consecutive points are close to each other
     :param target_pts_np: Array of target points in global coordinate system
     :type target_pts_np: ndarray
-    :return: 2D array of weighted parametrised cumulative viewshed
+    :param reg: computational region
+    :type reg: Region()
+    :param tile_size: Size of the tiles in map units
+    :type tile_size: float
+    :return: Array of target points sorted along the curve
     :rtype: ndarray
     """
-    # Set counter
-    counter = 1
+    tile_col = ((target_pts_np[:, 1] - reg.west) // tile_size).astype(np.uint64)
+    tile_row = ((reg.north - target_pts_np[:, 2]) // tile_size).astype(np.uint64)
+
+    # interleave the bits of tile row and column index
+    code = np.zeros(target_pts_np.shape[0], dtype=np.uint64)
+    for bit in range(32):
+        code |= ((tile_col >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        code |= ((tile_row >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+
+    return target_pts_np[np.argsort(code, kind="stable")]
+
+
+def local_region(t_glob, reg, exp_range):
+    """Compute local computational region: +/- exp_range from target point,
+    aligned with and limited to the global computational region
+    :param t_glob: Global coordinates of target point
+    :type t_glob: ndarray
+    :param reg: computational region
+    :type reg: Region()
+    :param exp_range: exposure range
+    :type exp_range: float
+    :return: North, south, east and west edge of local region
+    :rtype: list
+    """
+    # compute position of target point within a pixel
+    delta_n = math.ceil((t_glob[1] - reg.south) / reg.nsres) * reg.nsres - (
+        t_glob[1] - reg.south
+    )
+    delta_s = (t_glob[1] - reg.south) - math.floor(
+        (t_glob[1] - reg.south) / reg.nsres
+    ) * reg.nsres
+    delta_e = math.ceil((t_glob[0] - reg.west) / reg.ewres) * reg.ewres - (
+        t_glob[0] - reg.west
+    )
+    delta_w = (t_glob[0] - reg.west) - math.floor(
+        (t_glob[0] - reg.west) / reg.ewres
+    ) * reg.ewres
+
+    # ensure that local region doesn't exceed global region
+    return [
+        min(t_glob[1] + exp_range + delta_n, reg.north),
+        max(t_glob[1] - exp_range - delta_s, reg.south),
+        min(t_glob[0] + exp_range + delta_e, reg.east),
+        max(t_glob[0] - exp_range - delta_w, reg.west),
+    ]
+
+
+def read_dsm_tile(r_dsm, dsm_type, reg, bbox):
+    """Read a window of the digital surface model as float array with NaN
+    as NoData
+    :param r_dsm: Name of digital surface model raster
+    :type r_dsm: string
+    :param dsm_type: Raster map precision type
+    :type dsm_type: string
+    :param reg: computational region
+    :type reg: Region()
+    :param bbox: North, south, east and west edge of the window
+    :type bbox: list
+    :return: 2D array of DSM and row, column of its origin in global region
+    :rtype: tuple
+    """
+    treg = deepcopy(reg)
+    treg.set_bbox(Bbox(*bbox))
+    treg.set_raster_region()
+
+    np_dsm = raster2numpy(r_dsm)
+
+    # Ensure that values are represented as float (in case of CELL
+    # data type) and replace integer NaN with numpy NaN
+    if dsm_type == "CELL":
+        np_dsm = np_dsm.astype(np.float32)
+        np_dsm[np_dsm == -2147483648] = np.nan
+
+    origin = [
+        int(round((reg.north - bbox[0]) / reg.nsres)),
+        int(round((bbox[3] - reg.west) / reg.ewres)),
+    ]
+
+    return np_dsm, origin
+
+
+def do_it_all(global_vars, target_pts_np):
+    """Conduct weighted and parametrised partial viewsheds for a batch of
+    target points and cummulate them in the shared cumulative viewshed
+    :param target_pts_np: Array of target points in global coordinate system
+    :type target_pts_np: ndarray
+    :return: Number of processed target points and seconds spent per stage
+    :rtype: tuple
+    """
 
     # Get variables out of global_vars dictionary
     reg = global_vars["region"]
@@ -309,21 +453,39 @@ def do_it_all(global_vars, target_pts_np):
     b_1 = global_vars["b_1"]
     cores = global_vars["cores"]
     tempname = global_vars["tempname"]
+    use_dsm = global_vars["use_dsm"]
+    max_tile_cells = global_vars["max_tile_cells"]
 
-    # Create empty viewshed
-    np_cum = np.empty((reg.rows, reg.cols), dtype=np.single)
-    np_cum[:] = np.nan
+    # Shared cumulative viewshed
+    np_cum = WORKER_STATE["np_cum"]
+    lock = WORKER_STATE["lock"]
     tmp_vs = "{}_{}".format(tempname, os.getpid())
 
-    for target_pnt in target_pts_np:
+    timings = dict.fromkeys(STAGES, 0.0)
 
-        # Display a progress info message
-        grass.percent(counter, len(target_pts_np), 1)
-        grass.verbose(
-            "Processing point {i} ({p:.1%})".format(
-                i=int(target_pnt[0]), p=counter / len(target_pts_np)
-            )
+    # Local regions of all points in the batch
+    loc_regs = [local_region(pnt[1:], reg, exp_range) for pnt in target_pts_np]
+
+    # Read the DSM tile covering the whole batch once, if it is not too large
+    np_dsm_tile = None
+    if use_dsm and loc_regs:
+        start = time.perf_counter()
+        tile_bbox = [
+            max(lr[0] for lr in loc_regs),
+            min(lr[1] for lr in loc_regs),
+            max(lr[2] for lr in loc_regs),
+            min(lr[3] for lr in loc_regs),
+        ]
+        tile_cells = ((tile_bbox[0] - tile_bbox[1]) / reg.nsres) * (
+            (tile_bbox[2] - tile_bbox[3]) / reg.ewres
         )
+        if tile_cells <= max_tile_cells:
+            np_dsm_tile, tile_origin = read_dsm_tile(r_dsm, dsm_type, reg, tile_bbox)
+        timings["read DSM"] += time.perf_counter() - start
+
+    for target_pnt, loc_reg in zip(target_pts_np, loc_regs):
+
+        grass.debug("Processing point {i}".format(i=int(target_pnt[0])))
 
         # Global coordinates and attributes of target point T
         t_glob = target_pnt[1:]
@@ -331,25 +493,7 @@ def do_it_all(global_vars, target_pts_np):
         # ======================================================================
         # 1. Set local computational region: +/- exp_range from target point
         # ======================================================================
-        # compute position of target point within a pixel
-        delta_n = math.ceil((t_glob[1] - reg.south) / reg.nsres) * reg.nsres - (
-            t_glob[1] - reg.south
-        )
-        delta_s = (t_glob[1] - reg.south) - math.floor(
-            (t_glob[1] - reg.south) / reg.nsres
-        ) * reg.nsres
-        delta_e = math.ceil((t_glob[0] - reg.west) / reg.ewres) * reg.ewres - (
-            t_glob[0] - reg.west
-        )
-        delta_w = (t_glob[0] - reg.west) - math.floor(
-            (t_glob[0] - reg.west) / reg.ewres
-        ) * reg.ewres
-
-        # ensure that local region doesn't exceed global region
-        loc_reg_n = min(t_glob[1] + exp_range + delta_n, reg.north)
-        loc_reg_s = max(t_glob[1] - exp_range - delta_s, reg.south)
-        loc_reg_e = min(t_glob[0] + exp_range + delta_e, reg.east)
-        loc_reg_w = max(t_glob[0] - exp_range - delta_w, reg.west)
+        loc_reg_n, loc_reg_s, loc_reg_e, loc_reg_w = loc_reg
 
         # pygrass sets region for pygrass tasks
         lreg = deepcopy(reg)
@@ -364,9 +508,16 @@ def do_it_all(global_vars, target_pts_np):
 
         lreg_shape = [lreg.rows, lreg.cols]
 
+        # Determine position of local region within global region
+        o_2 = [
+            int(round((reg.north - loc_reg_n) / reg.nsres)),  # NS (rows)
+            int(round((loc_reg_w - reg.west) / reg.ewres)),  # EW (cols)
+        ]
+
         # ======================================================================
         # 2. Calculate binary viewshed and convert to numpy
         # ======================================================================
+        start = time.perf_counter()
         vs = grass.pipe_command(
             "r.viewshed",
             flags="b" + flagstring,
@@ -385,11 +536,25 @@ def do_it_all(global_vars, target_pts_np):
         vs.communicate()
         # Workaround for https://github.com/OSGeo/grass/issues/1436
         clean_temp(vs.pid)
+        timings["viewshed"] += time.perf_counter() - start
 
         # Read viewshed into numpy with single precision and replace NoData
+        start = time.perf_counter()
         np_viewshed = raster2numpy(tmp_vs).astype(np.single)
         np_viewshed[np_viewshed == -2147483648] = np.nan
 
+        # DSM in local region, sliced from the batch tile if available
+        np_dsm = None
+        if use_dsm:
+            if np_dsm_tile is not None:
+                np_dsm = np_dsm_tile[
+                    o_2[0] - tile_origin[0] : o_2[0] - tile_origin[0] + lreg_shape[0],
+                    o_2[1] - tile_origin[1] : o_2[1] - tile_origin[1] + lreg_shape[1],
+                ]
+            else:
+                np_dsm = read_dsm_tile(r_dsm, dsm_type, reg, loc_reg)[0]
+        timings["read-back"] += time.perf_counter() - start
+
         # ======================================================================
         # 3. Prepare local coordinates and attributes of target point T
         # ======================================================================
@@ -413,66 +578,34 @@ def do_it_all(global_vars, target_pts_np):
         # ======================================================================
         # 4. Parametrise viewshed
         # ======================================================================
+        start = time.perf_counter()
         np_viewshed = parametrise_viewshed(
             lreg_shape,
             t_loc,
             np_viewshed,
             reg,
             exp_range,
-            r_dsm,
-            dsm_type,
+            np_dsm,
             v_elevation,
             b_1,
         ).astype(np.single)
+        timings["parametrise"] += time.perf_counter() - start
 
         # ======================================================================
         # 5. Cummulate viewsheds
         # ======================================================================
-        # Determine position of local parametrised viewshed within
-        # global cumulative viewshed
-        o_2 = [
-            int(round((reg.north - loc_reg_n) / reg.nsres)),  # NS (rows)
-            int(round((loc_reg_w - reg.west) / reg.ewres)),  # EW (cols)
-        ]
-
         # Add local parametrised viewshed to global cumulative viewshed
-        # replace nans with 0 in processed regions, keep nan where both are nan
-        all_nan = np.all(
-            np.isnan(
-                [
-                    np_cum[
-                        o_2[0] : o_2[0] + lreg_shape[0], o_2[1] : o_2[1] + lreg_shape[1]
-                    ],
-                    np_viewshed,
-                ]
-            ),
-            axis=0,
-        )
-
-        np_cum[o_2[0] : o_2[0] + lreg_shape[0], o_2[1] : o_2[1] + lreg_shape[1]] = (
-            np.nansum(
-                [
-                    np_cum[
-                        o_2[0] : o_2[0] + lreg_shape[0], o_2[1] : o_2[1] + lreg_shape[1]
-                    ],
-                    np_viewshed,
-                ],
-                axis=0,
-            )
-        )
+        start = time.perf_counter()
+        with lock:
+            accumulate(np_cum, np_viewshed, o_2)
+        timings["accumulate"] += time.perf_counter() - start
 
-        np_cum[o_2[0] : o_2[0] + lreg_shape[0], o_2[1] : o_2[1] + lreg_shape[1]][
-            all_nan
-        ] = np.nan
+    np_cum.flush()
 
-        counter += 1
+    return target_pts_np.shape[0], timings
 
-    return np_cum
 
-
-def binary(
-    lreg_shape, t_loc, np_viewshed, reg, exp_range, r_dsm, dsm_type, v_elevation, b_1
-):
+def binary(lreg_shape, t_loc, np_viewshed, reg, exp_range, np_dsm, v_elevation, b_1):
     """Weight binary viewshed by constant weight
     :param lreg_shape: Dimensions of local computational region
     :type lreg_shape: list
@@ -484,10 +617,9 @@ def binary(
     :type reg: Region()
     :param exp_range: exposure range
     :type reg: float
-    :param r_dsm: Name of digital surface model raster
-    :type r_dsm: string
-    :param dsm_type: Raster map precision type
-    :type dsm_type: string
+    :param np_dsm: 2D array of digital surface model in local region, with
+                   NaN as NoData (only for Solid_angle and Visual_magnitude)
+    :type np_dsm: ndarray
     :param v_elevation: Observer height
     :type v_elevation: float
     :param b_1: radius in fuzzy viewshed parametrisation
@@ -500,7 +632,7 @@ def binary(
 
 
 def solid_angle_reverse(
-    lreg_shape, t_loc, np_viewshed, reg, exp_range, r_dsm, dsm_type, v_elevation, b_1
+    lreg_shape, t_loc, np_viewshed, reg, exp_range, np_dsm, v_elevation, b_1
 ):
     """Calculate solid angle from viewpoints to target based on
     Domingo-Santos et al. (2011) and use it to parametrise binary viewshed
@@ -514,10 +646,9 @@ def solid_angle_reverse(
     :type reg: Region()
     :param exp_range: exposure range
     :type reg: float
-    :param r_dsm: Name of digital surface model raster
-    :type r_dsm: string
-    :param dsm_type: Raster map precision type
-    :type dsm_type: string
+    :param np_dsm: 2D array of digital surface model in local region, with
+                   NaN as NoData (only for Solid_angle and Visual_magnitude)
+    :type np_dsm: ndarray
     :param v_elevation: Observer height
     :type v_elevation: float
     :param b_1: radius in fuzzy viewshed parametrisation
@@ -525,14 +656,7 @@ def solid_angle_reverse(
     :return: 2D array of weighted parametrised viewshed
     :rtype: ndarray
     """
-    # 1. Convert DSM to numpy
-    np_dsm = raster2numpy(r_dsm)
-
-    # Ensure that values are represented as float (in case of CELL
-    # data type) and replace integer NaN with numpy NaN
-    if dsm_type == "CELL":
-        np_dsm = np_dsm.astype(np.float32)
-        np_dsm[np_dsm == -2147483648] = np.nan
+    # 1. DSM in local region is provided by the caller
 
     # 2. local row, col coordinates and global Z coordinate of observer points V
     #    3D array (lreg_shape[0] x lreg_shape[1] x 3)
@@ -646,7 +770,7 @@ def solid_angle_reverse(
 
 
 def distance_decay_reverse(
-    lreg_shape, t_loc, np_viewshed, reg, exp_range, r_dsm, dsm_type, v_elevation, b_1
+    lreg_shape, t_loc, np_viewshed, reg, exp_range, np_dsm, v_elevation, b_1
 ):
     """Calculates distance decay weights to target based on
     Gret-Regamey et al. (2007) and Chamberlain & Meitner (2013) and use these
@@ -661,10 +785,9 @@ def distance_decay_reverse(
     :type reg: Region()
     :param exp_range: exposure range
     :type reg: float
-    :param r_dsm: Name of digital surface model raster
-    :type r_dsm: string
-    :param dsm_type: Raster map precision type
-    :type dsm_type: string
+    :param np_dsm: 2D array of digital surface model in local region, with
+                   NaN as NoData (only for Solid_angle and Visual_magnitude)
+    :type np_dsm: ndarray
     :param v_elevation: Observer height
     :type v_elevation: float
     :param b_1: radius in fuzzy viewshed parametrisation
@@ -707,7 +830,7 @@ def distance_decay_reverse(
 
 
 def fuzzy_viewshed_reverse(
-    lreg_shape, t_loc, np_viewshed, reg, exp_range, r_dsm, dsm_type, v_elevation, b_1
+    lreg_shape, t_loc, np_viewshed, reg, exp_range, np_dsm, v_elevation, b_1
 ):
     """Calculates fuzzy viewshed weights from viewpoints to target based on
     Fisher (1994) and use these to parametrise binary viewshed
@@ -721,10 +844,9 @@ def fuzzy_viewshed_reverse(
     :type reg: Region()
     :param exp_range: exposure range
     :type reg: float
-    :param r_dsm: Name of digital surface model raster
-    :type r_dsm: string
-    :param dsm_type: Raster map precision type
-    :type dsm_type: string
+    :param np_dsm: 2D array of digital surface model in local region, with
+                   NaN as NoData (only for Solid_angle and Visual_magnitude)
+    :type np_dsm: ndarray
     :param v_elevation: Observer height
     :type v_elevation: float
     :param b_1: radius in fuzzy viewshed parametrisation
@@ -769,7 +891,7 @@ def fuzzy_viewshed_reverse(
 
 
 def visual_magnitude_reverse(
-    lreg_shape, t_loc, np_viewshed, reg, exp_range, r_dsm, dsm_type, v_elevation, b_1
+    lreg_shape, t_loc, np_viewshed, reg, exp_range, np_dsm, v_elevation, b_1
 ):
     """Calculate visual magnitude from viewpoints to target based on
     Chamberlain (2011) and Chamberlain & Meither (2013) and use it to
@@ -784,10 +906,9 @@ def visual_magnitude_reverse(
     :type reg: Region()
     :param exp_range: exposure range
     :type reg: float
-    :param r_dsm: Name of digital surface model raster
-    :type r_dsm: string
-    :param dsm_type: Raster map precision type
-    :type dsm_type: string
+    :param np_dsm: 2D array of digital surface model in local region, with
+                   NaN as NoData (only for Solid_angle and Visual_magnitude)
+    :type np_dsm: ndarray
     :param v_elevation: Observer height
     :type v_elevation: float
     :param b_1: radius in fuzzy viewshed parametrisation
@@ -795,16 +916,7 @@ def visual_magnitude_reverse(
     :return: 2D array of weighted parametrised viewshed
     :rtype: ndarray
     """
-    # 1. Convert DSM to numpy
-    np_dsm = raster2numpy(r_dsm)
-
-    # Ensure that values are represented as float (in case of CELL
-    # data type) and replace integer NaN with numpy NaN
-    dsm_type = grass.parse_command("r.info", map=r_dsm, flags="g")["datatype"]
-
-    if dsm_type == "CELL":
-        np_dsm = np_dsm.astype(np.float32)
-        np_dsm[np_dsm == -2147483648] = np.nan
+    # 1. DSM in local region is provided by the caller
 
     # 2. local row, col coordinates and global Z coordinate of observer points V
     #    3D array (lreg_shape[0] x lreg_shape[1] x 3)
@@ -1355,24 +1467,68 @@ def main():
         "dsm_type": dsm_type,
         "cores": cores,
         "tempname": TEMPNAME,
+        "use_dsm": pfunction in ["Solid_angle", "Visual_magnitude"],
+        # DSM tiles of a batch may use half of the memory per core (float32)
+        "max_tile_cells": memory * 1024 * 1024 / (8 * cores),
     }
 
-    # Split target points to chunks for each core
-    target_pnts = np.array_split(target_pts_np, cores)
-
-    # Combine each chunk with dictionary
-    combo = list(zip(itertools.repeat(global_vars), target_pnts))
-
-    # Calculate partial cumulative viewshed
-    with Pool(cores) as pool:
-        np_sum = pool.starmap(do_it_all, combo)
+    # Create empty cumulative viewshed shared by all workers
+    global ACCUMULATOR_FILE
+    ACCUMULATOR_FILE = grass.tempfile(create=False) + ".npy"
+    np_cum = np.lib.format.open_memmap(
+        ACCUMULATOR_FILE, mode="w+", dtype=np.single, shape=(reg.rows, reg.cols)
+    )
+    np_cum[:] = np.nan
+    np_cum.flush()
+
+    # Order target points along a space-filling curve and split them to
+    # spatially compact batches, several for each core so that the load is
+    # balanced between the workers. Each batch then touches only a small
+    # part of the DSM and of the cumulative viewshed.
+    target_pts_np = spatial_order(target_pts_np, reg, 2 * exp_range)
+    n_batches = min(no_points, cores * BATCHES_PER_CORE)
+    target_pnts = np.array_split(target_pts_np, max(n_batches, 1))
+
+    # Calculate cumulative viewshed
+    processed = 0
+    timings = dict.fromkeys(STAGES, 0.0)
+    start = time.perf_counter()
+    with Pool(
+        cores, initializer=init_worker, initargs=(Lock(), ACCUMULATOR_FILE)
+    ) as pool:
+        for n_pts, batch_timings in pool.imap_unordered(
+            partial(do_it_all, global_vars), target_pnts
+        ):
+            processed += n_pts
+            for stage, seconds in batch_timings.items():
+                timings[stage] += seconds
+            grass.percent(processed, no_points, 1)
         pool.close()
         pool.join()
+    elapsed = time.perf_counter() - start
+
+    if flags["t"]:
+        grass.message(
+            "Processed {n} points in {s:.2f} s ({r:.2f} points/s) using {c} "
+            "cores".format(
+                n=processed,
+                s=elapsed,
+                r=processed / elapsed if elapsed > 0 else 0,
+                c=cores,
+            )
+        )
+        total = sum(timings.values())
+        for stage in STAGES:
+            grass.message(
+                "{stage}: {s:.2f} s ({p:.1%}, {ms:.2f} ms/point)".format(
+                    stage=stage,
+                    s=timings[stage],
+                    p=timings[stage] / total if total > 0 else 0,
+                    ms=1000 * timings[stage] / processed if processed else 0,
+                )
+            )
 
-    # We should probably use nansum here?
-    all_nan = np.all(np.isnan(np_sum), axis=0)
-    np_sum = np.nansum(np_sum, axis=0, dtype=np.single)
-    np_sum[all_nan] = np.nan
+    np_sum = np.load(ACCUMULATOR_FILE, mmap_mode="r")
 
     grass.verbose("Writing final result and cleaning up...")
 
@@ -70,6 +70,10 @@
 # % guisection: Statistics
 # %end
 
+# %option G_OPT_M_NPROCS
+# % guisection: Statistics
+# %end
+
 # %option
 # % key: plot_dimensions
 # % type: string
@@ -224,9 +228,10 @@
 # %end
 
 
-import atexit
+import os
 import sys
-import uuid
+from functools import partial
+from multiprocessing import Pool
 from subprocess import PIPE
 
 from dateutil import parser
@@ -236,8 +241,12 @@ import matplotlib.dates as mdates
 import grass.script as gs
 from grass.pygrass.modules import Module
 
-
-clean_maps = []
+# The boxplot statistics are computed by the engine of the r.boxplot addon
+sys.path.insert(1, os.path.join(os.path.dirname(sys.path[0]), "etc", "r.boxplot"))
+try:
+    from boxplot_stats import read_outliers, read_stats
+except ImportError:
+    gs.fatal(_("The r.boxplot addon is required. Install it with g.extension."))
 
 
 def lazy_import_py_modules():
@@ -255,51 +264,6 @@ def lazy_import_py_modules():
         gs.fatal(_("Matplotlib is not installed. Please, install it."))
 
 
-def create_unique_name(name):
-    """Generate a temporary name which contains prefix
-    Store the name in the global list.
-
-    :param str name: prefix to be used for unique string
-
-    :return str: Unique string with user defined prefix
-    """
-    unique_string = f"{name}{uuid.uuid4().hex}"
-    return unique_string
-
-
-def create_temporary_name(prefix):
-    """Create temporary file name and add this to clean_maps
-
-    :param str name: prefix to be used for unique string
-
-    :return str: Unique string with user defined prefix
-    """
-    tmpf = create_unique_name(prefix)
-    clean_maps.append(tmpf)
-    return tmpf
-
-
-def cleanup():
-    """Remove temporary maps specified in the global list"""
-    maps = reversed(clean_maps)
-    mapset = gs.gisenv()["MAPSET"]
-    for map_name in maps:
-        for element in ("raster", "vector"):
-            found = gs.find_file(
-                name=map_name,
-                element=element,
-                mapset=mapset,
-            )
-            if found["file"]:
-                Module(
-                    "g.remove",
-                    flags="f",
-                    type=element,
-                    name=map_name,
-                    quiet=True,
-                )
-
-
 def strip_mapset(name, join_char="@"):
     """Strip Mapset name and '@' from map name
     >>> strip_mapset('elevation@PERMANENT')
@@ -432,136 +396,37 @@ def get_bx_width(option_bxp_width, temp_type, strds):
     return [bxp_width, temp_lngt, temp_unit]
 
 
-def bxp_stats(rastername, whisker_range):
-    """Compute boxplot statistics
-
-    :param str rastername: name of input raster
-    :param float whisker_range: number representing the whisker range
-
-    :return list: list with minimum value, 1st, 2nd and 3rd
-                  quantiles and maximum value of the input raster
-    """
-    quantile_rules = Module(
-        "r.quantile",
-        flags="r",
-        input=rastername,
-        percentiles=[25, 50, 75],
-        stdout_=PIPE,
-    ).outputs.stdout
-    quantile_rules = quantile_rules.replace("\r", "").split("\n")
-    quantile_rules = [_f for _f in quantile_rules if _f]
-    quantiles = [x.split(":") for x in quantile_rules]
-    min_value = float(quantiles[0][0])
-    quant1 = float(quantiles[0][1])
-    quant2 = float(quantiles[1][1])
-    quant3 = float(quantiles[2][1])
-    max_value = float(quantiles[3][1])
-
-    # Compute iqr and whisker limits
-    iqr = whisker_range * (quant3 - quant1)
-    lower_bound = quant1 - iqr
-    if lower_bound > min_value:
-        lower_whisker = lower_bound
-    else:
-        lower_whisker = min_value
-    upper_bound = quant3 + iqr
-    if upper_bound < max_value:
-        upper_whisker = upper_bound
-    else:
-        upper_whisker = max_value
+def bxp_stats(rastername, whisker_range, notch=False, outliers=False):
+    """Compute boxplot statistics, notches and outliers
 
-    # Return values
-    return [
-        min_value,
-        quant1,
-        quant2,
-        quant3,
-        max_value,
-        iqr,
-        lower_whisker,
-        upper_whisker,
-    ]
-
-
-def compute_notch(rastername, quant2, iqr):
-    """Compute notches of boxplots
+    The statistics are computed in a single pass over the raster. The
+    outliers of floating point rasters are read in a second pass.
 
     :param str rastername: name of input raster
-    :param float quant2: 2nd quantile
-    :param float iqr: interquartile range
+    :param float whisker_range: number representing the whisker range
+    :param bool notch: compute the lower and upper notch
+    :param bool outliers: get the values outside the whiskers
 
-    :return list: list with lower and upper notch value of input raster
+    :return dict: box with the whiskers, quantiles, outliers and notches of
+                  the input raster, or None if the raster has no data
     """
-    univar = Module(
-        "r.univar", flags=["g", "t"], map=rastername, stdout_=PIPE
-    ).outputs.stdout
-    n_values = int(univar.replace("\r", "").split("\n")[1].split("|")[0])
-    lower_notch = quant2 - 1.57 * (iqr / n_values**0.5)
-    upper_notch = quant2 + 1.57 * (iqr / n_values**0.5)
-    return [lower_notch, upper_notch]
-
-
-def compute_outliers(rastername, min_value, max_value, lower_whisker, upper_whisker):
-    """Compute notches of boxplots
-
-    :param float min_value: minimum raster raster 'rastername'
-    :param float max_value: maximum raster raster 'rastername'
-    :param float lower_whisker: lower whisker value 'rastername'
-    :param float upper_whisker: upper whisker value 'rastername'
+    stats = read_stats(rastername)
+    count = stats.count()
+    if not count:
+        return None
+    box = stats.box(whisker_range, 0, notch_count=count if notch else None)
+
+    # Get outliers, one per cell
+    if outliers:
+        if stats.integer:
+            box["fliers"] = stats.fliers(box, 0)
+        else:
+            whiskers = {0: (box["whislo"], box["whishi"])}
+            box["fliers"] = read_outliers(rastername, whiskers)[0].tolist()
+        if not box["fliers"]:
+            gs.message("\n--> There are no outliers")
 
-    :return list: list with outlier values for input raster
-    """
-    # Define recode rules to extract outliers
-    lower_outliers = f"{min_value}:{lower_whisker}:1"
-    upper_outliers = f"{upper_whisker}:{max_value}:1"
-    if min_value < lower_whisker and max_value > upper_whisker:
-        recode_rules = "{}\n{}".format(lower_outliers, upper_outliers)
-    elif min_value < lower_whisker:
-        recode_rules = lower_outliers
-    elif max_value > upper_whisker:
-        recode_rules = upper_outliers
-    else:
-        recode_rules = False
-    if bool(recode_rules):
-        colname = "tmpcolname"
-        tmprast = create_temporary_name("tmp01")
-        Module(
-            "r.recode",
-            input=rastername,
-            output=tmprast,
-            rules="-",
-            stdin_=recode_rules,
-        )
-        vect_name = create_temporary_name("tmpv")
-        rast_name = create_temporary_name("tmpr")
-        Module(
-            "r.mapcalc",
-            expression="{} = {}*{}".format(rast_name, tmprast, rastername),
-        )
-        Module(
-            "r.to.vect",
-            input=rast_name,
-            output=vect_name,
-            type="point",
-            column=colname,
-        )
-        fliers = Module(
-            "db.select", sql=f"select {colname} from {vect_name}", stdout_=PIPE
-        ).outputs.stdout
-        fliers = fliers.split("\n")[1:-1]
-        fliers = [float(x) for x in fliers]
-        remove_names = [tmprast, rast_name, vect_name]
-        Module(
-            "g.remove",
-            flags="f",
-            name=remove_names,
-            type=["raster", "vector"],
-            quiet=True,
-        )
-    else:
-        fliers = []
-        gs.message("\n--> There are no outliers")
-    return fliers
+    return box
 
 
 def set_axis(ax, date_format, temp_unit, vertical, rast_dates, temp_lngt):
@@ -717,47 +582,21 @@ def main(options, flags):
     )
 
     # Create the stats and define the boxes
-    boxes = []
-    for _, rastername in enumerate(rast_names):
-
-        # Compute boxplot stats
-        (
-            min_value,
-            quant1,
-            quant2,
-            quant3,
-            max_value,
-            iqr,
-            lower_whisker,
-            upper_whisker,
-        ) = bxp_stats(rastername, whisker_range)
-
-        # Compute notch limits
-        if flags["n"]:
-            lower_notch, upper_notch = compute_notch(rastername, quant2, iqr)
-        else:
-            lower_notch = upper_notch = ""
-
-        # Compute outliers
-        if flags["o"]:
-            fliers = compute_outliers(
-                rastername, min_value, max_value, lower_whisker, upper_whisker
-            )
-        else:
-            fliers = []
-
-        # Create box for raster
-        dict_i = {
-            "whislo": lower_whisker,
-            "q1": quant1,
-            "med": quant2,
-            "q3": quant3,
-            "whishi": upper_whisker,
-            "fliers": fliers,
-            "cilo": lower_notch,
-            "cihi": upper_notch,
-        }
-        boxes.append(dict_i)
+    nprocs = max(1, min(int(options["nprocs"]), len(rast_names)))
+    compute_box = partial(
+        bxp_stats,
+        whisker_range=whisker_range,
+        notch=flags["n"],
+        outliers=flags["o"],
+    )
+    if nprocs > 1:
+        with Pool(processes=nprocs) as pool:
+            boxes = pool.map(compute_box, rast_names)
+    else:
+        boxes = [compute_box(rastername) for rastername in rast_names]
+    for rastername, box in zip(rast_names, boxes):
+        if box is None:
+            gs.fatal(_("Raster map {} contains no data").format(rastername))
 
     # Plot the figure
     _, ax = plt.subplots(figsize=dimensions)
@@ -849,5 +688,4 @@ def main(options, flags):
 
 
 if __name__ == "__main__":
-    atexit.register(cleanup)
     sys.exit(main(*gs.parser()))
@@ -125,6 +125,12 @@
 # % description: Create new columns for the selected methods, it combine STRDS and method names
 # %end
 
+# %flag
+# % key: b
+# % label: Sample each raster map only once for all points (batch mode)
+# % description: Points are read once and grouped by time window, each raster map is sampled once and the table is updated in a single transaction
+# %end
+
 # %rules
 # % exclusive: date,date_column
 # %end
@@ -145,8 +151,11 @@
 # % requires: final_date_column, date_column
 # %end
 
+from bisect import bisect_left
 from datetime import datetime
 from datetime import timedelta
+from functools import partial
+from multiprocessing import Pool
 from subprocess import PIPE as PI
 import numpy as np
 import grass.script as gscript
@@ -187,6 +196,180 @@ def return_value(vals, met):
         return
 
 
+def aggregate_values(vals, met):
+    """Return the values according the choosen method for each row of a
+    2D array of values with one row per point and one column per raster map"""
+    if met == "average":
+        return vals.mean(axis=1)
+    elif met == "median":
+        return np.median(vals, axis=1)
+    elif met == "mode":
+        try:
+            from scipy import stats
+
+            return np.ravel(stats.mode(vals, axis=1).mode)
+        except ImportError:
+            gscript.fatal(_("For method 'mode' you need to install scipy"))
+    elif met == "minimum":
+        return vals.min(axis=1)
+    elif met == "maximum":
+        return vals.max(axis=1)
+    elif met == "stddev":
+        return vals.std(axis=1)
+    elif met == "sum":
+        return vals.sum(axis=1)
+    elif met == "variance":
+        return vals.var(axis=1)
+    elif met == "quart1":
+        return np.percentile(vals, 25, axis=1)
+    elif met == "quart3":
+        return np.percentile(vals, 75, axis=1)
+    elif met == "perc90":
+        return np.percentile(vals, 90, axis=1)
+    elif met == "quantile":
+        return np.full(vals.shape[0], np.nan)
+
+
+def time_window(start, final, temporal_type, dateformat, td, after):
+    """Return the start and end of the aggregation time window for a date"""
+    if temporal_type == "absolute":
+        fdata = datetime.strptime(start, dateformat)
+    else:
+        fdata = int(start)
+    if final:
+        sdata = datetime.strptime(final, dateformat)
+    elif after:
+        sdata = fdata + td
+    else:
+        sdata = fdata
+        fdata = sdata - td
+    return fdata, sdata
+
+
+def read_points(invect):
+    """Read the categories and the cells of the current region of the
+    points of a vector map
+
+    :return: arrays with the category, row and column of each point, row
+             and column are -1 for points outside the current region
+    """
+    from grass.pygrass.gis.region import Region
+    from grass.pygrass.vector import VectorTopo
+
+    reg = Region()
+    cats = []
+    coords = []
+    with VectorTopo(invect, mode="r") as pymap:
+        for point in pymap.viter("points"):
+            cats.append(point.cat)
+            coords.append((point.x, point.y))
+    coords = np.array(coords, dtype=float).reshape(-1, 2)
+    rows = np.floor((reg.north - coords[:, 1]) / reg.nsres).astype(int)
+    cols = np.floor((coords[:, 0] - reg.west) / reg.ewres).astype(int)
+    outside = (rows < 0) | (rows >= reg.rows) | (cols < 0) | (cols >= reg.cols)
+    rows[outside] = -1
+    cols[outside] = -1
+    return np.array(cats), rows, cols
+
+
+def sample_map(mapid, rows, cols, index):
+    """Sample a raster map at the given cells of the current region
+
+    :param str mapid: name of the raster map
+    :param rows: array with the row of each point
+    :param cols: array with the column of each point
+    :param index: array with the index of the points to sample
+    :return: array with the values at the points in index, NaN for no data
+    """
+    from grass.pygrass.raster import RasterRow
+
+    values = np.full(index.size, np.nan)
+    point_rows = rows[index]
+    order = np.argsort(point_rows, kind="stable")
+    row_ids, starts = np.unique(point_rows[order], return_index=True)
+    ends = np.append(starts[1:], order.size)
+    with RasterRow(mapid) as src:
+        for row, start, end in zip(row_ids, starts, ends):
+            if row < 0:
+                continue
+            sel = order[start:end]
+            line = np.asarray(src[int(row)])[cols[index[sel]]]
+            if line.dtype.kind == "f":
+                values[sel] = line
+            else:
+                values[sel] = np.where(line == np.iinfo(np.int32).min, np.nan, line)
+    return values
+
+
+def batch_aggregate(sp, dbif, windows, points, rows, cols, mets, nprocs):
+    """Sample the raster maps of a STRDS for groups of points sharing a
+    time window and aggregate the values of each point
+
+    Each raster map is sampled only once for all the points whose time
+    window covers it.
+
+    :param sp: the space time raster dataset
+    :param dbif: the temporal database interface
+    :param list windows: list of (start, end) tuples of the time windows
+    :param list points: list with an array of the index of the points of
+                        each time window
+    :param rows: array with the row of each point
+    :param cols: array with the column of each point
+    :param list mets: aggregation methods
+    :param int nprocs: number of processes used to sample the raster maps
+    :return: list with, for each time window, a 2D array with the values of
+             the methods (columns) for the points (rows) of the window, or
+             None if there are no raster maps in the time window; all values
+             of a point are NaN if a raster map has no data at the point
+    """
+    maps = sp.get_registered_maps("id,start_time", None, "start_time", dbif)
+    map_ids = [row["id"] for row in maps]
+    map_starts = [row["start_time"] for row in maps]
+
+    # Raster maps with start_time >= start and < end of each time window
+    ranges = [
+        (bisect_left(map_starts, start), bisect_left(map_starts, end))
+        for start, end in windows
+    ]
+
+    # Points to sample in each raster map
+    needed = [[] for _ in map_ids]
+    for w, (first, last) in enumerate(ranges):
+        for m in range(first, last):
+            needed[m].append(points[w])
+    tasks = [
+        (map_ids[m], np.unique(np.concatenate(index)))
+        for m, index in enumerate(needed)
+        if index
+    ]
+    sampler = partial(sample_map, rows=rows, cols=cols)
+    if nprocs > 1 and len(tasks) > 1:
+        with Pool(processes=min(nprocs, len(tasks))) as pool:
+            samples = pool.starmap(sampler, tasks)
+    else:
+        samples = [sampler(*task) for task in tasks]
+    sampled = {}
+    for (mapid, index), values in zip(tasks, samples):
+        sampled[mapid] = (index, values)
+
+    results = []
+    for (first, last), index in zip(ranges, points):
+        if first == last:
+            results.append(None)
+            continue
+        vals = np.empty((index.size, last - first))
+        for m in range(first, last):
+            map_index, map_values = sampled[map_ids[m]]
+            vals[:, m - first] = map_values[np.searchsorted(map_index, index)]
+        if last - first == 1:
+            result = np.repeat(vals, len(mets), axis=1)
+        else:
+            result = np.column_stack([aggregate_values(vals, met) for met in mets])
+        result[np.isnan(vals).any(axis=1)] = np.nan
+        results.append(result)
+    return results
+
+
 def main(options, flags):
     import grass.pygrass.modules as pymod
     import grass.temporal as tgis
@@ -345,23 +528,85 @@ def main(options, flags):
 
     if stdout:
         outtxt = ""
+    if flags["b"]:
+        from grass.pygrass.vector import VectorTopo
+
+        cats, rows, pcols = read_points(invect)
+        # Group the points by their time window
+        groups = {}
+        if incol:
+            mysql = "SELECT cat,{dc} from {vmap}".format(
+                dc=",".join([incol, endcol] if endcol else [incol]),
+                vmap=invect,
+            )
+            try:
+                qdates = pymod.Module(
+                    "db.select", flags="c", stdout_=PI, stderr_=PI, sql=mysql
+                )
+            except CalledModuleError:
+                gscript.fatal(_("db.select return an error"))
+            catdates = {}
+            for line in qdates.outputs["stdout"].value.splitlines():
+                vals = line.split("|")
+                if vals[1]:
+                    catdates[int(vals[0])] = (vals[1], vals[2] if endcol else None)
+            for idx, cat in enumerate(cats):
+                if cat in catdates:
+                    groups.setdefault(catdates[cat], []).append(idx)
+        else:
+            groups[(indate, enddate or None)] = list(range(cats.size))
+        dates = sorted(groups)
+        windows = [
+            time_window(
+                start, final, sp.get_temporal_type(), dateformat, td, flags["a"]
+            )
+            for start, final in dates
+        ]
+        points = [np.array(groups[date], dtype=int) for date in dates]
+        results = batch_aggregate(
+            sp, dbif, windows, points, rows, pcols, mets, int(nprocs)
+        )
+        updates = []
+        for (start, final), index, result in zip(dates, points, results):
+            if result is None:
+                result = np.full((index.size, len(mets)), np.nan)
+            for cat, values in zip(cats[index].tolist(), result.tolist()):
+                if stdout:
+                    outtxt += "{di}{sep}{da}".format(di=cat, da=start, sep=separator)
+                    for val in values:
+                        outtxt += "{sep}{val}".format(
+                            val="*" if np.isnan(val) else val, sep=separator
+                        )
+                    outtxt += "\n"
+                elif not np.isnan(values).all():
+                    updates.append(
+                        tuple(None if np.isnan(val) else val for val in values) + (cat,)
+                    )
+        if updates:
+            with VectorTopo(invect, mode="r") as pymap:
+                table = pymap.table
+                param = "%s" if table.columns.is_pg() else "?"
+                table.execute(
+                    "UPDATE {tab} SET {cols} WHERE {key}={param}".format(
+                        tab=table.name,
+                        cols=",".join("{}={}".format(col, param) for col in cols),
+                        key=table.key,
+                        param=param,
+                    ),
+                    many=True,
+                    values=updates,
+                )
+                table.conn.commit()
+        mydates = []
     for data in mydates:
         try:
             start, final = data.split("|")
         except ValueError:
             start = data
             final = None
-        if sp.get_temporal_type() == "absolute":
-            fdata = datetime.strptime(start, dateformat)
-        else:
-            fdata = int(start)
-        if final:
-            sdata = datetime.strptime(final, dateformat)
-        elif flags["a"]:
-            sdata = fdata + td
-        else:
-            sdata = fdata
-            fdata = sdata - td
+        fdata, sdata = time_window(
+            start, final, sp.get_temporal_type(), dateformat, td, flags["a"]
+        )
         mwhere = "start_time >= '{inn}' and start_time < " "'{out}'".format(
             inn=fdata, out=sdata
         )
@@ -164,6 +164,27 @@ A_average
 2|2001-05-01|200.0|300.0
 3|2001-05-01|200.0|300.0
 
+"""
+        self.assertLooksLike(text, t_rast_what.outputs.stdout)
+
+    def test_bflag(self):
+        """Testing b flag"""
+        t_rast_what = SimpleModule(
+            "t.rast.what.aggr",
+            strds="A",
+            flags="b",
+            input="points",
+            date="2001-05-01",
+            granularity="3 months",
+            overwrite=True,
+            method=["minimum", "maximum"],
+            verbose=True,
+        )
+        self.assertModule(t_rast_what)
+        text = """1|2001-05-01|200.0|300.0
+2|2001-05-01|200.0|300.0
+3|2001-05-01|200.0|300.0
+
 """
         self.assertLooksLike(text, t_rast_what.outputs.stdout)
 
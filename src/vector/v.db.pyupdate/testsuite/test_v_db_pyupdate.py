@@ -76,6 +76,56 @@ class TestVDbPyUpdate(TestCase):
                 else:
                     self.assertTrue(row["display_phone"] is None)
 
+    def test_chunks_vectorized(self):
+        """Check evaluation over column arrays in several chunks"""
+        self.runModule(
+            "v.db.addcolumn", map=self.vector_name, columns="double_cat double"
+        )
+        self.assertModule(
+            "v.db.pyupdate",
+            map=self.vector_name,
+            column="double_cat",
+            expression="np.where(cat > 10, cat * 2, -1)",
+            chunk_size=7,
+            flags="v",
+        )
+        table = json.loads(
+            gs.read_command("v.db.select", map=self.vector_name, format="json")
+        )["records"]
+        for row in table:
+            expected = row["cat"] * 2 if row["cat"] > 10 else -1
+            self.assertEqual(
+                row["double_cat"],
+                expected,
+                msg="Column does not contain the expected value: {row}".format(
+                    **locals()
+                ),
+            )
+
+    def test_chunks_not_vectorizable(self):
+        """Check that rows are evaluated one by one if needed"""
+        self.runModule(
+            "v.db.addcolumn", map=self.vector_name, columns="display_phone text"
+        )
+        self.assertModule(
+            "v.db.pyupdate",
+            map=self.vector_name,
+            column="display_phone",
+            expression="f'Phone num. {phone}'",
+            condition="phone.startswith('(919)')",
+            where="phone is not null",
+            chunk_size=7,
+            flags="v",
+        )
+        table = json.loads(
+            gs.read_command("v.db.select", map=self.vector_name, format="json")
+        )["records"]
+        for row in table:
+            if row["PHONE"] and row["PHONE"].startswith("(919)"):
+                self.assertEqual(row["display_phone"], f"Phone num. {row['PHONE']}")
+            else:
+                self.assertTrue(row["display_phone"] is None)
+
 
 if __name__ == "__main__":
     test()
@@ -69,6 +69,13 @@ This executable script is a GRASS GIS module to run in a GRASS GIS session.
 # % description: This file can contain imports and it will loaded before expression and condition are evaluated
 # % required: no
 # %end
+# %option
+# % key: chunk_size
+# % type: integer
+# % label: Number of rows to read and update at once
+# % description: Used with the -v flag
+# % answer: 100000
+# %end
 # %flag
 # % key: s
 # % label: Import all functions from specificed packages
@@ -79,6 +86,11 @@ This executable script is a GRASS GIS module to run in a GRASS GIS session.
 # % label: Do not provide the additional lower-cased column names
 # % description: Attributes will be accessible only using the original (often uppercase) column name
 # %end
+# %flag
+# % key: v
+# % label: Evaluate expression and condition over column arrays in chunks
+# % description: Attributes are NumPy arrays; rows are evaluated one by one if the expression is not vectorizable
+# %end
 # %rules
 # % requires: -s,packages
 # %end
@@ -89,8 +101,10 @@ import csv
 
 # Importing so that it available to the expression.
 import math  # noqa: F401 pylint: disable=unused-import
+import numpy as np
 
 import grass.script as gs
+from grass.pygrass.vector.table import Link
 
 
 SQL_INT_TYPES = [
@@ -113,6 +127,80 @@ SQL_FLOAT_TYPES = [
 ]
 
 
+def row_to_kwargs(row, ensure_lowercase, null_workaround=True):
+    """Create keyword arguments for the Python functions from a row"""
+    kwargs = {}
+    for key, value in row.items():
+        # Translate NULL representation to None
+        # TODO: Is this just a workaround for a bug in v.db.select -j?
+        if null_workaround and value == key:
+            value = None
+        # Type is determined through JSON or the database, so assuming it is correct.
+        kwargs[key] = value
+        if ensure_lowercase:
+            kwargs[key.lower()] = value
+        # TODO: fix variables which are Python keywords
+    return kwargs
+
+
+def evaluation_error(expression, kwargs, error):
+    """End with an error message showing the attributes of a failed row"""
+    attributes = []
+    for key, value in kwargs.items():
+        # Limit the number of attributes shown in the message.
+        max_attrs_show = 3
+        if len(attributes) >= max_attrs_show:
+            attributes.append("...")
+            break
+        # Try to show the relevant attributes. The "relevant" does not
+        # apply when they are misspelled.
+        # TODO: Merge with the case for all misspelled where this won't show
+        # any.
+        if key in expression:
+            attributes.append(f"{key}={value}")
+    if not attributes:
+        # TODO: needs to be more systematic regarding number of items and format str/int/float
+        attributes = [f"{key}={value}" for key, value in kwargs.items()][:3]
+        attributes.append("...")
+    gs.fatal(
+        _(
+            "Evaluation of expression <{expression}...>"
+            " where {attributes} failed with: {error}"
+        ).format(
+            expression=expression[:20],  # TODO: short expressions without ...
+            attributes=", ".join(attributes),
+            error=error,
+        )
+    )
+
+
+def evaluate_rows(
+    rows,
+    key,
+    expression,
+    expression_function,
+    condition,
+    condition_function,
+    ensure_lowercase,
+    null_workaround=True,
+):
+    """Apply Python functions row by row
+
+    Yields key and new value of each row selected by the condition.
+    """
+    for row in rows:
+        kwargs = row_to_kwargs(row, ensure_lowercase, null_workaround)
+        if condition and not condition_function(**kwargs):
+            # No Python condition or condition evaluates as False
+            continue
+        # TODO: Add specific error handling for wrong column names?
+        try:
+            value = expression_function(**kwargs)
+        except Exception as error:  # pylint: disable=broad-except
+            evaluation_error(expression, kwargs, error)
+        yield row[key], value
+
+
 def python_to_transaction(
     table,
     table_contents,
@@ -127,55 +215,16 @@ def python_to_transaction(
     """Apply Python functions and create SQL"""
     not_quoted_types = SQL_INT_TYPES + SQL_FLOAT_TYPES
     cmd = ["BEGIN TRANSACTION"]  # Makes execution significantly faster
-    for row in table_contents:
-        kwargs = {}
-        for key, value in row.items():
-            # Translate NULL representation to None
-            # TODO: Is this just a workaround for a bug in v.db.select -j?
-            if value == key:
-                kwargs[key] = None
-                if ensure_lowercase:
-                    kwargs[key.lower()] = None
-            else:
-                # Type is determined through JSON, so assuming it is correct.
-                kwargs[key] = value
-                if ensure_lowercase:
-                    kwargs[key.lower()] = value
-            # TODO: fix variables which are Python keywords
-        if condition and not condition_function(**kwargs):
-            # No Python condition or condition evaluates as False
-            continue
-        # TODO: Add specific error handling for wrong column names?
-        try:
-            value = expression_function(**kwargs)
-        except Exception as error:  # pylint: disable=broad-except
-            attributes = []
-            for key, value in kwargs.items():
-                # Limit the number of attributes shown in the message.
-                max_attrs_show = 3
-                if len(attributes) >= max_attrs_show:
-                    attributes.append("...")
-                    break
-                # Try to show the relevant attributes. The "relevant" does not
-                # apply when they are misspelled.
-                # TODO: Merge with the case for all misspelled where this won't show
-                # any.
-                if key in expression:
-                    attributes.append(f"{key}={value}")
-            if not attributes:
-                # TODO: needs to be more systematic regarding number of items and format str/int/float
-                attributes = [f"{key}={value}" for key, value in kwargs.items()][:3]
-                attributes.append("...")
-            gs.fatal(
-                _(
-                    "Evaluation of expression <{expression}...>"
-                    " where {attributes} failed with: {error}"
-                ).format(
-                    expression=expression[:20],  # TODO: short expressions without ...
-                    attributes=", ".join(attributes),
-                    error=error,
-                )
-            )
+    cat_column = "cat"
+    for cat, value in evaluate_rows(
+        table_contents,
+        cat_column,
+        expression,
+        expression_function,
+        condition,
+        condition_function,
+        ensure_lowercase,
+    ):
         if value is None:
             # Translate None to SQL NULL
             value = "NULL"
@@ -183,13 +232,174 @@ def python_to_transaction(
             # Quote strings
             # TODO: We need a robust SQL escape function here.
             value = f"'{value}'"
-        cat_column = "cat"
-        cat = row[cat_column]
         cmd.append(f"UPDATE {table} SET {column} = {value} WHERE {cat_column} = {cat};")
     cmd.append("END TRANSACTION")
     return cmd
 
 
+def column_arrays(names, rows, columns, ensure_lowercase):
+    """Create a dictionary of NumPy arrays from the rows of a chunk
+
+    Numeric columns are numeric arrays with NULL as NaN (integer columns
+    become float if they contain NULL), other columns are object arrays
+    with NULL as None.
+    """
+    arrays = {}
+    for index, name in enumerate(names):
+        values = [row[index] for row in rows]
+        column_type = columns.get(name, {}).get("type", "").upper()
+        if column_type in SQL_INT_TYPES + SQL_FLOAT_TYPES:
+            if None in values:
+                values = [np.nan if value is None else value for value in values]
+                array = np.array(values, dtype=np.float64)
+            elif column_type in SQL_INT_TYPES:
+                array = np.array(values, dtype=np.int64)
+            else:
+                array = np.array(values, dtype=np.float64)
+        else:
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+        arrays[name] = array
+        if ensure_lowercase:
+            arrays[name.lower()] = array
+    return arrays
+
+
+def evaluate_arrays(arrays, size, expression_function, condition, condition_function):
+    """Apply Python functions to column arrays of a chunk
+
+    Returns a boolean array of selected rows and an array of new values.
+    Raises ValueError if the results are not arrays with one value per row,
+    e.g., when a string is created from a whole array.
+    """
+    if condition:
+        selected = condition_function(**arrays)
+        if not isinstance(selected, np.ndarray) or selected.shape != (size,):
+            raise ValueError(_("Condition does not evaluate to an array of rows"))
+        selected = selected.astype(bool)
+    else:
+        selected = np.ones(size, dtype=bool)
+    values = expression_function(**arrays)
+    # Accept also array-like results such as pandas Series
+    if hasattr(values, "to_numpy"):
+        values = values.to_numpy()
+    if not isinstance(values, np.ndarray) or values.shape != (size,):
+        raise ValueError(_("Expression does not evaluate to an array of rows"))
+    return selected, values
+
+
+def update_in_chunks(
+    connection,
+    placeholder,
+    table,
+    key,
+    where,
+    column,
+    columns,
+    chunk_size,
+    expression,
+    expression_function,
+    condition,
+    condition_function,
+    ensure_lowercase,
+):
+    """Evaluate the expression over chunks of the table and update it
+
+    Chunks are read ordered by the key column starting after the last key
+    of the previous chunk, so memory use is bounded by the chunk size.
+    The updates of each chunk are written with one executemany call
+    and all of them are committed at once.
+
+    Returns the number of updated rows.
+    """
+    numeric_column = columns[column]["type"].upper() in SQL_INT_TYPES + SQL_FLOAT_TYPES
+    update_sql = (
+        f"UPDATE {table} SET {column} = {placeholder} WHERE {key} = {placeholder}"
+    )
+    gs.verbose(f'Using SQL: "{update_sql}"')
+    conditions = [f"({where})"] if where else []
+
+    cursor = connection.cursor()
+    count_sql = f"SELECT COUNT(*) FROM {table}"
+    if conditions:
+        count_sql += " WHERE " + conditions[0]
+    cursor.execute(count_sql)
+    num_rows = cursor.fetchone()[0]
+
+    vectorize = True
+    processed = 0
+    updated = 0
+    last_key = None
+    while True:
+        chunk_conditions = list(conditions)
+        parameters = []
+        if last_key is not None:
+            chunk_conditions.append(f"{key} > {placeholder}")
+            parameters.append(last_key)
+        select_sql = f"SELECT * FROM {table}"
+        if chunk_conditions:
+            select_sql += " WHERE " + " AND ".join(chunk_conditions)
+        select_sql += f" ORDER BY {key} LIMIT {int(chunk_size)}"
+        cursor.execute(select_sql, parameters)
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        names = [description[0] for description in cursor.description]
+        key_index = names.index(key)
+        last_key = rows[-1][key_index]
+
+        updates = None
+        if vectorize:
+            arrays = column_arrays(names, rows, columns, ensure_lowercase)
+            try:
+                selected, values = evaluate_arrays(
+                    arrays,
+                    len(rows),
+                    expression_function,
+                    condition,
+                    condition_function,
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                gs.verbose(
+                    _(
+                        "Expression or condition is not vectorizable ({error}),"
+                        " evaluating rows one by one"
+                    ).format(error=error)
+                )
+                vectorize = False
+            else:
+                keys = arrays[key][selected].tolist()
+                values = values[selected].tolist()
+                if numeric_column:
+                    # Translate NaN to SQL NULL
+                    values = [None if value != value else value for value in values]
+                updates = list(zip(values, keys))
+        if updates is None:
+            updates = [
+                (value, row_key)
+                for row_key, value in evaluate_rows(
+                    (dict(zip(names, row)) for row in rows),
+                    key,
+                    expression,
+                    expression_function,
+                    condition,
+                    condition_function,
+                    ensure_lowercase,
+                    null_workaround=False,
+                )
+            ]
+
+        if updates:
+            cursor.executemany(update_sql, updates)
+        updated += len(updates)
+        processed += len(rows)
+        gs.percent(processed, num_rows, 1)
+
+    connection.commit()
+    cursor.close()
+    return updated
+
+
 def csv_loads(text, delimeter, quotechar='"', null=None):
     """Load CSV from a string
 
@@ -253,6 +463,7 @@ def main():
     table = db_info["table"]
     database = db_info["database"]
     driver = db_info["driver"]
+    key = db_info["key"]
     columns = gs.vector_columns(vector, layer)
 
     # Check that column exists
@@ -298,6 +509,49 @@ def main():
     if not where:
         # The condition needs to be None, an empty string is passed through.
         where = None
+
+    if flags["v"]:
+        if driver not in ("sqlite", "pg"):
+            gs.fatal(
+                _(
+                    "Evaluation in chunks (-v) is supported only for the sqlite"
+                    " and pg drivers, not <{driver}>"
+                ).format(driver=driver)
+            )
+        chunk_size = int(options["chunk_size"])
+        if chunk_size < 1:
+            gs.fatal(_("Option chunk_size must be a positive number"))
+        link = Link(
+            layer=int(layer),
+            name=table,
+            table=table,
+            key=key,
+            database=database,
+            driver=driver,
+        )
+        connection = link.connection()
+        updated = update_in_chunks(
+            connection=connection,
+            placeholder="?" if driver == "sqlite" else "%s",
+            table=table,
+            key=key,
+            where=where,
+            column=column,
+            columns=columns,
+            chunk_size=chunk_size,
+            expression=expression,
+            expression_function=expression_function,
+            condition=condition,
+            condition_function=condition_function,
+            ensure_lowercase=not flags["u"],
+        )
+        connection.close()
+        if not updated:
+            gs.message(
+                "No rows to update. Try a different SQL where or Python condition."
+            )
+        gs.vector_history(vector)
+        return
     if gs.version()["version"] < "7.9":
         sep = "|"  # Only one char sep for Python csv package.
         null = "NULL"
@@ -0,0 +1,85 @@
+"""Benchmarking of the import methods of v.in.osm
+
+Compares the three-step ogr method (v.in.ogr, v.split, v.build.polylines)
+with the stream method on the lines layer of a sample OSM PBF file given
+as argument, e.g. an extract from https://download.geofabrik.de, and
+checks that both methods create the same numbers of lines and nodes:
+
+python benchmark_v_in_osm.py liechtenstein-latest.osm.pbf
+
+Run it in a location in WGS84 (EPSG:4326).
+"""
+
+import sys
+
+from grass.pygrass.modules import Module
+
+import grass.benchmark as bm
+import grass.script as gs
+
+OUTPUT = "benchmark_v_in_osm"
+LAYER = "lines"
+COLUMNS = ["osm_id", "name", "highway", "maxspeed", "surface"]
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python benchmark_v_in_osm.py <file.osm.pbf>")
+    pbf = sys.argv[1]
+
+    times = {}
+    lines = {}
+    nodes = {}
+    for method in ("ogr", "stream"):
+        times[method] = benchmark(pbf, method)
+        topology = gs.vector_info_topo("{}_{}".format(OUTPUT, method))
+        lines[method] = topology["lines"]
+        nodes[method] = topology["nodes"]
+    # stream method with filtered tag-to-column mapping
+    times["stream columns"] = benchmark(pbf, "stream", columns=COLUMNS)
+
+    print("method          time [s]  lines")
+    for method in times:
+        print(
+            "{:14s}  {:8.2f}  {}".format(
+                method, times[method], lines.get(method, lines["stream"])
+            )
+        )
+
+    gs.run_command(
+        "g.remove",
+        type="vector",
+        name=["{}_{}".format(OUTPUT, method) for method in ("ogr", "stream")],
+        flags="f",
+    )
+    for name, counts in (("lines", lines), ("nodes", nodes)):
+        if counts["ogr"] != counts["stream"]:
+            sys.exit(
+                "Numbers of {} differ: ogr {}, stream {}".format(
+                    name, counts["ogr"], counts["stream"]
+                )
+            )
+
+
+def benchmark(pbf, method, columns=None, repeat=3):
+    module = Module(
+        "v.in.osm",
+        input=pbf,
+        table=LAYER,
+        type="line",
+        output="{}_{}".format(OUTPUT, method),
+        method=method,
+        columns=columns,
+        run_=False,
+        stdout_=None,
+        stderr_=None,
+        overwrite=True,
+    )
+    result = bm.benchmark_single(
+        module, label="{} {}".format(method, columns or ""), repeat=repeat
+    )
+    return result.time
+
+
+if __name__ == "__main__":
+    main()
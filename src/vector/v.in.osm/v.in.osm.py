@@ -42,6 +42,23 @@ This program is free software under the GNU General Public License
 # %option G_OPT_DB_TABLE
 # %end
 
+# %option
+# % key: method
+# % type: string
+# % label: Import method
+# % options: ogr,stream
+# % descriptions: ogr;Import with v.in.ogr, split lines to segments and build polylines from them;stream;Read features with GDAL and write them directly, lines split at vertices shared with other lines found by a first reading (point and line layers)
+# % answer: ogr
+# %end
+
+# %option
+# % key: columns
+# % type: string
+# % label: OSM tags to import as attribute columns (stream method only)
+# % description: Fields of the layer or keys of its other_tags (default: all fields of the layer)
+# % multiple: yes
+# %end
+
 # %flag
 # % key: o
 # % label: Override projection check (use current location's projection)
@@ -54,12 +71,88 @@ This program is free software under the GNU General Public License
 # %end
 
 import os
+import re
 import sys
 import atexit
+from array import array
+from ctypes import c_double
 from grass.script.utils import try_rmdir
 import grass.script as grass
 from grass.exceptions import CalledModuleError
 
+# number of attribute rows inserted at once by the stream method
+CHUNK_SIZE = 10000
+
+# number of temporary files the keys of vertices of lines are distributed
+# to by the stream method, the keys of one file are sorted at a time
+VERTEX_PARTITIONS = 256
+
+# number of keys of vertices collected before writing them to these files
+VERTEX_BUFFER = 1 << 20
+
+# key/value pairs of hstore strings such as other_tags of the OSM driver
+HSTORE_PAIR = re.compile(r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"')
+HSTORE_ESCAPE = re.compile(r"\\(.)")
+
+
+def parse_tags(other_tags):
+    """Parse hstore string of tags into dictionary
+
+    >>> parse_tags('"surface"=>"asphalt","lanes"=>"2"')
+    {'surface': 'asphalt', 'lanes': '2'}
+    """
+    if not other_tags:
+        return {}
+    return {
+        HSTORE_ESCAPE.sub(r"\1", key): HSTORE_ESCAPE.sub(r"\1", value)
+        for key, value in HSTORE_PAIR.findall(other_tags)
+    }
+
+
+def vertex_key(point):
+    """Return 64-bit key of the coordinates of a vertex"""
+    return hash((point[0], point[1]))
+
+
+def split_line(coordinates, shared):
+    """Split line at its inner vertices whose keys are in the sorted array
+    shared
+
+    >>> import numpy as np
+    >>> shared = np.array([vertex_key((1, 0))], dtype=np.int64)
+    >>> split_line([(0, 0), (1, 0), (2, 0), (3, 0)], shared)
+    [[(0, 0), (1, 0)], [(1, 0), (2, 0), (3, 0)]]
+    """
+    import numpy as np
+
+    if len(coordinates) < 3 or not shared.size:
+        return [coordinates]
+    keys = np.fromiter(
+        (vertex_key(point) for point in coordinates[1:-1]),
+        dtype=np.int64,
+        count=len(coordinates) - 2,
+    )
+    found = np.minimum(np.searchsorted(shared, keys), shared.size - 1)
+    lines = []
+    start = 0
+    for index in np.flatnonzero(shared[found] == keys).tolist():
+        lines.append(coordinates[start : index + 2])
+        start = index + 1
+    lines.append(coordinates[start:])
+    return lines
+
+
+def column_name(tag):
+    """Make legal column name from tag
+
+    >>> column_name("addr:street")
+    'addr_street'
+    """
+    name = re.sub(r"\W", "_", tag.lower())
+    if not name or name[0].isdigit():
+        name = "t_" + name
+    return name
+
 
 class OsmImporter:
     def __init__(self):
@@ -90,6 +183,318 @@ class OsmImporter:
 
         return self._getTmpName(name)
 
+    def _checkProjection(self, srs, osr):
+        """Check that projection of layer is the same as of location"""
+        if srs is None:
+            return
+        try:
+            wkt = grass.read_command("g.proj", flags="w", quiet=True)
+        except CalledModuleError:
+            return
+        location = osr.SpatialReference()
+        try:
+            location.ImportFromWkt(wkt)
+        except RuntimeError:
+            return
+        if not srs.IsSame(location):
+            grass.fatal(
+                _(
+                    "Projection of dataset does not appear to match current "
+                    "location, use the -o flag to override the projection check"
+                )
+            )
+
+    def _readFeatures(self, dataset, layer):
+        """Read features of layer
+
+        OSM files are read interleaved, features of other layers are skipped.
+
+        @return generator of (feature, read fraction of the data source)
+        """
+        if dataset.GetDriver().ShortName == "OSM":
+            name = layer.GetName()
+            dataset.ResetReading()
+            while True:
+                feature, feature_layer, fraction = dataset.GetNextFeature(
+                    include_layer=True, include_pct=True
+                )
+                if feature is None:
+                    return
+                if feature_layer.GetName() == name:
+                    yield feature, fraction
+        else:
+            layer.ResetReading()
+            count = max(layer.GetFeatureCount(), 1)
+            for index, feature in enumerate(layer):
+                yield feature, index / count
+
+    def _geometries(self, dataset, layer, vector_types, ogr):
+        """Read geometries of features of the imported types
+
+        @return generator of (feature, vector type, list of parts), feature
+        is None for features of other types
+        """
+        percent = -1
+        for feature, fraction in self._readFeatures(dataset, layer):
+            if int(fraction * 100) != percent:
+                percent = int(fraction * 100)
+                grass.percent(percent, 100, 1)
+
+            geometry = feature.GetGeometryRef()
+            geometry_type = None
+            if geometry is not None:
+                geometry_type = ogr.GT_Flatten(geometry.GetGeometryType())
+            if geometry_type not in vector_types:
+                yield None, None, []
+                continue
+
+            if geometry_type in (ogr.wkbPoint, ogr.wkbLineString):
+                parts = [geometry.GetPoints()]
+            else:
+                parts = [
+                    geometry.GetGeometryRef(index).GetPoints()
+                    for index in range(geometry.GetGeometryCount())
+                ]
+            yield feature, vector_types[geometry_type], [part for part in parts if part]
+        grass.percent(1, 1, 1)
+
+    def _sharedVertices(self, dataset, layer, vector_types, ogr, libvect):
+        """Find vertices of lines which are used more than once
+
+        The ogr method creates nodes at these vertices (v.split and
+        v.build.polylines), so lines are split at them. While reading,
+        64-bit keys of the coordinates are distributed to VERTEX_PARTITIONS
+        temporary files, which are then sorted one at a time to find
+        duplicate keys.
+
+        @return sorted array of keys of shared vertices
+        """
+        import numpy as np
+
+        tempdir = grass.tempdir()
+        paths = [os.path.join(tempdir, "%d" % i) for i in range(VERTEX_PARTITIONS)]
+
+        def write_keys(keys):
+            """Append keys to the files of their partitions"""
+            keys = np.frombuffer(keys.tobytes(), dtype=np.int64)
+            partitions = keys % VERTEX_PARTITIONS
+            order = np.argsort(partitions, kind="stable")
+            keys = keys[order]
+            bounds = np.searchsorted(
+                partitions[order], np.arange(VERTEX_PARTITIONS + 1)
+            )
+            for index in np.flatnonzero(np.diff(bounds)).tolist():
+                with open(paths[index], "ab") as partition:
+                    keys[bounds[index] : bounds[index + 1]].tofile(partition)
+
+        try:
+            keys = array("q")
+            for feature, vector_type, parts in self._geometries(
+                dataset, layer, vector_types, ogr
+            ):
+                if vector_type != libvect.GV_LINE:
+                    continue
+                for part in parts:
+                    keys.extend(vertex_key(point) for point in part)
+                if len(keys) >= VERTEX_BUFFER:
+                    write_keys(keys)
+                    keys = array("q")
+            write_keys(keys)
+            del keys
+
+            shared = [np.empty(0, dtype=np.int64)]
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                keys = np.sort(np.fromfile(path, dtype=np.int64))
+                os.remove(path)
+                shared.append(np.unique(keys[1:][keys[1:] == keys[:-1]]))
+        finally:
+            try_rmdir(tempdir)
+
+        return np.sort(np.concatenate(shared))
+
+    def streamImport(self, options, flags):
+        """Import point or line layer without intermediate vector maps
+
+        Features are read with GDAL and their points and lines written
+        directly into the output vector map. Lines are split at vertices
+        shared with other lines found by a first reading of the geometries.
+        Attributes are inserted in chunks of CHUNK_SIZE rows.
+
+        @return False if the layer is not a point or line layer
+        """
+        try:
+            from osgeo import gdal, ogr, osr
+        except ImportError:
+            grass.fatal(_("GDAL Python bindings are required for method <stream>"))
+
+        import grass.lib.vector as libvect
+        from grass.pygrass.vector import VectorTopo
+
+        gdal.UseExceptions()
+        try:
+            dataset = gdal.OpenEx(options["input"], gdal.OF_VECTOR)
+        except RuntimeError as error:
+            grass.fatal(
+                _("Unable to open data source <%s>: %s") % (options["input"], error)
+            )
+        layer = dataset.GetLayerByName(options["table"])
+        if layer is None:
+            grass.fatal(_("Layer <%s> not found") % options["table"])
+
+        vector_types = {
+            ogr.wkbPoint: libvect.GV_POINT,
+            ogr.wkbMultiPoint: libvect.GV_POINT,
+            ogr.wkbLineString: libvect.GV_LINE,
+            ogr.wkbMultiLineString: libvect.GV_LINE,
+        }
+        layer_type = ogr.GT_Flatten(layer.GetGeomType())
+        if layer_type not in vector_types and layer_type != ogr.wkbUnknown:
+            grass.warning(
+                _("Method <stream> supports only point and line layers, using <ogr>")
+            )
+            return False
+
+        types = options["type"].split(",")
+        vector_types = {
+            geometry_type: vector_type
+            for geometry_type, vector_type in vector_types.items()
+            if (vector_type == libvect.GV_POINT and "point" in types)
+            or (vector_type == libvect.GV_LINE and "line" in types)
+        }
+
+        if not flags["o"]:
+            self._checkProjection(layer.GetSpatialRef(), osr)
+
+        # map tags to columns, tags which are not fields are read from other_tags
+        definition = layer.GetLayerDefn()
+        fields = {}
+        for index in range(definition.GetFieldCount()):
+            field = definition.GetFieldDefn(index)
+            fields[field.GetName()] = (index, field.GetType())
+
+        if options["columns"]:
+            tags = options["columns"].split(",")
+            if "osm_id" in fields and "osm_id" not in tags:
+                tags.insert(0, "osm_id")
+        else:
+            tags = list(fields)
+
+        sql_types = {
+            ogr.OFTInteger: "INTEGER",
+            ogr.OFTInteger64: "INTEGER",
+            ogr.OFTReal: "DOUBLE PRECISION",
+        }
+        columns = [("cat", "INTEGER PRIMARY KEY")]
+        mapping = []
+        for tag in tags:
+            name = column_name(tag)
+            if name in [column[0] for column in columns]:
+                grass.warning(
+                    _("Duplicate column <%s> for tag <%s> skipped") % (name, tag)
+                )
+                continue
+            if tag in fields:
+                index, field_type = fields[tag]
+                columns.append((name, sql_types.get(field_type, "TEXT")))
+                mapping.append((index, tag))
+            else:
+                columns.append((name, "TEXT"))
+                mapping.append((None, tag))
+
+        other_tags = fields.get("other_tags", (None,))[0]
+        used = set(tag for index, tag in mapping if index is not None)
+        if other_tags is not None and any(index is None for index, tag in mapping):
+            used.add("other_tags")
+        # fields of the attribute filter are needed to evaluate it
+        filtered = set()
+        if options["where"]:
+            layer.SetAttributeFilter(options["where"])
+            filtered = set(
+                name
+                for name in fields
+                if re.search(r"\b{}\b".format(re.escape(name)), options["where"])
+            )
+
+        shared = None
+        if libvect.GV_LINE in vector_types.values():
+            grass.message(_("Finding vertices shared by lines..."))
+            layer.SetIgnoredFields([name for name in fields if name not in filtered])
+            shared = self._sharedVertices(dataset, layer, vector_types, ogr, libvect)
+
+        # skip parsing of fields which are not imported
+        layer.SetIgnoredFields(
+            [name for name in fields if name not in used and name not in filtered]
+        )
+
+        output = VectorTopo(options["output"])
+        output.open("w", tab_cols=columns, overwrite=grass.overwrite())
+        insert = output.table.columns.insert_str
+        cursor = output.table.conn.cursor()
+
+        points = libvect.Vect_new_line_struct()
+        cats = libvect.Vect_new_cats_struct()
+        rows = []
+        cat = 0
+        skipped = 0
+        grass.message(_("Importing features of layer <%s>...") % options["table"])
+        for feature, vector_type, parts in self._geometries(
+            dataset, layer, vector_types, ogr
+        ):
+            if feature is None:
+                skipped += 1
+                continue
+
+            cat += 1
+            libvect.Vect_reset_cats(cats)
+            libvect.Vect_cat_set(cats, 1, cat)
+            if vector_type == libvect.GV_LINE and shared is not None and shared.size:
+                parts = [line for part in parts for line in split_line(part, shared)]
+            for coordinates in parts:
+                count = len(coordinates)
+                x = (c_double * count)(*[point[0] for point in coordinates])
+                y = (c_double * count)(*[point[1] for point in coordinates])
+                libvect.Vect_copy_xyz_to_pnts(points, x, y, None, count)
+                if (
+                    libvect.Vect_write_line(output.c_mapinfo, vector_type, points, cats)
+                    < 0
+                ):
+                    grass.fatal(_("Unable to write feature %d") % cat)
+
+            tag_values = None
+            row = [cat]
+            for index, tag in mapping:
+                if index is not None:
+                    row.append(feature.GetField(index))
+                    continue
+                if tag_values is None:
+                    tag_values = {}
+                    if other_tags is not None:
+                        tag_values = parse_tags(feature.GetField(other_tags))
+                row.append(tag_values.get(tag))
+            rows.append(row)
+
+            if len(rows) >= CHUNK_SIZE:
+                cursor.executemany(insert, rows)
+                output.table.conn.commit()
+                rows = []
+
+        cursor.executemany(insert, rows)
+        output.table.conn.commit()
+        cursor.close()
+
+        libvect.Vect_destroy_line_struct(points)
+        libvect.Vect_destroy_cats_struct(cats)
+        grass.message(_("Building topology..."))
+        output.close()
+
+        grass.message(
+            _("%d features imported, %d features of other types skipped")
+            % (cat, skipped)
+        )
+        return True
+
     def main(self, options, flags):
 
         # just get the layer names
@@ -107,6 +512,12 @@ class OsmImporter:
             if not options["output"]:
                 grass.fatal(_("Required parameter <%s> not set") % "output")
 
+        if options["method"] == "stream":
+            if self.streamImport(options, flags):
+                return
+        elif options["columns"]:
+            grass.warning(_("Option <columns> is used only by method <stream>"))
+
         # process
         try:
             # http://gdal.org/drv_osm.html
@@ -0,0 +1,228 @@
+"""
+Name:      test_wfs_download
+Purpose:   Tests paged and tiled download of v.in.wfs2 against a mock
+           WFS server
+
+Author:    GRASS Development Team
+Copyright: (C) 2024 by GRASS Development Team
+Licence:   This program is free software under the GNU General Public
+           License (>=v2). Read the file COPYING that comes with GRASS
+           for details.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from grass.gunittest.case import TestCase
+from grass.gunittest.main import test
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wfs_download import (  # noqa: E402
+    WFSError,
+    download,
+    feature_ids,
+    number_matched,
+    page_urls,
+    short_pages,
+    tile_bboxes,
+    unique_features,
+)
+
+# point features (id, x, y), points with x or y 2 are on borders of 2 x 2 tiles
+POINTS = [(i, float(i % 5), float(i // 5)) for i in range(25)] + [(100, 2.5, 2.5)]
+
+COLLECTION = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+    'xmlns:gml="http://www.opengis.net/gml/3.2" '
+    'xmlns:test="http://example.org/test" {attributes}>{members}'
+    "</wfs:FeatureCollection>"
+)
+MEMBER = (
+    '<wfs:member><test:points gml:id="points.{id}">'
+    "<test:geom><gml:Point><gml:pos>{x} {y}</gml:pos></gml:Point></test:geom>"
+    "</test:points></wfs:member>"
+)
+EXCEPTION = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1">'
+    "<ows:Exception>Unknown layer</ows:Exception></ows:ExceptionReport>"
+)
+
+
+class MockWFS(BaseHTTPRequestHandler):
+    """GetFeature with RESULTTYPE, STARTINDEX, COUNT and BBOX parameters"""
+
+    hits = True
+    # maximum number of features per response, None for no limit
+    max_count = None
+
+    def do_GET(self):
+        params = {
+            key.upper(): value[0]
+            for key, value in parse_qs(urlparse(self.path).query).items()
+        }
+        if params.get("TYPENAMES") != "points":
+            return self.respond(EXCEPTION)
+        points = POINTS
+        if "BBOX" in params:
+            minx, miny, maxx, maxy = [float(i) for i in params["BBOX"].split(",")]
+            points = [
+                point
+                for point in points
+                if minx <= point[1] <= maxx and miny <= point[2] <= maxy
+            ]
+        if params.get("RESULTTYPE") == "hits":
+            matched = len(points) if self.hits else "unknown"
+            return self.respond(
+                COLLECTION.format(attributes='numberMatched="%s"' % matched, members="")
+            )
+        start = int(params.get("STARTINDEX", 0))
+        count = int(params.get("COUNT", len(points)))
+        if self.max_count:
+            count = min(count, self.max_count)
+        members = "".join(
+            MEMBER.format(id=id_, x=x, y=y) for id_, x, y in points[start:][:count]
+        )
+        self.respond(COLLECTION.format(attributes="", members=members))
+
+    def respond(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWFSDownload(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), MockWFS)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:%d/wfs?SERVICE=WFS&REQUEST=GetFeature" % (
+            cls.server.server_address[1]
+        )
+        cls.tempdir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        for name in os.listdir(cls.tempdir):
+            os.remove(os.path.join(cls.tempdir, name))
+        os.rmdir(cls.tempdir)
+
+    def setUp(self):
+        MockWFS.hits = True
+        MockWFS.max_count = None
+
+    def temp(self):
+        handle, path = tempfile.mkstemp(dir=self.tempdir)
+        os.close(handle)
+        return path
+
+    def test_number_matched(self):
+        """Number of features is read from hits, None if unknown"""
+        url = self.url + "&TYPENAMES=points"
+        self.assertEqual(number_matched(url), len(POINTS))
+        MockWFS.hits = False
+        self.assertIsNone(number_matched(url))
+
+    def test_pages(self):
+        """Pages downloaded concurrently contain all features once"""
+        url = self.url + "&TYPENAMES=points"
+        ids = []
+        pages = download(page_urls(url, 4, len(POINTS)), self.temp, nprocs=3)
+        indices = []
+        for index, path in pages:
+            indices.append(index)
+            ids.extend(feature_ids(path))
+        self.assertEqual(sorted(indices), list(range(7)))
+        self.assertEqual(
+            sorted(ids), sorted("points.%d" % point[0] for point in POINTS)
+        )
+
+    def test_pages_unknown_total(self):
+        """Paging stops after a short page if the total is unknown"""
+        url = self.url + "&TYPENAMES=points"
+        last_page = []
+        requested = []
+
+        def requests():
+            for index, page_url in page_urls(url, 10):
+                if last_page and index > last_page[0]:
+                    return
+                requested.append(index)
+                yield index, page_url
+
+        ids = []
+        for index, path in download(requests(), self.temp, nprocs=2):
+            page = feature_ids(path)
+            if len(page) < 10 and not last_page:
+                last_page.append(index)
+            ids.extend(page)
+        self.assertEqual(len(ids), len(POINTS))
+        # the last page is 2, at most one more was running concurrently
+        self.assertLessEqual(max(requested), 3)
+
+    def test_short_pages(self):
+        """Pages cut by a limit of the server are found, the last is not"""
+        url = self.url + "&TYPENAMES=points"
+        requests = list(page_urls(url, 4, len(POINTS)))
+
+        def counts():
+            return {
+                index: len(feature_ids(path))
+                for index, path in download(requests, self.temp, nprocs=3)
+            }
+
+        self.assertEqual(short_pages(counts(), 4, len(POINTS)), [])
+        MockWFS.max_count = 3
+        self.assertEqual(short_pages(counts(), 4, len(POINTS)), list(range(6)))
+
+    def test_tiles(self):
+        """Features in several tiles are kept only once"""
+        bbox = {"minx": 0.0, "miny": 0.0, "maxx": 4.0, "maxy": 4.0}
+        tiles = tile_bboxes(bbox, 2)
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(tiles[-1]["maxx"], 4.0)
+        self.assertEqual(tiles[-1]["maxy"], 4.0)
+
+        url = self.url + "&TYPENAMES=points"
+        requests = [
+            (
+                index,
+                url
+                + "&BBOX=%s,%s,%s,%s" % (t["minx"], t["miny"], t["maxx"], t["maxy"]),
+            )
+            for index, t in enumerate(tiles)
+        ]
+        seen_ids = set()
+        count = 0
+        ids = []
+        for index, path in download(requests, self.temp, nprocs=4):
+            count += unique_features(path, seen_ids)
+            ids.extend(feature_ids(path))
+        self.assertEqual(count, len(POINTS))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), len(POINTS))
+
+    def test_exception(self):
+        """Exception report of server raises WFSError"""
+        url = self.url + "&TYPENAMES=unknown"
+        for index, path in download([(0, url)], self.temp):
+            self.assertRaises(WFSError, feature_ids, path)
+
+
+if __name__ == "__main__":
+    test()
@@ -64,7 +64,7 @@ This program is free software under the GNU General Public License
 # % key: wfs_version
 # % type:string
 # % description:WFS standard
-# % options:1.1.0, 1.0.0
+# % options:2.0.0, 1.1.0, 1.0.0
 # % answer:1.1.0
 # % guisection: Request properties
 # %end
@@ -77,6 +77,30 @@ This program is free software under the GNU General Public License
 # % guisection: Request properties
 # %end
 
+# %option
+# % key: page_size
+# % type: integer
+# % label: Number of features requested at once
+# % description: Features are downloaded in pages of this size (only with GRASS driver and WFS 2.0.0)
+# % guisection: Request properties
+# %end
+
+# %option
+# % key: tiles
+# % type: integer
+# % label: Number of tiles per side of the requested bounding box
+# % description: Features are downloaded in tiles x tiles requests (only with GRASS driver)
+# % guisection: Request properties
+# %end
+
+# %option
+# % key: nprocs
+# % type: integer
+# % answer: 1
+# % description: Number of concurrent requests for pages or tiles
+# % guisection: Request properties
+# %end
+
 # %option
 # % key: urlparams
 # % type:string
@@ -99,6 +123,11 @@ This program is free software under the GNU General Public License
 # % answer:WFS_GRASS
 # %end
 
+# %rules
+# % exclusive: page_size, tiles
+# % requires: tiles, -r
+# %end
+
 
 import os
 import sys
@@ -1,7 +1,10 @@
 import os
 from math import ceil
 
-from urllib2 import urlopen, HTTPError, URLError
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
 
 import grass.script as grass
 from grass.exceptions import CalledModuleError
@@ -59,6 +62,22 @@ class WFSBase:
         except ValueError:
             self.o_maximum_features = None
 
+        self.o_page_size = None
+        if options["page_size"]:
+            self.o_page_size = int(options["page_size"])
+            if self.o_page_size < 1:
+                grass.fatal(_("Invalid page size (must be >0)"))
+            if self.o_wfs_version != "2.0.0":
+                grass.fatal(_("Paging requires WFS version 2.0.0"))
+
+        self.o_tiles = None
+        if options["tiles"]:
+            self.o_tiles = int(options["tiles"])
+            if self.o_tiles < 1:
+                grass.fatal(_("Invalid number of tiles (must be >0)"))
+
+        self.o_nprocs = max(1, int(options["nprocs"] or 1))
+
         # read projection info
         self.proj_location = grass.read_command("g.proj", flags="jf").rstrip("\n")
 
@@ -99,10 +118,23 @@ class WFSBase:
         else:
             self.bbox = None
 
+        if self._paged():
+            self._downloadPages()
+            return
+
+        if self.o_page_size or self.o_tiles:
+            grass.warning(
+                _("Paging and tiling are supported only by GRASS driver, ignoring")
+            )
+
         self.temp_map = self._download()
 
         self._createOutputMap()
 
+    def _paged(self):
+        """!Whether the driver downloads the data in pages or tiles"""
+        return False
+
     def GetCapabilities(self, options):
         """!Get capabilities from WFS server"""
         # download capabilities file
@@ -128,7 +160,7 @@ class WFSBase:
         bbox = {}
 
         if self.proj_srs == self.proj_location:  # TODO: do it better
-            for bbox_item, region_item in bbox_region_items.iteritems():
+            for bbox_item, region_item in bbox_region_items.items():
                 bbox[bbox_item] = self.region[region_item]
 
         # if location projection and wfs query projection are
@@ -136,7 +168,7 @@ class WFSBase:
         # projection and then bbox is created from extreme coordinates
         # of the transformed points
         else:
-            for bbox_item, region_item in bbox_region_items.iteritems():
+            for bbox_item, region_item in bbox_region_items.items():
                 bbox[bbox_item] = None
 
             temp_region = self._temp()
@@ -177,7 +209,7 @@ class WFSBase:
                 grass.fatal(_("Region defintion: 4 points required"))
 
             for point in points:
-                point = map(float, point.split("|"))
+                point = [float(coor) for coor in point.split("|")]
                 if not bbox["maxy"]:
                     bbox["maxy"] = point[1]
                     bbox["miny"] = point[1]
@@ -211,8 +243,13 @@ class WFSBase:
         return bbox
 
     def _createOutputMap(self):
-        """!Import downloaded data into GRASS, reproject data if needed
-        using ogr2ogr
+        """!Import downloaded data into GRASS"""
+        grass.message(_("Importing vector map into GRASS..."))
+        self._importMap(self.temp_map, self.o_output)
+
+    def _importMap(self, temp_map, output):
+        """!Import downloaded data into GRASS vector map output, reproject
+        data if needed using ogr2ogr
         """
         # reprojection of downloaded data
         if self.proj_srs != self.proj_location:  # TODO: do it better
@@ -237,7 +274,7 @@ class WFSBase:
                     "-f",
                     "%s" % self.ogr_drv_format,
                     temp_warpmap,
-                    self.temp_map,
+                    temp_map,
                 ],
                 stdout=nuldev,
             )
@@ -250,9 +287,8 @@ class WFSBase:
                 grass.fatal(_("%s failed") % "ogr2ogr")
         # downloaded data projection is same as projection of location
         else:
-            temp_warpmap = self.temp_map
+            temp_warpmap = temp_map
 
-        grass.message(_("Importing vector map into GRASS..."))
         # importing temp_map into GRASS
         try:
             grass.run_command(
@@ -260,13 +296,13 @@ class WFSBase:
                 quiet=True,
                 overwrite=True,
                 input=temp_warpmap,
-                output=self.o_output,
+                output=output,
             )
         except CalledModuleError:
             grass.fatal(_("%s failed") % "v.in.ogr")
 
         grass.try_rmdir(temp_warpmap)
-        grass.try_remove(self.temp_map)
+        grass.try_remove(temp_map)
 
     def _flipBbox(self, bbox):
         """
@@ -0,0 +1,247 @@
+"""
+MODULE:    v.in.wfs2
+
+PURPOSE:   Paged and tiled concurrent download of WFS GetFeature responses
+
+COPYRIGHT: (C) 2012 Stepan Turek, and by the GRASS Development Team
+
+This program is free software under the GNU General Public License
+(>=v2). Read the file COPYING that comes with GRASS for details.
+
+This module does not depend on GRASS, so it can be tested against
+any (mock) WFS server.
+"""
+
+import shutil
+import xml.etree.ElementTree as etree
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+# size of the blocks in which responses are written to disk
+BLOCK_SIZE = 1024 * 1024
+
+EXCEPTION_TAGS = ("ExceptionReport", "ServiceExceptionReport")
+# elements containing the features of a feature collection
+MEMBER_TAGS = ("member", "featureMember", "featureMembers")
+
+
+class WFSError(Exception):
+    """Error reported by a WFS server"""
+
+
+def local_name(name):
+    """Return the name of a tag or attribute without namespace"""
+    return name.rsplit("}", 1)[-1]
+
+
+def open_url(url, timeout=None):
+    """Open url, with timeout in seconds if given"""
+    if timeout:
+        return urlopen(url, timeout=timeout)
+    return urlopen(url)
+
+
+def fetch(url, path, timeout=None):
+    """Stream the response of a request into a file
+
+    @return path of the file
+    """
+    response = open_url(url, timeout)
+    try:
+        with open(path, "wb") as output:
+            shutil.copyfileobj(response, output, BLOCK_SIZE)
+    finally:
+        response.close()
+    return path
+
+
+def check_exception(path, root):
+    """Raise WFSError if the response is an exception report"""
+    if local_name(root.tag) in EXCEPTION_TAGS:
+        with open(path) as report:
+            raise WFSError(report.read())
+
+
+def feature_id(feature):
+    """Return gml:id (GML 3) or fid (GML 2) of a feature or None"""
+    for name, value in feature.attrib.items():
+        if name == "fid" or local_name(name) == "id":
+            return value
+    return None
+
+
+def feature_ids(path):
+    """Read ids of the features in a GetFeature response file
+
+    The file is parsed incrementally, so memory use does not depend
+    on its size. Features without id have None as id.
+
+    @return list of feature ids
+    """
+    ids = []
+    parents = []
+    context = etree.iterparse(path, events=("start", "end"))
+    for event, element in context:
+        if event == "start":
+            if not parents:
+                check_exception(path, element)
+            elif len(parents) == 2 and local_name(parents[-1].tag) in MEMBER_TAGS:
+                ids.append(feature_id(element))
+            parents.append(element)
+        else:
+            parents.pop()
+            # free the parsed features
+            if len(parents) == 1:
+                parents[0].remove(element)
+    return ids
+
+
+def number_matched(url, timeout=None):
+    """Ask the server for the number of features matching a request
+
+    @return number of features or None if the server does not know it
+    """
+    response = open_url(url + "&RESULTTYPE=hits", timeout)
+    try:
+        root = etree.parse(response).getroot()
+    finally:
+        response.close()
+    if local_name(root.tag) in EXCEPTION_TAGS:
+        return None
+    for name in ("numberMatched", "numberOfFeatures"):
+        try:
+            return int(root.get(name))
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def remove_features(path, ids):
+    """Remove the features with the given ids from a GetFeature response"""
+    # keep the namespace prefixes of the file
+    for event, (prefix, uri) in etree.iterparse(path, events=("start-ns",)):
+        etree.register_namespace(prefix, uri)
+    tree = etree.parse(path)
+    root = tree.getroot()
+    for member in list(root):
+        if local_name(member.tag) not in MEMBER_TAGS:
+            continue
+        for feature in list(member):
+            if feature_id(feature) in ids:
+                member.remove(feature)
+        if not len(member):
+            root.remove(member)
+    tree.write(path, encoding="utf-8", xml_declaration=True)
+
+
+def unique_features(path, seen_ids):
+    """Remove features already seen in other responses from a response
+
+    Used for tiles of a bounding box, which contain the features crossing
+    tile borders more than once. Features without id are kept.
+
+    @return number of features left in the file
+    """
+    ids = feature_ids(path)
+    duplicates = set(id_ for id_ in ids if id_ is not None and id_ in seen_ids)
+    seen_ids.update(id_ for id_ in ids if id_ is not None)
+    if duplicates:
+        remove_features(path, duplicates)
+    return len(ids) - len([id_ for id_ in ids if id_ in duplicates])
+
+
+def page_urls(url, page_size, total=None):
+    """Generate WFS 2.0 requests for pages of features
+
+    Without total, pages are generated until the caller stops iterating.
+
+    @return iterator of (page index, url)
+    """
+    index = 0
+    while total is None or index * page_size < total:
+        count = page_size
+        if total is not None:
+            count = min(page_size, total - index * page_size)
+        yield index, url + "&STARTINDEX=%d&COUNT=%d" % (index * page_size, count)
+        index += 1
+
+
+def short_pages(counts, page_size, total):
+    """Find pages before the last one with less features than requested
+
+    Servers may return less features than requested, e.g. if they limit
+    the number of features per response. The remaining features of these
+    pages are not downloaded.
+
+    @param counts dictionary of page index: number of features
+    @param total number of features of all pages
+    @return sorted list of indices of short pages
+    """
+    last = (total - 1) // page_size
+    return sorted(
+        index for index, count in counts.items() if index < last and count < page_size
+    )
+
+
+def tile_bboxes(bbox, tiles):
+    """Split a bounding box into tiles x tiles tiles
+
+    @param bbox dictionary with minx, miny, maxx and maxy
+    @return list of bounding boxes
+    """
+    width = (bbox["maxx"] - bbox["minx"]) / float(tiles)
+    height = (bbox["maxy"] - bbox["miny"]) / float(tiles)
+    bboxes = []
+    for row in range(tiles):
+        for col in range(tiles):
+            bboxes.append(
+                {
+                    "minx": bbox["minx"] + col * width,
+                    "maxx": bbox["minx"] + (col + 1) * width,
+                    "miny": bbox["miny"] + row * height,
+                    "maxy": bbox["miny"] + (row + 1) * height,
+                }
+            )
+    # avoid rounding errors at the outer edges
+    for tile in bboxes[-tiles:]:
+        tile["maxy"] = bbox["maxy"]
+    for tile in bboxes[tiles - 1 :: tiles]:
+        tile["maxx"] = bbox["maxx"]
+    return bboxes
+
+
+def download(requests, temp, nprocs=1, timeout=None):
+    """Download requests concurrently into files
+
+    At most nprocs requests are running at a time. A new request is
+    taken from requests only after a finished one was passed to the
+    caller, so requests can be generated lazily and the caller can
+    stop them (e.g. after a page with less features than requested).
+
+    @param requests iterable of (index, url)
+    @param temp function returning a path of a new temporary file
+    @return generator of (index, path) in the order of completion
+    """
+    requests = iter(requests)
+    with ThreadPoolExecutor(max_workers=max(1, nprocs)) as pool:
+        running = {}
+
+        def submit():
+            for index, url in requests:
+                running[pool.submit(fetch, url, temp(), timeout)] = index
+                return True
+            return False
+
+        for i in range(max(1, nprocs)):
+            if not submit():
+                break
+        while running:
+            done = wait(running, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                index = running.pop(future)
+                yield index, future.result()
+                submit()
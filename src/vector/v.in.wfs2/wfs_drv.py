@@ -1,12 +1,67 @@
+import itertools
+import os
+
 import grass.script as grass
+from grass.exceptions import CalledModuleError
 
-from urllib2 import urlopen
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
 import xml.etree.ElementTree as etree
 
 from wfs_base import WFSBase
+from wfs_download import (
+    WFSError,
+    download,
+    feature_ids,
+    number_matched,
+    page_urls,
+    short_pages,
+    tile_bboxes,
+    unique_features,
+)
 
 
 class WFSDrv(WFSBase):
+    def _requestUrl(self):
+        """!Build GetFeature request without bounding box and feature limit"""
+        if self.o_wfs_version == "2.0.0":
+            typename = "TYPENAMES"
+        else:
+            typename = "TYPENAME"
+
+        url = self.o_url + (
+            "SERVICE=WFS&REQUEST=GetFeature&VERSION=%s&%s=%s"
+            % (self.o_wfs_version, typename, self.o_layers)
+        )
+
+        if self.o_urlparams != "":
+            url += "&" + self.o_urlparams
+
+        return url
+
+    def _bboxParam(self, bbox):
+        """!Build BBOX parameter of GetFeature request"""
+        if self.flip_coords:
+            # flip coordinates if projection is geographic (see:wfs_base.py _computeBbox)
+            query_bbox = dict(self._flipBbox(bbox))
+        else:
+            query_bbox = bbox
+
+        return "&BBOX=%s,%s,%s,%s" % (
+            query_bbox["minx"],
+            query_bbox["miny"],
+            query_bbox["maxx"],
+            query_bbox["maxy"],
+        )
+
+    def _maxFeaturesParam(self, maximum_features):
+        """!Build parameter limiting number of features"""
+        if self.o_wfs_version == "2.0.0":
+            return "&COUNT=" + str(maximum_features)
+        return "&MAXFEATURES=" + str(maximum_features)
+
     def _download(self):
         """!Downloads data from WFS server
 
@@ -14,32 +69,13 @@ class WFSDrv(WFSBase):
         """
         grass.message(_("Downloading data from WFS server..."))
 
-        proj = self.projection_name + "=EPSG:" + str(self.o_srs)
-
-        url = self.o_url + (
-            "SERVICE=WFS&REQUEST=GetFeature&VERSION=%s&TYPENAME=%s"
-            % (self.o_wfs_version, self.o_layers)
-        )
+        url = self._requestUrl()
 
         if self.bbox:
-            if self.flip_coords:
-                # flip coordinates if projection is geographic (see:wfs_base.py _computeBbox)
-                query_bbox = dict(self._flipBbox(self.bbox))
-            else:
-                query_bbox = self.bbox
-
-            url += "&BBOX=%s,%s,%s,%s" % (
-                query_bbox["minx"],
-                query_bbox["miny"],
-                query_bbox["maxx"],
-                query_bbox["maxy"],
-            )
+            url += self._bboxParam(self.bbox)
 
         if self.o_maximum_features:
-            url += "&MAXFEATURES=" + str(self.o_maximum_features)
-
-        if self.o_urlparams != "":
-            url += "&" + self.o_urlparams
+            url += self._maxFeaturesParam(self.o_maximum_features)
 
         grass.debug(url)
         try:
@@ -51,7 +87,7 @@ class WFSDrv(WFSBase):
 
         # download data into temporary file
         try:
-            temp_map_opened = open(temp_map, "w")
+            temp_map_opened = open(temp_map, "wb")
             temp_map_opened.write(wfs_data.read())
             temp_map_opened
         except IOError:
@@ -62,7 +98,7 @@ class WFSDrv(WFSBase):
         namespaces = ["http://www.opengis.net/ows", "http://www.opengis.net/ogc"]
 
         context = etree.iterparse(temp_map, events=["start"])
-        event, root = context.next()
+        event, root = next(context)
 
         for namesp in namespaces:
             if (
@@ -83,3 +119,167 @@ class WFSDrv(WFSBase):
                     grass.fatal(_("WFS server unknown error"))
 
         return temp_map
+
+    def _paged(self):
+        return bool(self.o_page_size or self.o_tiles)
+
+    def _pageRequests(self, last_page):
+        """!Requests for pages of features (WFS 2.0.0)
+
+        @param last_page list whose only item is index of the last page
+        with features (None if not known yet), pages behind it are not
+        requested if the server did not report the number of features
+
+        Sets self.features_matched to the number of features requested
+        in all pages, None if not known.
+
+        @return iterator of (index, url)
+        """
+        url = self._requestUrl()
+        if self.bbox:
+            url += self._bboxParam(self.bbox)
+
+        try:
+            total = number_matched(url)
+        except (IOError, etree.ParseError):
+            total = None
+        self._debug("_pageRequests", "number of features: %s" % total)
+
+        if self.o_maximum_features:
+            if total is None:
+                total = self.o_maximum_features
+            else:
+                total = min(total, self.o_maximum_features)
+        self.features_matched = total
+
+        requests = page_urls(url, self.o_page_size, total)
+        if total is not None:
+            return requests
+        return itertools.takewhile(
+            lambda request: last_page[0] is None or request[0] <= last_page[0],
+            requests,
+        )
+
+    def _tileRequests(self):
+        """!Requests for tiles of the bounding box
+
+        @return list of (index, url)
+        """
+        url = self._requestUrl()
+        if self.o_maximum_features:
+            url += self._maxFeaturesParam(self.o_maximum_features)
+
+        return [
+            (index, url + self._bboxParam(bbox))
+            for index, bbox in enumerate(tile_bboxes(self.bbox, self.o_tiles))
+        ]
+
+    def _downloadPages(self):
+        """!Download data in pages or tiles by concurrent requests and import
+        each of them as soon as it is downloaded
+        """
+        grass.message(_("Downloading data from WFS server..."))
+
+        last_page = [None]
+        if self.o_tiles:
+            requests = self._tileRequests()
+            # features crossing borders of tiles are in several tiles
+            seen_ids = set()
+        else:
+            requests = self._pageRequests(last_page)
+            seen_ids = None
+
+        # temporary maps of the parts, removed also if the import fails
+        maps = {}
+        counts = {}
+        try:
+            self._importPages(requests, seen_ids, last_page, maps, counts)
+
+            if seen_ids is None and self.features_matched is not None:
+                short = short_pages(counts, self.o_page_size, self.features_matched)
+                if short:
+                    grass.warning(
+                        _(
+                            "WFS server returned less than %d features for pages "
+                            "%s, their remaining features are missing. The server "
+                            "may limit the number of features per request, try a "
+                            "smaller page_size."
+                        )
+                        % (self.o_page_size, ", ".join(str(i) for i in short))
+                    )
+
+            if not maps:
+                grass.fatal(_("No features downloaded from WFS server"))
+
+            grass.message(_("Patching downloaded parts into output vector map..."))
+            names = [maps[index] for index in sorted(maps)]
+            try:
+                if len(names) == 1:
+                    grass.run_command(
+                        "g.rename",
+                        vector=(names[0], self.o_output),
+                        overwrite=True,
+                        quiet=True,
+                    )
+                    maps.clear()
+                else:
+                    grass.run_command(
+                        "v.patch",
+                        flags="e",
+                        input=names,
+                        output=self.o_output,
+                        overwrite=True,
+                        quiet=True,
+                    )
+            except CalledModuleError:
+                grass.fatal(_("Unable to create vector map <%s>") % self.o_output)
+        finally:
+            self._removeMaps(maps.values())
+
+    def _importPages(self, requests, seen_ids, last_page, maps, counts):
+        """!Download pages or tiles and import each of them into a
+        temporary map as soon as it is downloaded
+
+        @param maps dictionary to which the names of the temporary maps are
+        added by index before they are created
+        @param counts dictionary to which the number of features of each
+        page is added by index
+        """
+        try:
+            for index, temp_map in download(requests, self._temp, self.o_nprocs):
+                try:
+                    if seen_ids is None:
+                        count = len(feature_ids(temp_map))
+                    else:
+                        count = unique_features(temp_map, seen_ids)
+                except WFSError as error:
+                    grass.fatal(_("WFS server error: %s") % error)
+                except etree.ParseError:
+                    grass.fatal(_("Invalid response of WFS server"))
+
+                counts[index] = count
+                if seen_ids is None and count < self.o_page_size:
+                    if last_page[0] is None or index < last_page[0]:
+                        last_page[0] = index
+
+                self._debug("_downloadPages", "%d features in %d" % (count, index))
+                if not count:
+                    grass.try_remove(temp_map)
+                    continue
+
+                maps[index] = "tmp_wfs_%d_%d" % (os.getpid(), index)
+                self._importMap(temp_map, maps[index])
+        except IOError as error:
+            grass.fatal(_("Unable to fetch data from server: %s") % error)
+
+    def _removeMaps(self, names):
+        """!Remove temporary vector maps, ignoring maps not created"""
+        names = [
+            name
+            for name in names
+            if grass.find_file(name, element="vector", mapset=".")["file"]
+        ]
+        if names:
+            grass.run_command(
+                "g.remove", flags="f", type="vector", name=names, quiet=True
+            )
@@ -524,6 +524,78 @@ class TestBufferstats(TestCase):
         bufferstats.run()
         self.assertLooksLike(bufferstats.outputs.stdout, self.point_attrs)
 
+    def test_bulk(self):
+        """Test computing statistics for all geometries in one pass"""
+        self.runModule("g.region", vector=self.inpoint_tmp, align=self.inrast_cont_1)
+        bufferstats = SimpleModule(
+            "v.rast.bufferstats",
+            flags="b",
+            input=self.inpoint_tmp,
+            raster=[self.inrast_cont_1, self.inrast_cont_2],
+            buffers=[30, 50],
+            type="points",
+            column_prefix=["elev", "aspect"],
+            methods=["sum", "maximum", "minimum", "average"],
+            output="-",
+        )
+        bufferstats.run()
+        self.assertLooksLike(bufferstats.outputs.stdout, self.points_cont)
+
+    def test_bulk_areas(self):
+        """Test that the bulk mode writes the same attributes as the default mode"""
+        areas = "{}_bulk".format(self.inarea_tmp)
+        self.runModule(
+            "v.extract",
+            input=self.inarea,
+            output=areas,
+            cats=self.inarea_cats,
+            overwrite=True,
+        )
+        self.runModule("g.region", vector=areas, align=self.inrast_label)
+        self.assertModule(
+            "v.rast.bufferstats",
+            flags="tl",
+            input=areas,
+            raster=[self.inrast_label, self.inrast_no_label],
+            buffers=[30],
+            type="areas",
+            column_prefix=["lc", "basin"],
+        )
+        self.assertModule(
+            "v.rast.bufferstats",
+            flags="btl",
+            input=areas,
+            raster=[self.inrast_label, self.inrast_no_label],
+            buffers=[30],
+            type="areas",
+            column_prefix=["lc_bulk", "basin_bulk"],
+        )
+
+        table = gscript.vector_db_select(areas)
+        self.runModule("g.remove", flags="f", type="vector", name=areas)
+        columns = table["columns"]
+        bulk_columns = {}
+        for index, column in enumerate(columns):
+            for prefix in ("lc", "basin"):
+                if column.startswith(prefix + "_bulk_"):
+                    name = prefix + column[len(prefix) + 5 :]
+                    bulk_columns[columns.index(name)] = index
+        self.assertTrue(bulk_columns)
+        self.assertEqual(
+            len(bulk_columns),
+            len([c for c in columns if c.startswith(("lc_", "basin_"))]) // 2,
+        )
+
+        for cat, values in table["values"].items():
+            for index, bulk_index in bulk_columns.items():
+                value, bulk_value = values[index], values[bulk_index]
+                if value == "" or bulk_value == "":
+                    self.assertEqual(value, bulk_value, msg=columns[index])
+                else:
+                    self.assertAlmostEqual(
+                        float(value), float(bulk_value), places=6, msg=columns[index]
+                    )
+
     def test_lines(self):
         """Test buffering lines"""
         self.runModule("g.region", vector=self.inline_tmp, align=self.inrast_cont_1)
@@ -125,6 +125,12 @@ To Dos:
 # % description: Use labels for column names if possible
 # %end
 
+# %flag
+# % key: b
+# % label: Compute statistics for all geometries in one pass
+# % description: Raster maps are read into memory once and buffers are rasterized internally
+# %end
+
 # %option G_OPT_F_OUTPUT
 # % description: Name for output file (if "-" output to stdout)
 # % required: no
@@ -141,6 +147,7 @@ import os
 import atexit
 import math
 from subprocess import PIPE
+import numpy as np
 import grass.script as grass
 from grass.pygrass.vector import VectorTopo
 from grass.pygrass.raster.abstract import RasterAbstractBase
@@ -148,6 +155,8 @@ from grass.pygrass.raster import RasterRow
 from grass.pygrass.gis import Mapset
 from grass.pygrass.vector.geometry import Boundary
 from grass.pygrass.vector.geometry import Centroid
+from grass.pygrass.vector.geometry import Area
+from grass.pygrass.vector.basic import Bbox
 from grass.pygrass.gis.region import Region
 
 # from grass.pygrass.vector.table import *
@@ -288,6 +297,7 @@ def raster_type(raster, tabulate, use_label):
     if not r_map.has_cats() and r_map.mtype != "CELL":
         rmap_type = "double precision"
         rcats = []
+        r_map.close()
     else:
         rmap_type = "int"
         rcats = []
@@ -318,6 +328,301 @@ def raster_type(raster, tabulate, use_label):
     return rmap_type, valid_lab, rcats
 
 
+def read_raster(raster, region):
+    """Read a raster map in the current region into memory
+
+    :param raster: name of the raster map to read
+    :type raster: string
+    :param region: PyGRASS Region object of the current region
+    :type region: PyGRASS Region object
+    :returns: array with the raster values in their native type and
+              boolean array of NULL cells
+    :rtype: tuple
+    """
+    with RasterRow(raster) as r_map:
+        dtype = {"CELL": np.int32, "FCELL": np.float32}.get(r_map.mtype, np.float64)
+        values = np.empty((region.rows, region.cols), dtype=dtype)
+        for row in range(region.rows):
+            values[row, :] = r_map[row]
+
+    if values.dtype.kind == "i":
+        nulls = values == np.iinfo(np.int32).min
+    else:
+        nulls = np.isnan(values)
+
+    return values, nulls
+
+
+def polygon_cells(coords, region):
+    """Get the cells of the region with their centre inside a polygon
+
+    Cells are selected the same way as v.to.rast selects cells for areas,
+    by scanning the polygon row by row.
+
+    :param coords: coordinates of the polygon boundary
+    :type coords: list of tuples
+    :param region: PyGRASS Region object with the grid of the cells
+    :type region: PyGRASS Region object
+    :returns: row and column offset of the bounding box of the polygon
+              in the region and boolean array of the cells within the
+              polygon, or None if the polygon does not overlap the region
+    :rtype: tuple
+    """
+    xy = np.asarray(coords, dtype=np.float64)[:, :2]
+    if not np.array_equal(xy[0], xy[-1]):
+        xy = np.vstack((xy, xy[:1]))
+
+    row_0 = max(int(math.floor((region.north - xy[:, 1].max()) / region.nsres)), 0)
+    row_1 = min(
+        int(math.ceil((region.north - xy[:, 1].min()) / region.nsres)), region.rows
+    )
+    col_0 = max(int(math.floor((xy[:, 0].min() - region.west) / region.ewres)), 0)
+    col_1 = min(
+        int(math.ceil((xy[:, 0].max() - region.west) / region.ewres)), region.cols
+    )
+    if row_0 >= row_1 or col_0 >= col_1:
+        return None
+
+    x_0, y_0 = xy[:-1, 0], xy[:-1, 1]
+    x_1, y_1 = xy[1:, 0], xy[1:, 1]
+    y_c = region.north - (np.arange(row_0, row_1) + 0.5) * region.nsres
+    x_c = region.west + (np.arange(col_0, col_1) + 0.5) * region.ewres
+
+    cells = np.zeros((y_c.size, x_c.size), dtype=bool)
+    for row, y in enumerate(y_c):
+        # Edges crossing the row centre and their intersections with it
+        crossing = (y_0 > y) != (y_1 > y)
+        if not crossing.any():
+            continue
+        x_cross = np.sort(
+            x_0[crossing]
+            + (y - y_0[crossing])
+            * (x_1[crossing] - x_0[crossing])
+            / (y_1[crossing] - y_0[crossing])
+        )
+        # A cell centre is inside if an odd number of edges are left of it
+        cells[row] = np.searchsorted(x_cross, x_c) % 2 == 1
+
+    return row_0, col_0, cells
+
+
+def zone_cells(geom, buf, region):
+    """Get the cells of the region within a buffer around a geometry
+
+    Without buffer distance, the cells within an area or the cells
+    containing the vertices of points and lines are selected.
+
+    :param geom: geometry to buffer
+    :type geom: PyGRASS geometry object
+    :param buf: buffer distance in map units
+    :type buf: float
+    :param region: PyGRASS Region object with the grid of the cells
+    :type region: PyGRASS Region object
+    :returns: row and column offset and boolean array of the cells within
+              the buffer, or None if the buffer does not overlap the region
+    :rtype: tuple
+    """
+    if buf > 0:
+        return polygon_cells(geom.buffer(buf)[0].to_list(), region)
+    if isinstance(geom, Area):
+        return polygon_cells(geom.boundary.to_list(), region)
+
+    xy = np.atleast_2d(
+        np.asarray(
+            geom.to_list() if hasattr(geom, "to_list") else geom.coords(),
+            dtype=np.float64,
+        )
+    )
+    rows = np.floor((region.north - xy[:, 1]) / region.nsres).astype(int)
+    cols = np.floor((xy[:, 0] - region.west) / region.ewres).astype(int)
+    inside = (rows >= 0) & (rows < region.rows) & (cols >= 0) & (cols < region.cols)
+    if not inside.any():
+        return None
+    rows, cols = rows[inside], cols[inside]
+
+    cells = np.zeros(
+        (rows.max() - rows.min() + 1, cols.max() - cols.min() + 1), dtype=bool
+    )
+    cells[rows - rows.min(), cols - cols.min()] = True
+
+    return rows.min(), cols.min(), cells
+
+
+def univar_stats(values, nulls, extended=False, percentile=None):
+    """Compute univariate statistics the same way as r.univar -g
+
+    :param values: raster values within a zone (without NULL cells)
+    :type values: numpy array
+    :param nulls: number of NULL cells within the zone
+    :type nulls: int
+    :param extended: compute quartiles and median
+    :type extended: bool
+    :param percentile: percentiles to compute
+    :type percentile: list of floats
+    :returns: statistics named like the keys of r.univar -g output
+    :rtype: dict
+    """
+    n = values.size
+    stats = {"n": n, "null_cells": nulls, "cells": n + nulls}
+    if n == 0:
+        return stats
+
+    d_values = values.astype(np.float64)
+    mean = d_values.mean()
+    variance = d_values.var()
+    stddev = math.sqrt(variance)
+    stats.update(
+        {
+            "min": values.min(),
+            "max": values.max(),
+            "range": values.max() - values.min(),
+            "mean": mean,
+            "mean_of_abs": np.abs(d_values).mean(),
+            "stddev": stddev,
+            "variance": variance,
+            "coeff_var": 100.0 * stddev / mean if mean != 0 else None,
+            "sum": values.sum(dtype=np.int64 if values.dtype.kind == "i" else None),
+        }
+    )
+
+    if extended or percentile:
+        values = np.sort(values)
+
+        def rank(perc):
+            return min(max(int(n * perc / 100.0 - 0.5), 0), n - 1)
+
+        stats["first_quartile"] = values[rank(25)]
+        if n % 2:
+            stats["median"] = values[(n - 1) // 2]
+        else:
+            stats["median"] = (float(values[n // 2 - 1]) + float(values[n // 2])) / 2.0
+        stats["third_quartile"] = values[rank(75)]
+        for perc in percentile or []:
+            stats["percentile_{}".format(int(perc) if perc.is_integer() else perc)] = (
+                values[rank(perc)]
+            )
+
+    return {
+        key: val.item() if isinstance(val, np.generic) else val
+        for key, val in stats.items()
+    }
+
+
+def category_stats(values, nulls, cell_area, percent=False):
+    """Tabulate the area of raster categories the same way as r.stats
+
+    :param values: raster values within a zone (without NULL cells)
+    :type values: numpy array
+    :param nulls: number of NULL cells within the zone
+    :type nulls: int
+    :param cell_area: area of a cell in square meters
+    :type cell_area: float
+    :param percent: return the percentage of area of the categories
+                    (excluding NULL cells) instead of the area
+    :type percent: bool
+    :returns: category and area tuples sorted by decreasing area, where
+              the category of NULL cells is None
+    :rtype: list
+    """
+    cats, counts = np.unique(values.astype(np.int64), return_counts=True)
+    tab = list(zip(cats.tolist(), counts.tolist()))
+    if percent:
+        tab = [(cat, 100.0 * count / values.size) for cat, count in tab]
+    else:
+        if nulls > 0:
+            tab.append((None, nulls))
+        tab = [(cat, count * cell_area) for cat, count in tab]
+
+    return sorted(tab, key=lambda t: t[1], reverse=True)
+
+
+def zonal_stats(
+    in_vect,
+    types,
+    buffers,
+    raster_maps,
+    region,
+    mask=None,
+    tabulate=False,
+    percent=False,
+    extended=False,
+    percentile=None,
+):
+    """Compute statistics of raster maps within buffers around all
+    geometries of a vector map
+
+    Raster maps are read into memory once, buffers are rasterized in memory
+    and statistics are computed from the cells within each buffer, so no
+    temporary maps are needed.
+
+    :param in_vect: open vector map with the geometries
+    :type in_vect: PyGRASS VectorTopo object
+    :param types: geometry types to compute statistics for
+    :type types: list of strings
+    :param buffers: buffer distances in map units
+    :type buffers: list
+    :param raster_maps: names of the raster maps
+    :type raster_maps: list of strings
+    :param region: PyGRASS Region object of the current region
+    :type region: PyGRASS Region object
+    :param mask: name of a raster map to use as MASK
+    :type mask: string
+    :param tabulate: tabulate area of categories instead of computing
+                     univariate statistics
+    :type tabulate: bool
+    :param percent: tabulate percentage of area of categories
+    :type percent: bool
+    :param extended: compute quartiles and median
+    :type extended: bool
+    :param percentile: percentiles to compute
+    :type percentile: list of floats
+    :returns: generator of category, buffer distance, index of the raster
+              map and statistics (see univar_stats and category_stats)
+    :rtype: generator
+    """
+    rasters = [read_raster(rmap, region) for rmap in raster_maps]
+    if mask:
+        # Cells outside the MASK are NULL in all raster maps
+        masked = read_raster(mask, region)[1]
+        for values, nulls in rasters:
+            nulls |= masked
+
+    cell_area = None
+    if tabulate and not percent:
+        meters = float(grass.parse_command("g.proj", flags="g").get("meters", 1))
+        cell_area = region.nsres * region.ewres * meters**2
+
+    geoms_n = sum(in_vect.number_of(geom_type) for geom_type in types)
+    n_geom = 1
+    for geom_type in types:
+        for geom in in_vect.viter(geom_type):
+            for buf in buffers:
+                zone = zone_cells(geom, buf, region)
+                for rm, (values, nulls) in enumerate(rasters):
+                    if zone is None:
+                        z_values = values[:0, 0]
+                        z_nulls = 0
+                    else:
+                        row, col, cells = zone
+                        window = (
+                            slice(row, row + cells.shape[0]),
+                            slice(col, col + cells.shape[1]),
+                        )
+                        z_null_cells = nulls[window][cells]
+                        z_values = values[window][cells][~z_null_cells]
+                        z_nulls = int(z_null_cells.sum())
+
+                    if tabulate:
+                        stats = category_stats(z_values, z_nulls, cell_area, percent)
+                    else:
+                        stats = univar_stats(z_values, z_nulls, extended, percentile)
+                    yield geom.cat, buf, rm, stats
+
+            # Give progress information
+            grass.percent(n_geom, geoms_n, 1)
+            n_geom = n_geom + 1
+
+
 def main():
     in_vector = options["input"].split("@")[0]
     if len(options["input"].split("@")) > 1:
@@ -330,7 +635,7 @@ def main():
     percentile = (
         None
         if options["percentile"] == ""
-        else map(float, options["percentile"].split(","))
+        else list(map(float, options["percentile"].split(",")))
     )
     column_prefix = tuple(options["column_prefix"].split(","))
     buffers = options["buffers"].split(",")
@@ -342,6 +647,7 @@ def main():
     percent = flags["p"]
     remove = flags["r"]
     use_label = flags["l"]
+    bulk = flags["b"]
 
     empty_buffer_warning = (
         "No data in raster map {} within buffer {} around geometry {}"
@@ -421,12 +727,14 @@ def main():
     # Generate list of required column names and types
     col_names = []
     valid_labels = []
+    raster_cats = []
     col_types = []
     for p in column_prefix:
         rmaptype, val_lab, rcats = raster_type(
             raster_maps[column_prefix.index(p)], tabulate, use_label
         )
         valid_labels.append(val_lab)
+        raster_cats.append(rcats)
 
         for b in buffers:
             b_str = str(b).replace(".", "_")
@@ -533,6 +841,7 @@ def main():
                 grass.warning(
                     "Column(s) {} already exist!".format(",".join(existing_cols))
                 )
+        known_cols = set(col_names)
         for e in existing_cols:
             idx = col_names.index(e)
             del col_names[idx]
@@ -559,14 +868,188 @@ def main():
     # Adjust region extent to buffer around geometry
     # reg = deepcopy(r)
 
-    # Create iterator for geometries of all selected types
-    geoms = chain()
-    geoms_n = 0
+    if bulk:
+        if grass.locn_is_latlong():
+            grass.fatal("The b-flag is not supported in latitude-longitude locations")
+
+        # Adjust region extent to the buffers around all geometries
+        bbox = in_vect.bbox()
+        dist = max(buffers)
+        r = align_current(
+            r,
+            Bbox(
+                north=bbox.north + dist,
+                south=bbox.south - dist,
+                east=bbox.east + dist,
+                west=bbox.west - dist,
+            ),
+        )
+        r.write()
+        r.set_raster_region()
+
+        labels = []
+        for rcats in raster_cats:
+            labels.append({})
+            for rcat in rcats:
+                if is_number(rcat[1]):
+                    labels[-1][int(float(rcat[1]))] = rcat[0]
+
+        results = {}
+        for cat, buf, rm, stats in zonal_stats(
+            in_vect,
+            types,
+            buffers,
+            raster_maps,
+            r,
+            mask="{}_MASK".format(tmp_map) if user_mask else None,
+            tabulate=tabulate,
+            percent=percent,
+            extended=bool(
+                set(methods).intersection(
+                    set(["first_quartile", "median", "third_quartile"])
+                )
+            ),
+            percentile=percentile,
+        ):
+            rmap = raster_maps[rm]
+            prefix = column_prefix[rm]
+            b_str = str(buf).replace(".", "_")
+
+            # Statistics as tuples of statistic name, text value,
+            # column name and column value
+            records = []
+            if tabulate:
+                if not stats:
+                    grass.warning(empty_buffer_warning.format(rmap, buf, cat))
+                    continue
+                non_null = [t for t in stats if t[0] is not None]
+                mode = non_null[0][0] if non_null else None
+                records.append(
+                    (
+                        "ncats",
+                        len(stats),
+                        "{}_{}_b{}".format(prefix, "ncats", b_str),
+                        len(stats),
+                    )
+                )
+                records.append(
+                    (
+                        "mode",
+                        "NULL" if mode is None else mode,
+                        "{}_{}_b{}".format(prefix, "mode", b_str),
+                        mode,
+                    )
+                )
+                for rcat, area in stats:
+                    if rcat is None:
+                        name = "no_data" if valid_labels[rm] else "null"
+                        col = "null"
+                    elif valid_labels[rm] and rcat in labels[rm]:
+                        name = labels[rm][rcat]
+                        col = name.replace(" ", "_")
+                    else:
+                        name = col = rcat
+                    records.append(
+                        (
+                            "area {}".format(name),
+                            "{:.2f}%".format(area) if percent else "{:f}".format(area),
+                            "{}_{}_b{}".format(prefix, col, b_str),
+                            area,
+                        )
+                    )
+                if not percent:
+                    area_tot = sum(area for rcat, area in non_null) if non_null else 0
+                    records.append(
+                        (
+                            "area total",
+                            area_tot,
+                            "{}_{}_b{}".format(prefix, "area_tot", b_str),
+                            area_tot,
+                        )
+                    )
+            else:
+                if stats["n"] == 0:
+                    grass.warning(empty_buffer_warning.format(rmap, buf, cat))
+                    continue
+                for m in methods:
+                    value = stats.get(int_dict[m][2])
+                    records.append(
+                        (
+                            m,
+                            value,
+                            "{}_{}_b{}".format(prefix, int_dict[m][2], b_str),
+                            value,
+                        )
+                    )
+                for perc in percentile or []:
+                    key = "percentile_{}".format(
+                        int(perc) if (perc).is_integer() else perc
+                    )
+                    records.append(
+                        (
+                            key,
+                            stats[key],
+                            "{}_{}_b{}".format(prefix, key, b_str),
+                            stats[key],
+                        )
+                    )
+
+            if not output:
+                results.setdefault(cat, {}).update(
+                    {
+                        col: value
+                        for name, text, col, value in records
+                        if col in known_cols
+                    }
+                )
+            else:
+                out_str = ""
+                for name, text, col, value in records:
+                    if text is None:
+                        text = "NULL"
+                    elif isinstance(text, float) and not name.startswith("area"):
+                        text = "{:.15g}".format(text)
+                    out_str += "{1}{0}{2}{0}{3}{0}{4}{0}{5}{6}".format(
+                        sep, cat, prefix, buf, name, text, os.linesep
+                    )
+                if output == "-":
+                    print(out_str.rstrip(os.linesep))
+                else:
+                    out.write(out_str)
+
+        if not output:
+            # Write all results in one transaction, grouped by the set of
+            # columns to update
+            param = (
+                "?" if in_vect.dblinks.by_layer(int(layer)).driver == "sqlite" else "%s"
+            )
+            rows = {}
+            for cat, values in results.items():
+                rows.setdefault(tuple(values), []).append(
+                    tuple(values.values()) + (cat,)
+                )
+            for cols, values in rows.items():
+                cur.executemany(
+                    "{}{} WHERE cat = {};".format(
+                        sql_str_start,
+                        ", ".join("{} = {}".format(col, param) for col in cols),
+                        param,
+                    ),
+                    values,
+                )
+            conn.commit()
+
+        geoms = []
+        geoms_n = 0
+    else:
+        # Create iterator for geometries of all selected types
+        geoms = chain()
+        geoms_n = 0
+        for geom_type in types:
+            geoms_n += in_vect.number_of(geom_type)
+            if in_vect.number_of(geom_type) > 0:
+                geoms = chain(in_vect.viter(geom_type))
     n_geom = 1
-    for geom_type in types:
-        geoms_n += in_vect.number_of(geom_type)
-        if in_vect.number_of(geom_type) > 0:
-            geoms = chain(in_vect.viter(geom_type))
 
     # Loop over geometries
     for geom in geoms:
@@ -77,6 +77,26 @@ class TestStreamOrder(TestCase):
 
         v.close()
 
+    def test_recursionlimit_deprecated(self):
+        # The deprecated option is still accepted and ignored
+        self.assertModule(
+            "v.stream.order",
+            input="stream_network",
+            points="stream_network_outlets",
+            output="stream_network_order_test_recursionlimit",
+            threshold=25,
+            order=["strahler"],
+            recursionlimit=10000,
+            overwrite=True,
+            verbose=True,
+        )
+
+        v = VectorTopo(name="stream_network_order_test_recursionlimit", mapset="")
+        v.open(mode="r")
+        self.assertEqual(v.num_primitive_of("line"), 101)
+        self.assertEqual(v.read(4).attrs["strahler"], 4)
+        v.close()
+
     def test_all(self):
         self.assertModule(
             "v.stream.order",
@@ -208,20 +228,6 @@ class TestStreamOrderFails(TestCase):
             verbose=True,
         )
 
-    def test_error_handling_4(self):
-        # Recursion limit is below 1000
-        self.assertModuleFail(
-            "v.stream.order",
-            input="stream_network",
-            points="stream_network_outlets",
-            output="stream_network_order",
-            threshold=25,
-            order=["strahler", "shreve", "drwal", "scheidegger"],
-            recursionlimit=0,
-            overwrite=True,
-            verbose=True,
-        )
-
     def test_error_handling_5(self):
         # Horton order is not implemented
         self.assertModuleFail(
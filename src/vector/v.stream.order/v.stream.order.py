@@ -66,17 +66,20 @@
 # %option
 # % key: recursionlimit
 # % type: integer
-# % description:The Python recursion limit that should be used (Python default is 1000)
+# % label: Deprecated, ignored
+# % description: The stream networks are traversed without recursion
 # % required : no
-# % answer: 10000
 # % multiple: no
 # %end
 
 import os
-import sys
+import math
+from array import array
+from ctypes import byref, c_int
+
 from grass.script import core as grass
 from grass.pygrass.vector import VectorTopo
-import math
+import grass.lib.vector as libvect
 
 # for Python 3 compatibility
 try:
@@ -99,73 +102,118 @@ ORDER_DICT = {
 }
 
 
-class GraphEdge(object):
+class Topology(object):
     """
-    This class defines a single edge of the stream network graph
+    This class stores the node-line topology of a vector map in integer arrays
     """
 
-    def __init__(self, id_, id_pol, start, end, start_edges, end_edges, reverse=False):
-        self.id = id_  # Line id
-        self.id_pol = id_pol  # Polarity of line positive integer or negative integer
-        self.start = start  # Start Node id
-        self.end = end  # End Node id
-        self.start_edges = start_edges  # A list of edge ids at the start node
-        self.end_edges = end_edges  # A list of edge ids at the end node
-        self.reverse = reverse  # If the edge should be reversed
-        self.stream_order = {
-            ORDER_STRAHLER: 0,
-            ORDER_SHREVE: 0,
-            ORDER_SCHEIDEGGER: 0,
-            ORDER_DRWAL: 0,
-        }  # stream_order for each algorithm
+    def __init__(self, vector):
+        """Read the nodes of all lines and the lines of all nodes in one pass
+
+        :param vector: The opened vector input file
+        """
+        c_mapinfo = vector.c_mapinfo
+        num_lines = libvect.Vect_get_num_lines(c_mapinfo)
+        num_nodes = libvect.Vect_get_num_nodes(c_mapinfo)
+
+        # Start and end node of each line, index is the line id
+        self.line_start = array("l", [0]) * (num_lines + 1)
+        self.line_end = array("l", [0]) * (num_lines + 1)
+        n1 = c_int()
+        n2 = c_int()
+        for line_id in xrange(1, num_lines + 1):
+            if libvect.Vect_line_alive(c_mapinfo, line_id):
+                libvect.Vect_get_line_nodes(c_mapinfo, line_id, byref(n1), byref(n2))
+                self.line_start[line_id] = n1.value
+                self.line_end[line_id] = n2.value
+
+        # Line ids of each node in the order of Node.ilines(), stored
+        # as compressed rows: the lines of node n are
+        # node_lines[node_offsets[n]:node_offsets[n + 1]]
+        self.node_offsets = array("l", [0]) * (num_nodes + 2)
+        self.node_lines = array("l")
+        for node_id in xrange(1, num_nodes + 1):
+            if libvect.Vect_node_alive(c_mapinfo, node_id):
+                for i in xrange(libvect.Vect_get_node_n_lines(c_mapinfo, node_id)):
+                    line_id = libvect.Vect_get_node_line(c_mapinfo, node_id, i)
+                    self.node_lines.append(abs(line_id))
+            self.node_offsets[node_id + 1] = len(self.node_lines)
+
+        # Reusable lookup tables for the networks
+        self.discovered = bytearray(num_nodes + 1)
+        self.position = array("l", [-1]) * (num_lines + 1)
+
+    def lines(self, node_id):
+        """Return the line ids at a node"""
+        return self.node_lines[
+            self.node_offsets[node_id] : self.node_offsets[node_id + 1]
+        ]
+
+
+class Graph(object):
+    """
+    This class defines the graph of a single stream network with arrays
+    indexed by the position of the edges in the graph
+    """
+
+    def __init__(self, topology, edges):
+        self.edges = edges  # Line ids in the order of discovery
+        self.start = array("l", (topology.line_start[e] for e in edges))  # Start nodes
+        self.end = array("l", (topology.line_end[e] for e in edges))  # End nodes
+        self.reverse = bytearray(len(edges))  # If the edge should be reversed
+        self.stream_order = {}  # stream_order arrays for each algorithm
+
+    def __len__(self):
+        return len(self.edges)
 
     def __str__(self):
-        return (
-            "Line id: %i (%i) start node: %i "
-            "end node: %i num start edges %i "
-            "num end edges %i   reverse: %s stream_order: %s"
-            % (
-                self.id,
-                self.id_pol,
-                self.start,
-                self.end,
-                len(self.start_edges),
-                len(self.end_edges),
-                self.reverse,
-                str(self.stream_order),
-            )
+        return "Graph with %i edges, reversed: %i stream_order: %s" % (
+            len(self.edges),
+            sum(self.reverse),
+            ", ".join(ORDER_DICT[order] for order in self.stream_order),
         )
 
 
-class GraphNode(object):
+def start_edges(topology, graph, index):
     """
-    This class defines a single node of the node network graph
+    Return the positions of the edges at the start node of an edge,
+    without the edge itself
+
+    :param topology: The Topology of the stream vector map
+    :param graph: The Graph of the edge, its edges must be
+                  registered in topology.position
+    :param index: The position of the edge in the graph
+    :return: A list of edge positions
     """
-
-    def __init__(self, id_, edge_ids):
-        self.id = id_  # Node id
-        self.edge_ids = edge_ids  # Line ids
-
-    def __str__(self):
-        return "Node id: %i line ids: %s" % (self.id, self.edge_ids)
+    line_id = graph.edges[index]
+    positions = []
+    found = False
+    for lid in topology.lines(graph.start[index]):
+        # Remove the edge once, a closed line is at its start node twice
+        if lid == line_id and not found:
+            found = True
+            continue
+        positions.append(topology.position[lid])
+    return positions
 
 
 def traverse_graph_create_stream_order(
     start_id,
-    edges,
-    checked_edges,
-    reversed_edges,
+    topology,
+    graph,
     order_types=[ORDER_STRAHLER, ORDER_SHREVE],
 ):
     """
     Traverse the graph, reverse lines that are not in
     the outflow direction and compute the required orders
 
+    The graph is traversed in upstream direction with an explicit stack
+    in depth-first order, so that the stream orders are computed from
+    the leaves down to the outlet without recursion.
+
     :param start_id: The id of the edge to start the traversing from
-    :param edges: A dictionary of edge objects
-    :param checked_edges: A list with edge ids that have been checked already
-    :param reversed_edges: A list of edges that have been checked for
-                           reversion and corrected if necessary
+    :param topology: The Topology of the stream vector map
+    :param graph: The Graph of the stream network
     :param order_types: The type of the ordering scheme as a list of ints
                       * ORDER_STRAHLER = 1
                       * ORDER_SHREVE = 2
@@ -175,121 +223,158 @@ def traverse_graph_create_stream_order(
 
     :return:
     """
-    current_edge = edges[start_id]
-
-    # Check for direction reversion
-    for edge_id in current_edge.start_edges:
-        if edge_id not in reversed_edges:
-            reversed_edges.append(edge_id)
-            edge = edges[edge_id]
-
-            # Reverse the edge if it is not in the outflow direction
-            if current_edge.start != edge.end:
-                start = edge.start
-                start_edges = edge.start_edges
-                edge.start = edge.end
-                edge.start_edges = edge.end_edges
-                edge.end = start
-                edge.end_edges = start_edges
-                edge.reverse = True
-
-    # Set the stream_order to one, if the edge is a leaf and return
-    if len(current_edge.start_edges) == 0:
-        for order in current_edge.stream_order:
-            current_edge.stream_order[order] = 1
-        return
-
-    stream_orders = {
-        ORDER_STRAHLER: [],
-        ORDER_SHREVE: [],
-        ORDER_SCHEIDEGGER: [],
-        ORDER_HORTON: [],
-        ORDER_DRWAL: [],
-    }
-
-    # Traverse the graph if its not a leaf
-    for edge_id in current_edge.start_edges:
-        if edge_id not in checked_edges:
-            checked_edges.append(edge_id)
-            traverse_graph_create_stream_order(
-                edge_id, edges, checked_edges, reversed_edges, order_types
-            )
+    num_edges = len(graph)
+    for index, line_id in enumerate(graph.edges):
+        topology.position[line_id] = index
 
-        for order in order_types:
-            stream_orders[order].append(edges[edge_id].stream_order[order])
-
-    # Compute the stream orders
-    if ORDER_STRAHLER in order_types:
-        maximum = max(stream_orders[ORDER_STRAHLER])
-        if stream_orders[ORDER_STRAHLER].count(maximum) > 1:
-            current_edge.stream_order[ORDER_STRAHLER] = maximum + 1
-        else:
-            current_edge.stream_order[ORDER_STRAHLER] = maximum
-    if ORDER_SHREVE in order_types:
-        current_edge.stream_order[ORDER_SHREVE] = sum(stream_orders[ORDER_SHREVE])
-    if ORDER_SCHEIDEGGER in order_types:
-        current_edge.stream_order[ORDER_SCHEIDEGGER] = sum(
-            stream_orders[ORDER_SCHEIDEGGER]
-        )
-    if ORDER_DRWAL in order_types:
-        current_edge.stream_order[ORDER_DRWAL] = sum(stream_orders[ORDER_DRWAL])
-    # Horton is wrong implemented
-    if ORDER_HORTON in order_types:
-        maximum = max(stream_orders[ORDER_HORTON])
-        current_edge.stream_order[ORDER_HORTON] = maximum + 1
-
-
-def traverse_network_create_graph(vector, start_node, graph_nodes, graph_edges):
-    """
-    Traverse a stream network vector map layer with depth-first search
-    and create a graphs structures for nodes and edges
+    for order in order_types:
+        graph.stream_order[order] = array("l", [0]) * num_edges
+    stream_order = [graph.stream_order[order] for order in order_types]
+
+    checked_edges = bytearray(num_edges)
+    reversed_edges = bytearray(num_edges)
+
+    def enter(index):
+        """Reverse the upstream edges of an edge if required and return them.
+        Leaves get the stream_order one and None is returned."""
+        upstream = start_edges(topology, graph, index)
+        for edge_index in upstream:
+            if not reversed_edges[edge_index]:
+                reversed_edges[edge_index] = 1
+
+                # Reverse the edge if it is not in the outflow direction
+                if graph.start[index] != graph.end[edge_index]:
+                    graph.start[edge_index], graph.end[edge_index] = (
+                        graph.end[edge_index],
+                        graph.start[edge_index],
+                    )
+                    graph.reverse[edge_index] = 1
+
+        # Set the stream_order to one, if the edge is a leaf
+        if not upstream:
+            for orders in stream_order:
+                orders[index] = 1
+            return None
+        return upstream
+
+    def compute(index, upstream_orders):
+        """Compute the stream orders of an edge from its upstream edges"""
+        for orders, values in zip(stream_order, upstream_orders):
+            orders[index] = sum(values)
+        if ORDER_STRAHLER in order_types:
+            values = upstream_orders[order_types.index(ORDER_STRAHLER)]
+            maximum = max(values)
+            if values.count(maximum) > 1:
+                maximum += 1
+            graph.stream_order[ORDER_STRAHLER][index] = maximum
+        # Horton is wrong implemented
+        if ORDER_HORTON in order_types:
+            values = upstream_orders[order_types.index(ORDER_HORTON)]
+            graph.stream_order[ORDER_HORTON][index] = max(values) + 1
+
+    # Each frame holds the edge, its upstream edges, the position of the
+    # upstream edge in progress and the collected upstream stream orders
+    start_index = topology.position[start_id]
+    upstream = enter(start_index)
+    frames = []
+    if upstream:
+        frames.append([start_index, upstream, 0, [[] for order in order_types]])
+    while frames:
+        frame = frames[-1]
+        index, upstream, i, upstream_orders = frame
+        if i == len(upstream):
+            compute(index, upstream_orders)
+            frames.pop()
+            if frames:
+                collect(frames[-1], stream_order)
+            continue
+
+        edge_index = upstream[i]
+        if not checked_edges[edge_index]:
+            checked_edges[edge_index] = 1
+            edge_upstream = enter(edge_index)
+            if edge_upstream:
+                frames.append(
+                    [edge_index, edge_upstream, 0, [[] for order in order_types]]
+                )
+                continue
+        collect(frame, stream_order)
 
-    :param vector: The opened vector input file
-    :param start_node: The start node object
-    :param graph_nodes: A dictionary of discovered nodes
-    :param graph_edges: A dictionary of Edge objects
-    :return:
-    """
+    for line_id in graph.edges:
+        topology.position[line_id] = -1
 
-    # Count line ids
-    edge_ids = start_node.ilines()
 
-    # For each line at that node
-    for line_id in edge_ids:
+def collect(frame, stream_order):
+    """Collect the stream orders of the upstream edge in progress of a frame"""
+    edge_index = frame[1][frame[2]]
+    for orders, values in zip(stream_order, frame[3]):
+        values.append(orders[edge_index])
+    frame[2] += 1
 
-        line_id_abs = abs(line_id)
-        line = vector.read(line_id_abs)
-        nodes = line.nodes()
 
-        # If the line id is not in the edge list, create a new entry
-        if line_id_abs not in graph_edges:
-            start_edges = [abs(lid) for lid in nodes[0].ilines()]
-            end_edges = [abs(lid) for lid in nodes[1].ilines()]
+def traverse_network_create_graph(topology, start_node_id):
+    """
+    Traverse a stream network with depth-first search
+    and create a graph of its edges
 
-            start_edges.remove(line_id_abs)
-            end_edges.remove(line_id_abs)
+    The lines of the nodes are visited in the order of the topology,
+    using an explicit stack instead of recursion.
 
-            e = GraphEdge(
-                line_id_abs,
-                line_id,
-                nodes[0].id,
-                nodes[1].id,
-                start_edges,
-                end_edges,
-                False,
-            )
-            graph_edges[line_id_abs] = e
-
-        # For start and end node
-        for node in nodes:
-            # If the node was not yet discovered, put it
-            # into the node dict and call traverse
-            if node.id not in graph_nodes:
-                graph_nodes[node.id] = GraphNode(
-                    node.id, [lid for lid in node.ilines()]
-                )
-                # Recursive call
-                traverse_network_create_graph(vector, node, graph_nodes, graph_edges)
+    :param topology: The Topology of the stream vector map
+    :param start_node_id: The id of the start node
+    :return: A Graph object
+    """
+    discovered = topology.discovered
+    position = topology.position
+    node_offsets = topology.node_offsets
+    node_lines = topology.node_lines
+    line_start = topology.line_start
+    line_end = topology.line_end
+    edges = array("l")
+    nodes = [start_node_id]
+    discovered[start_node_id] = 1
+
+    # Each frame holds the position of the line in progress in node_lines,
+    # the end of the lines of its node and if the start node of the
+    # line in progress was already checked
+    stack = [(node_offsets[start_node_id], node_offsets[start_node_id + 1], False)]
+    while stack:
+        i, end, start_checked = stack.pop()
+        while i < end:
+            line_id = node_lines[i]
+            if not start_checked:
+                # If the line id is not in the edge list, create a new entry
+                if position[line_id] < 0:
+                    position[line_id] = len(edges)
+                    edges.append(line_id)
+
+                # If the start node was not yet discovered, traverse it first
+                node = line_start[line_id]
+                if not discovered[node]:
+                    discovered[node] = 1
+                    nodes.append(node)
+                    stack.append((i, end, True))
+                    stack.append((node_offsets[node], node_offsets[node + 1], False))
+                    break
+
+            # The same for the end node
+            node = line_end[line_id]
+            if not discovered[node]:
+                discovered[node] = 1
+                nodes.append(node)
+                stack.append((i + 1, end, False))
+                stack.append((node_offsets[node], node_offsets[node + 1], False))
+                break
+            i += 1
+            start_checked = False
+
+    # Reset the lookup tables for the next network
+    for node in nodes:
+        discovered[node] = 0
+    for line_id in edges:
+        position[line_id] = -1
+
+    return Graph(topology, edges)
 
 
 def graph_to_vector(
@@ -301,6 +386,9 @@ def graph_to_vector(
     category and copy columns from the source stream network
     vector map if required.
 
+    The attributes of all features are inserted at once
+    after the geometries have been written.
+
     :param name: Name of the input stream vector map
     :param mapset: Mapset name of the input stream vector map
     :param graphs: The list of computed graphs
@@ -313,6 +401,13 @@ def graph_to_vector(
     streams = VectorTopo(name=name, mapset=mapset)
     streams.open("r")
 
+    # Read the attributes to copy in one query
+    copy_rows = {}
+    if copy_columns:
+        key_index = streams.table.columns.names().index(streams.table.key)
+        for row in streams.table.execute().fetchall():
+            copy_rows[row[key_index]] = row
+
     # Specifiy all columns that should be created
     cols = [
         ("cat", "INTEGER PRIMARY KEY"),
@@ -333,6 +428,8 @@ def graph_to_vector(
     grass.message(_("Writing vector map <%s>" % output))
     out_streams.open("w", tab_cols=cols)
 
+    rows = []
+    written_cats = set()
     count = 0
     for graph in graphs:
         outlet_cat = outlet_cats[count]
@@ -346,48 +443,52 @@ def graph_to_vector(
         )
 
         # Write each edge as line
-        for edge_id in graph:
-            edge = graph[edge_id]
-
+        for index, edge_id in enumerate(graph.edges):
             line = streams.read(edge_id)
             # Reverse the line if required
-            if edge.reverse is True:
+            if graph.reverse[index]:
                 line.reverse()
 
-            # Orders derived from shreve algorithm
-            if ORDER_SCHEIDEGGER in order_types:
-                edge.stream_order[ORDER_SCHEIDEGGER] *= 2
-            if ORDER_DRWAL in order_types:
-                if edge.stream_order[ORDER_DRWAL] != 0:
-                    edge.stream_order[ORDER_DRWAL] = int(
-                        math.log(edge.stream_order[ORDER_DRWAL], 2) + 1
-                    )
-
             # Create attributes
-            attrs = []
+            attrs = [edge_id]
             # Append the outlet point category
             attrs.append(outlet_cat)
             # Append the network id
             attrs.append(count)
             # The reverse flag
-            attrs.append(edge.reverse)
+            attrs.append(graph.reverse[index])
             # Then the stream orders defined at the command line
             for order in order_types:
-                val = int(edge.stream_order[order])
+                val = 0
+                if order in graph.stream_order:
+                    val = graph.stream_order[order][index]
+                # Orders derived from shreve algorithm
+                if order == ORDER_SCHEIDEGGER:
+                    val *= 2
+                if order == ORDER_DRWAL and val != 0:
+                    val = int(math.log(val, 2) + 1)
                 if val == 0:
                     val = None
                 attrs.append(val)
             # Copy attributes from original streams if the table exists
             if copy_columns:
+                row = copy_rows.get(line.cat)
                 for entry in copy_columns:
                     # First entry is the column index
-                    attrs.append(line.attrs.values()[entry[0]])
-
-            # Write the feature
-            out_streams.write(line, cat=edge_id, attrs=attrs)
-
-    # Commit the database entries
+                    attrs.append(row[entry[0]] if row else None)
+            # Only the first feature of a category gets attributes
+            if edge_id not in written_cats:
+                written_cats.add(edge_id)
+                rows.append(attrs)
+
+            # Write the feature, the attributes are inserted below
+            out_streams.write(line, cat=edge_id)
+
+    # Insert and commit the database entries
+    cursor = out_streams.table.conn.cursor()
+    cursor.executemany(out_streams.table.columns.insert_str, rows)
     out_streams.table.conn.commit()
+    cursor.close()
     # Close the input and output map
     out_streams.close()
     streams.close()
@@ -540,20 +641,16 @@ def detect_compute_networks(
         grass.fatal(_("Unable to find start nodes"))
 
     # We create a graph representation for further computations
-    graphs = []
-
-    # Traverse each network from the outflow node on
-    for node in start_nodes:
-        graph_nodes = {}
-        graph_edges = {}
-        graph_nodes[node.id] = GraphNode(node.id, [lid for lid in node.ilines()])
-        traverse_network_create_graph(v, node, graph_nodes, graph_edges)
-        # For now we only use the edges graph
-        graphs.append(graph_edges)
+    topology = Topology(v)
 
     # Close the vector map, since we have our own graph representation
     v.close()
 
+    # Traverse each network from the outflow node on
+    graphs = []
+    for node in start_nodes:
+        graphs.append(traverse_network_create_graph(topology, node.id))
+
     # Set stream order types
     order_types = []
 
@@ -571,11 +668,7 @@ def detect_compute_networks(
     # Compute the stream orders
     for i in xrange(len(start_edges)):
         edge_id = start_edges[i]
-        checked_edges = []
-        reversed_edges = []
-        traverse_graph_create_stream_order(
-            edge_id, graphs[i], checked_edges, reversed_edges, order_types
-        )
+        traverse_graph_create_stream_order(edge_id, topology, graphs[i], order_types)
 
     # Write the graphs as vector map
     graph_to_vector(
@@ -590,15 +683,14 @@ def main():
     order = options["order"]
     threshold = options["threshold"]
     columns = options["columns"]
-    recursionlimit = options["recursionlimit"]
-
-    # We are using a recursive tree traversing algorithm, that may exceed
-    # the 1000 recursion length for huge networks.
-    # The default is 10000 in the option section
-    if int(recursionlimit) < 1000:
-        grass.fatal(_("The Python recursion limit should be equal or larger than 1000"))
 
-    sys.setrecursionlimit(int(recursionlimit))
+    if options["recursionlimit"]:
+        grass.warning(
+            _(
+                "Option <recursionlimit> is deprecated and ignored, "
+                "the networks are traversed without recursion"
+            )
+        )
 
     # Check map names for mapsets
     vname = input
@@ -126,10 +126,20 @@ from builtins import range
 import sys
 import os
 import atexit
+from multiprocessing import Lock, Pool
+
+import numpy as np
 import grass.script as grass
 from grass.exceptions import CalledModuleError
+from grass.pygrass.raster import RasterRow
+from grass.pygrass.raster.buffer import Buffer
+
+CELL_NULL = -2147483648
+# number of rows of the blocks in which the sums are accumulated
+BLOCK_ROWS = 256
 
-TMP_FILE = None
+TMP_FILES = []
+SETTINGS = {}
 
 
 def cleanup():
@@ -138,7 +148,141 @@ def cleanup():
     grass.run_command(
         "g.remove", flags="f", type="raster", pattern=tmp_base + "*", quiet=True
     )
-    grass.try_remove(TMP_FILE)
+    for tmp_file in TMP_FILES:
+        grass.try_remove(tmp_file)
+
+
+def row_values(raster, row):
+    """Return a row of a raster as float array with NaN for NULL"""
+    values = np.array(raster[row], dtype=np.float64)
+    if raster.mtype == "CELL":
+        values[values == CELL_NULL] = np.nan
+    return values
+
+
+def site_cells(sites, region):
+    """Return the row and column of each site in the region"""
+    rows = np.floor((region["n"] - sites[:, 1]) / region["nsres"]).astype(int)
+    cols = np.floor((sites[:, 0] - region["w"]) / region["ewres"]).astype(int)
+    # sites on the southern or eastern edge
+    rows = np.clip(rows, 0, region["rows"] - 1)
+    cols = np.clip(cols, 0, region["cols"] - 1)
+    return rows, cols
+
+
+def cost_map_values(cost_map, rows, cols):
+    """Read the values of the cost map at the given cells
+
+    Each row of the cost map is read only once.
+    """
+    values = np.empty(len(rows))
+    with RasterRow(cost_map) as raster:
+        for row in np.unique(rows):
+            in_row = rows == row
+            values[in_row] = row_values(raster, row)[cols[in_row]]
+    return values
+
+
+def site_weights(cost, friction, divisor, rbf):
+    """Compute the weights of a site from its cumulative cost
+
+    The cost is 0 at the site itself, it is set to 0.1 so that the divisor
+    exists and the weighting is huge at the exact sample spots.
+    NULL (NaN) is returned where the site is not reachable.
+    """
+    cost = np.where(cost == 0, 0.1, cost)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if rbf:
+            weights = 1.0 / (np.power(cost, friction) * np.log(cost))
+        else:
+            weights = 1.0 / np.power(cost / divisor, friction)
+    # division by zero is NULL like in r.mapcalc
+    weights[~np.isfinite(weights)] = np.nan
+    return weights
+
+
+def nan_add(total, values):
+    """Add values to total where they are not NULL, NULL + x is x"""
+    valid = ~np.isnan(values)
+    total[valid] = np.where(
+        np.isnan(total[valid]), values[valid], total[valid] + values[valid]
+    )
+
+
+def init_worker(settings, locks):
+    global SETTINGS
+    SETTINGS = dict(settings, locks=locks)
+
+
+def run_site(site):
+    """Compute the cost surface of a site and add its weights to the sums
+
+    The cost surface is written to one raster per worker process, which is
+    overwritten by the next site of the same worker. Weights are added to
+    the memory-mapped numerator and denominator block by block.
+    Returns the site number and None on success, an error message otherwise.
+    """
+    num, easting, northing, data_value = site
+    s = SETTINGS
+    cost_site = s["tmp_base"] + "cost_site_" + str(os.getpid())
+    try:
+        grass.run_command(
+            "r.cost",
+            flags="k",
+            input=s["area_mask"],
+            output=cost_site,
+            start_coordinates=(easting, northing),
+            quiet=True,
+            overwrite=True,
+        )
+    except CalledModuleError:
+        return num, _("Problem running %s") % "r.cost"
+
+    rows, cols = s["shape"]
+    numerator = np.memmap(
+        s["numerator"], dtype=np.float64, mode="r+", shape=(rows, cols)
+    )
+    denominator = np.memmap(
+        s["denominator"], dtype=np.float64, mode="r+", shape=(rows, cols)
+    )
+    with RasterRow(cost_site) as raster:
+        for block, start in enumerate(range(0, rows, BLOCK_ROWS)):
+            end = min(start + BLOCK_ROWS, rows)
+            cost = np.array([row_values(raster, row) for row in range(start, end)])
+            weights = site_weights(cost, s["friction"], s["divisor"], s["rbf"])
+            with s["locks"][block]:
+                nan_add(numerator[start:end], data_value * weights)
+                nan_add(denominator[start:end], weights)
+    numerator.flush()
+    denominator.flush()
+    del numerator, denominator
+    return num, None
+
+
+def write_output(output, numerator, denominator, post_mask):
+    """Write the weighted mean of the data values, applying the post_mask"""
+    rows, cols = numerator.shape
+    mask = None
+    if post_mask:
+        mask = RasterRow(post_mask)
+        mask.open("r")
+    out = RasterRow(output)
+    out.open("w", mtype="DCELL", overwrite=grass.overwrite())
+    buff = Buffer((cols,), "DCELL")
+    for row in range(rows):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = numerator[row] / denominator[row]
+        if mask is not None:
+            # NULL and zero cells of the post_mask are masked like by MASK
+            mask_values = row_values(mask, row)
+            values[np.isnan(mask_values) | (mask_values == 0)] = np.nan
+        values[~np.isfinite(values)] = np.nan
+        buff[:] = values
+        out.put_row(buff)
+        grass.percent(row + 1, rows, 5)
+    out.close()
+    if mask is not None:
+        mask.close()
 
 
 def main():
@@ -165,10 +309,6 @@ def main():
     if not grass.find_file(pts_input, element="vector")["file"]:
         grass.fatal(_("Vector map <%s> not found") % pts_input)
     if post_mask:
-        if grass.find_file("MASK")["file"]:
-            grass.fatal(
-                _("A MASK already exists; remove it before using the post_mask option.")
-            )
         if not grass.find_file(post_mask)["file"]:
             grass.fatal(_("Raster map <%s> not found") % post_mask)
 
@@ -249,26 +389,25 @@ def main():
                 + "fewer points or get ready to wait a while ..."
             )
         )
-        import time
-
-        time.sleep(5)
-
-    #### generate cost maps for each site in range
-    grass.message(_("Generating cost maps ..."))
 
-    # avoid do-it-yourself brain surgery
-    points_list_orig = list(points_list)
-
-    proc = {}
+    # read the attribute table and the cost map at the sites only once
+    data_values = grass.vector_db_select(pts_input, layer=layer, columns=column)[
+        "values"
+    ]
+    region = grass.region()
+    coordinates = np.array(
+        [[float(position[0]), float(position[1])] for position in points_list]
+    ).reshape(-1, 2)
+    rows, cols = site_cells(coordinates, region)
+    site_costs = cost_map_values(cost_map, rows, cols)
+
+    sites = []
     num = 1
-    for i in range(n):
-        position = points_list_orig[i]
+    for i, position in enumerate(points_list):
         easting = position[0]
         northing = position[1]
         cat = int(position[-1])
-
-        # retrieve data value from vector's attribute table:
-        data_value = grass.vector_db_select(pts_input, columns=column)["values"][cat][0]
+        data_value = data_values.get(cat, [None])[0]
 
         if not data_value:
             grass.message(
@@ -276,7 +415,6 @@ def main():
                 % (num, n, float(easting), float(northing), cat)
             )
             grass.message(_(" -- Skipping, no data here."))
-            del points_list[num - 1]
             n -= 1
             continue
         else:
@@ -286,18 +424,8 @@ def main():
             )
 
         # we know the point is in the region, but is it in a non-null area of the cost surface?
-        rast_val = (
-            grass.read_command(
-                "r.what",
-                map=area_mask,
-                coordinates="%s,%s" % (position[0], position[1]),
-            )
-            .strip()
-            .split("|")[-1]
-        )
-        if rast_val == "*":
+        if np.isnan(site_costs[i]) or site_costs[i] == 0:
             grass.message(_(" -- Skipping, point lays outside of cost_map."))
-            del points_list[num - 1]
             n -= 1
             continue
 
@@ -307,244 +435,64 @@ def main():
         except:
             grass.fatal("Data value [%s] is non-numeric" % data_value)
 
-        cost_site_name = tmp_base + "cost_site." + "%05d" % num
-        proc[num - 1] = grass.start_command(
-            "r.cost",
-            flags="k",
-            input=area_mask,
-            output=cost_site_name,
-            start_coordinates=easting + "," + northing,
-            quiet=True,
-        )
-        # stall to wait for the nth worker to complete,
-        if num % workers == 0:
-            proc[num - 1].wait()
-
+        sites.append((num, easting, northing, data_value))
         num += 1
 
-    # make sure everyone is finished
-    for i in range(n):
-        if proc[i].wait() != 0:
-            grass.fatal(_("Problem running %s") % "r.cost")
-
-    grass.message(_("Removing anomalies at site positions ..."))
-
-    proc = {}
-    for i in range(n):
-        cost_site_name = tmp_base + "cost_site." + "%05d" % (i + 1)
-        # max_cost="$GIS_OPT_MAX_COST"  : commented out until r.null cleansing/continue code is sorted out
-        # start_points=tmp_idw_cost_site_$$
-
-        # we do this so the divisor exists and the weighting is huge at the exact sample spots
-        # more efficient to reclass to 1?
-        proc[i] = grass.mapcalc_start(
-            "$cost_n_cleansed = if($cost_n == 0, 0.1, $cost_n)",
-            cost_n_cleansed=cost_site_name + ".cleansed",
-            cost_n=cost_site_name,
-            quiet=True,
-        )
-        # stall to wait for the nth worker to complete,
-        if (i + 1) % workers == 0:
-            # print 'stalling ...'
-            proc[i].wait()
-
-    # make sure everyone is finished
-    for i in range(n):
-        if proc[i].wait() != 0:
-            grass.fatal(_("Problem running %s") % "r.mapcalc")
-
-    grass.message(_("Applying radial decay ..."))
-
-    proc = {}
-    for i in range(n):
-        cost_site_name = tmp_base + "cost_site." + "%05d" % (i + 1)
-        grass.run_command(
-            "g.remove", flags="f", type="raster", name=cost_site_name, quiet=True
-        )
-        grass.run_command(
-            "g.rename",
-            raster=cost_site_name + ".cleansed" + "," + cost_site_name,
-            quiet=True,
-        )
-
-        # r.to.vect then r.patch output
-        # v.to.rast in=tmp_idw_cost_site_29978 out=tmp_idw_cost_val_$$ use=val val=10
-
-        if not flags["r"]:
-            #  exp(3,2) is 3^2  etc.  as is pow(3,2)
-            # r.mapcalc "1by_cost_site_sqrd.$NUM =  1.0 / exp(cost_site.$NUM , $FRICTION)"
-            #      EXPRESSION="1.0 / pow(cost_site.$NUM $DIVISOR, $FRICTION )"
-            expr = "1.0 / pow($cost_n / " + str(divisor) + ", $friction)"
-        else:
-            # use log10() or ln() ?
-            #      EXPRESSION="1.0 / ( pow(cost_site.$NUM, $FRICTION) * log (cost_site.$NUM) )"
-            expr = '1.0 / ( pow($cost_n, $friction) * log($cost_n) )"'
-
-        grass.debug("r.mapcalc expression is: [%s]" % expr)
-
-        one_by_cost_site_sq_n = tmp_base + "1by_cost_site_sq." + "%05d" % (i + 1)
-
-        proc[i] = grass.mapcalc_start(
-            "$result = " + expr,
-            result=one_by_cost_site_sq_n,
-            cost_n=cost_site_name,
-            friction=friction,
-            quiet=True,
-        )
-        # stall to wait for the nth worker to complete,
-        if (i + 1) % workers == 0:
-            # print 'stalling ...'
-            proc[i].wait()
-
-        # r.patch in=1by_cost_site_sqrd.${NUM},tmp_idw_cost_val_$$ out=1by_cost_site_sqrd.${NUM} --o
-        # g.remove type=rast name=cost_site.$NUM -f
-
-    # make sure everyone is finished
-    for i in range(n):
-        if proc[i].wait() != 0:
-            grass.fatal(_("Problem running %s") % "r.mapcalc")
-
-    grass.run_command(
-        "g.remove",
-        flags="f",
-        type="raster",
-        pattern=tmp_base + "cost_site.*",
-        quiet=True,
-    )
-    # grass.run_command('g.list', type = 'raster', mapset = '.')
+    if not sites:
+        grass.fatal(_("No sites with data on the cost map"))
+
+    #### generate cost maps for each site and sum the weights
+    grass.message(_("Generating cost maps and summing cost weights ..."))
+
+    # numerator sum(data_i / d_i^n) and denominator sum(1 / d_i^n)
+    # accumulated in memory-mapped files shared by the workers
+    shape = (region["rows"], region["cols"])
+    sums = {}
+    for name in ("numerator", "denominator"):
+        sums[name] = grass.tempfile()
+        TMP_FILES.append(sums[name])
+        array = np.memmap(sums[name], dtype=np.float64, mode="w+", shape=shape)
+        array[:] = np.nan
+        array.flush()
+        del array
+
+    settings = {
+        "tmp_base": tmp_base,
+        "area_mask": area_mask,
+        "shape": shape,
+        "numerator": sums["numerator"],
+        "denominator": sums["denominator"],
+        "friction": friction,
+        "divisor": divisor,
+        "rbf": flags["r"],
+    }
+    locks = [Lock() for start in range(0, shape[0], BLOCK_ROWS)]
+    with Pool(
+        processes=min(workers, len(sites)),
+        initializer=init_worker,
+        initargs=(settings, locks),
+    ) as pool:
+        done = 0
+        for num, error in pool.imap_unordered(run_site, sites, chunksize=1):
+            if error:
+                pool.terminate()
+                grass.fatal(error)
+            done += 1
+            grass.percent(done, len(sites), 1)
 
     #######################################################
-    #### Step 3) find sum(cost^2)
-    grass.verbose("")
-    grass.verbose(_("Finding sum of squares ..."))
-
-    # todo: test if MASK exists already, fatal exit if it does?
-    if post_mask:
-        grass.message(_("Setting post_mask <%s>"), post_mask)
-        grass.mapcalc("MASK = $maskmap", maskmap=post_mask, overwrite=True)
-
-    grass.message(_("Summation of cost weights ..."))
-
-    input_maps = tmp_base + "1by_cost_site_sq.%05d" % 1
-
-    global TMP_FILE
-    TMP_FILE = grass.tempfile()
-    with open(TMP_FILE, "w") as maplist:
-        for i in range(2, n + 1):
-            mapname = "%s1by_cost_site_sq.%05d" % (tmp_base, i)
-            maplist.write(mapname + "\n")
-
-    # grass.run_command('g.list', type = 'raster', mapset = '.')
-
-    sum_of_1by_cost_sqs = tmp_base + "sum_of_1by_cost_sqs"
-    try:
-        grass.run_command(
-            "r.series", method="sum", file=TMP_FILE, output=sum_of_1by_cost_sqs
-        )
-    except CalledModuleError:
-        grass.fatal(_("Problem running %s") % "r.series")
+    #### ( 1/di^2 / sum(1/d^2) ) *  ai
+    grass.message(_("Calculating final values ..."))
 
     if post_mask:
-        grass.message(_("Removing post_mask <%s>"), post_mask)
-        grass.run_command("g.remove", flags="f", name="MASK", quiet=True)
-
-    #######################################################
-    #### Step 4) ( 1/di^2 / sum(1/d^2) ) *  ai
-    grass.verbose("")
-    grass.message(_("Creating partial weights ..."))
-
-    proc = {}
-    num = 1
-    for position in points_list:
-        easting = position[0]
-        northing = position[1]
-        cat = int(position[-1])
-        data_value = grass.vector_db_select(pts_input, columns=column)["values"][cat][0]
-        data_value = float(data_value)
-
-        # failsafe: at this point the data values should all be valid
-        if not data_value:
-            grass.message(_("Site %d of %d,  cat = %d, data value = ?") % (num, n, cat))
-            grass.message(_(" -- Skipping, no data here. [Probably programmer error]"))
-            n -= 1
-            continue
-        else:
-            grass.message(
-                _("Site %d of %d,  cat = %d, data value = %.8g")
-                % (num, n, cat, data_value)
-            )
+        grass.message(_("Applying post_mask <%s>") % post_mask)
 
-        # we know the point is in the region, but is it in a non-null area of the cost surface?
-        rast_val = (
-            grass.read_command(
-                "r.what",
-                map=area_mask,
-                coordinates="%s,%s" % (position[0], position[1]),
-            )
-            .strip()
-            .split("|")[-1]
-        )
-        if rast_val == "*":
-            grass.message(
-                _(
-                    " -- Skipping, point lays outside of cost_map. [Probably programmer error]"
-                )
-            )
-            n -= 1
-            continue
-
-        partial_n = tmp_base + "partial." + "%05d" % num
-        one_by_cost_site_sq = tmp_base + "1by_cost_site_sq." + "%05d" % num
-
-        # "( $DATA_VALUE / $N ) * (1.0 - ( cost_sq_site.$NUM / sum_of_cost_sqs ))"
-        # "( cost_sq_site.$NUM / sum_of_cost_sqs ) * ( $DATA_VALUE / $N )"
-
-        proc[num - 1] = grass.mapcalc_start(
-            "$partial_n = ($data * $one_by_cost_sq) / $sum_of_1by_cost_sqs",
-            partial_n=partial_n,
-            data=data_value,
-            one_by_cost_sq=one_by_cost_site_sq,
-            sum_of_1by_cost_sqs=sum_of_1by_cost_sqs,
-            quiet=True,
-        )
-
-        # stall to wait for the nth worker to complete,
-        if num % workers == 0:
-            proc[num - 1].wait()
-
-        # free up disk space ASAP
-        # grass.run_command('g.remove', flags = 'f', type = 'raster', name = one_by_cost_site_sq, quiet = True)
-
-        num += 1
-        if num > n:
-            break
-
-    # make sure everyone is finished
-    for i in range(n):
-        proc[i].wait()
-
-    # free up disk space ASAP
-    grass.run_command(
-        "g.remove",
-        flags="f",
-        type="raster",
-        pattern=tmp_base + "1by_cost_site_sq.*",
-        quiet=True,
+    numerator = np.memmap(sums["numerator"], dtype=np.float64, mode="r", shape=shape)
+    denominator = np.memmap(
+        sums["denominator"], dtype=np.float64, mode="r", shape=shape
     )
-    # grass.run_command('g.list', type = 'raster', mapset = '.')
-
-    #######################################################
-    grass.message("")
-    grass.message(_("Calculating final values ..."))
-
-    input_maps = tmp_base + "partial.%05d" % 1
-    for i in range(2, n + 1):
-        input_maps += ",%spartial.%05d" % (tmp_base, i)
-
-    try:
-        grass.run_command("r.series", method="sum", input=input_maps, output=output)
-    except CalledModuleError:
-        grass.fatal(_("Problem running %s") % "r.series")
+    write_output(output, numerator, denominator, post_mask)
+    del numerator, denominator
 
     # TODO: r.patch in v.to.rast of values at exact seed site locations. currently set to null
 